@@ -6,11 +6,15 @@ from django.db.models import ProtectedError
 
 from registration.models import RegistrationProfile
 
-from .mtmodel import ConcurrencyError
+from .denormalization import deferred_denormalization
+from .mtmodel import BulkCloner, ConcurrencyError
 from .core.models import Product, ProductVersion, ApiKey
 from .core.auth import User, Role, Permission
 from .environments.models import Environment, Profile, Element, Category
-from .execution.models import Run, RunSuite, RunCaseVersion, Result, StepResult
+from .execution.models import (
+    Run, RunSuite, RunCaseVersion, Result, StepResult, LatestResult,
+    ResultRollup)
+from .jobs.models import Job
 from .library.bulk import BulkParser
 from .library.models import (
     Case, CaseVersion, CaseAttachment, CaseStep, Suite, SuiteCase)
@@ -0,0 +1,71 @@
+"""
+Export Suite and Case data of a given Product Version.
+
+The data is written in JSON, in the format the ``import`` command accepts
+(see ``moztrap.model.library.exporter.Exporter``), to the given file or to
+standard output. It is read in batches and streamed, so product versions of
+any size can be exported.
+
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from optparse import make_option
+
+from moztrap.model.core.models import Product, ProductVersion
+from moztrap.model.library.exporter import BATCH_SIZE, Exporter
+
+
+
+class Command(BaseCommand):
+    args = "<product_name> <product_version> [<filename>]"
+    help = (
+        "Exports the suites and cases of the specified Product Version "
+        "to a JSON file (or standard output)")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--batch-size",
+            type="int",
+            dest="batch_size",
+            default=BATCH_SIZE,
+            help="Number of cases read at a time (default {0})".format(
+                BATCH_SIZE)),
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options.get("batch_size", BATCH_SIZE)
+        if len(args) not in [2, 3] or batch_size < 1:
+            raise CommandError(
+                "Usage: {0} [--batch-size <n>]".format(self.args))
+
+        try:
+            product = Product.objects.get(name=args[0])
+        except Product.DoesNotExist:
+            raise CommandError('Product "{0}" does not exist'.format(args[0]))
+
+        try:
+            product_version = ProductVersion.objects.get(
+                product=product, version=args[1])
+        except ProductVersion.DoesNotExist:
+            raise CommandError(
+                'Version "{0}" of product "{1}" does not exist'.format(
+                    args[1], args[0])
+                )
+
+        chunks = Exporter(product_version, batch_size=batch_size).export_json()
+
+        if len(args) == 2:
+            for chunk in chunks:
+                self.stdout.write(chunk)
+            return
+
+        try:
+            with open(args[2], "w") as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+        except IOError as (errno, strerror):
+            raise CommandError(
+                'Could not open "{0}", I/O error {1}: {2}'.format(
+                    args[2], errno, strerror)
+                )
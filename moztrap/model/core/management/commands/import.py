@@ -28,16 +28,21 @@ The data must be in JSON format and structured like this::
         ]
     }
 
+Files are read as a stream and imported in batches (each batch in its own
+transaction), so they can be of any size. With ``--dry-run``, everything
+is rolled back at the end.
+
 """
 
 from django.core.management.base import BaseCommand, CommandError
 
 from optparse import make_option
-import json
 import os.path
+import time
 
 from moztrap.model.core.models import Product, ProductVersion
-from moztrap.model.library.importer import Importer
+from moztrap.model.library.casefiles import CaseFileError, parse_json
+from moztrap.model.library.importer import BATCH_SIZE, Importer
 
 
 
@@ -56,14 +61,31 @@ class Command(BaseCommand):
             default=False,
             help="Force importing cases, even if the case name is a"
             " duplicate"),
+        make_option(
+            "--batch-size",
+            type="int",
+            dest="batch_size",
+            default=BATCH_SIZE,
+            help="Number of suites and cases imported per transaction "
+            "(default {0})".format(BATCH_SIZE)),
+        make_option(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            default=False,
+            help="Check the import and report on it, but don't save anything"),
 
         )
 
     def handle(self, *args, **options):
-        if not len(args) == 3:
-            raise CommandError("Usage: {0}".format(self.args))
+        batch_size = options.get("batch_size", BATCH_SIZE)
+        if not len(args) == 3 or batch_size < 1:
+            raise CommandError(
+                "Usage: {0} [--batch-size <n>] [--dry-run]".format(self.args))
 
+        verbosity = int(options.get("verbosity", 1))
         force_dupes = options.get("force_dupes")
+        dry_run = options.get("dry_run")
 
         try:
             product = Product.objects.get(name=args[0])
@@ -89,39 +111,56 @@ class Command(BaseCommand):
             else:
                 files.append(args[2])
 
-            results_for_files = None
-            for file in files:
-                with open(file) as fh:
-
-                    # try to import this as JSON
-                    try:
-                        case_data = json.load(fh)   # pragma: no branch
-                    except ValueError as e:
-                        raise CommandError(
-                            "Could not parse JSON: {0}: {1}".format(
-                                str(e),
-                                fh,
-                                ))
-
-                    # @@@: support importing as CSV.  Rather than returning an
-                    # error above, just try CSV import instead.
-
-                    result = Importer().import_data(
-                        product_version, case_data, force_dupes=force_dupes)
-
-                    # append this result to those for any of the other files.
-                    if not results_for_files:
-                        results_for_files = result
-                    else:
-                        results_for_files.append(result)  # pragma: no branch
-
-            if results_for_files:
-                result_list = results_for_files.get_as_list()
-                result_list.append("")
-                self.stdout.write("\n".join(result_list))
-            else:
+            if not files:
                 self.stdout.write("No files found to import.\n")
-
+                return
+
+            # all files are imported as one stream, in one dry run; warnings
+            # are written out per batch, and only counted here
+            num_cases = num_suites = num_warnings = 0
+            start = time.time()
+            results = Importer().import_stream(
+                product_version,
+                read_files(files),
+                force_dupes=force_dupes,
+                batch_size=batch_size,
+                dry_run=dry_run,
+                )
+            for i, result in enumerate(results):
+                num_cases += result.num_cases
+                num_suites += result.num_suites
+                num_warnings += len(result.warnings)
+                result_list = result.get_warnings_as_list()
+                if verbosity > 1:
+                    result_list.append(
+                        "Batch {0}: imported {1} cases and {2} suites "
+                        "({3} cases so far).".format(
+                            i + 1,
+                            result.num_cases,
+                            result.num_suites,
+                            num_cases,
+                            )
+                        )
+                if result_list:
+                    result_list.append("")
+                    self.stdout.write("\n".join(result_list))
+            seconds = time.time() - start
+
+            result_list = [
+                "Imported {0} cases".format(num_cases),
+                "Imported {0} suites".format(num_suites),
+                ]
+            if num_warnings:
+                result_list.append(
+                    "{0} warnings (see above)".format(num_warnings))
+            if verbosity > 1:
+                result_list.append(
+                    "Imported in {0:.2f}s ({1:.1f} cases/s).".format(
+                        seconds, num_cases / seconds if seconds else 0))
+            if dry_run:
+                result_list.append("Dry run: nothing was saved.")
+            result_list.append("")
+            self.stdout.write("\n".join(result_list))
 
         except IOError as (errno, strerror):
             raise CommandError(
@@ -129,3 +168,23 @@ class Command(BaseCommand):
                     args[2], errno, strerror)
                 )
 
+
+
+def read_files(files):
+    """Yield the suites and cases in given JSON files, one at a time."""
+    for file in files:
+        with open(file) as fh:
+
+            # try to import this as JSON
+            try:
+                for item in parse_json(fh):
+                    yield item
+            except CaseFileError as e:
+                raise CommandError(
+                    "Could not parse JSON: {0}: {1}".format(
+                        str(e),
+                        fh,
+                        ))
+
+            # @@@: support importing as CSV.  Rather than returning an
+            # error above, just try CSV import instead.
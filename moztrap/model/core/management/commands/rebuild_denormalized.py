@@ -0,0 +1,97 @@
+"""
+Management command to verify and repair denormalized data.
+
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from moztrap.model.core.models import Product
+from moztrap.model.execution.models import LatestResult, RunCaseVersion
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the order and latest flags of product versions, the latest "
+        "flags of caseversions and the latest-result pointers, fixing any "
+        "that are wrong (result rollups have rebuild_result_rollups).")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--check",
+            action="store_true",
+            dest="check",
+            default=False,
+            help="Only report what is wrong; don't fix it"),
+        make_option(
+            "--batch-size",
+            type="int",
+            dest="batch_size",
+            default=500,
+            help="Number of runcaseversions per transaction (default 500)"),
+        )
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        check = options["check"]
+        batch_size = options["batch_size"]
+        if args or batch_size < 1:
+            raise CommandError("Usage: [--check] [--batch-size <n>]")
+
+        versions = caseversions = latest = 0
+        # one product at a time
+        for product in Product.everything.order_by("id"):
+            with transaction.commit_manually():
+                try:
+                    v, cv = product.reorder_versions()
+                except Exception:
+                    transaction.rollback()
+                    raise
+                finish(check)
+            versions += v
+            caseversions += cv
+            if verbosity > 1 and (v or cv):
+                self.stdout.write(
+                    "Product {0}: {1} version(s), {2} caseversion(s).\n"
+                    .format(product.id, v, cv))
+
+        # runcaseversions a batch at a time, paging by id
+        last_id = 0
+        while True:
+            batch = list(
+                RunCaseVersion.everything.filter(id__gt=last_id).order_by(
+                    "id").values_list("id", flat=True)[:batch_size]
+                )
+            if not batch:
+                break
+            last_id = batch[-1]
+            with transaction.commit_manually():
+                try:
+                    latest += LatestResult.objects.rebuild(batch)
+                except Exception:
+                    transaction.rollback()
+                    raise
+                finish(check)
+
+        if verbosity:
+            self.stdout.write(
+                "{0} {1} product version(s), {2} caseversion(s) and {3} "
+                "latest result(s).\n".format(
+                    "Would fix" if check else "Fixed",
+                    versions,
+                    caseversions,
+                    latest,
+                    )
+                )
+
+
+
+def finish(check):
+    """Roll back changes if only checking, else commit them."""
+    if check:
+        transaction.rollback()
+    else:
+        transaction.commit()
@@ -5,11 +5,12 @@ Core MozTrap models (Product).
 import uuid
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
 
 from pkg_resources import parse_version
 from preferences.models import Preferences
 
+from ..denormalization import deferring
 from ..environments.models import HasEnvironmentsModel
 from ..mtmodel import MTModel, MTManager, TeamModel
 from .auth import Role, User
@@ -51,19 +52,56 @@ class Product(MTModel, TeamModel):
         If an ``update_instance`` is given, update it with new order and
         ``latest`` flag.
 
+        Versions whose order or ``latest`` flag changes are updated with a
+        single statement; then the latest caseversions of the product's cases
+        are recomputed (see ``Case.set_product_latest_versions``).
+
+        Returns a tuple of the numbers of versions and caseversions changed.
+
         """
         ordered = sorted(self.versions.all(), key=by_version)
+        changed = []
         for i, version in enumerate(ordered, 1):
-            version.order = i
-            version.latest = (i == len(ordered))
-            version.save(force_update=True, skip_reorder=True, notrack=True)
-            if version == update_instance:
-                update_instance.order = version.order
-                update_instance.latest = version.latest
+            latest = (i == len(ordered))
+            if (version.order, version.latest) != (i, latest):
+                version.order, version.latest = i, latest
+                changed.append(version)
+
+        if changed:
+            qn = connection.ops.quote_name
+            when = " ".join(["WHEN %s THEN %s"] * len(changed))
+            cursor = connection.cursor()
+            cursor.execute(
+                """UPDATE {table} SET
+                    {order} = CASE id {when} END,
+                    latest = CASE id {when} END,
+                    cc_version = cc_version + 1
+                WHERE id IN ({ids})
+                """.format(
+                    table=qn(ProductVersion._meta.db_table),
+                    order=qn("order"),
+                    when=when,
+                    ids=",".join(["%s"] * len(changed)),
+                    ),
+                [x for v in changed for x in (v.id, v.order)] +
+                [x for v in changed for x in (v.id, v.latest)] +
+                [v.id for v in changed]
+                )
+            transaction.commit_unless_managed()
+
+        if update_instance is not None and update_instance in ordered:
+            version = ordered[ordered.index(update_instance)]
+            update_instance.order = version.order
+            update_instance.latest = version.latest
+            if version in changed:
                 update_instance.cc_version += 1
-        # now we have to update latest caseversions too, @@@ too slow?
-        for case in self.cases.all():
-            case.set_latest_version()
+            update_instance._snapshot(
+                [ProductVersion._meta.get_field(n) for n in ["order", "latest"]])
+
+        return (
+            len(changed),
+            self.cases.model.set_product_latest_versions(self.id),
+            )
 
 
 
@@ -96,19 +134,27 @@ class ProductVersion(MTModel, TeamModel, HasEnvironmentsModel):
         skip_reorder = kwargs.pop("skip_reorder", False)
         super(ProductVersion, self).save(*args, **kwargs)
         if not skip_reorder:
-            self.product.reorder_versions(update_instance=self)
+            self._reorder(update_instance=self)
 
 
     def delete(self, *args, **kwargs):
         """Delete productversion, updating latest version."""
         super(ProductVersion, self).delete(*args, **kwargs)
-        self.product.reorder_versions()
+        self._reorder()
 
 
     def undelete(self, *args, **kwargs):
         """Undelete productversion, updating latest version."""
         super(ProductVersion, self).undelete(*args, **kwargs)
-        self.product.reorder_versions()
+        self._reorder()
+
+
+    def _reorder(self, update_instance=None):
+        """Reorder versions of the product, or record it if deferring."""
+        if deferring() is not None:
+            deferring().add_product(self.product_id, update_instance)
+        else:
+            self.product.reorder_versions(update_instance=update_instance)
 
 
     def clean(self):
@@ -0,0 +1,175 @@
+"""
+Deferred maintenance of denormalized data, for bulk operations.
+
+Some data is denormalized and kept up to date as each object is saved: the
+``order`` and ``latest`` flag of product versions
+(``Product.reorder_versions``), the ``latest`` flag of caseversions
+(``Case.set_latest_version``), and the latest-result pointers and rollups of
+results (``LatestResult`` and ``ResultRollup``). Within
+``deferred_denormalization()``, saves only record what they affect, and it is
+all recomputed set-based on exit::
+
+    with deferred_denormalization():
+        for data in cases:
+            CaseVersion.objects.create(**data)
+
+Until then, denormalized data of the objects saved is stale. The saved
+caseversion and product version instances themselves are kept, and their
+``latest`` flags (and ``order``), and ``cc_version``, are reloaded on exit;
+so they can be saved again afterwards, but not within the block.
+
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import threading
+
+
+
+# number of cases or runcaseversions recomputed at a time
+BATCH_SIZE = 500
+
+_state = threading.local()
+
+
+
+def deferring():
+    """Return the ``Pending`` changes being deferred, or None."""
+    return getattr(_state, "pending", None)
+
+
+
+@contextmanager
+def deferred_denormalization():
+    """
+    Defer maintenance of denormalized data until the end of the block.
+
+    Yields the ``Pending`` changes being recorded. Nested blocks are part of
+    the outermost one. If the block raises an exception, nothing is
+    recomputed (the changes are presumably being rolled back).
+
+    """
+    pending = deferring()
+    if pending is not None:
+        yield pending
+        return
+
+    pending = _state.pending = Pending()
+    try:
+        yield pending
+    finally:
+        _state.pending = None
+    pending.apply()
+
+
+
+class Pending(object):
+    """Denormalized data to recompute, recorded by saves while deferring."""
+    def __init__(self):
+        # ids of products whose versions need reordering
+        self.product_ids = set()
+        # ids of cases whose latest version needs marking
+        self.case_ids = set()
+        # ids of runcaseversions and environments with new or changed results
+        self.runcaseversion_ids = set()
+        self.environment_ids = set()
+        # saved instances, with names of their fields to reload on apply
+        self.instances = defaultdict(list)
+
+
+    def add_product(self, product_id, productversion=None):
+        """
+        Record that versions of a product were added or changed.
+
+        If the saved ``productversion`` is given, its ``order``, ``latest``
+        flag and ``cc_version`` are reloaded once recomputed.
+
+        """
+        self.product_ids.add(product_id)
+        if productversion is not None:
+            self.instances[("order", "latest")].append(productversion)
+
+
+    def add_cases(self, case_ids, caseversions=()):
+        """
+        Record that versions of given cases were added or changed.
+
+        The ``latest`` flag and ``cc_version`` of given saved
+        ``caseversions`` are reloaded once recomputed.
+
+        """
+        self.case_ids.update(case_ids)
+        self.instances[("latest",)].extend(caseversions)
+
+
+    def add_result(self, result):
+        """Record that a result was added or changed."""
+        self.runcaseversion_ids.add(result.runcaseversion_id)
+        self.environment_ids.add(result.environment_id)
+
+
+    def apply(self):
+        """
+        Recompute all recorded denormalized data, set-based.
+
+        Products are reordered one at a time (which also marks the latest
+        versions of all their cases); other cases and runcaseversions are
+        recomputed in batches.
+
+        """
+        from .core.models import Product
+        from .execution.models import (
+            LatestResult, ResultRollup, RunCaseVersion)
+        from .library.models import Case
+
+        for product in Product.everything.filter(id__in=self.product_ids):
+            product.reorder_versions()
+
+        case_ids = sorted(self.case_ids)
+        for i in range(0, len(case_ids), BATCH_SIZE):
+            batch = case_ids[i:i + BATCH_SIZE]
+            if self.product_ids:
+                # cases of reordered products are already done
+                batch = list(
+                    Case.everything.filter(id__in=batch).exclude(
+                        product__in=self.product_ids).values_list(
+                        "id", flat=True)
+                    )
+            if batch:
+                Case.set_latest_versions(batch)
+
+        rcv_ids = sorted(self.runcaseversion_ids)
+        for i in range(0, len(rcv_ids), BATCH_SIZE):
+            batch = rcv_ids[i:i + BATCH_SIZE]
+            LatestResult.objects.rebuild(batch)
+            ResultRollup.objects.refresh(
+                RunCaseVersion.everything.filter(id__in=batch),
+                self.environment_ids,
+                )
+
+        self.reload_instances()
+
+
+    def reload_instances(self):
+        """
+        Reload recomputed fields, and ``cc_version``, of recorded instances.
+
+        The recomputing bumps ``cc_version`` in the database, so without this
+        saving one of the instances again would raise ``ConcurrencyError``.
+
+        """
+        for names, instances in self.instances.items():
+            by_model = defaultdict(dict)
+            for obj in instances:
+                by_model[obj.__class__].setdefault(obj.id, []).append(obj)
+            for model, by_id in by_model.items():
+                fields = [model._meta.get_field(n) for n in names]
+                ids = sorted(by_id)
+                for i in range(0, len(ids), BATCH_SIZE):
+                    for row in model.everything.filter(
+                            id__in=ids[i:i + BATCH_SIZE]).values_list(
+                            "id", "cc_version", *names):
+                        for obj in by_id[row[0]]:
+                            obj.cc_version = row[1]
+                            for name, value in zip(names, row[2:]):
+                                setattr(obj, name, value)
+                            obj._snapshot(fields)
@@ -0,0 +1,96 @@
+"""
+Covering arrays: small sets of combinations covering all n-wise interactions.
+
+Given some groups of values (e.g. environment elements by category), the full
+Cartesian product has one combination per way of picking a value from each
+group, which grows exponentially with the number of groups. A covering array
+of strength ``t`` instead only guarantees that every combination of values
+from any ``t`` groups (every pair, for ``t=2``) appears in at least one of its
+combinations, which usually takes orders of magnitude fewer combinations.
+
+Generated with the (deterministic) IPOG strategy: build the full product of
+the first ``t`` groups, then add one group at a time, first extending the
+existing combinations with the value covering the most new interactions and
+then adding combinations for the interactions still left uncovered.
+
+"""
+import itertools
+
+
+
+def covering_array(groups, strength=2):
+    """
+    Return list of combinations covering all ``strength``-wise interactions.
+
+    ``groups`` is a list of lists of values; each returned combination is a
+    tuple with one value from each group, in the same order as ``groups``.
+    If there are no more groups than ``strength``, the full Cartesian product
+    is returned.
+
+    """
+    if strength < 1:
+        raise ValueError("Strength must be at least 1.")
+    groups = [list(g) for g in groups]
+    if any(not g for g in groups):
+        return []
+    if len(groups) <= strength:
+        return list(itertools.product(*groups))
+
+    # larger groups first gives smaller arrays; rows hold value indices
+    order = sorted(
+        range(len(groups)), key=lambda i: (-len(groups[i]), i))
+    sizes = [len(groups[i]) for i in order]
+
+    rows = [
+        list(row) + [None] * (len(sizes) - strength)
+        for row in itertools.product(*[range(s) for s in sizes[:strength]])
+        ]
+
+    for col in range(strength, len(sizes)):
+        others = list(itertools.combinations(range(col), strength - 1))
+        uncovered = set()
+        for cols in others:
+            for values in itertools.product(*[range(sizes[c]) for c in cols]):
+                for value in range(sizes[col]):
+                    uncovered.add((cols, values + (value,)))
+
+        # horizontal growth: extend each row with its best value
+        for row in rows:
+            best, best_covered = None, []
+            for value in range(sizes[col]):
+                covered = []
+                for cols in others:
+                    values = tuple(row[c] for c in cols)
+                    if None in values:
+                        continue
+                    key = (cols, values + (value,))
+                    if key in uncovered:
+                        covered.append(key)
+                if len(covered) > len(best_covered):
+                    best, best_covered = value, covered
+            row[col] = best
+            uncovered.difference_update(best_covered)
+
+        # vertical growth: fit each uncovered interaction into a row whose
+        # values are compatible (or unset), else add a row for it
+        for cols, values in sorted(uncovered):
+            positions = cols + (col,)
+            for row in rows:
+                if all(row[p] is None or row[p] == v
+                       for p, v in zip(positions, values)):
+                    break
+            else:
+                row = [None] * len(sizes)
+                rows.append(row)
+            for p, v in zip(positions, values):
+                row[p] = v
+
+    combinations = []
+    for row in rows:
+        combination = [None] * len(groups)
+        for position, group_index in enumerate(order):
+            # values still unset don't matter; use the first one
+            value = row[position] if row[position] is not None else 0
+            combination[group_index] = groups[group_index][value]
+        combinations.append(tuple(combination))
+    return combinations
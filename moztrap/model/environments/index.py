@@ -0,0 +1,220 @@
+"""
+Cached per-run environment indexes, for selecting an environment to test in.
+
+Selecting an environment means finding the environment whose elements are all
+among the selected elements. Rather than scanning every environment of the run
+on each request, an ``EnvironmentIndex`` holds the category/element choices
+and an element id -> environment ids inverted index, and is cached per run.
+
+Cached indexes of a run are invalidated when the run's environments change
+(see ``invalidate_run``); any change to environments, elements or categories
+themselves, including (un)deletes, invalidates all cached indexes (see
+``invalidate_all``). Cached environment labels (see
+``Environment.element_names``) share that versioning.
+
+Invalidation must reach every process, so nothing is cached unless the cache
+backend is shared by all of them (see ``enabled``).
+
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+
+# seconds cached data is kept; changes we can't see (e.g. queryset
+# soft-deletes) are picked up at the latest after this long
+CACHE_TIMEOUT = 60 * 60
+
+GENERATION_KEY = "moztrap-envindex-generation"
+
+
+
+def enabled():
+    """
+    Return True if environment indexes and labels are cached.
+
+    The ``CACHE_ENVIRONMENTS`` setting turns caching on or off; by default it
+    is on unless the cache backend is local-memory, which is per-process.
+
+    """
+    setting = getattr(settings, "CACHE_ENVIRONMENTS", None)
+    if setting is not None:
+        return setting
+    return not isinstance(cache, LocMemCache)
+
+
+
+def _generation():
+    """
+    Return current generation of cached indexes and labels.
+
+    A lost generation restarts from the current time, so it never goes back
+    to a generation that may still have cached indexes.
+
+    """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, int(time.time()), CACHE_TIMEOUT)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def cache_keys(kind, obj_ids):
+    """Return list of current cache keys of ``kind`` data for ``obj_ids``."""
+    generation = _generation()
+    return [
+        "moztrap-env{0}-{1}-{2}".format(kind, generation, obj_id)
+        for obj_id in obj_ids
+        ]
+
+
+
+def invalidate_run(*run_ids):
+    """Discard cached indexes of runs with given ids."""
+    if enabled():
+        cache.delete_many(cache_keys("index", run_ids))
+
+
+
+def invalidate_all():
+    """Discard all cached indexes and environment labels."""
+    if not enabled():
+        return
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, int(time.time()), CACHE_TIMEOUT)
+
+
+
+class EnvironmentIndex(object):
+    """
+    Category/element choices and element matching for a set of environments.
+
+    Only holds plain ids and names, so it can be pickled for caching.
+
+    """
+    def __init__(self, rows):
+        """
+        Build index from ``rows`` of environment/element links.
+
+        Each row is a tuple (environment id, element id, element name,
+        category id, category name).
+
+        """
+        # list of (category id, category name), ordered by name
+        self.categories = []
+
+        # maps category id to list of (element id, element name) by name
+        self.choices = {}
+
+        # maps element id to category id
+        self.category_by_element = {}
+
+        # maps environment ID to list of element IDs, ordered by category
+        self.elementids_by_envid = {}
+
+        # maps element id to set of ids of environments including it
+        self.envids_by_element = defaultdict(set)
+
+        elements_by_envid = defaultdict(set)
+        elements_by_category = defaultdict(set)
+        category_names = {}
+        for env_id, el_id, el_name, cat_id, cat_name in rows:
+            elements_by_envid[env_id].add(el_id)
+            elements_by_category[cat_id].add((el_id, el_name))
+            category_names[cat_id] = cat_name
+            self.category_by_element[el_id] = cat_id
+            self.envids_by_element[el_id].add(env_id)
+        self.envids_by_element = dict(self.envids_by_element)
+
+        self.categories = sorted(
+            category_names.items(), key=lambda c: (c[1], c[0]))
+        for cat_id, elements in elements_by_category.items():
+            self.choices[cat_id] = sorted(elements, key=lambda e: (e[1], e[0]))
+
+        # maps environment id to its number of elements
+        self.element_counts = {}
+
+        # maps frozenset of element ids to id of environment with them
+        self.envid_by_elements = {}
+
+        positions = dict(
+            (cat_id, i) for i, (cat_id, name) in enumerate(self.categories))
+        for env_id, element_ids in elements_by_envid.items():
+            byenv = [None] * len(self.categories)
+            for el_id in element_ids:
+                byenv[positions[self.category_by_element[el_id]]] = el_id
+            self.elementids_by_envid[env_id] = byenv
+            self.element_counts[env_id] = len(element_ids)
+            self.envid_by_elements.setdefault(
+                frozenset(element_ids), env_id)
+
+
+    @classmethod
+    def for_environments(cls, environments):
+        """Build (uncached) index of given environments queryset."""
+        from .models import Environment
+        return cls(
+            Environment.elements.through.objects.filter(
+                environment__in=environments).values_list(
+                "environment_id",
+                "element_id",
+                "element__name",
+                "element__category_id",
+                "element__category__name",
+                )
+            )
+
+
+    @classmethod
+    def for_run(cls, run):
+        """Return (cached) index of the environments of ``run``."""
+        if not enabled():
+            return cls.for_environments(run.environments.all())
+        key = cache_keys("index", [run.id])[0]
+        index = cache.get(key)
+        if index is None:
+            index = cls.for_environments(run.environments.all())
+            cache.set(key, index, CACHE_TIMEOUT)
+        return index
+
+
+    def match(self, element_ids):
+        """
+        Return id of an environment whose elements are all in ``element_ids``.
+
+        An environment with exactly the given elements is preferred; otherwise
+        the one with the most elements wins (lowest id among equals). Returns
+        None if there is no such environment.
+
+        """
+        element_ids = frozenset(element_ids)
+        exact = self.envid_by_elements.get(element_ids)
+        if exact is not None:
+            return exact
+
+        found = defaultdict(int)
+        for el_id in element_ids:
+            for env_id in self.envids_by_element.get(el_id, ()):
+                found[env_id] += 1
+        matches = [
+            (-count, env_id) for env_id, count in found.items()
+            if count == self.element_counts[env_id]
+            ]
+        if not matches:
+            return None
+        return min(matches)[1]
+
+
+    def elements_of(self, env_id):
+        """Return list of (category id, element id) of given environment."""
+        return [
+            (self.category_by_element[el_id], el_id)
+            for el_id in self.elementids_by_envid.get(env_id, [])
+            if el_id is not None
+            ]
@@ -0,0 +1,211 @@
+"""
+Benchmark cascading environment additions and removals.
+
+Compares the set-based cascade of ``HasEnvironmentsModel.add_envs`` and
+``remove_envs`` with the previous approaches: adding environments one object
+at a time, and removing them with a collecting ``QuerySet.delete()`` per
+level. Builds a synthetic product version in a transaction that is rolled back
+afterwards, so nothing is left in the database.
+
+"""
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from moztrap.model.core.models import Product, ProductVersion
+from moztrap.model.environments.models import Environment
+from moztrap.model.execution.models import Run
+from moztrap.model.library.models import Case, CaseVersion
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Time set-based vs. per-object cascading of environment changes "
+        "on a synthetic product version (rolled back afterwards).")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--cases",
+            type="int",
+            dest="cases",
+            default=5000,
+            help="Number of caseversions (default 5000)"),
+        make_option(
+            "--runs",
+            type="int",
+            dest="runs",
+            default=10,
+            help="Number of draft runs of the product version (default 10)"),
+        make_option(
+            "--envs",
+            type="int",
+            dest="envs",
+            default=10,
+            help="Number of environments (default 10)"),
+        )
+
+
+    def handle(self, *args, **options):
+        if (args or options["cases"] < 1 or options["runs"] < 0
+                or options["envs"] < 2):
+            raise CommandError(
+                "Usage: [--cases <n>] [--runs <n>] [--envs <n>] "
+                "(at least 1 case, 2 envs)")
+
+        with transaction.commit_manually():
+            try:
+                pv, envs = build_productversion(
+                    options["cases"], options["runs"], options["envs"])
+                timings = []
+                for action, env, funcs in [
+                        ("add", envs[0], [
+                            ("per object", per_object_add_envs),
+                            ("set-based", set_based_add_envs),
+                            ]),
+                        ("remove", envs[1], [
+                            ("collected", collected_remove_envs),
+                            ("set-based", set_based_remove_envs),
+                            ]),
+                        ]:
+                    results = []
+                    for label, func in funcs:
+                        sid = transaction.savepoint()
+                        start = time.time()
+                        func(pv, env)
+                        timings.append(
+                            (
+                                "{0} ({1})".format(action, label),
+                                time.time() - start,
+                                )
+                            )
+                        results.append(environment_links(pv))
+                        transaction.savepoint_rollback(sid)
+                    if results[0] != results[1]:
+                        raise CommandError(
+                            "Results of {0} approaches differ.".format(action))
+            finally:
+                transaction.rollback()
+
+        self.stdout.write(
+            "{0} caseversions, {1} runs, {2} environments:\n".format(
+                options["cases"], options["runs"], options["envs"]))
+        for label, seconds in timings:
+            self.stdout.write("  {0}: {1:.3f}s\n".format(label, seconds))
+
+
+
+def build_productversion(num_cases, num_runs, num_envs):
+    """
+    Create a product version with caseversions and draft runs.
+
+    Returns the product version and a list of ``num_envs`` environments; the
+    product version, its caseversions and runs have all but the first one.
+
+    """
+    product = Product.objects.create(name="benchmark")
+    pv = ProductVersion.objects.create(product=product, version="1")
+    Environment.objects.bulk_create(
+        [Environment() for i in range(num_envs)])
+    envs = list(Environment.objects.order_by("-id")[:num_envs])
+    ProductVersion.environments.through.objects.bulk_create(
+        [
+            ProductVersion.environments.through(
+                productversion_id=pv.id, environment_id=env.id)
+            for env in envs[1:]
+            ]
+        )
+
+    Case.objects.bulk_create([Case(product=product) for i in range(num_cases)])
+    case_ids = Case.objects.filter(
+        product=product).values_list("id", flat=True)
+    CaseVersion.objects.bulk_create(
+        [
+            CaseVersion(productversion=pv, case_id=case_id, name="benchmark")
+            for case_id in case_ids
+            ]
+        )
+    CaseVersion.environments.through.objects.bulk_create(
+        [
+            CaseVersion.environments.through(
+                caseversion_id=cv_id, environment_id=env.id)
+            for cv_id in CaseVersion.objects.filter(
+                productversion=pv).values_list("id", flat=True)
+            for env in envs[1:]
+            ]
+        )
+
+    for i in range(num_runs):
+        Run.objects.create(productversion=pv, name="benchmark")
+
+    return pv, envs
+
+
+
+def environment_links(pv):
+    """Return set of (model name, id, env id) links in and under ``pv``."""
+    links = set(
+        ("productversion", pv.id, env_id)
+        for env_id in pv.environments.values_list("id", flat=True)
+        )
+    for name, model in [("caseversion", CaseVersion), ("run", Run)]:
+        links.update(
+            (name, obj_id, env_id)
+            for obj_id, env_id in model.environments.through.objects.filter(
+                **{"{0}__productversion".format(name): pv}).values_list(
+                "{0}_id".format(name), "environment_id")
+            )
+    return links
+
+
+
+def set_based_add_envs(pv, env):
+    """Add ``env`` to ``pv``, cascading the way ``add_envs`` does."""
+    pv.add_envs(env)
+
+
+
+def set_based_remove_envs(pv, env):
+    """Remove ``env`` from ``pv``, cascading the way ``remove_envs`` does."""
+    pv.remove_envs(env)
+
+
+
+def per_object_add_envs(obj, env):
+    """
+    Add ``env`` to ``obj`` and cascade one object at a time.
+
+    This is how ``HasEnvironmentsModel.add_envs`` used to work; kept here for
+    comparison.
+
+    """
+    obj.environments.add(env)
+    for model, instances in obj.cascade_envs_to([obj], adding=True).items():
+        for instance in instances:
+            per_object_add_envs(instance, env)
+
+
+
+def collected_remove_envs(pv, env):
+    """
+    Remove ``env`` from ``pv`` and cascade with collecting deletes.
+
+    This is how ``HasEnvironmentsModel._remove_envs`` used to delete links
+    (runcaseversion rollups aside); kept here for comparison.
+
+    """
+    def remove(cls, objs):
+        cascade = cls.cascade_envs_to(objs, adding=False)
+        for model, instances in cascade.items():
+            remove(model, instances)
+        cls.environments.through._base_manager.filter(
+            **{
+                "{0}__in".format(
+                    cls.environments.field.related_query_name()): objs,
+                "environment": env,
+                }
+            ).delete()
+
+    remove(ProductVersion, [pv])
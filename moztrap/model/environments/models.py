@@ -2,12 +2,38 @@
 Models for environments.
 
 """
+import hashlib
 import itertools
 from collections import defaultdict
 
-from django.db import models
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models.query import QuerySet
+from django.db.models.sql import DeleteQuery
+from django.db.models.signals import m2m_changed
 
-from ..mtmodel import MTModel
+from ..mtmodel import MTModel, MTManager, MTQuerySet, utcnow
+from .combinations import covering_array
+from . import index as envindex
+
+
+
+# number of environments / element links inserted, or of objects linked to
+# environments, per query
+BATCH_SIZE = 500
+
+
+
+def element_signature(element_ids):
+    """
+    Return canonical signature of the set of elements with ``element_ids``.
+
+    The signature is a SHA-1 hex digest of the sorted, comma-separated element
+    ids, so environments with the same elements have the same signature.
+
+    """
+    ids = sorted(set(int(i) for i in element_ids))
+    return hashlib.sha1(",".join(str(i) for i in ids)).hexdigest()
 
 
 
@@ -35,20 +61,85 @@ class Profile(MTModel):
         Elements are split by category, and then an environment is generated
         for each combination of one element from each category.
 
+        With a ``strength`` keyword argument ``t`` (2 for pairwise, 3 for
+        3-wise), only enough environments are generated to cover every
+        combination of elements from any ``t`` categories (see
+        ``combinations.covering_array``).
+
         """
+        strength = kwargs.pop("strength", None)
         by_category = defaultdict(list)
         for element in elements:
-            by_category[element.category].append(element)
+            by_category[element.category_id].append(element.id)
+        groups = [by_category[c] for c in sorted(by_category)]
 
-        new = cls.objects.create(name=name, **kwargs)
+        if strength:
+            element_id_lists = covering_array(groups, strength)
+        else:
+            element_id_lists = itertools.product(*groups)
 
-        for element_list in itertools.product(*by_category.values()):
-            e = Environment.objects.create(profile=new)
-            e.elements.add(*element_list)
+        new = cls.objects.create(name=name, **kwargs)
+        new.add_environments(element_id_lists, kwargs.get("user"))
 
         return new
 
 
+    def add_environments(self, element_id_lists, user=None):
+        """
+        Add an environment for each given list of element ids, in bulk.
+
+        Environments and their element links are inserted in batches of
+        ``BATCH_SIZE`` rows, rather than a few queries per environment. Lists
+        with the same elements as one before them, or as an environment
+        already in this profile, are skipped. Returns the number of
+        environments added.
+
+        """
+        existing = set(
+            self.environments.values_list("signature", flat=True))
+        elements_by_signature = {}
+        for element_ids in element_id_lists:
+            signature = element_signature(element_ids)
+            if signature not in existing:
+                elements_by_signature.setdefault(
+                    signature, sorted(set(element_ids)))
+
+        now = utcnow()
+        signatures = list(elements_by_signature)
+        for i in range(0, len(signatures), BATCH_SIZE):
+            Environment.objects.bulk_create(
+                [
+                    Environment(
+                        profile=self,
+                        signature=signature,
+                        created_by=user,
+                        created_on=now,
+                        modified_by=user,
+                        modified_on=now,
+                        )
+                    for signature in signatures[i:i + BATCH_SIZE]
+                    ]
+                )
+
+        # signatures of environments already in the profile were skipped
+        env_ids = dict(
+            (signature, env_id) for signature, env_id
+            in self.environments.values_list("signature", "id")
+            if signature in elements_by_signature
+            )
+        links = [
+            Environment.elements.through(
+                environment_id=env_ids[signature], element_id=element_id)
+            for signature in signatures
+            for element_id in elements_by_signature[signature]
+            ]
+        for i in range(0, len(links), BATCH_SIZE):
+            Environment.elements.through.objects.bulk_create(
+                links[i:i + BATCH_SIZE])
+
+        return len(signatures)
+
+
     def clone(self, *args, **kwargs):
         """Clone profile, with environments."""
         kwargs.setdefault("cascade", ["environments"])
@@ -64,6 +155,96 @@ class Profile(MTModel):
 
 
 
+class InUseQuerySet(MTQuerySet):
+    """
+    An ``MTQuerySet`` whose objects can't be deleted while in use.
+
+    Subclasses define ``_in_use_sql`` and ``in_use_by``.
+
+    """
+    def with_in_use(self):
+        """
+        Annotate each object with the number of objects using it.
+
+        The value is selected as ``in_use_count``; the ``deletable`` property
+        of annotated objects uses it instead of querying.
+
+        """
+        return self.extra(select={"in_use_count": self._in_use_sql()})
+
+
+    def _in_use_sql(self):
+        """Return SQL subquery counting (undeleted) users of an object."""
+        raise NotImplementedError
+
+
+    def in_use_by(self):
+        """Return queryset of (undeleted) objects using any of these."""
+        raise NotImplementedError
+
+
+    def _ids(self):
+        """Return ids of these objects, for use as a subquery."""
+        return self.values("id")
+
+
+    def delete(self, *args, **kwargs):
+        """Delete objects, or raise ProtectedError if any of them is in use."""
+        users = self.in_use_by()
+        if users.exists():
+            raise models.ProtectedError(
+                "{0} in use cannot be deleted.".format(
+                    unicode(self.model._meta.verbose_name_plural).capitalize()),
+                list(users)
+                )
+        return super(InUseQuerySet, self).delete(*args, **kwargs)
+
+
+
+class InUseManager(MTManager):
+    """An ``MTManager`` using an ``InUseQuerySet``."""
+    def with_in_use(self):
+        """Return queryset annotated with in-use counts."""
+        return self.get_query_set().with_in_use()
+
+
+
+def _q(name):
+    """Quote table or column ``name`` for SQL."""
+    return connection.ops.quote_name(name)
+
+
+
+class CategoryQuerySet(InUseQuerySet):
+    """Categories are in use if an environment includes their elements."""
+    def _in_use_sql(self):
+        """Count environments including an element of a category."""
+        return (
+            "SELECT COUNT(DISTINCT ee.environment_id) FROM {links} ee "
+            "INNER JOIN {elements} el ON el.id = ee.element_id "
+            "INNER JOIN {envs} env ON env.id = ee.environment_id "
+            "WHERE el.category_id = {table}.id AND env.deleted_on IS NULL"
+            ).format(
+            links=_q(Environment.elements.through._meta.db_table),
+            elements=_q(Element._meta.db_table),
+            envs=_q(Environment._meta.db_table),
+            table=_q(self.model._meta.db_table),
+            )
+
+
+    def in_use_by(self):
+        """Return queryset of environments including elements of these."""
+        return Environment.objects.filter(
+            elements__category__in=self._ids()).distinct()
+
+
+
+class CategoryManager(InUseManager):
+    """An ``MTManager`` using ``CategoryQuerySet``."""
+    queryset_class = CategoryQuerySet
+
+
+
 class Category(MTModel):
     """
     A category of parallel environment elements.
@@ -74,6 +255,9 @@ class Category(MTModel):
     """
     name = models.CharField(max_length=200)
 
+    everything = CategoryManager(show_deleted=True)
+    objects = CategoryManager(show_deleted=False)
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -85,14 +269,35 @@ class Category(MTModel):
         verbose_name_plural = "categories"
 
 
-    # @@@ there should be some way to annotate this onto a queryset efficiently
+    def save(self, *args, **kwargs):
+        """Save category; cached environment indexes include its name."""
+        ret = super(Category, self).save(*args, **kwargs)
+        envindex.invalidate_all()
+        return ret
+
+
+    @classmethod
+    def bulk_deleted(cls, queryset):
+        """Discard cached environment indexes, which include categories."""
+        envindex.invalidate_all()
+
+
+    bulk_undeleted = bulk_deleted
+
+
     @property
     def deletable(self):
-        """Return True if this category can be deleted, otherwise False."""
+        """
+        Return True if this category can be deleted, otherwise False.
+
+        Uses the in-use count annotated by ``with_in_use()``, if present.
+
+        """
+        if getattr(self, "in_use_count", None) is not None:
+            return not self.in_use_count
         return not Environment.objects.filter(elements__category=self).exists()
 
 
-    # @@@ this protection should apply to queryset.delete as well
     def delete(self, *args, **kwargs):
         """Delete this category, or raise ProtectedError if its in use."""
         if not self.deletable:
@@ -105,6 +310,33 @@ class Category(MTModel):
 
 
 
+class ElementQuerySet(InUseQuerySet):
+    """Elements are in use if an environment includes them."""
+    def _in_use_sql(self):
+        """Count environments including an element."""
+        return (
+            "SELECT COUNT(*) FROM {links} ee "
+            "INNER JOIN {envs} env ON env.id = ee.environment_id "
+            "WHERE ee.element_id = {table}.id AND env.deleted_on IS NULL"
+            ).format(
+            links=_q(Environment.elements.through._meta.db_table),
+            envs=_q(Environment._meta.db_table),
+            table=_q(self.model._meta.db_table),
+            )
+
+
+    def in_use_by(self):
+        """Return queryset of environments including these elements."""
+        return Environment.objects.filter(elements__in=self._ids()).distinct()
+
+
+
+class ElementManager(InUseManager):
+    """An ``MTManager`` using ``ElementQuerySet``."""
+    queryset_class = ElementQuerySet
+
+
+
 class Element(MTModel):
     """
     An individual environment factor (e.g. "OS X" or "English").
@@ -113,6 +345,9 @@ class Element(MTModel):
     name = models.CharField(max_length=200)
     category = models.ForeignKey(Category, related_name="elements")
 
+    everything = ElementManager(show_deleted=True)
+    objects = ElementManager(show_deleted=False)
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -123,14 +358,35 @@ class Element(MTModel):
         ordering = ["name"]
 
 
-    # @@@ there should be some way to annotate this onto a queryset efficiently
+    def save(self, *args, **kwargs):
+        """Save element; cached environment indexes include its name."""
+        ret = super(Element, self).save(*args, **kwargs)
+        envindex.invalidate_all()
+        return ret
+
+
+    @classmethod
+    def bulk_deleted(cls, queryset):
+        """Discard cached environment indexes, which include elements."""
+        envindex.invalidate_all()
+
+
+    bulk_undeleted = bulk_deleted
+
+
     @property
     def deletable(self):
-        """Return True if this element can be deleted, otherwise False."""
+        """
+        Return True if this element can be deleted, otherwise False.
+
+        Uses the in-use count annotated by ``with_in_use()``, if present.
+
+        """
+        if getattr(self, "in_use_count", None) is not None:
+            return not self.in_use_count
         return not self.environments.exists()
 
 
-    # @@@ this protection should apply to queryset.delete as well
     def delete(self, *args, **kwargs):
         """Delete this element, or raise ProtectedError if its in use."""
         if not self.deletable:
@@ -143,6 +399,77 @@ class Element(MTModel):
 
 
 
+class EnvironmentQuerySet(InUseQuerySet):
+    """
+    Environments are in use if a product version includes them.
+
+    Can also batch-load environment labels.
+
+    """
+    _with_labels = False
+
+
+    def with_labels(self):
+        """
+        Prefetch element names (labels) of environments when evaluated.
+
+        Whatever slice of the queryset is evaluated gets its labels from the
+        cache, and those not cached in one query; see ``prefetch_labels``.
+
+        """
+        clone = self._clone()
+        clone._with_labels = True
+        return clone
+
+
+    def _clone(self, *args, **kwargs):
+        """Clone queryset, preserving the prefetch flag."""
+        clone = super(EnvironmentQuerySet, self)._clone(*args, **kwargs)
+        clone._with_labels = self._with_labels
+        return clone
+
+
+    def iterator(self):
+        """Iterate over objects, prefetching labels if requested."""
+        objs = super(EnvironmentQuerySet, self).iterator()
+        if self._with_labels:
+            objs = prefetch_labels(objs)
+        return iter(objs)
+
+
+    def _in_use_sql(self):
+        """Count product versions including an environment."""
+        from moztrap.model import ProductVersion
+        return (
+            "SELECT COUNT(*) FROM {links} pe "
+            "INNER JOIN {pvs} pv ON pv.id = pe.productversion_id "
+            "WHERE pe.environment_id = {table}.id AND pv.deleted_on IS NULL"
+            ).format(
+            links=_q(ProductVersion.environments.through._meta.db_table),
+            pvs=_q(ProductVersion._meta.db_table),
+            table=_q(self.model._meta.db_table),
+            )
+
+
+    def in_use_by(self):
+        """Return queryset of product versions including these environments."""
+        from moztrap.model import ProductVersion
+        return ProductVersion.objects.filter(
+            environments__in=self._ids()).distinct()
+
+
+
+class EnvironmentManager(InUseManager):
+    """An ``MTManager`` using ``EnvironmentQuerySet``."""
+    queryset_class = EnvironmentQuerySet
+
+
+    def with_labels(self):
+        """Return queryset that prefetches labels when evaluated."""
+        return self.get_query_set().with_labels()
+
+
+
 class Environment(MTModel):
     """
     A collection of elements representing a testing environment.
@@ -158,13 +485,19 @@ class Environment(MTModel):
     """
     profile = models.ForeignKey(
         Profile, blank=True, null=True, related_name="environments")
+    # element_signature() of elements; kept up to date on element changes
+    signature = models.CharField(
+        max_length=40, db_index=True, blank=True, editable=False)
 
     elements = models.ManyToManyField(Element, related_name="environments")
 
+    everything = EnvironmentManager(show_deleted=True)
+    objects = EnvironmentManager(show_deleted=False)
+
 
     def __unicode__(self):
         """Return unicode representation."""
-        return u", ".join(unicode(e) for e in self.ordered_elements())
+        return u", ".join(self.element_names())
 
 
     class Meta:
@@ -181,21 +514,86 @@ class Environment(MTModel):
         return iter(self.elements.order_by("category__name"))
 
 
+    def element_names(self):
+        """
+        Return list of names of elements, in category name order.
+
+        Names are prefetched by ``EnvironmentQuerySet.with_labels``, or come
+        from the cache, which is invalidated when elements or categories are
+        renamed or elements of environments change.
+
+        """
+        if self.id is None:
+            return []
+        try:
+            return self._element_names
+        except AttributeError:
+            prefetch_labels([self])
+            return self._element_names
+
+
+    @classmethod
+    def update_signatures(cls, env_ids):
+        """
+        Recompute stored element signatures of given environments.
+
+        Signatures are derived data, so updating them isn't a modification of
+        the environment (and doesn't bump its concurrency-control version).
+        Returns dictionary mapping environment id to new signature.
+
+        Signatures are read and written in batches of environments, with one
+        ``UPDATE ... CASE id`` statement per batch.
+
+        """
+        env_ids = list(set(env_ids))
+        signatures = {}
+        # three query parameters per environment
+        batch_size = BATCH_SIZE // 3
+        cursor = connection.cursor()
+        for i in range(0, len(env_ids), batch_size):
+            batch = env_ids[i:i + batch_size]
+            element_ids = dict((env_id, []) for env_id in batch)
+            for env_id, element_id in cls.elements.through.objects.filter(
+                    environment__in=batch).values_list(
+                    "environment_id", "element_id"):
+                element_ids[env_id].append(element_id)
+            for env_id, ids in element_ids.items():
+                signatures[env_id] = element_signature(ids)
+            cursor.execute(
+                "UPDATE {table} SET signature = CASE id {when} END "
+                "WHERE id IN ({ids})".format(
+                    table=_q(cls._meta.db_table),
+                    when=" ".join(["WHEN %s THEN %s"] * len(batch)),
+                    ids=",".join(["%s"] * len(batch)),
+                    ),
+                [x for env_id in batch for x in (env_id, signatures[env_id])]
+                + batch
+                )
+        if env_ids:
+            transaction.commit_unless_managed()
+        return signatures
+
+
     def clone(self, *args, **kwargs):
         """Clone environment, including element relationships."""
         kwargs.setdefault("cascade", ["elements"])
         return super(Environment, self).clone(*args, **kwargs)
 
 
-    # @@@ there should be some way to annotate this onto a queryset efficiently
     @property
     def deletable(self):
-        """Return True if this environment can be deleted, otherwise False."""
+        """
+        Return True if this environment can be deleted, otherwise False.
+
+        Uses the in-use count annotated by ``with_in_use()``, if present.
+
+        """
+        if getattr(self, "in_use_count", None) is not None:
+            return not self.in_use_count
         from moztrap.model import ProductVersion
         return not ProductVersion.objects.filter(environments=self).exists()
 
 
-    # @@@ this protection should apply to queryset.delete as well
     def delete(self, *args, **kwargs):
         """Delete this environment, or raise ProtectedError if its in use."""
         if not self.deletable:
@@ -208,6 +606,15 @@ class Environment(MTModel):
         return super(Environment, self).delete(*args, **kwargs)
 
 
+    @classmethod
+    def bulk_deleted(cls, queryset):
+        """Discard cached environment indexes, which include environments."""
+        envindex.invalidate_all()
+
+
+    bulk_undeleted = bulk_deleted
+
+
     def remove_from_profile(self, user=None):
         """Remove environment from its profile and delete it if not in use."""
         if self.deletable:
@@ -218,6 +625,81 @@ class Environment(MTModel):
 
 
 
+def prefetch_labels(environments):
+    """
+    Set element names (labels) on ``environments`` and return them as a list.
+
+    Names not in the cache (or all, if caching is off; see
+    ``envindex.enabled``) are loaded in one query (per ``BATCH_SIZE``
+    environments) and cached.
+
+    """
+    environments = list(environments)
+    if not environments:
+        return environments
+    env_ids = list(set(env.id for env in environments))
+    keys = {}
+    names = {}
+    if envindex.enabled():
+        keys = dict(zip(env_ids, envindex.cache_keys("label", env_ids)))
+        cached = cache.get_many(keys.values())
+        names = dict(
+            (env_id, cached[key])
+            for env_id, key in keys.items() if key in cached
+            )
+
+    missing = [env_id for env_id in env_ids if env_id not in names]
+    for i in range(0, len(missing), BATCH_SIZE):
+        batch = missing[i:i + BATCH_SIZE]
+        loaded = dict((env_id, []) for env_id in batch)
+        for env_id, name in Environment.elements.through.objects.filter(
+                environment__in=batch).order_by(
+                "element__category__name", "element__name").values_list(
+                "environment_id", "element__name"):
+            loaded[env_id].append(name)
+        if keys:
+            cache.set_many(
+                dict((keys[env_id], n) for env_id, n in loaded.items()),
+                envindex.CACHE_TIMEOUT,
+                )
+        names.update(loaded)
+
+    for env in environments:
+        env._element_names = names[env.id]
+    return environments
+
+
+
+def _environment_elements_changed(sender, instance, action, reverse, pk_set,
+        **kwargs):
+    """Keep environment signatures in sync with their elements."""
+    if reverse:
+        # ``instance`` is an element
+        if action == "pre_clear":
+            instance._clearing_environment_ids = list(
+                sender.objects.filter(element=instance).values_list(
+                    "environment_id", flat=True)
+                )
+        elif action == "post_clear":
+            Environment.update_signatures(
+                instance.__dict__.pop("_clearing_environment_ids", []))
+        elif action in ["post_add", "post_remove"]:
+            Environment.update_signatures(pk_set or [])
+    elif action in ["post_add", "post_remove", "post_clear"]:
+        instance.signature = Environment.update_signatures(
+            [instance.pk])[instance.pk]
+        instance.__dict__.pop("_element_names", None)
+    if action in ["post_add", "post_remove", "post_clear"]:
+        envindex.invalidate_all()
+
+
+m2m_changed.connect(
+    _environment_elements_changed,
+    sender=Environment.elements.through,
+    )
+
+
+
 class HasEnvironmentsModel(models.Model):
     """
     Base for models that inherit/cascade environments to/from parents/children.
@@ -272,18 +754,93 @@ class HasEnvironmentsModel(models.Model):
         return {}
 
 
+    @classmethod
+    def _add_envs(cls, objs, envs):
+        """
+        Add one or more environments to one or more objects of this class.
+
+        ``objs`` and ``envs`` may be querysets, lists of instances or ids.
+        Links are inserted in bulk, a batch of objects at a time, and then
+        cascaded a level at a time.
+
+        """
+        envs = _environments(envs)
+        obj_ids = _pks(objs)
+        if not envs or not obj_ids:
+            return
+        cls._link_envs(obj_ids, envs)
+        for model, instances in cls.cascade_envs_to(objs, adding=True).items():
+            model._add_envs(instances, envs)
+
+
+    @classmethod
+    def _link_envs(cls, obj_ids, envs):
+        """
+        Link objects with ``obj_ids`` to environments ``envs``.
+
+        Existing links are left alone. Sends the ``m2m_changed`` signals a
+        reverse add (from each environment) would send, for each batch.
+
+        """
+        through = cls.environments.through
+        field_name = cls.environments.field.m2m_field_name()
+        db = through._base_manager.db
+        for i in range(0, len(obj_ids), BATCH_SIZE):
+            batch = obj_ids[i:i + BATCH_SIZE]
+            existing = set(
+                through._base_manager.filter(
+                    **{"{0}__in".format(field_name): batch}).values_list(
+                    field_name, "environment")
+                )
+            added = [
+                (env, set(o for o in batch if (o, env.pk) not in existing))
+                for env in envs
+                ]
+            added = [(env, pk_set) for env, pk_set in added if pk_set]
+            if not added:
+                continue
+            for env, pk_set in added:
+                m2m_changed.send(
+                    sender=through, action="pre_add", instance=env,
+                    reverse=True, model=cls, pk_set=pk_set, using=db)
+            through._base_manager.bulk_create(
+                [
+                    through(
+                        **{
+                            "{0}_id".format(field_name): obj_id,
+                            "environment_id": env.pk,
+                            }
+                        )
+                    for env, pk_set in added
+                    for obj_id in pk_set
+                    ]
+                )
+            for env, pk_set in added:
+                m2m_changed.send(
+                    sender=through, action="post_add", instance=env,
+                    reverse=True, model=cls, pk_set=pk_set, using=db)
+
+
     @classmethod
     def _remove_envs(cls, objs, envs):
-        """Remove one or environments from one or more objects of this class."""
+        """
+        Remove one or more environments from one or more objects of this class.
+
+        Cascades first, then deletes the links with a single query; ``objs``
+        may be a queryset, so each level is a subquery of the one above.
+
+        """
         for model, instances in cls.cascade_envs_to(objs, adding=False).items():
             model._remove_envs(instances, envs)
         m2m_reverse_name = cls.environments.field.related_query_name()
-        cls.environments.through._base_manager.filter(
-            **{
-                "{0}__in".format(m2m_reverse_name): objs,
-                "environment__in": envs
-                }
-              ).delete()
+        _delete_rows(
+            cls.environments.through._base_manager.filter(
+                **{
+                    "{0}__in".format(m2m_reverse_name): objs,
+                    "environment__in": envs
+                    }
+                )
+            )
 
 
     def remove_envs(self, *envs):
@@ -293,9 +850,39 @@ class HasEnvironmentsModel(models.Model):
 
     def add_envs(self, *envs):
         """Add one or more environments to this object's profile."""
-        # @@@ optimize this to reduce queries once we have bulk insert in 1.4
-        self.environments.add(*envs)
-        for model, instances in self.cascade_envs_to(
-                [self], adding=True).items():
-            for instance in instances:
-                instance.add_envs(*envs)
+        self._add_envs([self], envs)
+
+
+
+def _pks(objs):
+    """Return list of primary keys of a queryset, instances or ids."""
+    if isinstance(objs, QuerySet):
+        return list(objs.values_list("pk", flat=True))
+    return [getattr(o, "pk", o) for o in objs]
+
+
+
+def _environments(envs):
+    """Return list of environments, given instances and/or ids."""
+    found = [e for e in envs if isinstance(e, Environment)]
+    ids = [e for e in envs if not isinstance(e, Environment)]
+    for i in range(0, len(ids), BATCH_SIZE):
+        found.extend(
+            Environment._base_manager.filter(pk__in=ids[i:i + BATCH_SIZE]))
+    return found
+
+
+
+def _delete_rows(queryset):
+    """
+    Delete rows matched by ``queryset`` in one query.
+
+    Unlike ``queryset.delete()``, doesn't collect the rows first; only for
+    models with nothing cascading from them and no delete signal receivers.
+    Filters may only use the model's own columns (as with Django 1.5's
+    ``DeleteQuery.delete_qs``, joins trimmed from the query are dropped).
+
+    """
+    query = queryset.query.clone(klass=DeleteQuery)
+    query.tables = [t for t in query.tables if query.alias_refcount[t]]
+    query.get_compiler(queryset.db).execute_sql(None)
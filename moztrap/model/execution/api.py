@@ -1,12 +1,15 @@
 from tastypie.resources import ModelResource, ALL_WITH_RELATIONS
-from tastypie import fields
+from tastypie import fields, http
 from tastypie.bundle import Bundle
+from tastypie.utils import trailing_slash
 
 import json
 
+from django.conf.urls.defaults import url
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.http import HttpResponse
 
+from .importer import ResultImporter
 from .models import Run, RunCaseVersion, RunSuite, Result
 from ..mtapi import MTResource, MTApiKeyAuthentication
 from ..core.api import (ProductVersionResource, ProductResource,
@@ -234,6 +237,19 @@ class ResultResource(ModelResource):
             ]
         }
 
+    The same objects can be POSTed to ``result/bulk/``, which validates them
+    all up front and saves them in a single transaction: either all results
+    are saved (response 201) or, if any is invalid, none are (response 400).
+    Either way the response reports the number of results created and an
+    error for each invalid result, by its position in ``objects``::
+
+        {
+            "created": 0,
+            "errors": [
+                {"index": 1, "error": "Environment 99 does not exist"}
+            ]
+        }
+
     """
 
     class Meta:
@@ -245,6 +261,47 @@ class ResultResource(ModelResource):
         authorization = ReportResultsAuthorization()
 
 
+    def override_urls(self):
+        """Add the bulk-create URL."""
+        return [
+            url(
+                r"^(?P<resource_name>{0})/bulk{1}$".format(
+                    self._meta.resource_name, trailing_slash()),
+                self.wrap_view("bulk_create"),
+                name="api_result_bulk",
+                ),
+            ]
+
+
+    def bulk_create(self, request, **kwargs):
+        """Create all the results POSTed in ``objects``, or none of them."""
+        self.method_check(request, allowed=["post"])
+        self.is_authenticated(request)
+        self.is_authorized(request)
+        self.throttle_check(request)
+
+        data = self.deserialize(
+            request,
+            request.raw_post_data,
+            format=request.META.get("CONTENT_TYPE", "application/json"),
+            )
+        objects = data.get("objects") if isinstance(data, dict) else None
+        if not isinstance(objects, list):
+            return http.HttpBadRequest(
+                "The 'objects' key must exist and must be a list.")
+
+        import_result = ResultImporter(request.user).import_results(objects)
+
+        self.log_throttled_access(request)
+        return self.create_response(
+            request,
+            import_result.as_dict(),
+            response_class=(
+                http.HttpBadRequest if import_result.errors
+                else http.HttpCreated),
+            )
+
+
     def obj_create(self, bundle, request=None, **kwargs):
         """
         Manually create the proper results objects.
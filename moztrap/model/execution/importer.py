@@ -0,0 +1,470 @@
+"""
+Bulk import of results.
+
+"""
+import itertools
+import time
+
+from django.db import transaction
+
+from ..environments.models import Environment
+from ..library.models import CaseStep
+from ..mtmodel import BulkUpsert, utcnow
+from .models import (
+    LatestResult, Result, ResultRollup, Run, RunCaseVersion, StepResult)
+from . import resultfiles
+
+
+
+# maximum number of ids in one IN clause / objects per bulk_create call
+BATCH_SIZE = 500
+
+# number of unmatched tests and invalid results a file import reports
+MAX_REPORTED = 100
+
+
+
+class RunNotActive(ValueError):
+    """Results can't be imported into a run that isn't active."""
+    pass
+
+
+
+def chunks(items, size=BATCH_SIZE):
+    """Yield successive lists of at most ``size`` of ``items``."""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+
+class ResultImporter(object):
+    """
+    Imports a batch of results for one tester in a single transaction.
+
+    Each result is a dictionary formed like the objects submitted to the
+    result API::
+
+        {
+            "case": "326",
+            "environment": "23",
+            "run_id": "1",
+            "status": "failed",
+            "comment": "why u no pass?",
+            "stepnumber": 1,
+            "bug": "http://www.deathvalleydogs.com"
+        }
+
+    ``comment`` is optional; ``stepnumber`` and ``bug`` are optional and only
+    used for failed results.
+
+    All results are validated (with a handful of set queries, regardless of
+    the number of results) before anything is saved; if any result is invalid
+    none are saved.
+
+    """
+    ERROR_MISSING_KEY = "Missing key: {0}"
+    ERROR_BAD_STATUS = "Unknown status: {0}"
+    ERROR_BAD_ID = "Invalid {0}: {1}"
+    ERROR_NO_ENVIRONMENT = "Environment {0} does not exist"
+    ERROR_NO_RUNCASEVERSION = (
+        "RunCaseVersion not found for run: {0}, case: {1}, environment: {2}")
+
+    def __init__(self, user):
+        """Construct an importer saving results as tester ``user``."""
+        self.user = user
+
+
+    @transaction.commit_on_success
+    def import_results(self, results, partial=False):
+        """
+        Validate and save the given list of result dictionaries.
+
+        Returns a ``ResultImportResult``; if it has errors nothing was saved,
+        unless ``partial`` is True, in which case the valid results are saved
+        regardless. Results are validated and saved in one transaction, so
+        they are saved against the runs and environments they were validated
+        against.
+
+        """
+        import_result = ResultImportResult()
+        cleaned = self._clean(results, import_result)
+        if (import_result.errors and not partial) or not cleaned:
+            return import_result
+
+        self._save(cleaned)
+        import_result.created = len(cleaned)
+        return import_result
+
+
+    def _clean(self, results, import_result):
+        """
+        Return list of cleaned results, recording errors in ``import_result``.
+
+        Each cleaned result is a dictionary with keys ``rcv_id``,
+        ``caseversion_id``, ``environment_id``, ``status``, ``comment``,
+        ``step_id`` and ``bug``.
+
+        """
+        parsed = []
+        for i, data in enumerate(results):
+            try:
+                parsed.append((i, self._parse(data)))
+            except ValueError as e:
+                import_result.error(i, unicode(e))
+
+        env_ids = set(p["environment_id"] for i, p in parsed)
+        existing_env_ids = set()
+        for chunk in chunks(env_ids):
+            existing_env_ids.update(
+                Environment.objects.filter(pk__in=chunk).values_list(
+                    "id", flat=True)
+                )
+
+        # (run id, case id) -> (runcaseversion id, caseversion id)
+        rcvs = {}
+        run_ids = set(p["run_id"] for i, p in parsed)
+        for chunk in chunks(set(p["case_id"] for i, p in parsed)):
+            for rcv_id, run_id, case_id, cv_id in RunCaseVersion.objects.filter(
+                    run__in=run_ids, caseversion__case__in=chunk).values_list(
+                    "id", "run_id", "caseversion__case_id", "caseversion_id"):
+                rcvs[(run_id, case_id)] = (rcv_id, cv_id)
+
+        rcv_envs = set()
+        through = RunCaseVersion.environments.through
+        for chunk in chunks(rcv_id for rcv_id, cv_id in rcvs.values()):
+            rcv_envs.update(
+                through.objects.filter(
+                    runcaseversion__in=chunk,
+                    environment__in=existing_env_ids,
+                    ).values_list("runcaseversion_id", "environment_id")
+                )
+
+        cleaned = []
+        for i, p in parsed:
+            env_id = p["environment_id"]
+            if env_id not in existing_env_ids:
+                import_result.error(i, self.ERROR_NO_ENVIRONMENT.format(env_id))
+                continue
+            rcv_id, cv_id = rcvs.get((p["run_id"], p["case_id"]), (None, None))
+            if (rcv_id, env_id) not in rcv_envs:
+                import_result.error(
+                    i,
+                    self.ERROR_NO_RUNCASEVERSION.format(
+                        p["run_id"], p["case_id"], env_id)
+                    )
+                continue
+            p.update({"rcv_id": rcv_id, "caseversion_id": cv_id})
+            cleaned.append(p)
+
+        # unknown step numbers are ignored, as for single results
+        wanted_steps = set(
+            (p["caseversion_id"], p["stepnumber"])
+            for p in cleaned if p["stepnumber"] is not None
+            )
+        steps = {}
+        for chunk in chunks(set(cv_id for cv_id, num in wanted_steps)):
+            for cv_id, number, step_id in CaseStep.objects.filter(
+                    caseversion__in=chunk).values_list(
+                    "caseversion_id", "number", "id"):
+                if (cv_id, number) in wanted_steps:
+                    steps[(cv_id, number)] = step_id
+        for p in cleaned:
+            p["step_id"] = steps.get((p["caseversion_id"], p.pop("stepnumber")))
+
+        return cleaned
+
+
+    def _parse(self, data):
+        """Return parsed dictionary of result ``data``; raise ValueError."""
+        try:
+            status = data["status"]
+            case_id = data["case"]
+            env_id = data["environment"]
+            run_id = data["run_id"]
+        except (KeyError, TypeError) as e:
+            raise ValueError(self.ERROR_MISSING_KEY.format(e))
+
+        if status not in Result.COMPLETED_STATES:
+            raise ValueError(self.ERROR_BAD_STATUS.format(status))
+
+        parsed = {
+            "status": status,
+            "comment": data.get("comment") or "",
+            "stepnumber": None,
+            "bug": "",
+            }
+        ids = [
+            ("case_id", "case", case_id),
+            ("environment_id", "environment", env_id),
+            ("run_id", "run_id", run_id),
+            ]
+        if status == Result.STATUS.failed:
+            parsed["bug"] = data.get("bug") or ""
+            if data.get("stepnumber") is not None:
+                ids.append(("stepnumber", "stepnumber", data["stepnumber"]))
+        for key, name, value in ids:
+            try:
+                parsed[key] = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(self.ERROR_BAD_ID.format(name, value))
+
+        return parsed
+
+
+    def _save(self, cleaned):
+        """Save given cleaned results, pointing latest results at them."""
+        now = utcnow()
+        results = [
+            Result(
+                tester=self.user,
+                runcaseversion_id=p["rcv_id"],
+                environment_id=p["environment_id"],
+                status=p["status"],
+                comment=p["comment"],
+                created_by=self.user,
+                created_on=now,
+                modified_by=self.user,
+                modified_on=now,
+                )
+            for p in cleaned
+            ]
+
+        # sets the ids of the new results
+        BulkUpsert(Result).run(results)
+
+        # later results in the batch supersede earlier ones
+        latest = {}
+        for result in results:
+            latest[(result.runcaseversion_id, result.environment_id)] = result
+        LatestResult.objects.set_latest_bulk(latest.values())
+
+        stepresults = [
+            StepResult(
+                result_id=result.id,
+                step_id=p["step_id"],
+                status=StepResult.STATUS.failed,
+                bug_url=p["bug"],
+                created_by=self.user,
+                created_on=now,
+                modified_by=self.user,
+                modified_on=now,
+                )
+            for result, p in zip(results, cleaned)
+            if p["step_id"] is not None
+            ]
+        for chunk in chunks(stepresults):
+            StepResult.objects.bulk_create(chunk)
+
+        # a failed result modifies its runcaseversion
+        failed_rcv_ids = set(
+            p["rcv_id"] for p in cleaned
+            if p["status"] == Result.STATUS.failed
+            )
+        for chunk in chunks(failed_rcv_ids):
+            RunCaseVersion.everything.filter(pk__in=chunk).update(
+                user=self.user)
+
+        env_ids = list(set(p["environment_id"] for p in cleaned))
+        for chunk in chunks(set(p["rcv_id"] for p in cleaned)):
+            ResultRollup.objects.refresh(
+                RunCaseVersion.everything.filter(pk__in=chunk), env_ids)
+
+
+
+class ResultImportResult(object):
+    """Outcome of a result import: number created, and per-result errors."""
+    def __init__(self):
+        """
+        Construct a ResultImportResult.
+
+        created -- number of results saved
+        errors -- list of {"index": <position in input>, "error": <message>}
+
+        """
+        self.created = 0
+        self.errors = []
+
+
+    def error(self, index, message):
+        """Record an error for the result at position ``index``."""
+        self.errors.append({"index": index, "error": message})
+
+
+    def as_dict(self):
+        """Return a JSON-serializable report of the import."""
+        return {"created": self.created, "errors": self.errors}
+
+
+
+class ResultFileImporter(object):
+    """
+    Imports the results of a JUnit XML, TAP or NDJSON file into a run.
+
+    The file is parsed as a stream and its results are matched to the run's
+    runcaseversions and saved in batches of ``batch_size`` (each batch in its
+    own transaction), so files of any size are imported in constant memory.
+    Results whose case isn't found in the run are counted as unmatched.
+
+    Results can only be imported into active runs.
+
+    """
+    ERROR_NOT_ACTIVE = (
+        'Run "{0}" is {1}; results can only be imported into active runs.')
+
+    def __init__(self, run, environment, user, batch_size=BATCH_SIZE):
+        """
+        Construct importer of results in ``environment`` of ``run``.
+
+        Raises ``RunNotActive`` if ``run`` isn't active.
+
+        """
+        if run.status != Run.STATUS.active:
+            raise RunNotActive(
+                self.ERROR_NOT_ACTIVE.format(run.name, run.status))
+        self.run = run
+        self.environment = environment
+        self.user = user
+        self.batch_size = batch_size
+
+
+    def import_file(self, fh, format):
+        """
+        Import results from open file ``fh`` in ``format``.
+
+        ``format`` is one of the keys of ``resultfiles.PARSERS``. Returns a
+        ``ResultFileImportResult``; raises ``resultfiles.ResultFileError`` if
+        the file can't be parsed (batches imported before that are kept).
+
+        """
+        import_result = ResultFileImportResult()
+        records = resultfiles.PARSERS[format](fh)
+        start = time.time()
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                break
+            self._import_batch(batch, import_result)
+        import_result.seconds = time.time() - start
+        return import_result
+
+
+    def _import_batch(self, batch, import_result):
+        """Match and save a batch of result records."""
+        prefixes = dict(
+            RunCaseVersion.objects.filter(
+                run=self.run,
+                caseversion__case__in=set(
+                    r["case"] for r in batch if r["case"] is not None),
+                ).values_list(
+                "caseversion__case_id", "caseversion__case__idprefix")
+            )
+
+        matched = []
+        for r in batch:
+            prefix = prefixes.get(r["case"])
+            if prefix is None or (r["prefix"] and r["prefix"] != prefix):
+                import_result.add_unmatched(r["ref"])
+                continue
+            data = {
+                "case": r["case"],
+                "environment": r.get("environment", self.environment.id),
+                "run_id": self.run.id,
+                "status": r["status"],
+                "comment": r["comment"],
+                }
+            for key in ["bug", "stepnumber"]:
+                if key in r:
+                    data[key] = r[key]
+            matched.append((r["ref"], data))
+
+        result = ResultImporter(self.user).import_results(
+            [data for ref, data in matched], partial=True)
+        import_result.created += result.created
+        for error in result.errors:
+            import_result.add_error(
+                u"{0}: {1}".format(matched[error["index"]][0], error["error"]))
+
+
+
+class ResultFileImportResult(object):
+    """Outcome of a result file import."""
+    def __init__(self):
+        """
+        Construct a ResultFileImportResult.
+
+        created -- number of results saved
+        num_unmatched -- number of results not matched to a case in the run
+        unmatched -- set of names of the first ``MAX_REPORTED`` of those tests
+        num_errors -- number of invalid results
+        errors -- list of messages about the first ``MAX_REPORTED`` of them
+        seconds -- duration of the import
+
+        Only the first ``MAX_REPORTED`` unmatched tests and errors are kept,
+        so a file of any size is reported in constant memory.
+
+        """
+        self.created = 0
+        self.num_unmatched = 0
+        self.unmatched = set()
+        self.num_errors = 0
+        self.errors = []
+        self.seconds = 0
+
+
+    def add_unmatched(self, ref):
+        """Count an unmatched result of test ``ref``."""
+        self.num_unmatched += 1
+        if len(self.unmatched) < MAX_REPORTED:
+            self.unmatched.add(ref)
+
+
+    def add_error(self, message):
+        """Count an invalid result, with error ``message``."""
+        self.num_errors += 1
+        if len(self.errors) < MAX_REPORTED:
+            self.errors.append(message)
+
+
+    def more_unmatched(self):
+        """Return number of unmatched results not listed in ``unmatched``."""
+        return self.num_unmatched - len(self.unmatched)
+
+
+    def more_errors(self):
+        """Return number of invalid results not listed in ``errors``."""
+        return self.num_errors - len(self.errors)
+
+
+    def rate(self):
+        """Return number of results saved per second."""
+        try:
+            return self.created / self.seconds
+        except ZeroDivisionError:
+            return 0
+
+
+    def sorted_unmatched(self):
+        """Return sorted list of names of unmatched tests."""
+        return sorted(self.unmatched)
+
+
+    def get_as_list(self):
+        """Return list of lines reporting the import."""
+        lines = [
+            "Imported {0} results in {1:.2f}s ({2:.1f} results/s).".format(
+                self.created, self.seconds, self.rate())
+            ]
+        if self.num_unmatched:
+            lines.append(
+                "{0} unmatched tests:".format(self.num_unmatched))
+            lines.extend(u"  {0}".format(u) for u in self.sorted_unmatched())
+            if self.more_unmatched():
+                lines.append(
+                    "  ... and {0} more".format(self.more_unmatched()))
+        if self.num_errors:
+            lines.append("{0} invalid results:".format(self.num_errors))
+            lines.extend(u"  {0}".format(e) for e in self.errors)
+            if self.more_errors():
+                lines.append("  ... and {0} more".format(self.more_errors()))
+        return lines
@@ -0,0 +1,218 @@
+"""
+Benchmark updating runcaseversion environments when locking a run.
+
+Compares the set-based SQL used by ``Run._sync_runcaseversion_environments``
+with the previous approach of intersecting environment sets in Python. Builds
+a synthetic run in a transaction that is rolled back afterwards, so nothing is
+left in the database.
+
+"""
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, DatabaseError
+from django.db.models import Q
+
+from moztrap.model.core.models import Product, ProductVersion
+from moztrap.model.environments.models import Environment
+from moztrap.model.execution.models import Run, RunCaseVersion
+from moztrap.model.library.models import Case, CaseVersion
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Time set-based vs. Python updating of runcaseversion environments "
+        "on a synthetic run (rolled back afterwards).")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--cases",
+            type="int",
+            dest="cases",
+            default=2000,
+            help="Number of caseversions in the run (default 2000)"),
+        make_option(
+            "--envs",
+            type="int",
+            dest="envs",
+            default=20,
+            help="Number of environments in the run (default 20)"),
+        )
+
+
+    def handle(self, *args, **options):
+        if args or options["cases"] < 1 or options["envs"] < 2:
+            raise CommandError(
+                "Usage: [--cases <n>] [--envs <n>] (at least 1 case, 2 envs)")
+
+        with transaction.commit_manually():
+            try:
+                run, initial = build_run(options["cases"], options["envs"])
+                timings = []
+                results = []
+                for label, func in [
+                        ("python", python_update_environments),
+                        ("set-based", set_based_update_environments),
+                        ]:
+                    reset_environments(run, initial)
+                    sid = transaction.savepoint()
+                    start = time.time()
+                    try:
+                        func(run)
+                    except DatabaseError as e:
+                        # e.g. the OR-chain delete exceeding query limits
+                        transaction.savepoint_rollback(sid)
+                        timings.append((label, "failed ({0})".format(e)))
+                        continue
+                    timings.append(
+                        (label, "{0:.3f}s".format(time.time() - start)))
+                    results.append(
+                        set(
+                            RunCaseVersion.environments.through.objects.filter(
+                                runcaseversion__run=run).values_list(
+                                "runcaseversion_id", "environment_id")
+                            )
+                        )
+            finally:
+                transaction.rollback()
+
+        if len(results) == 2 and results[0] != results[1]:
+            raise CommandError("Set-based and Python results differ.")
+
+        self.stdout.write(
+            "{0} runcaseversions x {1} environments:\n".format(
+                options["cases"], options["envs"]))
+        for label, timing in timings:
+            self.stdout.write("  {0}: {1}\n".format(label, timing))
+
+
+
+def build_run(num_cases, num_envs):
+    """
+    Create an active run with ``num_cases`` caseversions and ``num_envs`` envs.
+
+    Every other caseversion lacks one of the run's environments. Returns the
+    run and a list of (rcv id, env id) pairs to start from: every other
+    runcaseversion has all run environments plus one the run doesn't have,
+    the rest have none.
+
+    """
+    product = Product.objects.create(name="benchmark")
+    pv = ProductVersion.objects.create(product=product, version="1")
+    Environment.objects.bulk_create(
+        [Environment() for i in range(num_envs + 1)])
+    env_ids = list(
+        Environment.objects.order_by("-id").values_list("id", flat=True)[
+            :num_envs + 1])
+    extra_env_id, env_ids = env_ids[0], env_ids[1:]
+
+    run = Run.objects.create(productversion=pv, name="benchmark")
+    Run.environments.through.objects.bulk_create(
+        [
+            Run.environments.through(run_id=run.id, environment_id=env_id)
+            for env_id in env_ids
+            ]
+        )
+
+    Case.objects.bulk_create([Case(product=product) for i in range(num_cases)])
+    case_ids = Case.objects.filter(product=product).values_list("id", flat=True)
+    CaseVersion.objects.bulk_create(
+        [
+            CaseVersion(productversion=pv, case_id=case_id, name="benchmark")
+            for case_id in case_ids
+            ]
+        )
+    cv_ids = list(
+        CaseVersion.objects.filter(productversion=pv).order_by(
+            "id").values_list("id", flat=True))
+    CaseVersion.environments.through.objects.bulk_create(
+        [
+            CaseVersion.environments.through(
+                caseversion_id=cv_id, environment_id=env_id)
+            for i, cv_id in enumerate(cv_ids)
+            for env_id in (env_ids[1:] if i % 2 else env_ids) + [extra_env_id]
+            ]
+        )
+
+    RunCaseVersion.objects.bulk_create(
+        [
+            RunCaseVersion(run_id=run.id, caseversion_id=cv_id, order=i)
+            for i, cv_id in enumerate(cv_ids)
+            ]
+        )
+    rcv_ids = list(
+        RunCaseVersion.objects.filter(run=run).order_by(
+            "id").values_list("id", flat=True))
+    initial = [
+        (rcv_id, env_id)
+        for rcv_id in rcv_ids[::2]
+        for env_id in env_ids + [extra_env_id]
+        ]
+
+    return run, initial
+
+
+
+def reset_environments(run, initial):
+    """Reset runcaseversion environments of ``run`` to ``initial`` pairs."""
+    through = RunCaseVersion.environments.through
+    through.objects.filter(runcaseversion__run=run).delete()
+    through.objects.bulk_create(
+        [
+            through(runcaseversion_id=rcv_id, environment_id=env_id)
+            for rcv_id, env_id in initial
+            ]
+        )
+
+
+
+def set_based_update_environments(run):
+    """Update runcaseversion environments the way run locking does."""
+    run._sync_runcaseversion_environments()
+
+
+
+def python_update_environments(run):
+    """
+    Update runcaseversion environments by intersecting env sets in Python.
+
+    This is how ``Run._bulk_update_runcaseversion_environments_for_lock``
+    used to work; kept here for comparison.
+
+    """
+    final_rcvs = RunCaseVersion.objects.filter(run=run).select_related(
+        "caseversion").prefetch_related("caseversion__environments")
+
+    final_rcv_ids = [x.id for x in final_rcvs]
+
+    prev_rcv_envs_set = set(
+        RunCaseVersion.environments.through.objects.filter(
+            runcaseversion_id__in=final_rcv_ids).values_list(
+            "runcaseversion_id", "environment_id"))
+
+    needed_rcv_envs_tuples = []
+    run_env_ids = set(run.environments.values_list("id", flat=True))
+    for rcv in final_rcvs:
+        case_env_ids = set([x.id for x in rcv.caseversion.environments.all()])
+        for env in run_env_ids.intersection(case_env_ids):
+            needed_rcv_envs_tuples.append((rcv.id, env))
+    needed_rcv_envs_set = set(needed_rcv_envs_tuples)
+
+    delete_rcv_envs = prev_rcv_envs_set - needed_rcv_envs_set
+    if len(delete_rcv_envs):
+        delquery = Q()
+        for combo in delete_rcv_envs:
+            delquery = delquery | Q(
+                **{"runcaseversion_id": combo[0],
+                   "environment_id": combo[1]})
+        RunCaseVersion.environments.through.objects.filter(delquery).delete()
+
+    needed_rcv_envs_set = needed_rcv_envs_set - prev_rcv_envs_set
+
+    needed_rcv_envs = [RunCaseVersion.environments.through(
+        runcaseversion_id=needed[0],
+        environment_id=needed[1]) for needed in needed_rcv_envs_set]
+
+    RunCaseVersion.environments.through.objects.bulk_create(needed_rcv_envs)
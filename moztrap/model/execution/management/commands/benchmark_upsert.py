@@ -0,0 +1,222 @@
+"""
+Benchmark bulk upserting runcaseversions when locking a run.
+
+Compares the parameterized, chunked ``BulkUpsert`` used by
+``Run._bulk_insert_new_runcaseversions`` (in the database's own dialect and
+in the portable fallback) with the previous string-built, single-statement
+``ON DUPLICATE KEY UPDATE`` (MySQL only). Builds a synthetic run in a
+transaction that is rolled back afterwards, so nothing is left in the
+database.
+
+"""
+from optparse import make_option
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from moztrap.model.core.models import Product, ProductVersion
+from moztrap.model.execution.models import Run, RunCaseVersion
+from moztrap.model.library.models import Case, CaseVersion
+from moztrap.model.mtmodel import BulkUpsert
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Time bulk upserting of runcaseversions in each dialect on a "
+        "synthetic run (rolled back afterwards).")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--cases",
+            type="int",
+            dest="cases",
+            default=50000,
+            help="Number of runcaseversions to upsert (default 50000)"),
+        make_option(
+            "--existing",
+            type="int",
+            dest="existing",
+            default=50,
+            help="Percentage of them that already exist (default 50)"),
+        )
+
+
+    def handle(self, *args, **options):
+        if args or options["cases"] < 1 or not (
+                0 <= options["existing"] <= 100):
+            raise CommandError(
+                "Usage: [--cases <n>] [--existing <percent>] "
+                "(at least 1 case)")
+
+        dialect = BulkUpsert(RunCaseVersion).dialect
+        approaches = [
+            ("string-built", string_built_upsert),
+            ("upsert, {0}".format(dialect), dialect_upsert(dialect)),
+            ]
+        if dialect != "fallback":
+            approaches.append(("upsert, fallback", dialect_upsert("fallback")))
+
+        with transaction.commit_manually():
+            try:
+                run, initial, proxies = build_run(
+                    options["cases"], options["existing"])
+                timings = []
+                results = []
+                for label, func in approaches:
+                    if func is string_built_upsert and (
+                            connection.vendor != "mysql"):
+                        timings.append((label, "skipped (MySQL only)"))
+                        continue
+                    reset_runcaseversions(run, initial)
+                    start = time.time()
+                    func(proxies(), run)
+                    timings.append(
+                        (label, "{0:.3f}s".format(time.time() - start)))
+                    results.append(
+                        set(
+                            RunCaseVersion.everything.filter(
+                                run=run).values_list("caseversion_id", "order")
+                            )
+                        )
+            finally:
+                transaction.rollback()
+
+        if any(r != results[0] for r in results):
+            raise CommandError("Results of upsert approaches differ.")
+
+        self.stdout.write(
+            "{0} runcaseversions, {1}% existing:\n".format(
+                options["cases"], options["existing"]))
+        for label, timing in timings:
+            self.stdout.write("  {0}: {1}\n".format(label, timing))
+
+
+
+def build_run(num_cases, percent_existing):
+    """
+    Create a run of a product version with ``num_cases`` caseversions.
+
+    Returns the run, a list of (id, caseversion id, order) of the
+    runcaseversions it starts with (``percent_existing`` of the caseversions,
+    in reverse order), and a function returning a new list of runcaseversion
+    proxies to upsert, as run locking builds them (all caseversions, in
+    order; with the ids of existing runcaseversions).
+
+    """
+    product = Product.objects.create(name="benchmark")
+    pv = ProductVersion.objects.create(product=product, version="1")
+    run = Run.objects.create(productversion=pv, name="benchmark")
+
+    Case.objects.bulk_create([Case(product=product) for i in range(num_cases)])
+    case_ids = Case.objects.filter(product=product).values_list("id", flat=True)
+    CaseVersion.objects.bulk_create(
+        [
+            CaseVersion(productversion=pv, case_id=case_id, name="benchmark")
+            for case_id in case_ids
+            ]
+        )
+    cv_ids = list(
+        CaseVersion.objects.filter(productversion=pv).order_by(
+            "id").values_list("id", flat=True))
+
+    num_existing = num_cases * percent_existing // 100
+    RunCaseVersion.objects.bulk_create(
+        [
+            RunCaseVersion(run=run, caseversion_id=cv_id, order=-i)
+            for i, cv_id in enumerate(cv_ids[:num_existing])
+            ]
+        )
+    initial = list(
+        RunCaseVersion.objects.filter(run=run).values_list(
+            "id", "caseversion_id", "order"))
+    existing = dict((cv_id, rcv_id) for rcv_id, cv_id, order in initial)
+
+    def proxies():
+        rcv_proxies = []
+        for order, cv_id in enumerate(cv_ids, 1):
+            kwargs = {"run_id": run.id, "caseversion_id": cv_id, "order": order}
+            if cv_id in existing:
+                kwargs["id"] = existing[cv_id]
+            rcv_proxies.append(RunCaseVersion(**kwargs))
+        return rcv_proxies
+
+    return run, initial, proxies
+
+
+
+def reset_runcaseversions(run, initial):
+    """Reset runcaseversions of ``run`` to ``initial`` (id, cv id, order)."""
+    cursor = connection.cursor()
+    cursor.execute(
+        "DELETE FROM {0} WHERE run_id = %s".format(
+            connection.ops.quote_name(RunCaseVersion._meta.db_table)),
+        [run.id],
+        )
+    RunCaseVersion.objects.bulk_create(
+        [
+            RunCaseVersion(
+                id=rcv_id, run=run, caseversion_id=cv_id, order=order)
+            for rcv_id, cv_id, order in initial
+            ]
+        )
+
+
+
+def dialect_upsert(dialect):
+    """Return function upserting runcaseversions in ``dialect``."""
+    def upsert(rcv_proxies, run):
+        BulkUpsert(
+            RunCaseVersion,
+            ["order", "modified_on"],
+            dialect=dialect,
+            ).run(rcv_proxies)
+    return upsert
+
+
+
+def string_built_upsert(rcv_proxies, run):
+    """
+    Upsert runcaseversions with a string-built ON DUPLICATE KEY UPDATE.
+
+    This is how ``MTManager.bulk_insert_or_update`` used to work (in a single
+    statement, with values formatted into the SQL); kept here for comparison.
+
+    """
+    create_fields = [
+        field.get_attname_column()[1]
+        for field in RunCaseVersion._meta.fields
+        ]
+    update_fields = set(create_fields) - set([
+        "id", "created_by_id", "created_on", "deleted_by_id", "deleted_on"
+        ])
+
+    def getfield(obj, field):
+        value = getattr(obj, field)
+        if isinstance(value, (str, datetime.datetime)):
+            return "'{0}'".format(value)
+        elif value is None:
+            return "NULL"
+        else:
+            return value
+
+    values = []
+    for obj in rcv_proxies:
+        values.append("({0})".format(", ".join(
+            ["{0}".format(getfield(obj, field)) for field in create_fields]
+            )))
+
+    cursor = connection.cursor()
+    cursor.execute(
+        "INSERT INTO {0} (`{1}`) VALUES {2} ON DUPLICATE KEY UPDATE {3}".format(
+            RunCaseVersion._meta.db_table,
+            "`, `".join(create_fields),
+            ", ".join(values),
+            ", ".join(
+                "`{0}`=VALUES(`{0}`)".format(field)
+                for field in update_fields
+                ),
+            )
+        )
@@ -0,0 +1,94 @@
+"""
+Import results of an automated test run from a JUnit XML, TAP or NDJSON file.
+
+Tests are matched to the run's cases by a case reference in their name (the
+case id, optionally with the case's idprefix, e.g. ``ab-12``); see
+``moztrap.model.execution.resultfiles``. NDJSON files have one object per
+line, like the objects submitted to the result API::
+
+    {"case": "ab-12", "status": "failed", "comment": "Timed out."}
+
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moztrap.model.core.auth import User
+from moztrap.model.environments.models import Environment
+from moztrap.model.execution.importer import (
+    BATCH_SIZE, ResultFileImporter, RunNotActive)
+from moztrap.model.execution.models import Run
+from moztrap.model.execution.resultfiles import (
+    PARSERS, ResultFileError, guess_format)
+
+
+
+class Command(BaseCommand):
+    args = "<run_id> <environment_id> <username> <filename>"
+    help = (
+        "Imports results from a JUnit XML, TAP or NDJSON file into the "
+        "specified run and environment, as the specified tester")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--format",
+            dest="format",
+            choices=sorted(PARSERS),
+            help="Format of the file: junit, tap or ndjson (default: guess "
+            "from the file extension)"),
+        make_option(
+            "--batch-size",
+            type="int",
+            dest="batch_size",
+            default=BATCH_SIZE,
+            help="Number of results saved per transaction (default {0})".format(
+                BATCH_SIZE)),
+        )
+
+
+    def handle(self, *args, **options):
+        if len(args) != 4 or options["batch_size"] < 1:
+            raise CommandError(
+                "Usage: {0} [--format <format>] [--batch-size <n>]".format(
+                    self.args))
+        run_id, env_id, username, filename = args
+
+        try:
+            run = Run.objects.get(pk=run_id)
+        except (Run.DoesNotExist, ValueError):
+            raise CommandError('Run "{0}" does not exist'.format(run_id))
+        try:
+            environment = Environment.objects.get(pk=env_id)
+        except (Environment.DoesNotExist, ValueError):
+            raise CommandError(
+                'Environment "{0}" does not exist'.format(env_id))
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError('User "{0}" does not exist'.format(username))
+
+        format = options["format"] or guess_format(filename)
+        if format is None:
+            raise CommandError(
+                'Could not guess format of "{0}", use --format'.format(
+                    filename))
+
+        try:
+            importer = ResultFileImporter(
+                run, environment, user, batch_size=options["batch_size"])
+        except RunNotActive as e:
+            raise CommandError(str(e))
+        try:
+            with open(filename) as fh:
+                result = importer.import_file(fh, format)
+        except IOError as e:
+            raise CommandError(
+                'Could not open "{0}", I/O error {1}: {2}'.format(
+                    filename, e.errno, e.strerror)
+                )
+        except ResultFileError as e:
+            raise CommandError(str(e))
+
+        result_list = result.get_as_list()
+        result_list.append("")
+        self.stdout.write(u"\n".join(result_list).encode("utf-8"))
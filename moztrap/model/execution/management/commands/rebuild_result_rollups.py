@@ -0,0 +1,40 @@
+"""
+Management command to rebuild result rollups from scratch.
+
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from moztrap.model.execution.models import Run, ResultRollup
+
+
+
+class Command(BaseCommand):
+    args = "[<run_id> <run_id> ...]"
+    help = (
+        "Rebuild the result rollups of the given runs (default all runs) "
+        "from their results and runcaseversion environments.")
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+
+        try:
+            run_ids = [int(a) for a in args]
+        except ValueError:
+            raise CommandError("Usage: {0}".format(self.args))
+        if not run_ids:
+            run_ids = Run.everything.values_list("id", flat=True)
+
+        count = 0
+        # one run at a time, so memory use is bounded by the largest run
+        for run_id in run_ids:
+            with transaction.commit_on_success():
+                ResultRollup.objects.rebuild([run_id])
+            count += 1
+            if verbosity > 1:
+                self.stdout.write("Rebuilt rollups for run {0}.\n".format(
+                    run_id))
+
+        if verbosity:
+            self.stdout.write("Rebuilt rollups for {0} run(s).\n".format(count))
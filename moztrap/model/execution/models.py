@@ -5,16 +5,179 @@ Models for test execution (runs, results).
 import datetime
 
 from django.core.exceptions import ValidationError
-from django.db import connection, transaction, models
-from django.db.models import Q
+from django.db import connection, transaction, models, IntegrityError
+from django.db.models import Q, Count, Max
+from django.db.models.query import QuerySet
+from django.db.models.signals import m2m_changed, post_delete
 
 from model_utils import Choices
 
-from ..mtmodel import MTModel, TeamModel, DraftStatusModel
+from ..mtmodel import (
+    MTModel, MTManager, MTQuerySet, TeamModel, DraftStatusModel, utcnow,
+    commit_on_success_unless_managed)
 from ..core.auth import User
 from ..core.models import ProductVersion
-from ..environments.models import Environment, HasEnvironmentsModel
-from ..library.models import CaseVersion, Suite, CaseStep
+from ..denormalization import deferring
+from ..environments import index as envindex
+from ..environments.models import (
+    Environment, HasEnvironmentsModel, prefetch_labels)
+from ..library.models import CaseVersion, Suite, SuiteCase, CaseStep
+
+
+
+class ResultSummaryQuerySet(MTQuerySet):
+    """An ``MTQuerySet`` that can batch-load result summaries."""
+    _with_result_summaries = False
+    _with_execution_results = None
+
+
+    def with_result_summaries(self):
+        """
+        Prefetch result summaries and completion when evaluated.
+
+        Whatever slice of the queryset is evaluated (e.g. a single page) gets
+        its summaries in one query; see ``prefetch_result_summaries``.
+
+        """
+        clone = self._clone()
+        clone._with_result_summaries = True
+        return clone
+
+
+    def with_execution_results(self, user, environment):
+        """
+        Prefetch what the run-tests page shows, when evaluated.
+
+        For use on runcaseversions; whatever slice is evaluated gets the
+        results of ``user`` and others in ``environment``, their step results
+        and the runcaseversions' suites in a few queries; see
+        ``prefetch_execution_results``.
+
+        """
+        clone = self._clone()
+        clone._with_execution_results = (user, environment)
+        return clone
+
+
+    def _clone(self, *args, **kwargs):
+        """Clone queryset, preserving the prefetch flags."""
+        clone = super(ResultSummaryQuerySet, self)._clone(*args, **kwargs)
+        clone._with_result_summaries = self._with_result_summaries
+        clone._with_execution_results = self._with_execution_results
+        return clone
+
+
+    def iterator(self):
+        """Iterate over objects, prefetching requested data."""
+        objs = super(ResultSummaryQuerySet, self).iterator()
+        if self._with_result_summaries:
+            objs = prefetch_result_summaries(objs)
+        if self._with_execution_results is not None:
+            objs = prefetch_execution_results(
+                objs, *self._with_execution_results)
+        return iter(objs)
+
+
+    def with_completion(self):
+        """
+        Annotate each object with its completion fraction, from its rollup.
+
+        The value is selected as ``completion_fraction``; objects without a
+        rollup get zero.
+
+        """
+        col, condition = self._completion_rollup_sql()
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        sql = (
+            "COALESCE((SELECT rr.completed_fraction FROM {rollups} rr "
+            "WHERE rr.{col} = {table}.id AND {condition}), 0)"
+            ).format(
+            rollups=connection.ops.quote_name(ResultRollup._meta.db_table),
+            col=col,
+            table=table,
+            condition=condition,
+            )
+        return self.extra(select={"completion_fraction": sql})
+
+
+    def order_by(self, *field_names):
+        """
+        Order by given fields; ``completion`` orders by completion fraction.
+
+        """
+        if not [f for f in field_names if f.lstrip("-") == "completion"]:
+            return super(ResultSummaryQuerySet, self).order_by(*field_names)
+        fields = []
+        for name in field_names:
+            if name.lstrip("-") == "completion":
+                name = name.replace("completion", "completion_fraction")
+            fields.append(name)
+        qs = self.with_completion()
+        return super(ResultSummaryQuerySet, qs).order_by(*fields)
+
+
+    def filter_completion(self, *ranges):
+        """
+        Filter to objects whose completion fraction falls in any of ``ranges``.
+
+        Each range is a ``(low, high)`` tuple; ``low`` is inclusive, ``high``
+        exclusive, and a ``high`` of ``None`` means unbounded. Objects without
+        a rollup count as zero complete.
+
+        """
+        rollups = ResultRollup.objects.filter(environment__isnull=True)
+        if issubclass(self.model, Run):
+            col = "run"
+            rollups = rollups.filter(runcaseversion__isnull=True)
+        else:
+            col = "runcaseversion"
+            rollups = rollups.filter(runcaseversion__isnull=False)
+
+        match = Q()
+        include_missing = False
+        for low, high in ranges:
+            bounds = {"completed_fraction__gte": low}
+            if high is not None:
+                bounds["completed_fraction__lt"] = high
+            match |= Q(**bounds)
+            if low <= 0 and (high is None or high > 0):
+                include_missing = True
+
+        q = Q(id__in=rollups.filter(match).values(col))
+        if include_missing:
+            q |= ~Q(id__in=rollups.values(col))
+        return self.filter(q)
+
+
+    def _completion_rollup_sql(self):
+        """Return (column, condition) selecting each object's rollup row."""
+        if issubclass(self.model, Run):
+            return (
+                "run_id",
+                "rr.runcaseversion_id IS NULL AND rr.environment_id IS NULL",
+                )
+        return ("runcaseversion_id", "rr.environment_id IS NULL")
+
+
+
+class ResultSummaryManager(MTManager):
+    """An ``MTManager`` using ``ResultSummaryQuerySet``."""
+    queryset_class = ResultSummaryQuerySet
+
+
+    def with_result_summaries(self):
+        """Return queryset that prefetches result summaries when evaluated."""
+        return self.get_query_set().with_result_summaries()
+
+
+    def with_completion(self):
+        """Return queryset annotated with completion fraction."""
+        return self.get_query_set().with_completion()
+
+
+    def filter_completion(self, *ranges):
+        """Return queryset filtered by ranges of completion fraction."""
+        return self.get_query_set().filter_completion(*ranges)
 
 
 
@@ -28,12 +191,17 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
     build = models.TextField(null=True, blank=True)
     is_series = models.BooleanField(default=False)
     series = models.ForeignKey("self", null=True, blank=True)
+    # when runcaseversions were last brought up to date with suites
+    locked_on = models.DateTimeField(blank=True, null=True, editable=False)
 
     caseversions = models.ManyToManyField(
         CaseVersion, through="RunCaseVersion", related_name="runs")
     suites = models.ManyToManyField(
         Suite, through="RunSuite", related_name="runs")
 
+    everything = ResultSummaryManager(show_deleted=True)
+    objects = ResultSummaryManager(show_deleted=False)
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -62,12 +230,20 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
         return {RunCaseVersion: RunCaseVersion.objects.filter(run__in=objs)}
 
 
+    @classmethod
+    def _remove_envs(cls, objs, envs):
+        """Remove environments, discarding cached environment indexes."""
+        super(Run, cls)._remove_envs(objs, envs)
+        envindex.invalidate_run(*[getattr(o, "pk", o) for o in objs])
+
+
     def clone(self, *args, **kwargs):
         """Clone this Run with default cascade behavior."""
         kwargs.setdefault(
             "cascade", ["runsuites", "environments", "team"])
         overrides = kwargs.setdefault("overrides", {})
         overrides["status"] = self.STATUS.draft
+        overrides["locked_on"] = None
         overrides.setdefault("name", "Cloned: {0}".format(self.name))
         return super(Run, self).clone(*args, **kwargs)
 
@@ -81,6 +257,7 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
         overrides.setdefault("name", "{0} - Build: {1}".format(
             self.name, build))
         overrides["status"] = self.STATUS.draft
+        overrides["locked_on"] = None
         overrides.setdefault("is_series", False)
         overrides.setdefault("build", build)
         overrides.setdefault("series", self)
@@ -99,25 +276,30 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
 
 
     def refresh(self, *args, **kwargs):
-        """Update all the runcaseversions while the run is active."""
+        """Update the runcaseversions that changed while the run is active."""
         if self.status == self.STATUS.active:
-            self.update_case_versions()
+            self.update_case_versions(incremental=True)
 
 
-    def update_case_versions(self):
+    def update_case_versions(self, incremental=False):
         """
         Update the runcaseversions with any changes to suites.
 
-        This can happen while the run is still active.
+        This can happen while the run is still active. If ``incremental`` is
+        True and the run was locked before, only changes since then are
+        applied.
         """
         # we don't need all the runcaseversions for a series.  It is the
         # series member runs that will use them.  So only lock the caseversions
         # if this is NOT a series.
         if not self.is_series:
-            self._lock_case_versions()
+            if incremental and self.locked_on is not None:
+                self._refresh_case_versions()
+            else:
+                self._lock_case_versions()
 
 
-    @transaction.commit_on_success
+    @commit_on_success_unless_managed
     def _lock_case_versions(self):
         """
         Select caseversions from suites, create runcaseversions.
@@ -128,38 +310,13 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
         assertNumQueries, don't use the PyCharm debugger.
 
         """
+        locked_on = utcnow()
 
         # get the list of environments for this run
         run_env_ids = self.environments.values_list("id", flat=True)
 
         # make a list of cvs in order by RunSuite, then SuiteCase.
-        if len(run_env_ids):
-            cursor = connection.cursor()
-            sql = """SELECT DISTINCT cv.id as id
-                FROM execution_run as r
-                    INNER JOIN execution_runsuite as rs
-                        ON rs.run_id = r.id
-                    INNER JOIN library_suitecase as sc
-                        ON rs.suite_id = sc.suite_id
-                    INNER JOIN library_suite as s
-                        ON sc.suite_id = s.id
-                    INNER JOIN library_caseversion as cv
-                        ON cv.case_id = sc.case_id
-                        AND cv.productversion_id = r.productversion_id
-                    INNER JOIN library_caseversion_environments as cve
-                        ON cv.id = cve.caseversion_id
-                WHERE cv.status = 'active'
-                    AND cv.deleted_on IS NULL
-                    AND s.status = 'active'
-                    AND rs.run_id = {0}
-                    AND cve.environment_id IN ({1})
-                ORDER BY rs.order, sc.order
-                """.format(self.id, ",".join(map(str, run_env_ids)))
-            cursor.execute(sql)
-
-            cv_list = [x[0] for x in cursor.fetchall()]
-        else:
-            cv_list = []
+        cv_list = self._select_caseversion_ids(run_env_ids)
 
         # delete rcvs that we won't be needing anymore
         self._delete_runcaseversions(cv_list)
@@ -196,9 +353,199 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
 
         self._bulk_update_runcaseversion_environments_for_lock()
 
+        # runcaseversions and their environments were changed in bulk, so
+        # result rollups for this run must be recomputed.
+        ResultRollup.objects.rebuild([self.id])
+
+        self._mark_locked(locked_on)
+
         self._lock_caseversions_complete()
 
 
+    def _select_caseversion_ids(self, run_env_ids, case_ids=None):
+        """
+        Return ids of caseversions this run should include, in order.
+
+        Ordered by RunSuite, then SuiteCase. If ``case_ids`` is given, only
+        versions of those cases are selected.
+
+        """
+        if not len(run_env_ids):
+            return []
+
+        case_filter = ""
+        if case_ids is not None:
+            if not case_ids:
+                return []
+            case_filter = "AND sc.case_id IN ({0})".format(
+                ",".join(map(str, case_ids)))
+
+        cursor = connection.cursor()
+        sql = """SELECT DISTINCT cv.id as id
+            FROM execution_run as r
+                INNER JOIN execution_runsuite as rs
+                    ON rs.run_id = r.id
+                INNER JOIN library_suitecase as sc
+                    ON rs.suite_id = sc.suite_id
+                INNER JOIN library_suite as s
+                    ON sc.suite_id = s.id
+                INNER JOIN library_caseversion as cv
+                    ON cv.case_id = sc.case_id
+                    AND cv.productversion_id = r.productversion_id
+                INNER JOIN library_caseversion_environments as cve
+                    ON cv.id = cve.caseversion_id
+            WHERE cv.status = 'active'
+                AND cv.deleted_on IS NULL
+                AND s.status = 'active'
+                AND rs.run_id = {0}
+                AND cve.environment_id IN ({1})
+                {2}
+            ORDER BY rs.{3}, sc.{3}
+            """.format(
+                self.id,
+                ",".join(map(str, run_env_ids)),
+                case_filter,
+                # "order" is a reserved word
+                connection.ops.quote_name("order"),
+                )
+        cursor.execute(sql)
+
+        return [x[0] for x in cursor.fetchall()]
+
+
+    @commit_on_success_unless_managed
+    def _refresh_case_versions(self):
+        """
+        Update runcaseversions for only what changed since the last lock.
+
+        Changed cases are found from ``PendingRunChange`` records (hard deletes
+        and environment additions, recorded by signal handlers) and from the
+        modified/deleted timestamps of suite cases and caseversions; only their
+        runcaseversions, environments and result rollups are touched. Changes
+        to the run's suites or environments need a full lock.
+
+        """
+        locked_on = utcnow()
+        changed = (
+            Q(modified_on__gte=self.locked_on) |
+            Q(deleted_on__gte=self.locked_on)
+            )
+
+        case_ids = set(self.pending_changes.values_list("case_id", flat=True))
+        if (None in case_ids or
+                RunSuite.everything.filter(changed, run=self).exists() or
+                Suite.everything.filter(changed, runsuites__run=self).exists()):
+            self._lock_case_versions()
+            return
+
+        suitecase_ids = set(
+            SuiteCase.everything.filter(
+                changed, suite__runsuites__run=self).values_list(
+                "case_id", flat=True)
+            )
+        case_ids.update(suitecase_ids)
+        case_ids.update(
+            CaseVersion.everything.filter(
+                changed, productversion=self.productversion_id).values_list(
+                "case_id", flat=True)
+            )
+
+        if case_ids:
+            added = self._refresh_cases(case_ids)
+            # new runcaseversions and suite changes can both shift ordering
+            if added or suitecase_ids:
+                self._reorder_runcaseversions()
+
+        self._mark_locked(locked_on)
+
+
+    def _refresh_cases(self, case_ids):
+        """
+        Bring runcaseversions of given cases up to date.
+
+        Returns True if any runcaseversions were added.
+
+        """
+        case_ids = sorted(case_ids)
+        run_env_ids = list(self.environments.values_list("id", flat=True))
+        wanted = set(self._select_caseversion_ids(run_env_ids, case_ids))
+        existing = dict(
+            self.runcaseversions.filter(
+                caseversion__case__in=case_ids).values_list(
+                "caseversion_id", "id")
+            )
+
+        stale = [
+            rcv_id for cv_id, rcv_id in existing.items() if cv_id not in wanted]
+        if stale:
+            ResultRollup.objects.discard(stale)
+            RunCaseVersion.objects.filter(id__in=stale).delete(permanent=True)
+
+        added = [
+            RunCaseVersion(run_id=self.id, caseversion_id=cv_id)
+            for cv_id in wanted if cv_id not in existing
+            ]
+        RunCaseVersion.objects.bulk_create(added)
+
+        rcvs = self.runcaseversions.filter(caseversion__in=wanted)
+        self._sync_runcaseversion_environments(
+            list(rcvs.values_list("id", flat=True)))
+        ResultRollup.objects.refresh(rcvs)
+
+        return bool(added)
+
+
+    def _reorder_runcaseversions(self):
+        """Renumber runcaseversion order, updating only rows that changed."""
+        run_env_ids = list(self.environments.values_list("id", flat=True))
+        position = dict(
+            (cv_id, i + 1) for i, cv_id
+            in enumerate(self._select_caseversion_ids(run_env_ids))
+            )
+        changed = {}
+        for rcv_id, cv_id, order in self.runcaseversions.values_list(
+                "id", "caseversion_id", "order"):
+            if cv_id in position and position[cv_id] != order:
+                changed[rcv_id] = position[cv_id]
+
+        qn = connection.ops.quote_name
+        items = sorted(changed.items())
+        cursor = connection.cursor()
+        for i in range(0, len(items), REORDER_BATCH_SIZE):
+            batch = items[i:i + REORDER_BATCH_SIZE]
+            params = []
+            for rcv_id, order in batch:
+                params.extend([rcv_id, order])
+            params.extend([rcv_id for rcv_id, order in batch])
+            cursor.execute(
+                "UPDATE {0} SET {1} = CASE id {2} END WHERE id IN ({3})".format(
+                    qn(RunCaseVersion._meta.db_table),
+                    qn("order"),
+                    " ".join(["WHEN %s THEN %s"] * len(batch)),
+                    ",".join(["%s"] * len(batch)),
+                    ),
+                params,
+                )
+
+
+    def _mark_locked(self, locked_on):
+        """Record that runcaseversions are up to date as of ``locked_on``."""
+        # stored timestamps may be truncated to whole seconds (MySQL), so
+        # round down; reprocessing a change is harmless, missing one isn't.
+        locked_on = locked_on.replace(microsecond=0)
+        cursor = connection.cursor()
+        cursor.execute(
+            "DELETE FROM {0} WHERE run_id = %s".format(
+                PendingRunChange._meta.db_table),
+            [self.id],
+            )
+        Run.everything.filter(pk=self.pk).update(
+            locked_on=locked_on, notrack=True)
+        # the queryset update also bumped the concurrency-control version
+        self.cc_version += 1
+        self.locked_on = locked_on
+
+
     def _delete_runcaseversions(self, cv_list):
         """Hook to delete runcaseversions we know we don't need anymore."""
         self.runcaseversions.exclude(caseversion__in=cv_list).delete(
@@ -206,65 +553,111 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
 
 
     def _bulk_insert_new_runcaseversions(self, rcv_proxies):
-        """Hook to bulk-insert runcaseversions we know we DO need."""
-        RunCaseVersion.objects.bulk_insert_or_update(rcv_proxies)
-
-
-    def _bulk_update_runcaseversion_environments_for_lock(self):
         """
-        update runcaseversion_environment records with latest state.
+        Hook to bulk-insert runcaseversions we know we DO need.
 
-        Approach:
-          do another raw sql query to get all existing_rcv_envs for this run
-          existing_rcv_envs - needed_rcv_envs = list to delete (no longer needed)
-          needed_rcv_envs - existing_rcv_envs = list to create
-        build a list of RunCaseVersion_environment objects
-        and use bulk_create.
+        Proxies with an id update the order of existing runcaseversions.
 
         """
+        RunCaseVersion.objects.bulk_insert_or_update(
+            rcv_proxies, update_fields=["order", "modified_on"])
 
-        # re-query all the rcvs (including newly created) for this run
-        final_rcvs = RunCaseVersion.objects.filter(run=self).select_related(
-            "caseversion").prefetch_related("caseversion__environments")
 
-        final_rcv_ids = [x.id for x in final_rcvs]
+    def _bulk_update_runcaseversion_environments_for_lock(self):
+        """
+        update runcaseversion_environment records with latest state.
 
-        # runcaseversion_environments that were there prior to our changes
-        prev_rcv_envs_set = set(RunCaseVersion.environments.through.objects.filter(
-            runcaseversion_id__in=final_rcv_ids).values_list(
-                "runcaseversion_id", "environment_id"))
+        Each runcaseversion should have the intersection of its caseversion's
+        environments and the run's environments.
 
-        # runcaseversion_environment objects we will use to bulk create
-        # loop through all cvs and fetch the env intersection with this run
-        needed_rcv_envs_tuples = []
-        run_env_ids = set(
-            self.environments.values_list("id", flat=True))
-        for rcv in final_rcvs:
-            case_env_ids = set([x.id for x in rcv.caseversion.environments.all()])
-            for env in run_env_ids.intersection(case_env_ids):
-                needed_rcv_envs_tuples.append((rcv.id, env))
-        needed_rcv_envs_set = set(needed_rcv_envs_tuples)
+        """
+        self._sync_runcaseversion_environments()
 
-        # get the set of rcv_envs we need to delete because they don't belong
-        # to the needed set.
-        delete_rcv_envs = prev_rcv_envs_set - needed_rcv_envs_set
-        if len(delete_rcv_envs):
-            delquery = Q()
-            for combo in delete_rcv_envs:
-                delquery = delquery | Q(
-                    **{"runcaseversion_id": combo[0],
-                       "environment_id": combo[1]})
-            RunCaseVersion.environments.through.objects.filter(delquery).delete()
 
-        # get the set of rcv_envs we need to create that don't already exist
-        needed_rcv_envs_set = needed_rcv_envs_set - prev_rcv_envs_set
+    def _sync_runcaseversion_environments(self, rcv_ids=None):
+        """
+        Set environments of runcaseversions to those they should have.
 
-        # build all the objects to pass to bulk_create
-        needed_rcv_envs = [RunCaseVersion.environments.through(
-            runcaseversion_id=needed[0],
-            environment_id=needed[1]) for needed in needed_rcv_envs_set]
+        Works on all of this run's runcaseversions, or just the ids in
+        ``rcv_ids``. The needed rcv/env pairs are computed in the database by
+        joining runcaseversions to caseversion and run environments: pairs not
+        needed are deleted with an anti-join and missing ones are added with
+        an INSERT ... SELECT. Runcaseversions are processed in chunks of
+        ``RCV_ENV_CHUNK_SIZE``, so memory use and statement size are bounded.
 
-        RunCaseVersion.environments.through.objects.bulk_create(needed_rcv_envs)
+        """
+        if rcv_ids is not None:
+            rcv_ids = sorted(rcv_ids)
+            chunks = (
+                rcv_ids[i:i + RCV_ENV_CHUNK_SIZE]
+                for i in range(0, len(rcv_ids), RCV_ENV_CHUNK_SIZE)
+                )
+        else:
+            chunks = self._runcaseversion_id_chunks()
+
+        qn = connection.ops.quote_name
+        tables = {
+            "rcv": qn(RunCaseVersion._meta.db_table),
+            "rcv_envs": qn(RunCaseVersion.environments.through._meta.db_table),
+            "cv_envs": qn(CaseVersion.environments.through._meta.db_table),
+            "run_envs": qn(Run.environments.through._meta.db_table),
+            "envs": qn(Environment._meta.db_table),
+            }
+        # rcv/env pairs this run needs; "r" is the runcaseversion
+        needed = """
+            FROM {rcv} r
+            INNER JOIN {cv_envs} cve
+                ON cve.caseversion_id = r.caseversion_id
+            INNER JOIN {run_envs} re
+                ON re.environment_id = cve.environment_id
+                AND re.run_id = r.run_id
+            INNER JOIN {envs} e
+                ON e.id = cve.environment_id
+            WHERE e.deleted_on IS NULL
+            """.format(**tables)
+
+        cursor = connection.cursor()
+        for chunk in chunks:
+            ids = ",".join(["%s"] * len(chunk))
+            cursor.execute(
+                """DELETE FROM {rcv_envs}
+                WHERE {rcv_envs}.runcaseversion_id IN ({ids})
+                AND NOT EXISTS (
+                    SELECT 1 {needed}
+                    AND r.id = {rcv_envs}.runcaseversion_id
+                    AND cve.environment_id = {rcv_envs}.environment_id
+                    )
+                """.format(ids=ids, needed=needed, **tables),
+                chunk,
+                )
+            cursor.execute(
+                """INSERT INTO {rcv_envs} (runcaseversion_id, environment_id)
+                SELECT r.id, cve.environment_id {needed}
+                AND r.id IN ({ids})
+                AND NOT EXISTS (
+                    SELECT 1 FROM {rcv_envs} x
+                    WHERE x.runcaseversion_id = r.id
+                    AND x.environment_id = cve.environment_id
+                    )
+                """.format(ids=ids, needed=needed, **tables),
+                chunk,
+                )
+        transaction.commit_unless_managed()
+
+
+    def _runcaseversion_id_chunks(self):
+        """Yield lists of this run's runcaseversion ids, in id order."""
+        last = 0
+        while True:
+            chunk = list(
+                self.runcaseversions.filter(id__gt=last).order_by(
+                    "id").values_list("id", flat=True)[:RCV_ENV_CHUNK_SIZE]
+                )
+            if chunk:
+                yield chunk
+            if len(chunk) < RCV_ENV_CHUNK_SIZE:
+                return
+            last = chunk[-1]
 
 
     def _lock_caseversions_complete(self):
@@ -274,22 +667,18 @@ class Run(MTModel, TeamModel, DraftStatusModel, HasEnvironmentsModel):
 
     def result_summary(self):
         """Return a dict summarizing status of results."""
-        return result_summary(Result.objects.filter(runcaseversion__run=self))
+        try:
+            return self._prefetched_result_summary
+        except AttributeError:
+            return ResultRollup.objects.for_run(self).summary()
 
 
     def completion(self):
         """Return fraction of case/env combos that have a completed result."""
-        total = RunCaseVersion.environments.through._default_manager.filter(
-            runcaseversion__run=self).count()
-        completed = Result.objects.filter(
-            status__in=Result.COMPLETED_STATES,
-            runcaseversion__run=self).values(
-            "runcaseversion", "environment").distinct().count()
-
         try:
-            return float(completed) / total
-        except ZeroDivisionError:
-            return 0
+            return self._prefetched_completion
+        except AttributeError:
+            return ResultRollup.objects.for_run(self).completion()
 
 
 
@@ -316,6 +705,9 @@ class RunCaseVersion(HasEnvironmentsModel, MTModel):
     caseversion = models.ForeignKey(CaseVersion, related_name="runcaseversions")
     order = models.IntegerField(default=0, db_index=True)
 
+    everything = ResultSummaryManager(show_deleted=True)
+    objects = ResultSummaryManager(show_deleted=False)
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -357,22 +749,39 @@ class RunCaseVersion(HasEnvironmentsModel, MTModel):
         return ret
 
 
+    @classmethod
+    def bulk_deleted(cls, queryset):
+        """Drop soft-deleted runcaseversions from their runs' rollups."""
+        ResultRollup.objects.refresh(queryset)
+
+
+    @classmethod
+    def bulk_undeleted(cls, queryset):
+        """Add undeleted runcaseversions back into their runs' rollups."""
+        ResultRollup.objects.refresh(queryset)
+
+
+    @classmethod
+    def _remove_envs(cls, objs, envs):
+        """Remove environments, keeping result rollups in sync."""
+        super(RunCaseVersion, cls)._remove_envs(objs, envs)
+        ResultRollup.objects.refresh(objs, [getattr(e, "pk", e) for e in envs])
+
+
     def result_summary(self):
         """Return a dict summarizing status of results."""
-        return result_summary(self.results.all())
+        try:
+            return self._prefetched_result_summary
+        except AttributeError:
+            return ResultRollup.objects.for_runcaseversion(self).summary()
 
 
     def completion(self):
         """Return fraction of environments that have a completed result."""
-        total = self.environments.count()
-        completed = self.results.filter(
-            status__in=Result.COMPLETED_STATES).values(
-            "environment").distinct().count()
-
         try:
-            return float(completed) / total
-        except ZeroDivisionError:
-            return 0
+            return self._prefetched_completion
+        except AttributeError:
+            return ResultRollup.objects.for_runcaseversion(self).completion()
 
 
     def testers(self):
@@ -448,7 +857,7 @@ class RunCaseVersion(HasEnvironmentsModel, MTModel):
                 stepresult.status = StepResult.STATUS.failed
                 stepresult.bug_url = bug
                 stepresult.save(user=user)
-        self.save(force_update=True, user=user)
+        self.save(force_update=True, user=user, update_fields=[])
 
 
 
@@ -475,6 +884,48 @@ class RunSuite(MTModel):
 
 
 
+class ResultQuerySet(MTQuerySet):
+    """An ``MTQuerySet`` that can batch-load environment labels."""
+    _with_labels = False
+
+
+    def with_labels(self):
+        """
+        Prefetch labels of the results' environments when evaluated.
+
+        Whatever slice of the queryset is evaluated gets the labels of its
+        environments (which should be selected with ``select_related``) in
+        at most one query; see ``prefetch_labels``.
+
+        """
+        clone = self._clone()
+        clone._with_labels = True
+        return clone
+
+
+    def _clone(self, *args, **kwargs):
+        """Clone queryset, preserving the prefetch flag."""
+        clone = super(ResultQuerySet, self)._clone(*args, **kwargs)
+        clone._with_labels = self._with_labels
+        return clone
+
+
+    def iterator(self):
+        """Iterate over objects, prefetching labels if requested."""
+        objs = super(ResultQuerySet, self).iterator()
+        if self._with_labels:
+            objs = list(objs)
+            prefetch_labels([r.environment for r in objs])
+        return iter(objs)
+
+
+
+class ResultManager(MTManager):
+    """An ``MTManager`` using ``ResultQuerySet``."""
+    queryset_class = ResultQuerySet
+
+
+
 class Result(MTModel):
     """A result of a User running a RunCaseVersion in an Environment."""
     STATUS = Choices("assigned", "started", "passed", "failed", "invalidated")
@@ -489,13 +940,15 @@ class Result(MTModel):
     status = models.CharField(
         max_length=50, db_index=True, choices=STATUS, default=STATUS.assigned)
     comment = models.TextField(blank=True)
-    is_latest = models.BooleanField(default=True)
 
     review = models.CharField(
         max_length=50, db_index=True, choices=REVIEW, default=REVIEW.pending)
     reviewed_by = models.ForeignKey(
         User, related_name="reviews", blank=True, null=True)
 
+    everything = ResultManager(show_deleted=True)
+    objects = ResultManager(show_deleted=False)
+
 
     def __unicode__(self):
         """Return unicode representation."""
@@ -509,6 +962,13 @@ class Result(MTModel):
 
     def bug_urls(self):
         """Returns set of bug URLs associated with this result."""
+        try:
+            return set(
+                sr.bug_url for sr in self._prefetched_stepresults.values()
+                if sr.bug_url
+                )
+        except AttributeError:
+            pass
         return set(
             self.stepresults.exclude(
                 bug_url="").values_list("bug_url", flat=True).distinct()
@@ -516,25 +976,75 @@ class Result(MTModel):
 
 
     def save(self, *args, **kwargs):
-        if self.pk is None:
-            self.set_latest()
+        """Save result; a new result is the latest for its env/user/rcv."""
+        adding = self.pk is None
         super(Result, self).save(*args, **kwargs)
+        if deferring() is not None:
+            deferring().add_result(self)
+            return
+        if adding:
+            LatestResult.objects.set_latest(self)
+            self.__dict__.pop("_latest_cache", None)
+        else:
+            LatestResult.objects.filter(result=self).update(status=self.status)
+        ResultRollup.objects.refresh(
+            [self.runcaseversion], [self.environment_id])
 
 
-    def set_latest(self):
-        """
-        Set this result to latest, and unset all others with this env/user/rcv
+    def delete(self, user=None, permanent=False):
+        """Delete result; soft-deletes refresh rollups in ``bulk_deleted``."""
+        super(Result, self).delete(user=user, permanent=permanent)
+        if permanent:
+            self._rollups_changed(
+                [self.runcaseversion_id], [self.environment_id])
+
+
+    @classmethod
+    def bulk_deleted(cls, queryset):
+        """Refresh rollups of the rcvs and envs of (un)deleted results."""
+        rcv_ids, env_ids = set(), set()
+        for rcv_id, env_id in queryset.order_by().values_list(
+                "runcaseversion_id", "environment_id").distinct():
+            rcv_ids.add(rcv_id)
+            env_ids.add(env_id)
+        cls._rollups_changed(rcv_ids, env_ids)
+
+
+    bulk_undeleted = bulk_deleted
+
+
+    @classmethod
+    def _rollups_changed(cls, runcaseversion_ids, environment_ids):
+        """Refresh (or defer refreshing) rollups of given rcvs and envs."""
+        pending = deferring()
+        if pending is not None:
+            pending.runcaseversion_ids.update(runcaseversion_ids)
+            pending.environment_ids.update(environment_ids)
+            return
+        ResultRollup.objects.refresh(
+            RunCaseVersion.everything.filter(id__in=runcaseversion_ids),
+            environment_ids,
+            )
+
 
+    @property
+    def is_latest(self):
         """
+        True if this is the latest result for its env/user/rcv.
 
-        Result.objects.filter(
-            tester=self.tester,
-            runcaseversion=self.runcaseversion,
-            environment=self.environment,
-            is_latest=True,
-            ).exclude(pk=self.pk).update(is_latest=False)
+        Uses the reverse ``latest`` pointer, so results selected with
+        ``select_related("latest")`` (or ``prefetch_related("latest")``)
+        don't query; otherwise the pointer is queried once and cached.
 
-        self.is_latest=True
+        """
+        if self.pk is None:
+            return False
+        try:
+            return self.latest is not None
+        except LatestResult.DoesNotExist:
+            # cache the missing pointer too, as select_related would
+            self._latest_cache = None
+            return False
 
 
 
@@ -555,6 +1065,818 @@ class StepResult(MTModel):
 
 
 
+class LatestResultManager(models.Manager):
+    """Maintains the ``LatestResult`` pointer of each env/user/rcv."""
+    def set_latest(self, result):
+        """
+        Point the latest result of ``result``'s env/user/rcv at it.
+
+        Updates the existing pointer row, or inserts one if there is none
+        yet; if a concurrent insert beat us to it, updates that row instead.
+
+        """
+        key = {
+            "runcaseversion": result.runcaseversion_id,
+            "environment": result.environment_id,
+            "tester": result.tester_id,
+            }
+        if self.filter(**key).update(result=result, status=result.status):
+            return
+        sid = transaction.savepoint()
+        try:
+            self.create(
+                runcaseversion_id=result.runcaseversion_id,
+                environment_id=result.environment_id,
+                tester_id=result.tester_id,
+                result=result,
+                status=result.status,
+                )
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            self.filter(**key).update(result=result, status=result.status)
+        else:
+            transaction.savepoint_commit(sid)
+
+
+    def set_latest_bulk(self, results):
+        """
+        Point latest results of the env/user/rcvs of ``results`` at them.
+
+        ``results`` are saved results, at most one per env/user/rcv. Replaces
+        the existing pointers of each tester and environment in batches, so
+        should be called within a transaction.
+
+        """
+        by_key = {}
+        for result in results:
+            by_key.setdefault(
+                (result.tester_id, result.environment_id), []).append(result)
+
+        for (tester_id, env_id), group in by_key.items():
+            for i in range(0, len(group), LATEST_BATCH_SIZE):
+                batch = group[i:i + LATEST_BATCH_SIZE]
+                self.filter(
+                    tester=tester_id,
+                    environment=env_id,
+                    runcaseversion__in=[r.runcaseversion_id for r in batch],
+                    ).delete()
+                self.bulk_create(
+                    [
+                        self.model(
+                            runcaseversion_id=r.runcaseversion_id,
+                            environment_id=env_id,
+                            tester_id=tester_id,
+                            result_id=r.id,
+                            status=r.status,
+                            )
+                        for r in batch
+                        ]
+                    )
+
+
+    def rebuild(self, runcaseversion_ids):
+        """
+        Recompute pointers of given runcaseversions from their results.
+
+        Each env/user/rcv with results points at the one with the highest id
+        (deleted or not, as ``set_latest`` would have). Only missing, stale
+        or wrong pointers are replaced; returns the number of them.
+
+        """
+        latest_ids = list(
+            Result.everything.filter(
+                runcaseversion__in=runcaseversion_ids).values(
+                "runcaseversion", "environment", "tester").annotate(
+                latest=Max("id")).values_list("latest", flat=True)
+            )
+        expected = {}
+        for i in range(0, len(latest_ids), LATEST_BATCH_SIZE):
+            for rcv_id, env_id, tester_id, result_id, status in (
+                    Result.everything.filter(
+                        id__in=latest_ids[i:i + LATEST_BATCH_SIZE]
+                        ).values_list(
+                        "runcaseversion_id",
+                        "environment_id",
+                        "tester_id",
+                        "id",
+                        "status",
+                        )):
+                expected[(rcv_id, env_id, tester_id)] = (result_id, status)
+
+        existing = {}
+        stale = []
+        orphaned = 0
+        for pointer_id, rcv_id, env_id, tester_id, result_id, status in (
+                self.filter(runcaseversion__in=runcaseversion_ids).values_list(
+                    "id",
+                    "runcaseversion_id",
+                    "environment_id",
+                    "tester_id",
+                    "result_id",
+                    "status",
+                    )):
+            key = (rcv_id, env_id, tester_id)
+            if expected.get(key) == (result_id, status):
+                existing[key] = pointer_id
+            else:
+                stale.append(pointer_id)
+                orphaned += key not in expected
+        missing = [key for key in expected if key not in existing]
+
+        for i in range(0, len(stale), LATEST_BATCH_SIZE):
+            self.filter(id__in=stale[i:i + LATEST_BATCH_SIZE]).delete()
+        self.bulk_create(
+            [
+                self.model(
+                    runcaseversion_id=rcv_id,
+                    environment_id=env_id,
+                    tester_id=tester_id,
+                    result_id=expected[(rcv_id, env_id, tester_id)][0],
+                    status=expected[(rcv_id, env_id, tester_id)][1],
+                    )
+                for rcv_id, env_id, tester_id in missing
+                ],
+            batch_size=LATEST_BATCH_SIZE,
+            )
+        transaction.commit_unless_managed()
+        return len(missing) + orphaned
+
+
+
+LATEST_BATCH_SIZE = 500
+
+
+
+class LatestResult(models.Model):
+    """
+    Pointer to the latest result of a tester for a runcaseversion/env.
+
+    There is one row per runcaseversion/environment/tester that has results,
+    holding the id and status of the most recent result; it's replaced
+    whenever a new result is saved. Reads of "latest" results (summaries,
+    filters, the run-tests page) go through this table rather than scanning
+    result history.
+
+    Not an ``MTModel``: pointers are derived data and are never soft-deleted;
+    readers that care exclude pointers to deleted results.
+
+    """
+    runcaseversion = models.ForeignKey(
+        RunCaseVersion, related_name="latestresults")
+    environment = models.ForeignKey(Environment, related_name="+")
+    tester = models.ForeignKey(User, related_name="+")
+    result = models.OneToOneField(Result, related_name="latest")
+    status = models.CharField(
+        max_length=50, db_index=True, choices=Result.STATUS)
+
+    objects = LatestResultManager()
+
+
+    def __unicode__(self):
+        """Return unicode representation."""
+        return "Latest result of %s for rcv %s, env %s: %s" % (
+            self.tester_id,
+            self.runcaseversion_id,
+            self.environment_id,
+            self.result_id,
+            )
+
+
+    class Meta:
+        unique_together = [("runcaseversion", "environment", "tester")]
+
+
+
+class ResultRollupManager(models.Manager):
+    """
+    Maintains ``ResultRollup`` rows from results and runcaseversion envs.
+
+    Rollups are built from "cells", one per runcaseversion/environment combo,
+    and the runcaseversion, run/environment and run rows are sums of cells.
+    A run is considered rolled-up once its run row exists; until then, reads
+    see zero counts and any refresh rebuilds the whole run. Rollups of runs
+    that predate them are built by migration or ``rebuild_result_rollups``.
+
+    Concurrent refreshes of the same cell are caught by the unique constraint
+    and retried as updates. Aggregate rows have NULL columns, which unique
+    constraints don't cover, so they are only created with their run locked.
+
+    """
+    def for_run(self, run):
+        """Return the run-level rollup for ``run`` (zeros if none)."""
+        rollup = self._get(run=run, runcaseversion=None, environment=None)
+        if rollup is None:
+            return self.model(run_id=run.id)
+        return rollup
+
+
+    def for_runcaseversion(self, rcv):
+        """Return the rollup for runcaseversion ``rcv`` (zeros if none)."""
+        rollup = self._get(
+            run=rcv.run_id, runcaseversion=rcv, environment=None)
+        if rollup is None:
+            return self.model(run_id=rcv.run_id, runcaseversion=rcv)
+        return rollup
+
+
+    def _filter(self, **kwargs):
+        """Return rollups matching ``kwargs``; a ``None`` value means NULL."""
+        lookups = {}
+        for k, v in kwargs.items():
+            if v is None:
+                lookups["{0}__isnull".format(k)] = True
+            else:
+                lookups[k] = v
+        return self.filter(**lookups)
+
+
+    def _get(self, **kwargs):
+        """Return the single rollup matching ``kwargs``, or ``None``."""
+        try:
+            return self._filter(**kwargs).get()
+        except self.model.DoesNotExist:
+            return None
+
+
+    def rebuild(self, run_ids=None):
+        """
+        Recompute all rollups from scratch for given runs (default all runs).
+
+        """
+        if run_ids is None:
+            run_ids = list(Run.everything.values_list("id", flat=True))
+        run_ids = list(run_ids)
+        if not run_ids:
+            return
+
+        self._lock_runs(run_ids)
+        cursor = connection.cursor()
+        cursor.execute(
+            "DELETE FROM {0} WHERE run_id IN ({1})".format(
+                self.model._meta.db_table, ",".join(["%s"] * len(run_ids))),
+            run_ids,
+            )
+
+        cells = self._compute_cells(
+            RunCaseVersion.environments.through.objects.filter(
+                runcaseversion__run__in=run_ids),
+            Result.objects.filter(runcaseversion__run__in=run_ids),
+            )
+
+        rollups = {}
+        for run_id in run_ids:
+            rollups[(run_id, None, None)] = [0] * len(ROLLUP_COUNTS)
+        for (run_id, rcv_id, env_id), counts in cells.items():
+            for key in [
+                    (run_id, rcv_id, env_id),
+                    (run_id, rcv_id, None),
+                    (run_id, None, env_id),
+                    (run_id, None, None)]:
+                totals = rollups.setdefault(key, [0] * len(ROLLUP_COUNTS))
+                for i, count in enumerate(counts):
+                    totals[i] += count
+
+        self.bulk_create(
+            [self._make(key, counts) for key, counts in rollups.items()],
+            batch_size=ROLLUP_BATCH_SIZE,
+            )
+        transaction.commit_unless_managed()
+
+
+    def discard(self, runcaseversion_ids):
+        """
+        Remove rollups of given runcaseversions (before deleting them).
+
+        Their cells are subtracted from the run/environment and run rollups.
+
+        """
+        cells = self.filter(
+            runcaseversion__in=runcaseversion_ids, environment__isnull=False)
+        deltas = {}
+        for cell in cells:
+            for key in [
+                    (cell.run_id, None, cell.environment_id),
+                    (cell.run_id, None, None)]:
+                totals = deltas.setdefault(key, [0] * len(ROLLUP_COUNTS))
+                for i, count in enumerate(cell.counts()):
+                    totals[i] -= count
+
+        for key, delta in deltas.items():
+            if any(delta):
+                self._apply_delta(key, delta)
+        self.filter(runcaseversion__in=runcaseversion_ids).delete()
+        transaction.commit_unless_managed()
+
+
+    def refresh(self, runcaseversions, environment_ids=None):
+        """
+        Recompute cells for given runcaseversions, optionally only some envs.
+
+        ``runcaseversions`` is an iterable or queryset of ``RunCaseVersion``.
+        Changes in the cells are applied as deltas to the runcaseversion,
+        run/environment and run rollups.
+
+        """
+        if isinstance(runcaseversions, QuerySet):
+            run_by_rcv = dict(runcaseversions.values_list("id", "run_id"))
+        else:
+            run_by_rcv = dict((rcv.id, rcv.run_id) for rcv in runcaseversions)
+        if not run_by_rcv:
+            return
+
+        run_ids = set(run_by_rcv.values())
+        built = set(
+            self.filter(
+                run__in=run_ids,
+                runcaseversion__isnull=True,
+                environment__isnull=True,
+                ).values_list("run_id", flat=True)
+            )
+        if run_ids - built:
+            self.rebuild(run_ids - built)
+        run_by_rcv = dict(
+            (rcv_id, run_id) for rcv_id, run_id in run_by_rcv.items()
+            if run_id in built)
+        if not run_by_rcv:
+            return
+
+        envs = RunCaseVersion.environments.through.objects.filter(
+            runcaseversion__in=run_by_rcv.keys())
+        results = Result.objects.filter(runcaseversion__in=run_by_rcv.keys())
+        old_cells = self.select_for_update().filter(
+            runcaseversion__in=run_by_rcv.keys(), environment__isnull=False)
+        if environment_ids is not None:
+            envs = envs.filter(environment__in=environment_ids)
+            results = results.filter(environment__in=environment_ids)
+            old_cells = old_cells.filter(environment__in=environment_ids)
+
+        old = dict(
+            ((c.run_id, c.runcaseversion_id, c.environment_id), c.counts())
+            for c in old_cells
+            )
+        new = self._compute_cells(envs, results, run_by_rcv)
+
+        deltas = {}
+        changed = []
+        for key in set(old).union(new):
+            old_counts = old.get(key, [0] * len(ROLLUP_COUNTS))
+            new_counts = new.get(key, [0] * len(ROLLUP_COUNTS))
+            delta = [n - o for n, o in zip(new_counts, old_counts)]
+            if not any(delta):
+                continue
+            changed.append(key)
+            run_id, rcv_id, env_id = key
+            for agg in [
+                    (run_id, rcv_id, None),
+                    (run_id, None, env_id),
+                    (run_id, None, None)]:
+                totals = deltas.setdefault(agg, [0] * len(ROLLUP_COUNTS))
+                for i, d in enumerate(delta):
+                    totals[i] += d
+
+        if not changed:
+            return
+
+        stale = [
+            c.id for c in old_cells
+            if (c.run_id, c.runcaseversion_id, c.environment_id) in changed]
+        if stale:
+            self.filter(id__in=stale).delete()
+        conflicts = self._create(
+            [self._make(key, new[key]) for key in changed if key in new])
+        for cell in conflicts:
+            # a concurrent refresh created this cell since we read the old
+            # ones; update it, and correct the deltas, which assumed zeros
+            key = (cell.run_id, cell.runcaseversion_id, cell.environment_id)
+            existing = self.select_for_update().get(
+                run=cell.run_id,
+                runcaseversion=cell.runcaseversion_id,
+                environment=cell.environment_id,
+                )
+            for agg in [
+                    (key[0], key[1], None),
+                    (key[0], None, key[2]),
+                    (key[0], None, None)]:
+                totals = deltas[agg]
+                for i, count in enumerate(existing.counts()):
+                    totals[i] -= count
+            cell.id = existing.id
+            cell.save()
+
+        # runcaseversion rollups with the same delta (e.g. an environment
+        # removed from all of them) are updated together
+        missing = []
+        rcv_ids_by_delta = {}
+        for key, delta in deltas.items():
+            if not any(delta):
+                continue
+            run_id, rcv_id, env_id = key
+            if rcv_id is not None:
+                rcv_ids_by_delta.setdefault(
+                    (run_id, tuple(delta)), []).append(rcv_id)
+            elif not self._apply_delta(key, delta):
+                missing.append((key, delta))
+        for (run_id, delta), rcv_ids in rcv_ids_by_delta.items():
+            for i in range(0, len(rcv_ids), RCV_ENV_CHUNK_SIZE):
+                chunk = rcv_ids[i:i + RCV_ENV_CHUNK_SIZE]
+                updated = self._apply_delta((run_id, chunk, None), delta)
+                if updated < len(chunk):
+                    existing = set(
+                        self.filter(
+                            runcaseversion__in=chunk, environment__isnull=True,
+                            ).values_list("runcaseversion_id", flat=True)
+                        )
+                    missing.extend(
+                        ((run_id, rcv_id, None), list(delta))
+                        for rcv_id in set(chunk) - existing)
+        if missing:
+            self._create_aggregates(missing)
+        transaction.commit_unless_managed()
+
+
+    def _create(self, rollups):
+        """
+        Insert unsaved ``rollups``; return those that already exist.
+
+        Each insert that breaks the unique constraint (because a concurrent
+        refresh inserted the same cell) is rolled back to a savepoint.
+
+        """
+        sid = transaction.savepoint()
+        try:
+            self.bulk_create(rollups, batch_size=ROLLUP_BATCH_SIZE)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+        else:
+            transaction.savepoint_commit(sid)
+            return []
+
+        conflicts = []
+        for rollup in rollups:
+            sid = transaction.savepoint()
+            try:
+                rollup.save(force_insert=True)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                rollup.id = None
+                conflicts.append(rollup)
+            else:
+                transaction.savepoint_commit(sid)
+        return conflicts
+
+
+    def _create_aggregates(self, deltas):
+        """
+        Create missing aggregate rollups, given a list of (key, delta) pairs.
+
+        Their runs are locked first, and the update retried in case a
+        concurrent refresh has created the rollup meanwhile.
+
+        """
+        self._lock_runs(set(key[0] for key, delta in deltas))
+        for key, delta in deltas:
+            if not self._apply_delta(key, delta):
+                self._make(key, delta).save()
+
+
+    def _lock_runs(self, run_ids):
+        """Lock the rows of given runs until the end of the transaction."""
+        list(
+            Run.everything.select_for_update().filter(
+                id__in=run_ids).values_list("id", flat=True)
+            )
+
+
+    def _apply_delta(self, key, delta):
+        """
+        Add ``delta`` counts to the (run, rcv, env) ``key`` rollup.
+
+        The rcv in ``key`` may also be a list of rcv ids, to update the
+        rollups of all of them.
+
+        Also recomputes ``completed_fraction`` in the same statement. It is
+        assigned first and computed from the old counts plus the delta, since
+        MySQL (unlike other databases) lets later assignments in an UPDATE
+        see earlier ones. Returns number of rows updated.
+
+        """
+        qn = connection.ops.quote_name
+        completed = delta[ROLLUP_COUNTS.index("completed")]
+        total = delta[ROLLUP_COUNTS.index("total")]
+        where = []
+        params = [total, completed, total]
+        params.extend(delta)
+        for col, value in zip(
+                ["run_id", "runcaseversion_id", "environment_id"], key):
+            if value is None:
+                where.append("{0} IS NULL".format(col))
+            elif isinstance(value, list):
+                where.append(
+                    "{0} IN ({1})".format(col, ", ".join(["%s"] * len(value))))
+                params.extend(value)
+            else:
+                where.append("{0} = %s".format(col))
+                params.append(value)
+
+        sql = (
+            "UPDATE {table} SET completed_fraction = "
+            "CASE WHEN total + %s > 0 "
+            "THEN 1.0 * (completed + %s) / (total + %s) ELSE 0 END, "
+            "{counts} WHERE {where}"
+            ).format(
+            table=qn(self.model._meta.db_table),
+            counts=", ".join(
+                ["{0} = {0} + %s".format(qn(name)) for name in ROLLUP_COUNTS]),
+            where=" AND ".join(where),
+            )
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+    def _compute_cells(self, envs, results, run_by_rcv=None):
+        """
+        Return dict mapping (run, rcv, env) ids to list of cell counts.
+
+        ``envs`` is a queryset of runcaseversion/environment through rows, and
+        ``results`` a queryset of the results to count. If ``run_by_rcv`` (a
+        dict mapping rcv id to run id) isn't given, run ids are queried.
+
+        """
+        cells = {}
+        keys = ["runcaseversion_id", "environment_id"]
+        if run_by_rcv is None:
+            keys.append("runcaseversion__run_id")
+        envs = envs.filter(
+            runcaseversion__deleted_on__isnull=True).values_list(*keys)
+        results = results.filter(
+            status__in=Result.COMPLETED_STATES).order_by().values(
+            *(keys + ["status"]))
+
+        def cell(rcv_id, env_id, run_id=None):
+            if run_by_rcv is not None:
+                run_id = run_by_rcv[rcv_id]
+            return cells.setdefault(
+                (run_id, rcv_id, env_id), [0] * len(ROLLUP_COUNTS))
+
+        total = ROLLUP_COUNTS.index("total")
+        for row in envs:
+            cell(*row)[total] = 1
+
+        completed = ROLLUP_COUNTS.index("completed")
+        for row in results.annotate(latest=Count("latest")):
+            counts = cell(
+                row["runcaseversion_id"],
+                row["environment_id"],
+                row.get("runcaseversion__run_id"),
+                )
+            counts[completed] = 1
+            counts[ROLLUP_COUNTS.index(row["status"])] += row["latest"]
+
+        return cells
+
+
+    def _make(self, key, counts):
+        """Return unsaved rollup for (run, rcv, env) ``key`` with ``counts``."""
+        run_id, rcv_id, env_id = key
+        kwargs = dict(zip(ROLLUP_COUNTS, counts))
+        rollup = self.model(
+            run_id=run_id,
+            runcaseversion_id=rcv_id,
+            environment_id=env_id,
+            **kwargs)
+        rollup.completed_fraction = rollup.completion()
+        return rollup
+
+
+
+ROLLUP_COUNTS = Result.COMPLETED_STATES + ["completed", "total"]
+ROLLUP_BATCH_SIZE = 1000
+
+
+
+class ResultRollup(models.Model):
+    """
+    Denormalized result counts for a run, runcaseversion, or run/environment.
+
+    ``runcaseversion`` and ``environment`` are both null for the whole-run
+    rollup; one of them is set for per-runcaseversion or per-run/environment
+    rollups, and both are set for individual runcaseversion/environment cells.
+
+    ``passed``, ``failed`` and ``invalidated`` count latest results;
+    ``completed`` counts case/env combos with any completed result, and
+    ``total`` counts case/env combos in the run. ``completed_fraction`` is
+    ``completed / total``, stored (and indexed) for sorting and filtering
+    runs and runcaseversions by completion in the database.
+
+    Not an ``MTModel``: rollups are derived data and are never soft-deleted.
+
+    """
+    run = models.ForeignKey(Run, related_name="rollups")
+    runcaseversion = models.ForeignKey(
+        RunCaseVersion, blank=True, null=True, related_name="rollups")
+    environment = models.ForeignKey(
+        Environment, blank=True, null=True, related_name="+")
+
+    passed = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    invalidated = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    completed_fraction = models.FloatField(default=0, db_index=True)
+
+    objects = ResultRollupManager()
+
+
+    def __unicode__(self):
+        """Return unicode representation."""
+        return "Rollup for run %s, rcv %s, env %s" % (
+            self.run_id, self.runcaseversion_id, self.environment_id)
+
+
+    def counts(self):
+        """Return list of counts in ``ROLLUP_COUNTS`` order."""
+        return [getattr(self, name) for name in ROLLUP_COUNTS]
+
+
+    def summary(self):
+        """Return a dict summarizing status of latest results."""
+        return dict((s, getattr(self, s)) for s in Result.COMPLETED_STATES)
+
+
+    def completion(self):
+        """Return fraction of case/env combos that have a completed result."""
+        try:
+            return float(self.completed) / self.total
+        except ZeroDivisionError:
+            return 0
+
+
+    class Meta:
+        unique_together = [("run", "runcaseversion", "environment")]
+
+
+
+def _runcaseversion_environments_changed(sender, instance, action, reverse,
+        pk_set, **kwargs):
+    """Keep result rollups in sync with runcaseversion environments."""
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    if reverse:
+        if pk_set:
+            ResultRollup.objects.refresh(
+                RunCaseVersion.everything.filter(pk__in=pk_set), [instance.pk])
+    else:
+        ResultRollup.objects.refresh([instance], pk_set)
+
+
+m2m_changed.connect(
+    _runcaseversion_environments_changed,
+    sender=RunCaseVersion.environments.through,
+    )
+
+
+
+class PendingRunChangeManager(models.Manager):
+    """Records changes that active runs' runcaseversions need to pick up."""
+    def record(self, runs, case_ids=None):
+        """
+        Record changes to cases ``case_ids`` (default: anything) for ``runs``.
+
+        ``runs`` is a queryset; only active, locked, non-series runs in it are
+        recorded, since the rest get a full lock when activated.
+
+        """
+        run_ids = list(
+            runs.filter(
+                status=Run.STATUS.active,
+                is_series=False,
+                locked_on__isnull=False,
+                ).values_list("id", flat=True).distinct()
+            )
+        if not run_ids:
+            return
+        if case_ids is None or len(case_ids) > PENDING_CHANGES_MAX_CASES:
+            case_ids = [None]
+        self.bulk_create(
+            [
+                self.model(run_id=run_id, case_id=case_id)
+                for run_id in run_ids for case_id in case_ids
+                ]
+            )
+
+
+
+PENDING_CHANGES_MAX_CASES = 500
+REORDER_BATCH_SIZE = 500
+RCV_ENV_CHUNK_SIZE = 500
+
+
+
+class PendingRunChange(models.Model):
+    """
+    A change since its last lock that a run's runcaseversions don't reflect.
+
+    Only changes that can't be found from modified/deleted timestamps are
+    recorded: permanent deletions and environment additions. ``case_id`` is
+    the case whose runcaseversions need refreshing; if null, the whole run
+    needs a full lock. It's a plain integer so a record can outlive the case.
+
+    """
+    run = models.ForeignKey(Run, related_name="pending_changes")
+    case_id = models.IntegerField(blank=True, null=True)
+
+    objects = PendingRunChangeManager()
+
+
+    def __unicode__(self):
+        """Return unicode representation."""
+        return "Pending change to case %s in run %s" % (
+            self.case_id, self.run_id)
+
+
+
+def _record_caseversion_changes(caseversions):
+    """Record pending changes for runs including given caseversions."""
+    case_ids_by_pv = {}
+    for cv in caseversions:
+        case_ids_by_pv.setdefault(cv.productversion_id, set()).add(cv.case_id)
+    for pv_id, case_ids in case_ids_by_pv.items():
+        PendingRunChange.objects.record(
+            Run.objects.filter(productversion=pv_id), case_ids)
+
+
+
+def _suitecase_deleted(sender, instance, **kwargs):
+    """A suite case was permanently deleted."""
+    PendingRunChange.objects.record(
+        Run.objects.filter(runsuites__suite=instance.suite_id),
+        [instance.case_id],
+        )
+
+
+
+def _caseversion_deleted(sender, instance, **kwargs):
+    """A caseversion was permanently deleted."""
+    _record_caseversion_changes([instance])
+
+
+
+def _runsuite_deleted(sender, instance, **kwargs):
+    """A run suite was permanently deleted."""
+    PendingRunChange.objects.record(Run.objects.filter(pk=instance.run_id))
+
+
+
+def _caseversion_environments_changed(sender, instance, action, reverse,
+        pk_set, **kwargs):
+    """Environments of caseversions were changed."""
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    if reverse:
+        if pk_set:
+            _record_caseversion_changes(
+                CaseVersion.everything.filter(pk__in=pk_set))
+    else:
+        _record_caseversion_changes([instance])
+
+
+
+def _run_environments_changed(sender, instance, action, reverse, pk_set,
+        **kwargs):
+    """Environments of runs were changed."""
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    if not reverse:
+        envindex.invalidate_run(instance.pk)
+    elif action == "post_clear":
+        envindex.invalidate_all()
+    else:
+        envindex.invalidate_run(*(pk_set or []))
+    # removals cascade to runcaseversions directly
+    if action != "post_add":
+        return
+    if reverse:
+        runs = Run.objects.filter(pk__in=pk_set or [])
+    else:
+        runs = Run.objects.filter(pk=instance.pk)
+    PendingRunChange.objects.record(runs)
+
+
+post_delete.connect(_suitecase_deleted, sender=SuiteCase)
+post_delete.connect(_caseversion_deleted, sender=CaseVersion)
+post_delete.connect(_runsuite_deleted, sender=RunSuite)
+m2m_changed.connect(
+    _caseversion_environments_changed,
+    sender=CaseVersion.environments.through,
+    )
+m2m_changed.connect(
+    _run_environments_changed,
+    sender=Run.environments.through,
+    )
+
+
+
 def result_summary(results):
     """
     Given a queryset of results, return a dict summarizing their states.
@@ -562,7 +1884,8 @@ def result_summary(results):
     """
     states = Result.COMPLETED_STATES
 
-    result_ids = results.filter(is_latest=True).values_list("id", flat=True)
+    result_ids = results.filter(
+        latest__isnull=False).values_list("id", flat=True)
 
     if not result_ids:
         return dict((s, 0) for s in states)
@@ -578,3 +1901,226 @@ def result_summary(results):
     return dict(zip(states, cursor.fetchone()))
 
 
+
+
+
+PREFETCH_SUMMARIES_SQL = """
+SELECT cells.grp, {sums}, SUM(cells.completed), SUM(cells.total)
+FROM (
+    SELECT {group} AS grp, {latest}, 1 AS completed, 0 AS total
+    FROM {result} r
+    INNER JOIN {rcv} rcv ON rcv.id = r.runcaseversion_id
+    LEFT OUTER JOIN {latestresult} lr ON lr.result_id = r.id
+    WHERE r.deleted_on IS NULL
+    AND r.status IN ({states})
+    AND {group} IN ({ids})
+    GROUP BY {group}, r.runcaseversion_id, r.environment_id
+    UNION ALL
+    SELECT {group}, {zeros}, 0, COUNT(*)
+    FROM {through} re
+    INNER JOIN {rcv} rcv ON rcv.id = re.runcaseversion_id
+    WHERE {group} IN ({ids})
+    GROUP BY {group}
+) cells
+GROUP BY cells.grp
+"""
+
+
+
+def prefetch_result_summaries(queryset_or_page):
+    """
+    Attach result summaries and completion to given runs or runcaseversions.
+
+    Accepts a queryset or other iterable of ``Run`` or ``RunCaseVersion``
+    instances (all of one class) and computes latest-result counts and
+    completion for all of them with a single grouped query. Afterwards their
+    ``result_summary()`` and ``completion()`` methods don't query. Returns the
+    instances as a list.
+
+    """
+    objs = list(queryset_or_page)
+    if not objs:
+        return objs
+
+    if isinstance(objs[0], Run):
+        group = "rcv.run_id"
+    else:
+        group = "rcv.id"
+
+    states = Result.COMPLETED_STATES
+    ids = list(set(o.id for o in objs))
+    qn = connection.ops.quote_name
+
+    sql = PREFETCH_SUMMARIES_SQL.format(
+        group=group,
+        sums=", ".join(["SUM(cells.{0})".format(s) for s in states]),
+        latest=", ".join(
+            [
+                "SUM(CASE WHEN lr.id IS NOT NULL AND r.status = %s "
+                "THEN 1 ELSE 0 END) AS {0}".format(s)
+                for s in states
+                ]
+            ),
+        zeros=", ".join(["0"] * len(states)),
+        states=", ".join(["%s"] * len(states)),
+        ids=", ".join(["%s"] * len(ids)),
+        result=qn(Result._meta.db_table),
+        latestresult=qn(LatestResult._meta.db_table),
+        rcv=qn(RunCaseVersion._meta.db_table),
+        through=qn(RunCaseVersion.environments.through._meta.db_table),
+        )
+    params = list(states)
+    params.extend(states)
+    params.extend(ids)
+    params.extend(ids)
+
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+
+    found = {}
+    for row in cursor.fetchall():
+        found[row[0]] = [int(c or 0) for c in row[1:]]
+
+    for obj in objs:
+        counts = found.get(obj.id, [0] * (len(states) + 2))
+        completed, total = counts[-2:]
+        obj._prefetched_result_summary = dict(zip(states, counts))
+        try:
+            obj._prefetched_completion = float(completed) / total
+        except ZeroDivisionError:
+            obj._prefetched_completion = 0
+
+    return objs
+
+
+
+def prefetch_execution_results(runcaseversions, user, environment):
+    """
+    Attach what the run-tests page shows to given runcaseversions.
+
+    For each runcaseversion, loads the latest result of ``user`` in
+    ``environment`` (see ``prefetch_results_for``), the step results of the
+    failed ones, and the suites the runcaseversion is in for its run (see
+    ``prefetch_run_suites``); in a fixed number of queries regardless of
+    the number of runcaseversions. Returns the runcaseversions as a list.
+
+    """
+    rcvs = prefetch_results_for(runcaseversions, user, environment)
+    prefetch_stepresults(
+        [
+            rcv._prefetched_result_for for rcv in rcvs
+            if rcv._prefetched_result_for.status == Result.STATUS.failed
+            ]
+        )
+    prefetch_run_suites(rcvs)
+    return rcvs
+
+
+
+def prefetch_results_for(runcaseversions, user, environment):
+    """
+    Attach latest results in ``environment`` to given runcaseversions.
+
+    Sets ``_prefetched_result_for`` to the latest result of ``user`` (or a new
+    unsaved result, if there is none) and ``_prefetched_other_result`` to the
+    most recently modified latest completed result of another tester (or
+    None). Returns the runcaseversions as a list.
+
+    """
+    rcvs = list(runcaseversions)
+    if not rcvs:
+        return rcvs
+    rcv_ids = [rcv.id for rcv in rcvs]
+
+    latest = LatestResult.objects.filter(
+        environment=environment,
+        runcaseversion__in=rcv_ids,
+        result__deleted_on__isnull=True,
+        )
+    mine = dict(
+        (lr.runcaseversion_id, lr.result)
+        for lr in latest.filter(tester=user).select_related("result")
+        )
+    # in modified order, so the most recent one wins
+    others = dict(
+        (lr.runcaseversion_id, lr.result)
+        for lr in latest.filter(
+            status__in=Result.COMPLETED_STATES).exclude(
+            tester=user).select_related("result__tester").order_by(
+            "result__modified_on", "result__id")
+        )
+
+    for rcv in rcvs:
+        result = mine.get(rcv.id)
+        if result is None:
+            result = Result(
+                environment=environment,
+                tester=user,
+                runcaseversion=rcv,
+                )
+        rcv._prefetched_result_for = result
+        rcv._prefetched_other_result = others.get(rcv.id)
+
+    return rcvs
+
+
+
+def prefetch_stepresults(results):
+    """
+    Attach step results to given results, by step id.
+
+    Sets ``_prefetched_stepresults`` to a dictionary mapping step id to step
+    result, for each of the given results (unsaved results have none).
+
+    """
+    saved = dict((r.id, r) for r in results if r.id is not None)
+    for result in results:
+        result._prefetched_stepresults = {}
+    if not saved:
+        return
+    for stepresult in StepResult.objects.filter(result__in=list(saved)):
+        result = saved[stepresult.result_id]
+        stepresult.result = result
+        result._prefetched_stepresults[stepresult.step_id] = stepresult
+
+
+
+def prefetch_run_suites(runcaseversions):
+    """
+    Attach to each runcaseversion the suites of its run that include its case.
+
+    Sets ``_prefetched_suites`` to a list of suites. Returns the
+    runcaseversions as a list.
+
+    """
+    rcvs = list(runcaseversions)
+    if not rcvs:
+        return rcvs
+
+    rcv_cases = dict(
+        RunCaseVersion.everything.filter(
+            pk__in=[rcv.id for rcv in rcvs]).values_list(
+            "id", "caseversion__case_id")
+        )
+    run_suites = {}
+    for run_id, suite_id in Run.suites.through.objects.filter(
+            run__in=set(rcv.run_id for rcv in rcvs),
+            suite__deleted_on__isnull=True,
+            ).values_list("run_id", "suite_id"):
+        run_suites.setdefault(run_id, set()).add(suite_id)
+    case_suites = {}
+    for case_id, suite_id in Suite.cases.through.everything.filter(
+            case__in=set(rcv_cases.values()),
+            suite__in=set().union(*run_suites.values()),
+            ).values_list("case_id", "suite_id"):
+        case_suites.setdefault(case_id, set()).add(suite_id)
+    suites = list(
+        Suite.objects.filter(pk__in=set().union(*case_suites.values())))
+
+    for rcv in rcvs:
+        suite_ids = case_suites.get(
+            rcv_cases.get(rcv.id), set()).intersection(
+            run_suites.get(rcv.run_id, set()))
+        rcv._prefetched_suites = [s for s in suites if s.id in suite_ids]
+
+    return rcvs
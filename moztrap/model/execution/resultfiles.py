@@ -0,0 +1,182 @@
+"""
+Streaming parsers for result files of automated test runs.
+
+Each parser takes an open file and yields one dictionary per test result,
+without reading the whole file into memory::
+
+    {
+        "ref": "ab-12 open the url",  # the test's name, for reporting
+        "prefix": "ab",  # case idprefix, or None
+        "case": 12,  # case id, or None if the name has no case reference
+        "status": "failed",
+        "comment": "Timed out."
+    }
+
+NDJSON records may also carry ``bug``, ``stepnumber`` and ``environment``.
+
+A test is tied to a case by a case reference (the case id, optionally
+preceded by the case's idprefix and a dash, as in ``ab-12``) either at the
+start of its name or anywhere in it after a ``#``: ``12``, ``ab-12: login``
+and ``test_login #ab-12`` all refer to case 12.
+
+"""
+import json
+import re
+from xml.etree import cElementTree as ElementTree
+
+
+
+class ResultFileError(ValueError):
+    """A result file can't be parsed."""
+    pass
+
+
+
+CASE_REF = r"(?:(?P<prefix>\S+)-)?(?P<id>\d+)\b"
+LEADING_CASE_REF = re.compile(r"^\s*#?" + CASE_REF)
+TAGGED_CASE_REF = re.compile(r"#" + CASE_REF)
+
+
+
+def parse_case_ref(name):
+    """Return (prefix, case id) referenced by test ``name``, or (None, None)."""
+    match = LEADING_CASE_REF.match(name) or TAGGED_CASE_REF.search(name)
+    if match is None:
+        return None, None
+    return match.group("prefix"), int(match.group("id"))
+
+
+
+def record(name, status, comment=""):
+    """Return result record for test ``name``."""
+    prefix, case_id = parse_case_ref(name)
+    return {
+        "ref": name,
+        "prefix": prefix,
+        "case": case_id,
+        "status": status,
+        "comment": comment,
+        }
+
+
+
+def parse_junit(fh):
+    """
+    Yield results of the ``testcase`` elements of a JUnit XML file.
+
+    A test case with a ``failure`` or ``error`` child failed, with the
+    failure message as comment; skipped test cases are left out. Parsed
+    elements are dropped as we go, so memory use doesn't grow with the file.
+
+    """
+    stack = []
+    try:
+        for event, elem in ElementTree.iterparse(fh, events=("start", "end")):
+            if event == "start":
+                stack.append(elem)
+                continue
+            stack.pop()
+            if elem.tag != "testcase":
+                continue
+
+            status, comment = "passed", ""
+            for child in elem:
+                if child.tag in ("failure", "error"):
+                    status = "failed"
+                    comment = (
+                        child.get("message") or (child.text or "").strip())
+                    break
+                if child.tag == "skipped":
+                    status = None
+            name = elem.get("name", "")
+            if stack:
+                stack[-1].remove(elem)
+            if status is not None:
+                yield record(name, status, comment)
+    except SyntaxError as e:
+        raise ResultFileError("Could not parse XML: {0}".format(e))
+
+
+
+TAP_RESULT = re.compile(r"^(?P<not>not )?ok\b\s*\d*\s*(?:-\s*)?(?P<desc>.*)$")
+TAP_DIRECTIVE = re.compile(r"\s#\s*(?P<directive>SKIP|TODO)\S*.*$", re.I)
+
+
+
+def parse_tap(fh):
+    """
+    Yield results of the test lines of a TAP stream.
+
+    Tests with a SKIP or TODO directive are left out. Parsing stops at a
+    ``Bail out!`` line.
+
+    """
+    for line in fh:
+        line = line.rstrip()
+        if line.startswith("Bail out!"):
+            break
+        match = TAP_RESULT.match(line)
+        if match is None:
+            continue
+        desc = match.group("desc")
+        if TAP_DIRECTIVE.search(desc):
+            continue
+        yield record(desc, "failed" if match.group("not") else "passed")
+
+
+
+def parse_ndjson(fh):
+    """
+    Yield results of a newline-delimited JSON file, one object per line.
+
+    Each object has a ``case`` (case id or reference like ``ab-12``) and a
+    ``status``, and optionally ``comment``, ``bug``, ``stepnumber`` and
+    ``environment``.
+
+    """
+    for i, line in enumerate(fh, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            raise ResultFileError(
+                "Could not parse JSON on line {0}: {1}".format(i, e))
+        if not isinstance(data, dict):
+            raise ResultFileError(
+                "Line {0} is not a JSON object.".format(i))
+
+        result = record(
+            unicode(data.get("case", "")),
+            data.get("status"),
+            data.get("comment") or "",
+            )
+        for key in ["bug", "stepnumber", "environment"]:
+            if data.get(key) is not None:
+                result[key] = data[key]
+        yield result
+
+
+
+PARSERS = {
+    "junit": parse_junit,
+    "tap": parse_tap,
+    "ndjson": parse_ndjson,
+    }
+
+
+EXTENSIONS = {
+    ".xml": "junit",
+    ".tap": "tap",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    }
+
+
+
+def guess_format(filename):
+    """Return result file format for ``filename`` by extension, or None."""
+    for ext, format in EXTENSIONS.items():
+        if filename.lower().endswith(ext):
+            return format
+    return None
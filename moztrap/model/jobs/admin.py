@@ -0,0 +1,18 @@
+"""
+Admin config for background jobs.
+
+"""
+from django.contrib import admin
+
+from . import models
+
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = [
+        "__unicode__", "user", "created_on", "finished_on", "done", "total"]
+    list_filter = ["status", "task"]
+
+
+
+admin.site.register(models.Job, JobAdmin)
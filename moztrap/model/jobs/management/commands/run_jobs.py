@@ -0,0 +1,57 @@
+"""
+Management command to run queued background jobs.
+
+"""
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moztrap.model.jobs.models import Job
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (run activation, series cloning...), "
+        "polling for new ones until interrupted.")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--once",
+            action="store_true",
+            dest="once",
+            default=False,
+            help="Exit when there are no more queued jobs"),
+        make_option(
+            "--interval",
+            type="float",
+            dest="interval",
+            default=2.0,
+            help="Seconds to wait between polls for jobs (default 2)"),
+        )
+
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get("verbosity", 1))
+        if args or options["interval"] <= 0:
+            raise CommandError("Usage: [--once] [--interval <seconds>]")
+
+        count = 0
+        try:
+            while True:
+                job = Job.objects.claim()
+                if job is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["interval"])
+                    continue
+                job.run(commit=True)
+                count += 1
+                if verbosity > 1 or job.status == Job.STATUS.failed:
+                    self.stdout.write(u"{0}\n".format(job))
+        except KeyboardInterrupt:
+            pass
+
+        if verbosity:
+            self.stdout.write("Ran {0} job(s).\n".format(count))
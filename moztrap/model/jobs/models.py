@@ -0,0 +1,248 @@
+"""
+Models for background jobs.
+
+"""
+import datetime
+import json
+import traceback
+
+from django.conf import settings
+from django.db import models, transaction
+
+from model_utils import Choices
+
+from ..mtmodel import utcnow
+from ..core.auth import User
+from . import tasks
+
+
+
+class JobManager(models.Manager):
+    """Queues and claims background jobs."""
+    def enqueue(self, task, user=None, unique=False, **kwargs):
+        """
+        Queue and return a job running ``task`` with keyword args ``kwargs``.
+
+        If ``unique`` is True and an unfinished job with the same task and
+        arguments exists (that isn't stale, see ``stale``), return that one
+        instead. Unless the ``ASYNC_JOBS``
+        setting is True, the job is run right away (and is finished when
+        returned); otherwise it's left for the ``run_jobs`` worker.
+
+        """
+        if task not in tasks.registry:
+            raise ValueError("Unknown task {0!r}.".format(task))
+        arguments = json.dumps(kwargs, sort_keys=True)
+
+        job = None
+        if unique:
+            job = self.filter(
+                models.Q(status=Job.STATUS.queued) |
+                models.Q(
+                    status=Job.STATUS.running,
+                    heartbeat_on__gte=self._stale_before(),
+                    ),
+                task=task,
+                arguments=arguments,
+                ).order_by("id")[:1]
+            job = job[0] if job else None
+        if job is None:
+            job = self.create(task=task, arguments=arguments, user=user)
+            if not settings.ASYNC_JOBS:
+                job.run()
+        return job
+
+
+    def claim(self):
+        """
+        Mark the oldest queued job running and return it; None if no jobs.
+
+        Safe to call from concurrent workers: a job is only claimed by the
+        worker whose update changes its status. Stale running jobs are
+        failed first (see ``fail_stale``).
+
+        """
+        self.fail_stale()
+        while True:
+            ids = list(
+                self.filter(status=Job.STATUS.queued).order_by(
+                    "id").values_list("id", flat=True)[:1]
+                )
+            if not ids:
+                # end the read transaction, so the next poll sees new jobs
+                transaction.commit_unless_managed()
+                return None
+            now = utcnow()
+            claimed = self.filter(pk=ids[0], status=Job.STATUS.queued).update(
+                status=Job.STATUS.running, started_on=now, heartbeat_on=now)
+            if claimed:
+                return self.get(pk=ids[0])
+
+
+    def stale(self):
+        """
+        Return running jobs whose worker has presumably died.
+
+        A running job is stale when it hasn't reported progress (or started)
+        within the last ``JOB_TIMEOUT`` seconds.
+
+        """
+        return self.filter(
+            status=Job.STATUS.running,
+            heartbeat_on__lt=self._stale_before(),
+            )
+
+
+    def fail_stale(self):
+        """
+        Mark stale running jobs failed; return how many there were.
+
+        Their work is not retried (a task that crashes its worker would be
+        retried forever); the operation can be queued again.
+
+        """
+        return self.stale().update(
+            status=Job.STATUS.failed,
+            error="Worker stopped responding.",
+            finished_on=utcnow(),
+            )
+
+
+    def _stale_before(self):
+        """Return time before which a running job's heartbeat is stale."""
+        return utcnow() - datetime.timedelta(seconds=settings.JOB_TIMEOUT)
+
+
+
+class Job(models.Model):
+    """
+    A task queued to run outside the request, e.g. activating a large run.
+
+    ``arguments`` and ``result`` are JSON. While the job runs, ``done`` and
+    ``total`` report its progress in task-defined steps, and ``heartbeat_on``
+    is the time of the last report; ``error`` is the traceback of a failed
+    job.
+
+    """
+    STATUS = Choices("queued", "running", "done", "failed")
+
+    task = models.CharField(max_length=100)
+    arguments = models.TextField(default="{}")
+    status = models.CharField(
+        max_length=30,
+        db_index=True,
+        choices=STATUS,
+        default=STATUS.queued,
+        )
+    done = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    user = models.ForeignKey(
+        User,
+        blank=True,
+        null=True,
+        related_name="+",
+        on_delete=models.SET_NULL,
+        )
+    created_on = models.DateTimeField(default=utcnow)
+    started_on = models.DateTimeField(blank=True, null=True)
+    heartbeat_on = models.DateTimeField(blank=True, null=True)
+    finished_on = models.DateTimeField(blank=True, null=True)
+
+    objects = JobManager()
+
+
+    def __unicode__(self):
+        """Return unicode representation."""
+        return u"{0} job {1} ({2})".format(self.task, self.id, self.status)
+
+
+    @property
+    def finished(self):
+        """True if this job is done or failed."""
+        return self.status in [self.STATUS.done, self.STATUS.failed]
+
+
+    def get_result(self):
+        """Return the decoded result of this job; None if not done."""
+        return json.loads(self.result) if self.result else None
+
+
+    def progress(self):
+        """Return fraction of this job that is finished."""
+        if self.status == self.STATUS.done:
+            return 1
+        try:
+            return float(self.done) / self.total
+        except ZeroDivisionError:
+            return 0
+
+
+    def set_progress(self, done, total):
+        """
+        Record that ``done`` of ``total`` steps of this job are finished.
+
+        When the job is run by the worker, this commits the work done so far,
+        so the progress is visible to others.
+
+        """
+        self.done, self.total = done, total
+        self._set(done=done, total=total, heartbeat_on=utcnow())
+        if getattr(self, "_commit", False):
+            transaction.commit()
+
+
+    def run(self, commit=False):
+        """
+        Run the task of this job now, recording its progress and outcome.
+
+        With ``commit`` (as in the worker), the task runs in a transaction
+        that is committed at each progress report and at the end; if the task
+        fails its uncommitted work is rolled back and the error is recorded
+        on the job. Without it (running inline in a request) the task runs in
+        the caller's transaction and errors propagate.
+
+        """
+        func = tasks.registry[self.task]
+        kwargs = dict(
+            (str(k), v) for k, v in json.loads(self.arguments).items())
+
+        self._commit = commit
+        now = utcnow()
+        self._set(status=self.STATUS.running, started_on=now, heartbeat_on=now)
+        try:
+            if commit:
+                with transaction.commit_manually():
+                    try:
+                        result = func(self, **kwargs)
+                    except Exception:
+                        transaction.rollback()
+                        raise
+                    else:
+                        transaction.commit()
+            else:
+                result = func(self, **kwargs)
+        except Exception:
+            if not commit:
+                raise
+            self._set(
+                status=self.STATUS.failed,
+                error=traceback.format_exc(),
+                finished_on=utcnow(),
+                )
+        else:
+            self._set(
+                status=self.STATUS.done,
+                result=json.dumps(result),
+                finished_on=utcnow(),
+                )
+        finally:
+            self._commit = False
+
+
+    def _set(self, **kwargs):
+        """Set and save given field values."""
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+        self.__class__.objects.filter(pk=self.pk).update(**kwargs)
@@ -0,0 +1,114 @@
+"""
+Tasks that can be run as background jobs.
+
+A task is a function taking the running ``Job`` and the job's keyword
+arguments, and returning a JSON-serializable result. Tasks report progress
+with ``job.set_progress(done, total)``; when run by the worker each progress
+report is committed, so tasks must be safe to re-run from any such point. A
+job that doesn't report progress for ``JOB_TIMEOUT`` seconds is assumed to
+have lost its worker and is failed.
+
+"""
+from ..mtmodel import BulkCloner
+from ..core.models import ProductVersion
+from ..environments.models import Element, Profile
+from ..execution.models import Run
+
+
+
+# maps task name to task function
+registry = {}
+
+
+
+def task(name):
+    """Decorator registering the decorated function as task ``name``."""
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+
+@task("activate_run")
+def activate_run(job, run_id):
+    """Activate run ``run_id``, locking in its runcaseversions."""
+    run = Run.objects.get(pk=run_id)
+    run.activate(user=job.user)
+    return {"run_id": run.id}
+
+
+
+@task("refresh_run")
+def refresh_run(job, run_id):
+    """Pick up changes to the suites and cases of active run ``run_id``."""
+    run = Run.objects.get(pk=run_id)
+    run.refresh(user=job.user)
+    return {"run_id": run.id}
+
+
+
+@task("clone_run_for_series")
+def clone_run_for_series(job, run_id, build):
+    """Clone series ``run_id`` for ``build`` and activate the clone."""
+    series = Run.objects.get(pk=run_id)
+    # no progress report in between: a committed draft clone would be found
+    # (and executed) as the run for this build. Activation joins the job's
+    # transaction rather than committing, so a failure rolls the clone back.
+    run = series.clone_for_series(build=build, user=job.user)
+    run.activate(user=job.user)
+    return {"run_id": run.id}
+
+
+
+@task("generate_profile")
+def generate_profile(job, name, element_ids, strength=None):
+    """
+    Generate environment profile ``name`` from elements ``element_ids``.
+
+    See ``Profile.generate`` for ``strength``.
+
+    """
+    elements = Element.objects.filter(pk__in=element_ids)
+    profile = Profile.generate(
+        name, *elements, **{"user": job.user, "strength": strength})
+    return {"profile_id": profile.id}
+
+
+
+FILL_PROGRESS_EVERY = 20
+
+
+
+@task("fill_productversion")
+def fill_productversion(job, productversion_id, source_id):
+    """
+    Clone caseversions of ``source_id`` into ``productversion_id``.
+
+    Cases that already have a version in ``productversion_id`` are skipped, so
+    an interrupted fill can be resumed by running it again. Caseversions are
+    cloned in bulk, a progress report's worth at a time.
+
+    """
+    pv = ProductVersion.objects.get(pk=productversion_id)
+    existing = pv.caseversions.values_list("case_id", flat=True)
+    caseversions = list(
+        ProductVersion.objects.get(pk=source_id).caseversions.exclude(
+            case_id__in=existing).order_by("id")
+        )
+
+    total = len(caseversions)
+    job.set_progress(0, total)
+    for start in range(0, total, FILL_PROGRESS_EVERY):
+        batch = caseversions[start:start + FILL_PROGRESS_EVERY]
+        cloner = BulkCloner(user=job.user)
+        for cv in batch:
+            cv.clone(
+                overrides={"productversion": pv, "name": cv.name},
+                user=job.user,
+                cloner=cloner,
+                )
+        cloner.run()
+        job.set_progress(start + len(batch), total)
+
+    return {"productversion_id": pv.id, "cloned": total}
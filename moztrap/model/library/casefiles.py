@@ -0,0 +1,189 @@
+"""
+Streaming parser for JSON case files.
+
+A case file is a JSON object with optional "suites" and "cases" lists (see
+``moztrap.model.library.importer.Importer``). ``parse_json`` reads it
+incrementally and yields its suites and cases one at a time, as
+``(section, data)`` items::
+
+    ("suites", {"name": "suite1 name", "description": "..."})
+    ("cases", {"name": "case title", "steps": [...], ...})
+
+The structure of the file (the top-level object and lists) is read a token at
+a time; each suite or case is decoded on its own with the standard JSON
+decoder. Only the current item is held in memory (and no more than
+``MAX_ITEM_SIZE`` bytes of it), however big the file. Other top-level keys
+are decoded and ignored.
+
+"""
+import json
+
+
+
+class CaseFileError(ValueError):
+    """A case file can't be parsed."""
+    pass
+
+
+
+SECTIONS = ["suites", "cases"]
+
+# bytes read from the file at a time
+READ_SIZE = 64 * 1024
+
+# items bigger than this are assumed to be malformed
+MAX_ITEM_SIZE = 16 * 1024 * 1024
+
+WHITESPACE = " \t\n\r"
+
+
+
+def parse_json(fh):
+    """
+    Yield ``(section, data)`` items of the suites and cases in JSON file.
+
+    Raises ``CaseFileError`` when the file isn't a JSON object, or any
+    suite or case isn't one; items before the error have been yielded.
+
+    """
+    reader = _Reader(fh)
+    reader.expect("{")
+    if reader.next_is("}"):
+        reader.end()
+        return
+    while True:
+        key = reader.value()
+        if not isinstance(key, basestring):
+            raise reader.error("Expecting property name")
+        reader.expect(":")
+        if key in SECTIONS:
+            reader.expect("[")
+            for data in reader.items():
+                if not isinstance(data, dict):
+                    raise reader.error(
+                        "Expecting an object in {0}".format(key),
+                        reader.start)
+                yield key, data
+        else:
+            reader.value()
+        if reader.next_is("}"):
+            break
+        reader.expect(",")
+    reader.end()
+
+
+
+class _Reader(object):
+    """Reads JSON tokens and values from a file, through a buffer."""
+    def __init__(self, fh):
+        """Read from open file ``fh``."""
+        self.fh = fh
+        self.buffer = ""
+        self.pos = 0
+        # position in the file of the start of the buffer, for errors
+        self.offset = 0
+        self.eof = False
+        # position in the file of the start of the last value
+        self.start = 0
+        self.decoder = json.JSONDecoder()
+
+
+    def error(self, message, pos=None):
+        """Return ``CaseFileError`` with message, at given file position."""
+        if pos is None:
+            pos = self.offset + self.pos
+        return CaseFileError("{0} (char {1})".format(message, pos))
+
+
+    def _fill(self):
+        """
+        Read more of the file into the buffer; return False at the end.
+
+        Reads at least as much as is left in the buffer, so a large value is
+        read in a few rounds.
+
+        """
+        if self.eof:
+            return False
+        data = self.fh.read(max(READ_SIZE, len(self.buffer) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+
+    def _skip_whitespace(self):
+        """Skip whitespace; return next character, or "" at the end."""
+        while True:
+            while self.pos < len(self.buffer):
+                if self.buffer[self.pos] not in WHITESPACE:
+                    return self.buffer[self.pos]
+                self.pos += 1
+            if not self._fill():
+                return ""
+
+
+    def next_is(self, char):
+        """Consume next non-whitespace character if it's ``char``."""
+        if self._skip_whitespace() == char:
+            self.pos += 1
+            return True
+        return False
+
+
+    def expect(self, char):
+        """Consume next non-whitespace character, which must be ``char``."""
+        if not self.next_is(char):
+            found = self._skip_whitespace()
+            raise self.error(
+                "Expecting '{0}', found {1}".format(
+                    char, repr(found) if found else "end of file"))
+
+
+    def end(self):
+        """Check there's nothing but whitespace left."""
+        if self._skip_whitespace():
+            raise self.error("Extra data")
+
+
+    def items(self):
+        """Yield values of a list (after its opening bracket)."""
+        if self.next_is("]"):
+            return
+        while True:
+            yield self.value()
+            if self.next_is("]"):
+                return
+            self.expect(",")
+
+
+    def value(self):
+        """
+        Decode and return the next value.
+
+        The buffer is extended until the value decodes; a number or literal
+        running up to the end of the buffer may be cut short, so more is
+        read to be sure. Errors in the value are reported at its start.
+
+        """
+        if not self._skip_whitespace():
+            raise self.error("Expecting value, found end of file")
+        self.start = self.offset + self.pos
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError as e:
+                if len(self.buffer) - self.pos > MAX_ITEM_SIZE:
+                    raise self.error(
+                        "Value too large or malformed", self.start)
+                if not self._fill():
+                    raise self.error(str(e).split(":")[0], self.start)
+                continue
+            if end == len(self.buffer) and not isinstance(
+                    value, (dict, list, basestring)) and self._fill():
+                continue
+            self.pos = end
+            return value
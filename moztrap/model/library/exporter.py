@@ -0,0 +1,173 @@
+"""Exporter for suites and cases, in the format the importer accepts."""
+
+import json
+
+from .models import CaseVersion, CaseStep, Suite, SuiteCase
+
+
+
+# number of cases (or suites) read at a time
+BATCH_SIZE = 500
+
+
+
+class Exporter(object):
+    """
+    Exporter for the Suites and Cases of a ProductVersion.
+
+    Exports the structure ``Importer.import_data`` accepts (see
+    ``moztrap.model.library.importer.Importer``): the suites of the product
+    version's cases, and its cases with their steps, tags, suites and
+    creators.
+
+    Instantiate an ``Exporter`` and iterate over its ``export_json`` method
+    to stream the JSON text::
+
+        exporter = Exporter(productversion)
+        for chunk in exporter.export_json():
+            fh.write(chunk)
+
+    Suites and cases are read ``batch_size`` at a time with ``values()``
+    queries (a case batch also reads its steps, tags and suites), so a
+    product version of any size is exported in constant memory.
+
+    """
+
+    def __init__(self, productversion, batch_size=BATCH_SIZE):
+        """Construct an Exporter of the library of ``productversion``."""
+
+        self.productversion = productversion
+        self.batch_size = batch_size
+
+
+    def export_data(self):
+        """Return a dictionary of all suites and cases."""
+
+        return {
+            "suites": list(self.suites()),
+            "cases": list(self.cases()),
+            }
+
+
+    def export_json(self):
+        """Yield chunks of JSON text of the suites and cases, one per item."""
+
+        yield '{\n"suites": ['
+        for i, suite in enumerate(self.suites()):
+            yield (",\n" if i else "\n") + json.dumps(suite, sort_keys=True)
+        yield '\n],\n"cases": ['
+        for i, case in enumerate(self.cases()):
+            yield (",\n" if i else "\n") + json.dumps(case, sort_keys=True)
+        yield "\n]\n}\n"
+
+
+    def suites(self):
+        """
+        Yield suite dictionaries, ordered by id.
+
+        Only suites with a case in this product version are exported::
+
+            {
+                "name": "suite1 name",
+                "description": "suite description"
+            }
+
+        """
+
+        qs = Suite.objects.filter(
+            suitecases__deleted_on__isnull=True,
+            suitecases__case__deleted_on__isnull=True,
+            suitecases__case__versions__deleted_on__isnull=True,
+            suitecases__case__versions__productversion=self.productversion,
+            ).distinct().order_by("id")
+        for batch in self._pages(qs, ["id", "name", "description"]):
+            for suite in batch:
+                yield {
+                    "name": suite["name"],
+                    "description": suite["description"],
+                    }
+
+
+    def cases(self):
+        """
+        Yield case dictionaries, ordered by id.
+
+        Tags, suites and the creator are only included if the case has
+        them::
+
+            {
+                "name": "case title",
+                "description": "case description",
+                "tags": ["tag1", "tag2"],
+                "suites": ["suite1 name"],
+                "created_by": "cdawson@mozilla.com",
+                "steps": [
+                    {
+                        "instruction": "instruction text",
+                        "expected": "expected text"
+                    },
+                ]
+            }
+
+        """
+
+        qs = CaseVersion.objects.filter(
+            productversion=self.productversion).order_by("id")
+        fields = ["id", "case", "name", "description", "created_by__email"]
+        for batch in self._pages(qs, fields):
+            cv_ids = [cv["id"] for cv in batch]
+
+            steps = {}
+            for step in CaseStep.objects.filter(
+                    caseversion__in=cv_ids).order_by(
+                    "caseversion", "number").values(
+                    "caseversion", "instruction", "expected"):
+                steps.setdefault(step["caseversion"], []).append(
+                    {
+                        "instruction": step["instruction"],
+                        "expected": step["expected"],
+                        }
+                    )
+
+            tags = {}
+            for cv_id, name in CaseVersion.tags.through.objects.filter(
+                    caseversion__in=cv_ids,
+                    tag__deleted_on__isnull=True,
+                    ).order_by("tag__name").values_list(
+                    "caseversion", "tag__name"):
+                tags.setdefault(cv_id, []).append(name)
+
+            suites = {}
+            for case_id, name in SuiteCase.objects.filter(
+                    case__in=[cv["case"] for cv in batch],
+                    suite__deleted_on__isnull=True,
+                    ).order_by("suite__name").values_list(
+                    "case", "suite__name"):
+                suites.setdefault(case_id, []).append(name)
+
+            for cv in batch:
+                case = {
+                    "name": cv["name"],
+                    "description": cv["description"],
+                    "steps": steps.get(cv["id"], []),
+                    }
+                if cv["id"] in tags:
+                    case["tags"] = tags[cv["id"]]
+                if cv["case"] in suites:
+                    case["suites"] = suites[cv["case"]]
+                if cv["created_by__email"]:
+                    case["created_by"] = cv["created_by__email"]
+                yield case
+
+
+    def _pages(self, qs, fields):
+        """Yield pages of ``values()`` of ``qs``, which is ordered by id."""
+
+        last_id = 0
+        while True:
+            batch = list(
+                qs.filter(id__gt=last_id).values(*fields)[:self.batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]["id"]
+            yield batch
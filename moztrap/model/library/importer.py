@@ -1,15 +1,24 @@
 """Importer for suites and cases from a dictionary."""
 
+import itertools
 import json
 
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import Q
 
 from ..core.auth import User
+from ..denormalization import deferred_denormalization
+from ..mtmodel import BulkUpsert
 from ..tags.models import Tag
 from .models import Case, CaseVersion, CaseStep, Suite, SuiteCase
 
 
 
+# number of cases (or links) inserted at a time
+BATCH_SIZE = 500
+
+
+
 class Importer(object):
     """
     Importer for Suites and Cases.
@@ -72,27 +81,89 @@ class Importer(object):
 
         """
 
+        # no reason why the data couldn't include ONLY suites.  So function
+        # gracefully if no cases.
+        case_importer = CaseImporter(productversion)
+        return self._import_batch(
+            case_importer,
+            case_data.get("suites", []),
+            case_data.get("cases", []),
+            force_dupes,
+            )
+
+
+    def import_stream(self, productversion, items, force_dupes=False,
+                      batch_size=BATCH_SIZE, dry_run=False):
+        """
+        Import a stream of suites and cases in batches; yield their results.
+
+        Keyword arguments:
+
+        * productversion -- The ProductVersion model object for which the
+          items will be imported
+        * items -- an iterable of ``(section, data)`` items, where section is
+          "suites" or "cases" and data is a suite or case dictionary (as
+          yielded by ``casefiles.parse_json``)
+        * force_dupes -- if True, will import cases with duplicate names.  If
+          False, they will be skipped.
+        * batch_size -- number of items imported (and committed) at a time
+        * dry_run -- if True, nothing is committed
+
+        Items are read ``batch_size`` at a time, so the stream is imported in
+        constant memory. Yields an ``ImportResult`` for each batch, once it
+        is committed; batches committed before an error are kept. In a dry
+        run, all batches are rolled back at the end.
+
+        """
+
+        items = iter(items)
+        case_importer = CaseImporter(productversion)
+        with transaction.commit_manually():
+            try:
+                while True:
+                    batch = list(itertools.islice(items, batch_size))
+                    if not batch:
+                        break
+                    result = self._import_batch(
+                        case_importer,
+                        [data for section, data in batch
+                         if section == "suites"],
+                        [data for section, data in batch
+                         if section == "cases"],
+                        force_dupes,
+                        )
+                    if not dry_run:
+                        transaction.commit()
+                    yield result
+            finally:
+                transaction.rollback()
+
+
+    def _import_batch(self, case_importer, suite_dicts, case_dicts,
+                      force_dupes):
+        """
+        Import lists of suite and case dictionaries; return the result.
+
+        Suites are added first, so the suites of the cases get their
+        descriptions.
+
+        """
+
         # the result object used to keep track of import status
         result = ImportResult()
 
-        # importer for suites.
-        suite_importer = None
-        if "suites" in case_data:
-            suite_importer = SuiteImporter(productversion.product)
-            suite_importer.add_dicts(case_data["suites"])
-
+        suite_importer = case_importer.suite_importer
+        suite_importer.add_dicts(suite_dicts)
 
-        # no reason why the data couldn't include ONLY suites.  So function
-        # gracefully if no cases.
-        if "cases" in case_data:
-            case_importer = CaseImporter(productversion, suite_importer)
-            result.append(case_importer.import_cases(
-                case_data["cases"],
-                force_dupes=force_dupes))
+        if case_dicts:
+            # latest versions of the new cases are marked all at once
+            with deferred_denormalization():
+                result.append(case_importer.import_cases(
+                    case_dicts,
+                    force_dupes=force_dupes))
 
         # now create the suites and add cases to them
-        if suite_importer:
-            result.append(suite_importer.import_suites())
+        result.append(suite_importer.import_suites())
 
         return result
 
@@ -113,8 +184,10 @@ class CaseImporter(object):
           for each case.  If None, or default, this class will create
           an empty one.
 
-        Also create a TagImporter for importing tags and a UserCache to
-        speed the lookup of User objects to match emails for case ownership.
+        Also create a TagImporter for importing tags; each call to
+        ``import_cases`` uses a new UserCache to speed the lookup of User
+        objects to match emails for case ownership, so that memory use is
+        bounded by the size of a batch of cases, however many are imported.
 
         """
 
@@ -126,7 +199,7 @@ class CaseImporter(object):
         # the object responsible for importing tags
         self.tag_importer = TagImporter(self.productversion.product)
 
-        # cache of user emails
+        # cache of user emails, for the cases being imported
         self.user_cache = UserCache()
 
     def import_cases(self, case_dict_list, force_dupes=False):
@@ -156,11 +229,27 @@ class CaseImporter(object):
                 }
             ]
 
+        All cases are validated first, against existing cases with the same
+        names and users, both looked up in bulk; then the valid ones are
+        inserted in bulk, ``BATCH_SIZE`` cases at a time, with their steps,
+        tags and suites.
+        Names (of cases, tags and suites) match case-insensitively, as they
+        do in MySQL.
 
         """
 
         result = ImportResult()
 
+        names = None
+        if not force_dupes:
+            names = self.existing_names(
+                [c["name"] for c in case_dict_list if "name" in c])
+        self.user_cache = UserCache()
+        self.user_cache.load(
+            [c["created_by"] for c in case_dict_list if "created_by" in c])
+
+        # list of (case data, caseversion, steps) to insert
+        valid = []
         for new_case in case_dict_list:
 
             if not "name" in new_case:
@@ -171,10 +260,7 @@ class CaseImporter(object):
                 continue
 
             # Don't re-import if we have the same case name and Product Version
-            if not force_dupes and CaseVersion.objects.filter(
-                name=new_case["name"],
-                productversion=self.productversion,
-                ).exists():
+            if not force_dupes and new_case["name"].lower() in names:
 
                 result.warn(
                     ImportResult.SKIP_CASE_NAME_CONFLICT,
@@ -195,54 +281,39 @@ class CaseImporter(object):
                         email,
                         )
 
-            # the case looks good so far, but there may be a problem with
-            # one of the steps.  So, create a savepoint in case something
-            # is inherently wrong with this case, we can roll back to skip
-            # it, and still import the rest of the cases.
-            sid = transaction.savepoint()
-
-            # create the top-level case object which holds the versions
-            case = Case.objects.create(product=self.productversion.product)
+            # a case with a bad step is skipped entirely
+            try:
+                steps = self.build_steps(new_case.get("steps", []))
+            except ValueError as e:
+                result.warn(
+                    e.args[0],
+                    new_case,
+                    )
+                continue
 
-            # create the case version which holds the details
-            caseversion = CaseVersion.objects.create(
+            caseversion = CaseVersion(
                 productversion=self.productversion,
-                case=case,
                 name=new_case["name"],
                 description=new_case.get("description", ""),
-                user=user,
+                created_by=user,
+                modified_by=user,
                 )
 
-            # add the steps to this case version
-            if "steps" in new_case:
-                try:
-                    self.import_steps(caseversion, new_case["steps"])
-                except ValueError as e:
-                    result.warn(
-                        e.args[0],
-                        new_case,
-                        )
-
-                    transaction.savepoint_rollback(sid)
-                    continue
-            else:
+            if not "steps" in new_case:
                 result.warn(
                     ImportResult.WARN_NO_STEPS,
                     caseversion,
                     )
 
-            if "tags" in new_case:
-                self.tag_importer.add_names(caseversion, new_case["tags"])
-
-            if "suites" in new_case:
-                self.suite_importer.add_names(case, new_case["suites"])
+            if names is not None:
+                names.add(new_case["name"].lower())
+            valid.append((new_case, caseversion, steps))
 
-            # case has been created, increment our count for reporting
+            # case is valid, increment our count for reporting
             result.num_cases += 1
 
-            # this case went ok.  We'll save it as complete in the overall
-            # transaction.
-            transaction.savepoint_commit(sid)
+        for i in range(0, len(valid), BATCH_SIZE):
+            self.save_cases(valid[i:i + BATCH_SIZE])
 
             # now create the tags and add case versions to them
             self.tag_importer.import_tags()
@@ -253,29 +324,99 @@ class CaseImporter(object):
         return result
 
 
-    def import_steps(self, caseversion, step_data):
+    def existing_names(self, names):
+        """
+        Return set of lower-case ``names`` of the productversion's cases.
+
+        Names are looked up case-insensitively, ``BATCH_SIZE`` at a time.
+
         """
-        Add the steps to this case version.
+
+        names = list(set(name.lower() for name in names))
+        qn = connection.ops.quote_name
+        column = "{0}.{1}".format(
+            qn(CaseVersion._meta.db_table), qn("name"))
+        existing = set()
+        for i in range(0, len(names), BATCH_SIZE):
+            batch = names[i:i + BATCH_SIZE]
+            existing.update(
+                name.lower() for name in CaseVersion.objects.filter(
+                    productversion=self.productversion).extra(
+                    where=["LOWER({0}) IN ({1})".format(
+                        column, ", ".join(["%s"] * len(batch)))],
+                    params=batch,
+                    ).values_list("name", flat=True)
+                )
+        return existing
+
+
+    def build_steps(self, step_data):
+        """
+        Return list of (unsaved) steps for a case version.
 
         Keyword arguments:
 
-        * caseversion -- the CaseVersion object that step_data applies to
-        * step_data -- a dictionary containing the steps for the case
+        * step_data -- a list of dictionaries containing the steps for the
+          case
 
-        Instruction is a required field for a step, but expected is optional.
+        Instruction is a required field for a step, but expected is optional;
+        raises ``ValueError`` if a step has no instruction.
 
         """
 
+        steps = []
         for step_num, new_step in enumerate(step_data):
             try:
-                casestep = CaseStep.objects.create(
-                    caseversion=caseversion,
-                    number=step_num+1,
-                    instruction=new_step["instruction"],
-                    expected=new_step.get("expected", ""),
+                steps.append(
+                    CaseStep(
+                        number=step_num+1,
+                        instruction=new_step["instruction"],
+                        expected=new_step.get("expected", ""),
+                        )
                     )
             except KeyError:
                 raise ValueError(ImportResult.SKIP_STEP_NO_INSTRUCTION)
+        return steps
+
+
+    def save_cases(self, valid):
+        """
+        Insert cases, case versions and steps in bulk.
+
+        Keyword arguments:
+
+        * valid -- a list of (case data, unsaved caseversion, unsaved steps)
+          tuples
+
+        Also adds the case versions' tags and the cases' suites to the tag
+        and suite importers.
+
+        """
+
+        product = self.productversion.product
+        cases = [Case(product=product) for new_case, cv, steps in valid]
+        BulkUpsert(Case).run(cases)
+
+        for case, (new_case, caseversion, steps) in zip(cases, valid):
+            caseversion.case = case
+        caseversions = [cv for new_case, cv, steps in valid]
+        BulkUpsert(CaseVersion).run(caseversions)
+        CaseVersion.bulk_created(caseversions)
+
+        all_steps = []
+        for new_case, caseversion, steps in valid:
+            for step in steps:
+                step.caseversion = caseversion
+                all_steps.append(step)
+        CaseStep.objects.bulk_create(all_steps, batch_size=BATCH_SIZE)
+
+        for new_case, caseversion, steps in valid:
+            if "tags" in new_case:
+                self.tag_importer.add_names(caseversion, new_case["tags"])
+
+            if "suites" in new_case:
+                self.suite_importer.add_names(
+                    caseversion.case, new_case["suites"])
 
 
 
@@ -284,7 +425,8 @@ class UserCache(object):
     Cache of emails to User objects.
 
     If an email was searched for, but no matching User object was found,
-    then cache None so we don't keep looking for it.
+    then cache None so we don't keep looking for it.  Emails match
+    case-insensitively.
 
     """
 
@@ -293,6 +435,28 @@ class UserCache(object):
 
         self.cache = {}
 
+        # emails looked up in bulk and not found, not yet reported
+        self.missing = set()
+
+
+    def load(self, emails):
+        """
+        Look up the users with given emails in bulk.
+
+        Keyword arguments:
+
+        * emails -- a list of strings containing email addresses
+
+        """
+
+        emails = list(set(e for e in emails if e.lower() not in self.cache))
+        for i in range(0, len(emails), BATCH_SIZE):
+            batch = emails[i:i + BATCH_SIZE]
+            for user in User.objects.filter(email__in=batch).order_by("id"):
+                self.cache.setdefault(user.email.lower(), user)
+            self.missing.update(
+                e.lower() for e in batch if e.lower() not in self.cache)
+
 
     def get_user(self, email):
         """
@@ -301,7 +465,6 @@ class UserCache(object):
         Keyword arguments:
 
         * email -- a string containing an email address
-        * result -- an ImportResult object to post results to
 
         If the email is already in the cache, then return that user.
         If this method had already searched for the user and not found it,
@@ -311,25 +474,31 @@ class UserCache(object):
 
         """
 
-        if email in self.cache:
-            return self.cache[email]
+        key = email.lower()
+        if key in self.cache:
+            return self.cache[key]
+
+        elif key in self.missing:
+            self.missing.discard(key)
+            self.cache[key] = None
+            raise User.DoesNotExist()
 
         else:
             try:
                 user = User.objects.get(email=email)
-                self.cache[email] = user
+                self.cache[key] = user
 
             except User.DoesNotExist as e:
-                self.cache[email] = None
+                self.cache[key] = None
                 raise e
 
-        return self.cache[email]
+        return self.cache[key]
 
 
 
 class TagImporter(object):
     """
-    Imports suites based on lists and dicts of suites used to build it.
+    Imports tags based on lists of tag names used to build it.
 
     """
 
@@ -339,6 +508,9 @@ class TagImporter(object):
         self.product = product
         self.map = {}
 
+        # maps lower-case tag name to tag, loaded on first import
+        self.tags = None
+
 
     def add_names(self, caseversion, tag_names):
         """
@@ -370,27 +542,44 @@ class TagImporter(object):
             * use existing global tag
             * create new product tag
 
+        Existing tags are loaded once; new tags and the links to case versions
+        are inserted in bulk.
+
         """
 
+        if not self.map:
+            return
+
+        if self.tags is None:
+            self.tags = {}
+            for tag in Tag.objects.filter(
+                    Q(product=self.product) | Q(product__isnull=True),
+                    ).order_by("id"):
+                key = tag.name.lower()
+                if key not in self.tags or (
+                        tag.product_id and not self.tags[key].product_id):
+                    self.tags[key] = tag
+
+        new_tags = []
+        for tag_name in self.map:
+            if tag_name.lower() not in self.tags:
+                tag = Tag(name=tag_name, product=self.product)
+                self.tags[tag_name.lower()] = tag
+                new_tags.append(tag)
+        BulkUpsert(Tag).run(new_tags)
+
+        links = set()
         for tag_name, caseversions in self.map.items():
-            existing_tags = Tag.objects.filter(
-                name=tag_name,
-                product__in=[None, self.product],
-                ).order_by("-product")
-
-            # If there is a product tag, it will be sorted to first.
-            # If not, then the only item will be the global one, so
-            # use that.
-            if list(existing_tags):
-                tag = existing_tags[0]
-
-            else:
-                tag = Tag.objects.create(
-                    name=tag_name,
-                    product=self.product,
-                    )
-
-            tag.caseversions.add(*caseversions)
+            tag = self.tags[tag_name.lower()]
+            links.update((tag.id, cv.id) for cv in caseversions)
+        through = CaseVersion.tags.through
+        through.objects.bulk_create(
+            [
+                through(tag_id=tag_id, caseversion_id=cv_id)
+                for tag_id, cv_id in links
+                ],
+            batch_size=BATCH_SIZE,
+            )
 
         # we have imported these items.  clear them out now.
         self.map.clear()
@@ -426,6 +615,9 @@ class SuiteImporter(object):
         self.map = {}
         self.result = ImportResult()
 
+        # maps lower-case suite name to suite, loaded on first import
+        self.suites = None
+
 
     def add_names(self, case, suite_names):
         """
@@ -488,28 +680,53 @@ class SuiteImporter(object):
 
 
     def import_suites(self):
-        """Import all mapped suites."""
+        """
+        Import all mapped suites.
 
-        for suite_name, suite_data in self.map.items():
+        Existing suites are loaded once; new suites and the links to cases
+        are inserted in bulk. Returns the result of this import (suites
+        created and warnings since the last one).
 
-            suite, created = Suite.objects.get_or_create(
-                name=suite_name,
-                product=self.product,
-                defaults={"description": suite_data.get("description", "")},
-                )
+        """
 
-            if created:
-                self.result.num_suites += 1
+        if self.map and self.suites is None:
+            self.suites = {}
+            for suite in Suite.objects.filter(
+                    product=self.product).order_by("id"):
+                self.suites.setdefault(suite.name.lower(), suite)
+
+        new_suites = []
+        for suite_name, suite_data in self.map.items():
+            if suite_name.lower() not in self.suites:
+                suite = Suite(
+                    name=suite_name,
+                    product=self.product,
+                    description=suite_data.get("description", ""),
+                    )
+                self.suites[suite_name.lower()] = suite
+                new_suites.append(suite)
+        BulkUpsert(Suite).run(new_suites)
+        self.result.num_suites += len(new_suites)
 
-            # now add any cases the suite may have specified
-            if "cases" in suite_data:
-                for case in suite_data["cases"]:
-                    SuiteCase.objects.create(case=case, suite=suite)
+        # now add any cases the suite may have specified
+        links = set()
+        for suite_name, suite_data in self.map.items():
+            suite = self.suites[suite_name.lower()]
+            links.update(
+                (suite.id, case.id) for case in suite_data.get("cases", []))
+        SuiteCase.objects.bulk_create(
+            [
+                SuiteCase(suite_id=suite_id, case_id=case_id)
+                for suite_id, case_id in links
+                ],
+            batch_size=BATCH_SIZE,
+            )
 
         # we have imported (or warned on) these items, so reset map.
         self.map.clear()
 
-        return self.result
+        result, self.result = self.result, ImportResult()
+        return result
 
 
 
@@ -568,6 +785,15 @@ class ImportResult(object):
         self.warnings.extend(result.warnings)
 
 
+    def get_warnings_as_list(self):
+        """Return a list of the warnings from the import."""
+
+        return [
+            "{0}: {1}".format(x["reason"], json.dumps(x["item"], indent=4))
+            for x in self.warnings
+            ]
+
+
     def get_as_list(self):
         """
         Return a list of the statuses from the import.
@@ -582,10 +808,7 @@ class ImportResult(object):
 
         """
 
-        result_list = [
-            "{0}: {1}".format(x["reason"], json.dumps(x["item"], indent=4))
-            for x in self.warnings
-            ]
+        result_list = self.get_warnings_as_list()
 
         result_list.append("Imported {0} cases".format(self.num_cases))
         result_list.append("Imported {0} suites".format(self.num_suites))
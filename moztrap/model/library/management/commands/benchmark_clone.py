@@ -0,0 +1,244 @@
+"""
+Benchmark cloning caseversions (with steps, tags and environments).
+
+Compares the bulk cloning of ``MTModel.clone`` with a ``BulkCloner`` against
+the previous approach of saving each clone (and each cascaded child) one
+object at a time. Clones into a separate product version per approach.
+Builds a synthetic product in a transaction that is rolled back afterwards, so
+nothing is left in the database.
+
+"""
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from moztrap.model.core.models import Product, ProductVersion
+from moztrap.model.environments.models import Environment
+from moztrap.model.library.models import Case, CaseVersion, CaseStep
+from moztrap.model.mtmodel import BulkCloner, utcnow
+from moztrap.model.tags.models import Tag
+
+
+
+class Command(BaseCommand):
+    help = (
+        "Time bulk vs. per-object cloning of caseversions to a new product "
+        "version on a synthetic product (rolled back afterwards).")
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--cases",
+            type="int",
+            dest="cases",
+            default=500,
+            help="Number of caseversions to clone (default 500)"),
+        make_option(
+            "--steps",
+            type="int",
+            dest="steps",
+            default=5,
+            help="Number of steps per caseversion (default 5)"),
+        make_option(
+            "--envs",
+            type="int",
+            dest="envs",
+            default=5,
+            help="Number of environments (default 5)"),
+        )
+
+
+    def handle(self, *args, **options):
+        if args or options["cases"] < 1 or options["steps"] < 0 or (
+                options["envs"] < 0):
+            raise CommandError(
+                "Usage: [--cases <n>] [--steps <n>] [--envs <n>] "
+                "(at least 1 case)")
+
+        debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        with transaction.commit_manually():
+            try:
+                source, targets = build_productversions(
+                    options["cases"], options["steps"], options["envs"])
+                timings = []
+                results = []
+                for (label, func), target in zip(
+                        [
+                            ("per object", per_object_clone),
+                            ("bulk", bulk_clone),
+                            ],
+                        targets,
+                        ):
+                    num_queries = len(connection.queries)
+                    start = time.time()
+                    func(source, target)
+                    timings.append(
+                        (
+                            label,
+                            time.time() - start,
+                            len(connection.queries) - num_queries,
+                            )
+                        )
+                    results.append(cloned_data(target))
+            finally:
+                transaction.rollback()
+                connection.use_debug_cursor = debug_cursor
+
+        if results[0] != results[1]:
+            raise CommandError("Per-object and bulk clones differ.")
+
+        self.stdout.write(
+            "{0} caseversions, {1} steps each, {2} environments:\n".format(
+                options["cases"], options["steps"], options["envs"]))
+        for label, seconds, num_queries in timings:
+            self.stdout.write(
+                "  {0}: {1:.3f}s, {2} queries\n".format(
+                    label, seconds, num_queries))
+
+
+
+def build_productversions(num_cases, num_steps, num_envs):
+    """
+    Create a product with three versions; the first one has caseversions.
+
+    Each caseversion has ``num_steps`` steps, a tag and all of the
+    ``num_envs`` environments of the product versions. Returns the first
+    product version and a list of the other two, to clone into.
+
+    """
+    product = Product.objects.create(name="benchmark")
+    source = ProductVersion.objects.create(product=product, version="1")
+    targets = [
+        ProductVersion.objects.create(product=product, version=version)
+        for version in ["2", "3"]
+        ]
+    Environment.objects.bulk_create(
+        [Environment() for i in range(num_envs)])
+    env_ids = list(
+        Environment.objects.order_by("-id").values_list(
+            "id", flat=True)[:num_envs])
+    for pv in [source] + targets:
+        ProductVersion.environments.through.objects.bulk_create(
+            [
+                ProductVersion.environments.through(
+                    productversion_id=pv.id, environment_id=env_id)
+                for env_id in env_ids
+                ]
+            )
+    tag = Tag.objects.create(name="benchmark")
+
+    Case.objects.bulk_create([Case(product=product) for i in range(num_cases)])
+    case_ids = Case.objects.filter(
+        product=product).values_list("id", flat=True)
+    CaseVersion.objects.bulk_create(
+        [
+            CaseVersion(productversion=source, case_id=case_id,
+                        name="benchmark {0}".format(case_id))
+            for case_id in case_ids
+            ]
+        )
+    cv_ids = list(
+        CaseVersion.objects.filter(productversion=source).values_list(
+            "id", flat=True))
+    CaseStep.objects.bulk_create(
+        [
+            CaseStep(caseversion_id=cv_id, number=i + 1,
+                     instruction="step {0}".format(i + 1))
+            for cv_id in cv_ids
+            for i in range(num_steps)
+            ]
+        )
+    CaseVersion.tags.through.objects.bulk_create(
+        [
+            CaseVersion.tags.through(caseversion_id=cv_id, tag_id=tag.id)
+            for cv_id in cv_ids
+            ]
+        )
+    CaseVersion.environments.through.objects.bulk_create(
+        [
+            CaseVersion.environments.through(
+                caseversion_id=cv_id, environment_id=env_id)
+            for cv_id in cv_ids
+            for env_id in env_ids
+            ]
+        )
+    Case.set_latest_versions(case_ids)
+
+    return source, targets
+
+
+
+def cloned_data(pv):
+    """Return set of comparable data of the caseversions of ``pv``."""
+    data = set()
+    for cv in CaseVersion.objects.filter(productversion=pv).prefetch_related(
+            "steps", "tags", "environments"):
+        data.add(
+            (
+                cv.case_id,
+                cv.name,
+                tuple((s.number, s.instruction) for s in cv.steps.all()),
+                frozenset(t.id for t in cv.tags.all()),
+                frozenset(e.id for e in cv.environments.all()),
+                )
+            )
+    return data
+
+
+
+def bulk_clone(source, target):
+    """Clone caseversions of ``source`` into ``target`` with one cloner."""
+    cloner = BulkCloner()
+    for cv in CaseVersion.objects.filter(productversion=source):
+        cv.clone(
+            overrides={"productversion": target, "name": cv.name},
+            cloner=cloner,
+            )
+    cloner.run()
+
+
+
+def per_object_clone(source, target):
+    """Clone caseversions of ``source`` into ``target`` one at a time."""
+    for cv in CaseVersion.objects.filter(productversion=source):
+        old_clone(
+            cv,
+            ["steps", "attachments", "tags", "environments"],
+            {"productversion": target, "name": cv.name},
+            )
+
+
+
+def old_clone(obj, cascade, overrides):
+    """
+    Clone ``obj``, saving the clone and each cascaded child one at a time.
+
+    This is how ``MTModel.clone`` used to work; kept here for comparison.
+
+    """
+    overrides = dict(
+        overrides, created_on=utcnow(), created_by=None, modified_by=None)
+    clone = obj.__class__()
+    for field in obj._meta.fields:
+        if field.primary_key:
+            continue
+        val = overrides.get(field.name, getattr(obj, field.name))
+        setattr(clone, field.name, val)
+    clone.save(force_insert=True)
+
+    for name in cascade:
+        mgr = getattr(obj, name)
+        if mgr.__class__.__name__ == "ManyRelatedManager":
+            clone_mgr = getattr(clone, name)
+            existing = set(clone_mgr.all())
+            new = set(mgr.all())
+            clone_mgr.add(*new.difference(existing))
+            clone_mgr.remove(*existing.difference(new))
+        else:
+            reverse_name = getattr(obj.__class__, name).related.field.name
+            for child in mgr.all():
+                old_clone(child, [], {reverse_name: clone})
+
+    return clone
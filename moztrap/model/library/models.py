@@ -2,10 +2,13 @@
 Models for test-case library (cases, suites).
 
 """
+from collections import defaultdict
+
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
 
 from ..attachments.models import Attachment
+from ..denormalization import deferring
 from ..mtmodel import MTModel, DraftStatusModel
 from ..core.models import Product, ProductVersion
 from ..environments.models import HasEnvironmentsModel
@@ -13,6 +16,18 @@ from ..tags.models import Tag
 
 
 
+# batch size for updating latest flags of caseversions without UPDATE joins
+LATEST_BATCH_SIZE = 500
+
+
+
+def _sqlite_version():
+    """Return version (tuple) of the SQLite library."""
+    from django.db.backends.sqlite3.base import Database
+    return Database.sqlite_version_info
+
+
+
 class Case(MTModel):
     """A test case for a given product."""
     product = models.ForeignKey(Product, related_name="cases")
@@ -54,6 +69,113 @@ class Case(MTModel):
                     update_instance.latest = False
 
 
+    @classmethod
+    def set_latest_versions(cls, case_ids):
+        """
+        Mark latest version of each of cases ``case_ids``, as a batch.
+
+        Same as ``set_latest_version`` on each case, in three queries.
+        Returns set of ids of the latest versions.
+
+        """
+        latest = {}
+        for case_id, cv_id, order in CaseVersion.objects.filter(
+                case__in=case_ids).order_by(
+                "productversion__order", "id").values_list(
+                "case_id", "id", "productversion__order"):
+            latest[case_id] = cv_id
+        latest_ids = set(latest.values())
+        CaseVersion.objects.filter(case__in=case_ids).exclude(
+            pk__in=latest_ids).update(latest=False, notrack=True)
+        CaseVersion.objects.filter(pk__in=latest_ids).update(
+            latest=True, notrack=True)
+        return latest_ids
+
+
+    @classmethod
+    def set_product_latest_versions(cls, product_id):
+        """
+        Mark latest version of every case of product ``product_id``.
+
+        The latest version of each case (that with the highest product
+        version order) is found with a grouped query and the ``latest`` flags
+        that change are updated in a single ``UPDATE`` joined to it (the
+        syntax depends on the database; others select the changes and update
+        them in batches).
+
+        Returns the number of caseversions whose flag changed.
+
+        """
+        qn = connection.ops.quote_name
+        tables = {
+            "cv": qn(CaseVersion._meta.db_table),
+            "pv": qn(ProductVersion._meta.db_table),
+            "case": qn(cls._meta.db_table),
+            "order": qn("order"),
+            }
+        # highest product version order of each case of the product
+        tables["grouped"] = """
+            SELECT gcv.case_id AS case_id, MAX(gpv.{order}) AS max_order
+            FROM {cv} gcv
+            INNER JOIN {pv} gpv ON gpv.id = gcv.productversion_id
+            INNER JOIN {case} gc ON gc.id = gcv.case_id
+            WHERE gc.product_id = %s AND gcv.deleted_on IS NULL
+            GROUP BY gcv.case_id
+            """.format(**tables)
+
+        cursor = connection.cursor()
+        vendor = connection.vendor
+        if vendor == "mysql":
+            cursor.execute(
+                """UPDATE {cv} cv
+                INNER JOIN {pv} pv ON pv.id = cv.productversion_id
+                INNER JOIN ({grouped}) m ON m.case_id = cv.case_id
+                SET cv.latest = (pv.{order} = m.max_order),
+                    cv.cc_version = cv.cc_version + 1
+                WHERE cv.deleted_on IS NULL
+                AND cv.latest != (pv.{order} = m.max_order)
+                """.format(**tables),
+                [product_id],
+                )
+            changed = cursor.rowcount
+        elif vendor == "postgresql" or (
+                vendor == "sqlite" and _sqlite_version() >= (3, 33, 0)):
+            cursor.execute(
+                """UPDATE {cv} SET
+                    latest = (pv.{order} = m.max_order),
+                    cc_version = {cv}.cc_version + 1
+                FROM {pv} pv, ({grouped}) m
+                WHERE pv.id = {cv}.productversion_id
+                AND m.case_id = {cv}.case_id
+                AND {cv}.deleted_on IS NULL
+                AND {cv}.latest != (pv.{order} = m.max_order)
+                """.format(**tables),
+                [product_id],
+                )
+            changed = cursor.rowcount
+        else:
+            cursor.execute(
+                """SELECT cv.id, (pv.{order} = m.max_order) FROM {cv} cv
+                INNER JOIN {pv} pv ON pv.id = cv.productversion_id
+                INNER JOIN ({grouped}) m ON m.case_id = cv.case_id
+                WHERE cv.deleted_on IS NULL
+                AND cv.latest != (pv.{order} = m.max_order)
+                """.format(**tables),
+                [product_id],
+                )
+            changes = defaultdict(list)
+            for cv_id, latest in cursor.fetchall():
+                changes[bool(latest)].append(cv_id)
+            for latest, ids in changes.items():
+                for i in range(0, len(ids), LATEST_BATCH_SIZE):
+                    CaseVersion.everything.filter(
+                        pk__in=ids[i:i + LATEST_BATCH_SIZE]).update(
+                        latest=latest, notrack=True)
+            changed = sum(len(ids) for ids in changes.values())
+        transaction.commit_unless_managed()
+        return changed
+
+
     def all_versions(self):
         """
         Return list of (productversion, caseversion) tuples for this case.
@@ -117,7 +239,46 @@ class CaseVersion(MTModel, DraftStatusModel, HasEnvironmentsModel):
         skip_set_latest = kwargs.pop("skip_set_latest", False)
         super(CaseVersion, self).save(*args, **kwargs)
         if not skip_set_latest:
-            self.case.set_latest_version(update_instance=self)
+            self._set_latest(update_instance=self)
+
+
+    @classmethod
+    def bulk_created(cls, caseversions):
+        """
+        Update bulk-inserted caseversions the way ``save()`` updates new ones.
+
+        They get the environments of their product version, and latest
+        versions of their cases are updated (unless deferred, see
+        ``deferred_denormalization``).
+
+        """
+        ids_by_pv = defaultdict(list)
+        for cv in caseversions:
+            ids_by_pv[cv.productversion_id].append(cv.id)
+        envs_by_pv = defaultdict(list)
+        for link in ProductVersion.environments.through.objects.filter(
+                productversion__in=ids_by_pv.keys(),
+                environment__deleted_on__isnull=True,
+                ).select_related("environment"):
+            envs_by_pv[link.productversion_id].append(link.environment)
+        for pv_id, cv_ids in ids_by_pv.items():
+            if envs_by_pv[pv_id]:
+                cls._link_envs(cv_ids, envs_by_pv[pv_id])
+
+        case_ids = set(cv.case_id for cv in caseversions)
+        if deferring() is not None:
+            deferring().add_cases(case_ids, caseversions)
+            return
+        latest_ids = Case.set_latest_versions(case_ids)
+        for cv in caseversions:
+            cv.cc_version += 1
+            cv.latest = cv.id in latest_ids
+
+
+    @classmethod
+    def bulk_cloned(cls, clones):
+        """Update bulk-inserted clones; see ``bulk_created``."""
+        cls.bulk_created(clones)
 
 
     def delete(self, *args, **kwargs):
@@ -128,13 +289,24 @@ class CaseVersion(MTModel, DraftStatusModel, HasEnvironmentsModel):
             # the case as well
             self.case.delete(*args, **kwargs)
         else:
-            self.case.set_latest_version()
+            self._set_latest()
 
 
     def undelete(self, *args, **kwargs):
         """Undelete CaseVersion, updating latest version."""
         super(CaseVersion, self).undelete(*args, **kwargs)
-        self.case.set_latest_version()
+        self._set_latest()
+
+
+    def _set_latest(self, update_instance=None):
+        """Mark latest version of the case, or record it if deferring."""
+        if deferring() is not None:
+            deferring().add_cases(
+                [self.case_id],
+                [update_instance] if update_instance is not None else [],
+                )
+        else:
+            self.case.set_latest_version(update_instance=update_instance)
 
 
     def clean(self):
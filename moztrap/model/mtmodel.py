@@ -6,11 +6,12 @@ creation, modification, and soft-deletion.
 
 """
 import datetime
+from collections import defaultdict
+from functools import wraps
 
-from django.db import models, router
-from django.db.models.deletion import Collector
+from django.db import connections, models, router, transaction
 from django.db.models.query import QuerySet
-from django.db.models.signals import class_prepared
+from django.db.models.signals import class_prepared, m2m_changed
 
 from model_utils import Choices
 
@@ -28,50 +29,721 @@ def utcnow():
 
 
 
-class SoftDeleteCollector(Collector):
+def commit_on_success_unless_managed(func):
     """
-    A variant of Django's default delete-cascade collector that implements soft
-    delete.
+    Decorate ``func`` to run in a transaction, unless one is already managed.
+
+    Like ``transaction.commit_on_success``, but in a transaction managed by
+    the caller (e.g. a job's ``commit_manually`` transaction in the worker)
+    ``func`` joins it, and committing or rolling back is left to the caller;
+    a nested ``commit_on_success`` would commit the caller's work too.
+
+    """
+    @wraps(func)
+    def _wrapped(*args, **kwargs):
+        if transaction.is_managed():
+            return func(*args, **kwargs)
+        return transaction.commit_on_success(func)(*args, **kwargs)
+    return _wrapped
+
+
+
+class SoftDeleteCascade(object):
+    """
+    Soft-deletes (or undeletes) objects and cascades to dependent objects.
+
+    Walks the reverse-FK relation graph like Django's delete collector, but
+    without loading instances: ids are selected a page of ``chunk_size`` at a
+    time, and dependents of each page are updated with ``UPDATE ... WHERE
+    fk_id IN (...)`` queries. Memory use is bounded by the depth of the
+    relation graph times ``chunk_size``, however many objects are affected.
+
+    Only ``CASCADE`` relations are followed (``PROTECT`` raises
+    ``ProtectedError``); many-to-many links and non-``MTModel`` data are left
+    alone, as soft-deleted objects keep them. Each page of updated objects is
+    passed to its model's ``bulk_deleted`` or ``bulk_undeleted`` hook, for
+    models to bring denormalized data (e.g. result rollups) up to date.
 
     """
-    def collect(self, objs, *args, **kwargs):
+    chunk_size = 1000
+
+
+    def __init__(self, using):
+        """Initialize cascade for database ``using``."""
+        self.using = using
+        self._relations = {}
+        self._cyclic = {}
+
+
+    def delete(self, queryset, user=None):
+        """Soft-delete objects in ``queryset`` and their dependents."""
+        now = utcnow()
+
+        def update(qs):
+            qs.filter(deleted_on__isnull=True).update(
+                deleted_by=user, deleted_on=now)
+            qs.model.bulk_deleted(qs)
+
+        self.cascade(queryset, update)
+
+
+    def undelete(self, queryset, user=None):
         """
-        Collect ``objs`` and dependent objects.
+        Undelete objects in ``queryset`` and their deleted dependents.
 
-        We override in order to store "root" objects for undelete.
+        Only dependents deleted at the same time as one of the objects in
+        ``queryset`` (i.e. deleted along with it) are undeleted.
 
         """
-        if kwargs.get("source", None) is None:
-            self.root_objs = objs
-        super(SoftDeleteCollector, self).collect(objs, *args, **kwargs)
+        queryset = self._root(queryset)
+        deletion_times = [
+            t for t in set(queryset.values_list("deleted_on", flat=True))
+            if t is not None
+            ]
+        if not deletion_times:
+            return
+        now = utcnow()
+
+        def update(qs):
+            # undeleting counts as a modification, for change tracking
+            qs.filter(deleted_on__in=deletion_times).update(
+                deleted_by=None,
+                deleted_on=None,
+                modified_by=user,
+                modified_on=now,
+                )
+            qs.model.bulk_undeleted(qs)
+
+        self.cascade(queryset, update)
 
 
-    def delete(self, user=None):
+    def cascade(self, queryset, update):
         """
-        Soft-delete all collected instances.
+        Call ``update`` with querysets of objects in or under ``queryset``.
+
+        ``update`` is called once per page of ``queryset`` and per relation
+        and page of dependents, dependents first, with a plain queryset of
+        ``MTModel`` objects to update.
 
         """
-        now = utcnow()
-        for model, instances in self.data.iteritems():
-            pk_list = [obj.pk for obj in instances]
-            model._base_manager.filter(
-                pk__in=pk_list, deleted_on__isnull=True).update(
-                deleted_by=user, deleted_on=now)
+        self._seen = defaultdict(set)
+        model = queryset.model
+        for ids in self._pages(self._root(queryset)):
+            self._cascade(model, ids, update)
+
+
+    def _root(self, queryset):
+        """Return unsliced queryset of the objects in ``queryset``."""
+        if not queryset.query.can_filter():
+            queryset = queryset.model._base_manager.filter(
+                pk__in=list(queryset.values_list("pk", flat=True)))
+        return queryset.using(self.using)
+
+
+    def _cascade(self, model, ids, update):
+        """Update ``model`` objects with ``ids`` and their dependents."""
+        if self._is_cyclic(model):
+            ids = [i for i in ids if i not in self._seen[model]]
+            if not ids:
+                return
+            self._seen[model].update(ids)
+
+        for related in self._related(model):
+            dependents = related.model._base_manager.using(self.using).filter(
+                **{"{0}__in".format(related.field.name): ids})
+            if related.field.rel.on_delete is models.PROTECT:
+                if dependents.exists():
+                    raise models.ProtectedError(
+                        "Cannot delete some instances of model '{0}' because "
+                        "they are referenced through a protected foreign key: "
+                        "'{1}.{2}'".format(
+                            model.__name__,
+                            related.model.__name__,
+                            related.field.name,
+                            ),
+                        list(dependents[:self.chunk_size]),
+                        )
+            elif self._related(related.model):
+                for page in self._pages(dependents):
+                    self._cascade(related.model, page, update)
+            else:
+                update(dependents)
 
+        if issubclass(model, MTModel):
+            update(model._base_manager.using(self.using).filter(pk__in=ids))
 
-    def undelete(self, user=None):
+
+    def _pages(self, queryset):
+        """Yield lists of ids of objects in ``queryset``, by ascending id."""
+        pks = queryset.order_by("pk").values_list("pk", flat=True)
+        last = None
+        while True:
+            page = pks if last is None else pks.filter(pk__gt=last)
+            page = list(page[:self.chunk_size])
+            if not page:
+                return
+            yield page
+            last = page[-1]
+
+
+    def _related(self, model):
+        """
+        Return list of relations of ``model`` that deletes cascade through.
+
+        These are reverse FKs with ``CASCADE`` to models that are, or have
+        dependents that are, ``MTModel`` subclasses; and ``PROTECT`` FKs.
+
+        """
+        if model not in self._relations:
+            # guard against recursion through self-referencing models
+            self._relations[model] = []
+            relations = []
+            for related in model._meta.get_all_related_objects(
+                    include_hidden=True, include_proxy_eq=True):
+                if related.model._meta.auto_created:
+                    continue
+                on_delete = related.field.rel.on_delete
+                if on_delete is models.PROTECT or (
+                        on_delete is models.CASCADE and (
+                            issubclass(related.model, MTModel) or
+                            self._related(related.model))):
+                    relations.append(related)
+            self._relations[model] = relations
+        return self._relations[model]
+
+
+    def _is_cyclic(self, model):
+        """Return True if ``model`` can (indirectly) cascade to itself."""
+        if model not in self._cyclic:
+            todo = [r.model for r in self._related(model)]
+            reached = set()
+            while todo and model not in reached:
+                dependent = todo.pop()
+                if dependent not in reached:
+                    reached.add(dependent)
+                    todo.extend(r.model for r in self._related(dependent))
+            self._cyclic[model] = model in reached
+        return self._cyclic[model]
+
+
+
+class BulkCloner(object):
+    """
+    Clones objects and their cascades, a level of the cascade tree at a time.
+
+    ``MTModel.clone`` queues the clone of an object (with its ``cascade``)
+    with ``add``; ``run`` then inserts each level of queued clones with
+    ``bulk_create`` per model, bulk-inserts their many-to-many rows and
+    loads the next level (reverse-FK children of the cloned objects, whose
+    own ``clone`` methods queue them, with the FK overridden to point to the
+    new parent) with a query per relation.
+
+    Clones are inserted with ``BulkUpsert``, which gets the ids of inserted
+    rows back from the database (with ``RETURNING``, or as consecutive ids
+    of a multi-row ``INSERT``). Models whose ``save()`` has side effects for
+    new instances (and don't implement them in bulk in ``bulk_cloned``) are
+    saved one at a time instead.
+
+    """
+    batch_size = 500
+
+
+    def __init__(self, user=None):
+        """Initialize cloner; ``user`` is set as creator of all clones."""
+        self.user = user
+        self.now = utcnow()
+        self._queued = []
+
+
+    def add(self, obj, clone, cascade):
+        """Queue unsaved ``clone`` of ``obj``, to cascade to ``cascade``."""
+        self._queued.append((obj, clone, cascade))
+
+
+    def run(self):
+        """Save all queued clones and their cascades."""
+        while self._queued:
+            level, self._queued = self._queued, []
+            groups = self._group(level, lambda node: node[0].__class__)
+            for model, nodes in groups:
+                self._insert(model, [clone for obj, clone, cascade in nodes])
+            for model, nodes in groups:
+                names = []
+                for obj, clone, cascade in nodes:
+                    names.extend(n for n in cascade if n not in names)
+                for name in names:
+                    self._cascade(
+                        name,
+                        [
+                            (obj, clone, cascade[name])
+                            for obj, clone, cascade in nodes
+                            if name in cascade
+                            ]
+                        )
+
+
+    def _group(self, items, key):
+        """Return list of (key, items) groups, in order of first appearance."""
+        groups = []
+        by_key = {}
+        for item in items:
+            k = key(item)
+            if k not in by_key:
+                by_key[k] = []
+                groups.append((k, by_key[k]))
+            by_key[k].append(item)
+        return groups
+
+
+    def _batches(self, items):
+        """Yield ``items`` (a list) in batches of ``batch_size``."""
+        for i in range(0, len(items), self.batch_size):
+            yield items[i:i + self.batch_size]
+
+
+    def _insert(self, model, clones):
+        """Insert ``clones`` of ``model``, setting their ids."""
+        bulk = (
+            model.save.im_func is MTModel.save.im_func or
+            model.bulk_cloned.im_func is not MTModel.bulk_cloned.im_func
+            )
+        if len(clones) == 1 or not bulk:
+            for clone in clones:
+                clone.save(force_insert=True)
+            return
+
+        for clone in clones:
+            clone.cc_version = 0
+            clone.modified_on = self.now
+        BulkUpsert(model, using=model._base_manager.db).run(clones)
+        model.bulk_cloned(clones)
+
+
+    def _cascade(self, name, nodes):
+        """Cascade-clone relation ``name`` for (obj, clone, filter) ``nodes``."""
+        manager_class = getattr(nodes[0][0], name).__class__.__name__
+        if manager_class == "ManyRelatedManager":
+            self._cascade_m2m(name, nodes)
+        elif manager_class == "RelatedManager":
+            self._cascade_reverse_fk(name, nodes)
+        else:
+            raise ValueError(
+                "Cannot cascade-clone '{0}'; "
+                "not a many-to-many or reverse foreignkey.".format(name))
+
+
+    def _cascade_m2m(self, name, nodes):
+        """Give clones the many-to-many links (``name``) of their sources."""
+        # maps (through model, source field, target field) to list of
+        # (manager, source id, clone id, filter)
+        links = {}
+        clones = {}
+        for obj, clone, filter_func in nodes:
+            mgr, clone_mgr = getattr(obj, name), getattr(clone, name)
+            if mgr.instance is not obj or clone_mgr.instance is not clone:
+                # relation is delegated (e.g. to parent's team); no bulk
+                filter_func = filter_func or (lambda qs: qs)
+                existing = set(clone_mgr.all())
+                new = set(filter_func(mgr.all()))
+                clone_mgr.add(*new.difference(existing))
+                clone_mgr.remove(*existing.difference(new))
+                continue
+            if not mgr.through._meta.auto_created:
+                raise ValueError(
+                    "Cannot cascade-clone '{0}'; "
+                    "it has an intermediary model.".format(name))
+            links.setdefault(
+                (mgr.through, mgr.source_field_name, mgr.target_field_name),
+                []).append((mgr, obj.pk, clone.pk, filter_func))
+            clones[clone.pk] = clone
+
+        for (through, source, target), entries in links.items():
+            source_id, target_id = "{0}_id".format(source), "{0}_id".format(
+                target)
+            target_model = entries[0][0].model
+
+            new = defaultdict(set)
+            bulk_ids = [e[1] for e in entries if e[3] is None]
+            for ids in self._batches(bulk_ids):
+                rows = through._base_manager.filter(
+                    **{"{0}__in".format(source): ids})
+                if issubclass(target_model, MTModel):
+                    rows = rows.filter(
+                        **{"{0}__deleted_on__isnull".format(target): True})
+                for obj_id, other_id in rows.values_list(source_id, target_id):
+                    new[obj_id].add(other_id)
+            for mgr, obj_id, clone_id, filter_func in entries:
+                if filter_func is not None:
+                    new[obj_id] = set(o.pk for o in filter_func(mgr.all()))
+
+            existing = defaultdict(set)
+            clone_ids = [e[2] for e in entries]
+            for ids in self._batches(clone_ids):
+                for clone_id, other_id in through._base_manager.filter(
+                        **{"{0}__in".format(source): ids}).values_list(
+                        source_id, target_id):
+                    existing[clone_id].add(other_id)
+
+            added, removed = [], []
+            for mgr, obj_id, clone_id, filter_func in entries:
+                added.extend(
+                    (clone_id, other_id)
+                    for other_id in new[obj_id] - existing[clone_id])
+                removed.extend(
+                    (clone_id, other_id)
+                    for other_id in existing[clone_id] - new[obj_id])
+
+            through_manager = through._base_manager
+            changes = _M2MChanges(through, source, target, clones)
+            changes.send("pre_add", added)
+            for batch in self._batches(added):
+                through_manager.bulk_create(
+                    [
+                        through(**{source_id: clone_id, target_id: other_id})
+                        for clone_id, other_id in batch
+                        ]
+                    )
+            changes.send("post_add", added)
+
+            changes.send("pre_remove", removed)
+            for (instance, reverse), pk_set in changes.grouped(removed):
+                field = target if reverse else source
+                other = source if reverse else target
+                through_manager.filter(
+                    **{
+                        field: instance.pk,
+                        "{0}__in".format(other): pk_set,
+                        }
+                    ).delete()
+            changes.send("post_remove", removed)
+
+
+    def _cascade_reverse_fk(self, name, nodes):
+        """Queue clones of reverse-FK (``name``) children of cloned objects."""
+        model = nodes[0][0].__class__
+        field = getattr(model, name).related.field
+        child_model = field.model
+        clones = dict((obj.pk, clone) for obj, clone, filter_func in nodes)
+
+        children = []
+        bulk_ids = [obj.pk for obj, clone, f in nodes if f is None]
+        for ids in self._batches(bulk_ids):
+            qs = child_model._base_manager.filter(
+                **{"{0}__in".format(field.name): ids})
+            if issubclass(child_model, MTModel):
+                qs = qs.filter(deleted_on__isnull=True)
+            children.extend(qs)
+        for obj, clone, filter_func in nodes:
+            if filter_func is not None:
+                children.extend(filter_func(getattr(obj, name).all()))
+
+        for child in children:
+            child.clone(
+                overrides={field.name: clones[getattr(child, field.attname)]},
+                user=self.user,
+                cloner=self,
+                )
+
+
+
+class _M2MChanges(object):
+    """
+    Sends ``m2m_changed`` signals for many-to-many links of clones.
+
+    Signals are sent from whichever side has fewer objects: from each clone
+    (with the set of linked objects), or from each linked object (with the
+    set of clones, as a reverse change).
+
+    """
+    def __init__(self, through, source, target, clones):
+        """Initialize for ``through`` model links of ``clones`` (by id)."""
+        self.through = through
+        self.source_model = through._meta.get_field(source).rel.to
+        self.target_model = through._meta.get_field(target).rel.to
+        self.clones = clones
+        self._targets = {}
+
+
+    def grouped(self, links):
+        """
+        Group (clone id, target id) ``links`` by the side with fewer objects.
+
+        Returns list of ((instance, reverse), pk_set) pairs.
+
+        """
+        by_clone, by_target = defaultdict(set), defaultdict(set)
+        for clone_id, other_id in links:
+            by_clone[clone_id].add(other_id)
+            by_target[other_id].add(clone_id)
+        if len(by_clone) <= len(by_target):
+            return [
+                ((self.clones[clone_id], False), pk_set)
+                for clone_id, pk_set in by_clone.items()
+                ]
+        missing = [i for i in by_target if i not in self._targets]
+        if missing:
+            self._targets.update(
+                self.target_model._base_manager.in_bulk(missing))
+        return [
+            ((self._targets[other_id], True), pk_set)
+            for other_id, pk_set in by_target.items()
+            ]
+
+
+    def send(self, action, links):
+        """Send ``action`` signals for (clone id, target id) ``links``."""
+        if not links:
+            return
+        for (instance, reverse), pk_set in self.grouped(links):
+            m2m_changed.send(
+                sender=self.through,
+                action=action,
+                instance=instance,
+                reverse=reverse,
+                model=self.source_model if reverse else self.target_model,
+                pk_set=pk_set,
+                using=self.through._base_manager.db,
+                )
+
+
+
+class BulkUpsert(object):
+    """
+    Inserts rows of a model in bulk, updating those that already exist.
+
+    Objects with a primary key are inserted with it, or update the existing
+    row with that key; objects without one are inserted as new rows. Values
+    are passed as query parameters, and rows are sent in chunks of at most
+    ``batch_size`` rows (fewer, if the backend limits query parameters) and
+    roughly ``max_bytes`` of values, well under MySQL's default
+    ``max_allowed_packet``.
+
+    The upsert ``dialect`` is ``"mysql"`` (``ON DUPLICATE KEY UPDATE``),
+    ``"on_conflict"`` (``ON CONFLICT DO UPDATE``; PostgreSQL 9.5+ and SQLite
+    3.24+) or ``"fallback"``: an ``UPDATE`` of the existing rows (of a chunk)
+    and an ``INSERT`` of the others.
+
+    """
+    batch_size = 1000
+    max_bytes = 1024 * 1024
+
+    # never updated by default, as in MTQuerySet.update
+    NOT_UPDATED = ["created_on", "created_by", "deleted_on", "deleted_by"]
+
+
+    def __init__(self, model, update_fields=None, using=None, dialect=None):
+        """
+        Initialize upsert of instances of ``model``.
+
+        ``update_fields`` are the names of fields set on existing rows
+        (default all fields but the primary key, creation and deletion ones).
+        The dialect is chosen by database backend, unless ``dialect`` is
+        given.
+
+        """
+        self.model = model
+        self.using = using or router.db_for_write(model)
+        self.connection = connections[self.using]
+        self.pk = model._meta.pk
+        self.fields = [
+            f for f in model._meta.local_fields if not f.primary_key]
+        if update_fields is None:
+            self.update_fields = [
+                f for f in self.fields if f.name not in self.NOT_UPDATED]
+        else:
+            self.update_fields = [
+                model._meta.get_field(name) for name in update_fields]
+        self.dialect = dialect or self._dialect()
+        self._consecutive = None
+
+
+    def _dialect(self):
+        """Return upsert dialect of the database backend."""
+        vendor = self.connection.vendor
+        if vendor == "mysql":
+            return "mysql"
+        if vendor == "postgresql":
+            self.connection.cursor()
+            if self.connection.pg_version >= 90500:
+                return "on_conflict"
+        if vendor == "sqlite":
+            from django.db.backends.sqlite3.base import Database
+            if Database.sqlite_version_info >= (3, 24, 0):
+                return "on_conflict"
+        return "fallback"
+
+
+    def run(self, objs):
+        """
+        Insert or update ``objs``; return list of their ids.
+
+        New objects (without a primary key) get their ids set.
+
+        """
+        existing = [o for o in objs if o.pk is not None]
+        new = [o for o in objs if o.pk is None]
+        cursor = self.connection.cursor()
+        for chunk in self._chunks(existing, [self.pk] + self.fields):
+            if self.dialect == "fallback":
+                self._update_or_insert(cursor, chunk)
+            else:
+                self._upsert(cursor, chunk)
+        for chunk in self._chunks(new, self.fields):
+            self._insert_new(cursor, chunk)
+        transaction.commit_unless_managed(using=self.using)
+        return [o.pk for o in objs]
+
+
+    def _chunks(self, objs, fields):
+        """Yield lists of (obj, values) for ``objs``, a chunk at a time."""
+        max_rows = min(
+            self.batch_size,
+            self.connection.ops.bulk_batch_size(fields, objs) or 1,
+            )
+        chunk, size = [], 0
+        for obj in objs:
+            values = [
+                f.get_db_prep_save(
+                    f.pre_save(obj, True), connection=self.connection)
+                for f in fields
+                ]
+            row_size = sum(
+                len(v) if isinstance(v, basestring) else 8 for v in values)
+            if chunk and (
+                    len(chunk) >= max_rows or size + row_size > self.max_bytes):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append((obj, values))
+            size += row_size
+        if chunk:
+            yield chunk
+
+
+    def _insert_sql(self, fields, num_rows):
+        """Return INSERT statement for ``num_rows`` rows of ``fields``."""
+        qn = self.connection.ops.quote_name
+        row = "({0})".format(", ".join(["%s"] * len(fields)))
+        return "INSERT INTO {0} ({1}) VALUES {2}".format(
+            qn(self.model._meta.db_table),
+            ", ".join(qn(f.column) for f in fields),
+            ", ".join([row] * num_rows),
+            )
+
+
+    def _upsert(self, cursor, chunk):
+        """Insert rows of ``chunk`` with their ids, updating existing ones."""
+        qn = self.connection.ops.quote_name
+        sql = self._insert_sql([self.pk] + self.fields, len(chunk))
+        if not self.update_fields:
+            # nothing to update, but existing rows mustn't be an error
+            update_fields = [self.pk]
+        else:
+            update_fields = self.update_fields
+        if self.dialect == "mysql":
+            sql += " ON DUPLICATE KEY UPDATE " + ", ".join(
+                "{0} = VALUES({0})".format(qn(f.column))
+                for f in update_fields
+                )
+        else:
+            sql += " ON CONFLICT ({0}) DO UPDATE SET ".format(
+                qn(self.pk.column)) + ", ".join(
+                "{0} = EXCLUDED.{0}".format(qn(f.column))
+                for f in update_fields
+                )
+        cursor.execute(sql, [v for obj, values in chunk for v in values])
+
+
+    def _update_or_insert(self, cursor, chunk):
+        """Update existing rows of ``chunk``; insert the others."""
+        qn = self.connection.ops.quote_name
+        existing = set(
+            self.model._base_manager.using(self.using).filter(
+                pk__in=[obj.pk for obj, values in chunk]).values_list(
+                "pk", flat=True)
+            )
+        positions = [
+            i for i, f in enumerate(self.fields) if f in self.update_fields]
+        updates = [
+            [values[i + 1] for i in positions] + [values[0]]
+            for obj, values in chunk if obj.pk in existing
+            ]
+        if updates and positions:
+            cursor.executemany(
+                "UPDATE {0} SET {1} WHERE {2} = %s".format(
+                    qn(self.model._meta.db_table),
+                    ", ".join(
+                        "{0} = %s".format(qn(self.fields[i].column))
+                        for i in positions
+                        ),
+                    qn(self.pk.column),
+                    ),
+                updates,
+                )
+        inserts = [
+            values for obj, values in chunk if obj.pk not in existing]
+        if inserts:
+            cursor.execute(
+                self._insert_sql([self.pk] + self.fields, len(inserts)),
+                [v for values in inserts for v in values],
+                )
+
+
+    def _insert_new(self, cursor, chunk):
+        """Insert rows of ``chunk`` as new rows; set ids of their objects."""
+        ops = self.connection.ops
+        table = self.model._meta.db_table
+        if self.connection.features.can_return_id_from_insert:
+            # PostgreSQL: "RETURNING id" returns ids of all inserted rows
+            cursor.execute(
+                self._insert_sql(self.fields, len(chunk)) + " " + (
+                    ops.return_insert_id()[0] % ops.quote_name(
+                        self.pk.column)),
+                [v for obj, values in chunk for v in values],
+                )
+            ids = [row[0] for row in cursor.fetchall()]
+        elif self.consecutive_ids:
+            # ids of the rows of one INSERT are consecutive, from the first
+            # (MySQL) or up to the last (SQLite) reported id
+            cursor.execute(
+                self._insert_sql(self.fields, len(chunk)),
+                [v for obj, values in chunk for v in values],
+                )
+            reported = ops.last_insert_id(cursor, table, self.pk.column)
+            if self.connection.vendor == "sqlite":
+                reported -= len(chunk) - 1
+            ids = range(reported, reported + len(chunk))
+        else:
+            ids = []
+            for obj, values in chunk:
+                cursor.execute(self._insert_sql(self.fields, 1), values)
+                ids.append(ops.last_insert_id(cursor, table, self.pk.column))
+        for (obj, values), obj_id in zip(chunk, ids):
+            obj.pk = obj_id
+            obj._state.adding = False
+            obj._state.db = self.using
+            if isinstance(obj, MTModel):
+                obj._snapshot()
+
+
+    @property
+    def consecutive_ids(self):
         """
-        Undelete all collected instances that were deleted.
+        Return True if rows inserted together get consecutive ids.
+
+        SQLite gives each row the highest rowid plus one, and the database is
+        locked while writing. MySQL does for a multi-row INSERT unless InnoDB
+        uses the "interleaved" auto-increment lock mode (the default from
+        MySQL 8), in which concurrent inserts can interleave their ids.
 
         """
-        # timestamps on which root obj(s) were deleted; only cascade items also
-        # deleted in one of these same cascade batches should be undeleted.
-        deletion_times = set([o.deleted_on for o in self.root_objs])
-        for model, instances in self.data.iteritems():
-            pk_list = [obj.pk for obj in instances]
-            model._base_manager.filter(
-                pk__in=pk_list, deleted_on__in=deletion_times).update(
-                deleted_by=None, deleted_on=None)
+        if self._consecutive is None:
+            vendor = self.connection.vendor
+            self._consecutive = vendor == "sqlite"
+            if vendor == "mysql":
+                cursor = self.connection.cursor()
+                cursor.execute("SELECT @@innodb_autoinc_lock_mode")
+                self._consecutive = cursor.fetchone()[0] < 2
+        return self._consecutive
 
 
 
@@ -110,9 +782,7 @@ class MTQuerySet(QuerySet):
         """
         if permanent:
             return super(MTQuerySet, self).delete()
-        collector = SoftDeleteCollector(using=self.db)
-        collector.collect(self)
-        collector.delete(user)
+        SoftDeleteCascade(using=self.db).delete(self, user)
 
 
     def undelete(self, user=None):
@@ -120,9 +790,7 @@ class MTQuerySet(QuerySet):
         Undelete all objects in this queryset.
 
         """
-        collector = SoftDeleteCollector(using=self.db)
-        collector.collect(self)
-        collector.undelete(user)
+        SoftDeleteCascade(using=self.db).undelete(self, user)
 
 
 
@@ -137,7 +805,12 @@ class MTManager(models.Manager):
     related-object managers (which subclass the default manager class) will
     still hide deleted objects.
 
+    Subclasses can set ``queryset_class`` to use a subclass of ``MTQuerySet``.
+
     """
+    queryset_class = MTQuerySet
+
+
     def __init__(self, *args, **kwargs):
         """Instantiate a MTManager, pulling out the ``show_deleted`` arg."""
         self._show_deleted = kwargs.pop("show_deleted", False)
@@ -146,46 +819,25 @@ class MTManager(models.Manager):
 
     def get_query_set(self):
         """Return a ``MTQuerySet`` for all queries."""
-        qs = MTQuerySet(self.model, using=self.db)
+        qs = self.queryset_class(self.model, using=self.db)
         if not self._show_deleted:
             qs = qs.filter(deleted_on__isnull=True)
         return qs
 
 
-    def bulk_insert_or_update(self, obj_list):
-        """ Bulk insert with a list of model objects"""
+    def bulk_insert_or_update(self, obj_list, update_fields=None):
+        """
+        Insert ``obj_list`` in bulk, updating rows that already exist.
+
+        Objects with a primary key update ``update_fields`` of the existing
+        row with that key, if any (default all fields but the creation and
+        deletion ones); new objects get their ids set. Returns list of ids of
+        the objects. See ``BulkUpsert``.
+
+        """
+        return BulkUpsert(
+            self.model, update_fields, using=self.db).run(obj_list)
 
-        if len(obj_list):
-            create_fields = [
-                field.get_attname_column()[1] for field in obj_list[0]._meta.fields
-                ]
-            update_fields = set(create_fields) - set([
-                "id", "created_by_id", "created_on", "deleted_by_id", "deleted_on"
-            ])
-
-            def getfield(obj, field):
-                value = getattr(obj, field)
-                if isinstance(value, (str, datetime.datetime)):
-                    return "'{0}'".format(value)
-                elif value is None:
-                    return "NULL"
-                else:
-                    return value
-
-            values = []
-            for obj in obj_list:
-                values.append("({0})".format(", ".join(
-                    ["{0}".format(getfield(obj, field)) for field in create_fields]
-                )))
-
-            db_table = self.model._meta.db_table
-
-            bulk_insert_or_update(
-                db_table,
-                create_fields,
-                update_fields,
-                values,
-                )
 
 
 class MTModel(models.Model):
@@ -217,6 +869,69 @@ class MTModel(models.Model):
     objects = MTManager(show_deleted=False)
 
 
+    # fields always saved on update, so not tracked as changed
+    UNTRACKED_FIELDS = frozenset(["modified_on", "modified_by", "cc_version"])
+
+
+    def __init__(self, *args, **kwargs):
+        """
+        Instantiate model; instances loaded from the db record field values.
+
+        The db instantiates with positional field values (or, for deferred
+        loading, keyword values of the loaded fields only); instances created
+        otherwise have no snapshot until saved, and are saved in full.
+
+        """
+        super(MTModel, self).__init__(*args, **kwargs)
+        self._loaded_values = None
+        if args or self._deferred:
+            self._snapshot()
+
+
+    def _tracked_fields(self):
+        """Return list of non-PK local fields tracked for changes."""
+        # deferred-loading (proxy) classes have no local fields of their own
+        return [
+            f for f in self._meta.concrete_model._meta.local_fields
+            if not f.primary_key and f.name not in self.UNTRACKED_FIELDS
+            ]
+
+
+    def _snapshot(self, fields=None):
+        """
+        Record current values of ``fields`` (default all tracked fields).
+
+        Fields not loaded (deferred) are not recorded, and so always saved if
+        they are loaded (or set) later.
+
+        """
+        if fields is None or self._loaded_values is None:
+            self._loaded_values = {}
+            fields = self._tracked_fields()
+        for f in fields:
+            if f.attname in self.__dict__:
+                self._loaded_values[f.attname] = self.__dict__[f.attname]
+
+
+    @property
+    def changed_fields(self):
+        """
+        Return list of names of fields changed since loaded or last saved.
+
+        Returns None if this instance has no record of loaded field values
+        (it wasn't loaded from the db, nor saved yet).
+
+        """
+        if self._loaded_values is None:
+            return None
+        return [
+            f.name for f in self._tracked_fields()
+            if f.attname in self.__dict__ and (
+                f.attname not in self._loaded_values or
+                self._loaded_values[f.attname] != self.__dict__[f.attname])
+            ]
+
+
     def save(self, *args, **kwargs):
         """
         Save this instance.
@@ -224,8 +939,15 @@ class MTModel(models.Model):
         Records modified timestamp and user, and raises ConcurrencyError if an
         out-of-date version is being saved.
 
+        An update only saves fields changed since the instance was loaded
+        (or last saved), or, if ``update_fields`` (an iterable of field names)
+        is given, only those fields; along with the modified timestamp and
+        user and the concurrency version.
+
         """
-        if not kwargs.pop("notrack", False):
+        update_fields = kwargs.pop("update_fields", None)
+        track = not kwargs.pop("notrack", False)
+        if track:
             user = kwargs.pop("user", None)
             now = utcnow()
             if self.pk is None and user is not None:
@@ -238,12 +960,21 @@ class MTModel(models.Model):
         # MTModels always have an auto-PK and we don't set PKs explicitly, so
         # we can assume that a set PK means this should be an update.
         if kwargs.get("force_update") or self.id is not None:
-            non_pks = [f for f in self._meta.local_fields if not f.primary_key]
+            if update_fields is None:
+                update_fields = self.changed_fields
+            if update_fields is None:
+                fields = self._tracked_fields()
+            else:
+                fields = self._update_fields(update_fields)
+            untracked = ["cc_version"]
+            if track:
+                untracked.extend(["modified_on", "modified_by"])
+            fields.extend(self._meta.get_field(n) for n in untracked)
             # This isn't a race condition because the save will only take
             # effect if previous_version is actually up to date.
             previous_version = self.cc_version
             self.cc_version += 1
-            values = [(f, None, f.pre_save(self, False)) for f in non_pks]
+            values = [(f, None, f.pre_save(self, False)) for f in fields]
             rows = self.__class__.objects.filter(
                 id=self.id, cc_version=previous_version)._update(values)
             if not rows:
@@ -251,11 +982,34 @@ class MTModel(models.Model):
                     "No row with id {0} and version {1} updated.".format(
                         self.id, previous_version)
                     )
+            self._snapshot(fields)
         else:
-            return super(MTModel, self).save(*args, **kwargs)
+            ret = super(MTModel, self).save(*args, **kwargs)
+            self._snapshot()
+            return ret
+
+
+    def _update_fields(self, names):
+        """Return list of tracked fields with given names (or attnames)."""
+        by_name = {}
+        for f in self._tracked_fields():
+            by_name[f.name] = by_name[f.attname] = f
+        fields = []
+        for name in names:
+            if name in self.UNTRACKED_FIELDS:
+                continue
+            try:
+                field = by_name[name]
+            except KeyError:
+                raise ValueError(
+                    "Cannot update '{0}'; not a field of {1}.".format(
+                        name, self._meta.object_name))
+            if field not in fields:
+                fields.append(field)
+        return fields
 
 
-    def clone(self, cascade=None, overrides=None, user=None):
+    def clone(self, cascade=None, overrides=None, user=None, cloner=None):
         """
         Clone this instance and return the new, cloned instance.
 
@@ -271,6 +1025,10 @@ class MTModel(models.Model):
         and values are a callable that takes the queryset of all related
         objects and returns those that should be cloned.
 
+        The clone and its cascade are saved by a ``BulkCloner``. If one is
+        given as ``cloner``, the clone is only queued in it, and saved (gets
+        its id) when the cloner is run; so many objects can be cloned in bulk.
+
         """
         if cascade is None:
             cascade = {}
@@ -278,7 +1036,8 @@ class MTModel(models.Model):
             try:
                 cascade.iteritems
             except AttributeError:
-                cascade = dict((i, lambda qs: qs) for i in cascade)
+                # None means all related objects, which can be bulk-loaded
+                cascade = dict((i, None) for i in cascade)
 
         if overrides is None:
             overrides = {}
@@ -286,37 +1045,68 @@ class MTModel(models.Model):
         overrides["created_on"] = utcnow()
         overrides["created_by"] = user
         overrides["modified_by"] = user
+        overrides["cc_version"] = 0
 
         clone = self.__class__()
 
         for field in self._meta.fields:
             if field.primary_key:
                 continue
-            val = overrides.get(field.name, getattr(self, field.name))
-            setattr(clone, field.name, val)
-
-        clone.save(force_insert=True)
-
-        for name, filter_func in cascade.items():
-            mgr = getattr(self, name)
-            if mgr.__class__.__name__ == "ManyRelatedManager": # M2M
-                clone_mgr = getattr(clone, name)
-                existing = set(clone_mgr.all())
-                new = set(filter_func(mgr.all()))
-                clone_mgr.add(*new.difference(existing))
-                clone_mgr.remove(*existing.difference(new))
-            elif mgr.__class__.__name__ == "RelatedManager": # reverse FK
-                reverse_name = getattr(self.__class__, name).related.field.name
-                for obj in filter_func(mgr.all()):
-                    obj.clone(overrides={reverse_name: clone})
+            if field.name in overrides:
+                setattr(clone, field.name, overrides[field.name])
             else:
-                raise ValueError(
-                    "Cannot cascade-clone '{0}'; "
-                    "not a many-to-many or reverse foreignkey.".format(name))
+                # copy FK ids, rather than loading related objects
+                setattr(clone, field.attname, getattr(self, field.attname))
+
+        if cloner is None:
+            cloner = BulkCloner(user=user)
+            cloner.add(self, clone, cascade)
+            cloner.run()
+        else:
+            cloner.add(self, clone, cascade)
 
         return clone
 
 
+    @classmethod
+    def bulk_cloned(cls, clones):
+        """
+        Hook called with clones inserted in bulk, bypassing ``save()``.
+
+        Models whose ``save()`` has side effects for new instances are cloned
+        one ``save()`` at a time, unless they override this to apply those
+        side effects to many clones at once.
+
+        """
+        pass
+
+
+    @classmethod
+    def bulk_deleted(cls, queryset):
+        """
+        Hook called with a queryset of objects just soft-deleted.
+
+        Soft-deletes (of single instances too) cascade with ``UPDATE``
+        queries, a page of objects at a time. Models with denormalized data
+        that depends on which objects are deleted override this to update it.
+        The queryset may include objects that were already deleted.
+
+        """
+        pass
+
+
+    @classmethod
+    def bulk_undeleted(cls, queryset):
+        """
+        Hook called with a queryset of objects just undeleted.
+
+        The counterpart of ``bulk_deleted``; the queryset may include objects
+        that were not undeleted.
+
+        """
+        pass
+
+
     def delete(self, user=None, permanent=False):
         """
         (Soft) delete this instance, unless permanent=True.
@@ -324,7 +1114,7 @@ class MTModel(models.Model):
         """
         if permanent:
             return super(MTModel, self).delete()
-        self._collector.delete(user)
+        self._cascade.delete(self._self_queryset, user)
 
 
     def undelete(self, user=None):
@@ -332,16 +1122,20 @@ class MTModel(models.Model):
         Undelete this instance.
 
         """
-        self._collector.undelete(user)
+        self._cascade.undelete(self._self_queryset, user)
 
 
     @property
-    def _collector(self):
-        """Returns populated delete-cascade collector."""
+    def _cascade(self):
+        """Returns soft-delete cascade for this instance's database."""
         db = router.db_for_write(self.__class__, instance=self)
-        collector = SoftDeleteCollector(using=db)
-        collector.collect([self])
-        return collector
+        return SoftDeleteCascade(using=db)
+
+
+    @property
+    def _self_queryset(self):
+        """Returns queryset containing only this instance."""
+        return self.__class__._base_manager.filter(pk=self.pk)
 
 
     class Meta:
@@ -475,43 +1269,5 @@ def set_default_status(sender, **kwargs):
         sender._meta.get_field("status").default = sender.DEFAULT_STATUS
 
 
-def bulk_insert_or_update(db_table, create_fields, update_fields, values):
-    """
-    Bulk insert with a list of fields and values list
-
-    On duplicate key, update those values based on the update_fields list.
-
-    The concept of this handy manager was borrowed
-    from a gist by mmohiudd: https://gist.github.com/3903508
-
-    Except I made this work with model objects instead of lists of
-    specific fields to update and insert.  We figure it out based on the
-    fields of the model object.
-
-    This provides bulk insert and UPDATE ON DUPLICATE KEY.
-
-    """
-
-    from django.db import connection, transaction
-    cursor = connection.cursor()
-
-    base_sql = "INSERT INTO {0} (`{1}`) VALUES {2}".format(
-        db_table,
-        "`, `".join(create_fields),
-        ", ".join(values)
-    )
-
-    on_duplicates = []
-    for field in update_fields:
-        on_duplicates.append("`{0}`=VALUES(`{0}`)".format(field, field))
-
-    sql = "{0} ON DUPLICATE KEY UPDATE {1}".format(
-        base_sql,
-        ", ".join(on_duplicates),
-        )
-
-    cursor.execute(sql)
-    transaction.commit_unless_managed()
-
 
 class_prepared.connect(set_default_status)
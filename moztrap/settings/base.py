@@ -138,6 +138,7 @@ INSTALLED_APPS = [
     "moztrap.model.execution",
     "moztrap.model.attachments",
     "moztrap.model.tags",
+    "moztrap.model.jobs",
     "moztrap.view",
     "moztrap.view.lists",
     "moztrap.view.markup",
@@ -153,6 +154,10 @@ CACHES = {
     }
 }
 
+# Cache environment indexes and labels? None means yes, unless the cache
+# backend is local-memory (which other processes can't invalidate).
+CACHE_ENVIRONMENTS = None
+
 AUTHENTICATION_BACKENDS = [
     "moztrap.model.core.auth.ModelBackend",
     "moztrap.model.core.auth.BrowserIDBackend",
@@ -215,6 +220,15 @@ FORBIDDEN_PASSWORDS = [
 
 ALLOW_ANONYMOUS_ACCESS = False
 
+# If True, slow operations (run activation, series cloning, profile generation
+# and product version cloning) are queued as background jobs, and
+# "manage.py run_jobs" must be running to process them.
+ASYNC_JOBS = False
+
+# A running background job that hasn't reported progress for this many seconds
+# is assumed to have lost its worker, and is marked failed.
+JOB_TIMEOUT = 30 * 60
+
 INSTALLED_APPS += ["icanhaz"]
 ICANHAZ_DIRS = [join(BASE_PATH, "jstemplates")]
 
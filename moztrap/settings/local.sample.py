@@ -115,6 +115,11 @@ Copy local.sample.py to local.py and modify as needed.
 #    }
 #}
 
+# Uncomment this to run slow operations (run activation, series cloning,
+# profile generation, product version cloning) as background jobs rather than
+# within the web request. Requires a worker: "python manage.py run_jobs".
+#ASYNC_JOBS = True
+
 # if DEBUG:
     # LOGGING["handlers"]["console"] = {
     #     "level": "DEBUG",
@@ -76,6 +76,7 @@ class RunFilterSet(filters.FilterSet):
             queryset=model.Run.objects.filter(is_series=True)
             ),
         filters.KeywordExactFilter("build"),
+        filters.CompletionFilter("completion"),
         ]
 
 
@@ -90,8 +91,7 @@ class RunCaseVersionFilterSet(filters.FilterSet):
         filters.ChoicesFilter(
             "result status",
             key="resultstatus",
-            lookup="results__status",
-            extra_filters={"results__is_latest": True},
+            lookup="latestresults__status",
             choices=Choices(*model.Result.COMPLETED_STATES),
             ),
         filters.KeywordExactFilter(
@@ -130,6 +130,7 @@ class RunCaseVersionFilterSet(filters.FilterSet):
             "suite",
             lookup="caseversion__case__suites",
             queryset=model.Suite.objects.all()),
+        filters.CompletionFilter("completion"),
         ]
 
 
@@ -0,0 +1,14 @@
+"""
+URLconf for background job status.
+
+"""
+from django.conf.urls.defaults import patterns, url
+
+
+
+urlpatterns = patterns(
+    "moztrap.view.jobs.views",
+
+    url(r"^(?P<job_id>\d+)/$", "job_status", name="job_status"),
+
+)
@@ -0,0 +1,36 @@
+"""
+Background job status views.
+
+"""
+import json
+
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.cache import never_cache
+
+from moztrap import model
+
+from ..utils.auth import login_maybe_required
+
+
+
+@never_cache
+@login_maybe_required
+def job_status(request, job_id):
+    """Return status and progress of a background job as JSON."""
+    job = get_object_or_404(model.Job, pk=job_id)
+    return HttpResponse(
+        json.dumps(
+            {
+                "id": job.id,
+                "task": job.task,
+                "status": job.status,
+                "done": job.done,
+                "total": job.total,
+                "progress": job.progress(),
+                "finished": job.finished,
+                "result": job.get_result(),
+                }
+            ),
+        content_type="application/json",
+        )
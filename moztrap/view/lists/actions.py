@@ -7,9 +7,14 @@ from functools import wraps
 from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
 
+from moztrap.model.jobs.models import Job
 
+from ..utils.jobs import job_message
 
-def actions(model, allowed_actions, permission=None, fall_through=False):
+
+
+def actions(model, allowed_actions, permission=None, fall_through=False,
+            background=None):
     """
     View decorator for handling single-model actions on manage list pages.
 
@@ -25,7 +30,12 @@ def actions(model, allowed_actions, permission=None, fall_through=False):
     decorator to be used with views that also do normal non-actions form
     handling.)
 
+    ``background`` maps action names to background job tasks; such actions are
+    run by queueing the task, with the object's id as ``<model name>_id``
+    argument, rather than by calling the method.
+
     """
+    background = background or {}
     def decorator(view_func):
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
@@ -43,7 +53,11 @@ def actions(model, allowed_actions, permission=None, fall_through=False):
                         except model.DoesNotExist:
                             pass
                         else:
-                            getattr(obj, action)(user=request.user)
+                            if action in background:
+                                queue_action(
+                                    request, obj, action, background[action])
+                            else:
+                                getattr(obj, action)(user=request.user)
                             action_taken = True
                 if action_taken or not fall_through:
                     if request.is_ajax():
@@ -59,6 +73,24 @@ def actions(model, allowed_actions, permission=None, fall_through=False):
 
 
 
+def queue_action(request, obj, action, task):
+    """Queue ``task`` to do ``action`` to ``obj``; add message if pending."""
+    job = Job.objects.enqueue(
+        task,
+        user=request.user,
+        unique=True,
+        **{"{0}_id".format(obj._meta.module_name): obj.id}
+        )
+    if not job.finished:
+        job_message(
+            request,
+            job,
+            u"{0} '{1}' will {2} shortly.".format(
+                obj._meta.verbose_name.capitalize(), obj, action),
+            )
+
+
+
 def get_action(post_data):
     """
     Given a request.POST including e.g. {"action-delete": "3"}, return
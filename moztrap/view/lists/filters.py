@@ -296,8 +296,8 @@ class Filter(object):
         one-argument function to coerce values to the correct type for this
         filter; it may raise ValueError or TypeError.
         ``extra_filters`` is a dict containing any extra filters that should be
-        attached to this filter.  For example, you might want to add
-        ``is_latest`` to a ``result status`` filter.
+        attached to this filter.  For example, you might want to limit a
+        filter on a related field to related objects that aren't deleted.
 
         """
         self.name = name
@@ -385,6 +385,38 @@ class ChoicesFilter(BaseChoicesFilter):
 
 
 
+class CompletionFilter(BaseChoicesFilter):
+    """
+    A filter on ranges of completion percentage.
+
+    Filtered querysets must have a ``filter_completion`` method, as run and
+    runcaseversion querysets do; the filtering is done in the database.
+
+    """
+    # (value, label, (low, high)); low inclusive, high exclusive
+    RANGES = [
+        ("0-25", "0-25%", (0, 0.25)),
+        ("25-50", "25-50%", (0.25, 0.5)),
+        ("50-75", "50-75%", (0.5, 0.75)),
+        ("75-100", "75-99%", (0.75, 1)),
+        ("100", "100%", (1, None)),
+        ]
+
+
+    def get_choices(self):
+        """Return completion range choices."""
+        return [(value, label) for value, label, bounds in self.RANGES]
+
+
+    def filter(self, queryset, values):
+        """Filter to objects whose completion is in any selected range."""
+        if values:
+            bounds = dict((v, b) for v, l, b in self.RANGES)
+            return queryset.filter_completion(*[bounds[v] for v in values])
+        return queryset
+
+
+
 class ModelFilter(BaseChoicesFilter):
     """
     A Filter whose choices are from a provided iterable of model instances.
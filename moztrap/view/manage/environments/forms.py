@@ -44,7 +44,8 @@ class EnvironmentElementSelectMultiple(mtforms.MTSelectMultiple):
             element = c[1].obj
             available.setdefault(element.category, []).append(element)
         # ensure we also include empty categories
-        categories = list(model.Category.objects.order_by("name"))
+        categories = list(
+            model.Category.objects.with_in_use().order_by("name"))
         for category in categories:
             # annotate with elements available in this widget
             category.choice_elements = available.get(category, [])
@@ -57,19 +58,48 @@ class EnvironmentElementSelectMultiple(mtforms.MTSelectMultiple):
 class AddProfileForm(ProfileForm):
     """Form for adding a profile."""
     elements = mtforms.MTModelMultipleChoiceField(
-        queryset=model.Element.objects.order_by(
+        queryset=model.Element.objects.with_in_use().order_by(
             "category", "name").select_related(),
         widget=EnvironmentElementSelectMultiple,
         error_messages={"required": "Please select at least one element."})
+    strength = forms.TypedChoiceField(
+        label="generate environments covering",
+        choices=[
+            ("", "all combinations of elements"),
+            ("2", "every pair of elements (pairwise)"),
+            ("3", "every three elements (3-wise)"),
+            ],
+        coerce=int,
+        empty_value=None,
+        required=False,
+        )
+
+
+    def __init__(self, *args, **kwargs):
+        """Initialize form; ``job`` is set if generation is queued."""
+        super(AddProfileForm, self).__init__(*args, **kwargs)
+        self.job = None
 
 
     def save(self, user=None):
-        """Create and return the new profile."""
-        return model.Profile.generate(
-            self.cleaned_data["name"],
-            *self.cleaned_data["elements"],
-            **{"user": user or self.user}
+        """
+        Create and return the new profile.
+
+        Generating the environments is a background job; if it hasn't finished
+        yet, return None (the job is available as ``self.job``).
+
+        """
+        self.job = model.Job.objects.enqueue(
+            "generate_profile",
+            user=user or self.user,
+            name=self.cleaned_data["name"],
+            element_ids=[e.id for e in self.cleaned_data["elements"]],
+            strength=self.cleaned_data.get("strength"),
             )
+        if self.job.status != model.Job.STATUS.done:
+            return None
+        return model.Profile.objects.get(
+            pk=self.job.get_result()["profile_id"])
 
 
 
@@ -20,6 +20,7 @@ from moztrap.view.lists import decorators as lists
 from moztrap.view.users.decorators import permission_required
 from moztrap.view.utils.ajax import ajax
 from moztrap.view.utils.auth import login_maybe_required
+from moztrap.view.utils.jobs import job_message
 
 from . import forms
 from .decorators import category_element_ajax_add_edit
@@ -76,6 +77,14 @@ def profile_add(request):
                     profile.name)
                 )
             return redirect("manage_profiles")
+        elif form.job is not None:
+            job_message(
+                request,
+                form.job,
+                u"Profile '{0}' will be added shortly.".format(
+                    form.cleaned_data["name"]),
+                )
+            return redirect("manage_profiles")
     else:
         form = forms.AddProfileForm(user=request.user)
     return TemplateResponse(
@@ -123,17 +132,17 @@ def profile_edit(request, profile_id):
             if not element_ids:
                 messages.error(
                     request, "Please select some environment elements.")
-            else:
-                env = model.Environment.objects.create(
-                    profile=profile, user=request.user)
-                env.elements.add(*element_ids)
+            elif not profile.add_environments(
+                    [element_ids], user=request.user):
+                messages.error(
+                    request, "That environment is already in this profile.")
 
     return TemplateResponse(
         request,
         "manage/environment/edit_profile.html",
         {
             "profile": profile,
-            "environments": profile.environments.all(),
+            "environments": profile.environments.with_labels(),
             }
         )
 
@@ -184,7 +193,7 @@ def productversion_environments_edit(request, productversion_id):
         "manage/environment/productversion.html",
         {
             "productversion": productversion,
-            "environments": productversion.environments.all(),
+            "environments": productversion.environments.with_labels(),
             "populate_form": form,
             }
         )
@@ -262,7 +271,7 @@ def narrow_environments(request, object_type, object_id):
         request,
         "manage/environment/narrowing.html",
         {
-            "environments": obj.productversion.environments.all(),
+            "environments": obj.productversion.environments.with_labels(),
             "selected_env_ids": current_env_ids,
             "filters": EnvironmentFilterSet().bind(), # for JS filtering
             "obj": obj,
@@ -24,6 +24,27 @@ class BaseProductVersionForm(mtforms.NonFieldErrorsClassFormMixin,
             }
 
 
+    def __init__(self, *args, **kwargs):
+        """Initialize form; ``job`` is set if copying cases is queued."""
+        super(BaseProductVersionForm, self).__init__(*args, **kwargs)
+        self.job = None
+
+
+    def fill(self, productversion, source, user=None):
+        """
+        Queue copying caseversions of ``source`` to ``productversion``.
+
+        Only cases that aren't in ``productversion`` yet are copied.
+
+        """
+        self.job = model.Job.objects.enqueue(
+            "fill_productversion",
+            user=user or self.user,
+            productversion_id=productversion.id,
+            source_id=source.id,
+            )
+
+
 
 class EditProductVersionForm(BaseProductVersionForm):
     """Form for editing productversions."""
@@ -57,10 +78,7 @@ class EditProductVersionForm(BaseProductVersionForm):
 
         fill_from = self.cleaned_data.get("fill_from")
         if fill_from:
-            # get the cases we already have in this version
-            existing = pv.caseversions.all().values_list("case_id", flat=True)
-            for cv in fill_from.caseversions.exclude(case_id__in=existing):
-                cv.clone(overrides={"productversion": pv, "name": cv.name})
+            self.fill(pv, fill_from, user=user)
 
         return pv
 
@@ -91,7 +109,6 @@ class AddProductVersionForm(BaseProductVersionForm):
         clone_from = self.cleaned_data.get("clone_from")
         if clone_from:
             pv.environments.add(*clone_from.environments.all())
-            for cv in clone_from.caseversions.all():
-                cv.clone(overrides={"productversion": pv, "name": cv.name})
+            self.fill(pv, clone_from, user=user)
 
         return pv
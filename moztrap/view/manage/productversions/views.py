@@ -2,13 +2,16 @@
 Manage views for productversions.
 
 """
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.template.defaultfilters import slugify
 from django.template.response import TemplateResponse
 from django.views.decorators.cache import never_cache
 
 from django.contrib import messages
 
 from moztrap import model
+from moztrap.model.library.exporter import Exporter
 
 from moztrap.view.filters import ProductVersionFilterSet
 from moztrap.view.lists import decorators as lists
@@ -16,6 +19,7 @@ from moztrap.view.lists.filters import PinnedFilters
 from moztrap.view.users.decorators import permission_required
 from moztrap.view.utils.ajax import ajax
 from moztrap.view.utils.auth import login_maybe_required
+from moztrap.view.utils.jobs import job_message
 
 from ..finders import ManageFinder
 
@@ -62,6 +66,28 @@ def productversion_details(request, productversion_id):
 
 
 
+@never_cache
+@login_maybe_required
+def productversion_export(request, productversion_id):
+    """
+    Download the suites and cases of a productversion as a JSON file.
+
+    The file is in the format the ``import`` command accepts; it is streamed
+    as it's generated, a batch of cases at a time.
+
+    """
+    productversion = get_object_or_404(
+        model.ProductVersion, pk=productversion_id)
+    response = HttpResponse(
+        Exporter(productversion).export_json(),
+        content_type="application/json",
+        )
+    response["Content-Disposition"] = 'attachment; filename="{0}.json"'.format(
+        slugify(productversion.name))
+    return response
+
+
+
 @never_cache
 @permission_required("core.manage_products")
 def productversion_add(request):
@@ -74,6 +100,7 @@ def productversion_add(request):
                 request, u"Product version '{0}' added.".format(
                     productversion.name)
                 )
+            queued_fill_message(request, form.job, productversion)
             return redirect("manage_productversions")
     else:
         pf = PinnedFilters(request.COOKIES)
@@ -103,6 +130,7 @@ def productversion_edit(request, productversion_id):
         pv = form.save_if_valid()
         if pv is not None:
             messages.success(request, u"Saved '{0}'.".format(pv.name))
+            queued_fill_message(request, form.job, pv)
             return redirect("manage_productversions")
     else:
         form = forms.EditProductVersionForm(
@@ -115,3 +143,15 @@ def productversion_edit(request, productversion_id):
             "productversion": productversion,
             }
         )
+
+
+
+def queued_fill_message(request, job, productversion):
+    """Add message if copying cases to ``productversion`` isn't finished."""
+    if job is not None and not job.finished:
+        job_message(
+            request,
+            job,
+            u"Test cases will be copied to '{0}' shortly.".format(
+                productversion.name),
+            )
@@ -4,9 +4,11 @@ Management forms for runs.
 """
 import floppyforms as forms
 
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ValidationError, NON_FIELD_ERRORS
 
 from moztrap import model
+from moztrap.model.execution import resultfiles
+from moztrap.model.execution.importer import ResultFileImporter, RunNotActive
 from moztrap.view.lists import filters
 from moztrap.view.utils import mtforms
 
@@ -151,3 +153,60 @@ class EditRunForm(RunForm):
                 product=self.instance.productversion.product_id)
 
             # ajax populates available and included suites on page load
+
+
+
+class ImportResultsForm(mtforms.NonFieldErrorsClassFormMixin, forms.Form):
+    """Form for uploading a file of results of an automated test run."""
+    FORMAT_CHOICES = [
+        ("", "guess from file extension"),
+        ("junit", "JUnit XML"),
+        ("tap", "TAP"),
+        ("ndjson", "NDJSON"),
+        ]
+
+    environment = forms.ModelChoiceField(
+        queryset=model.Environment.objects.none())
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False)
+    file = forms.FileField()
+
+
+    def __init__(self, *args, **kwargs):
+        """Initialize ImportResultsForm; takes ``run`` and ``user`` kwargs."""
+        self.run = kwargs.pop("run")
+        self.user = kwargs.pop("user")
+        super(ImportResultsForm, self).__init__(*args, **kwargs)
+        self.fields["environment"].queryset = (
+            self.run.environments.with_labels())
+
+
+    def clean(self):
+        """Make sure the format of the file is known."""
+        format = self.cleaned_data.get("format")
+        upload = self.cleaned_data.get("file")
+        if upload is not None and not format:
+            format = resultfiles.guess_format(upload.name)
+            if format is None:
+                raise ValidationError(
+                    "Could not guess the format of this file; "
+                    "please select one.")
+            self.cleaned_data["format"] = format
+        return self.cleaned_data
+
+
+    def save(self):
+        """
+        Import results from the uploaded file; return ``ResultFileImportResult``.
+
+        Returns None (and adds a form error) if the file can't be parsed, or
+        the run isn't active.
+
+        """
+        try:
+            importer = ResultFileImporter(
+                self.run, self.cleaned_data["environment"], self.user)
+            return importer.import_file(
+                self.cleaned_data["file"], self.cleaned_data["format"])
+        except (RunNotActive, resultfiles.ResultFileError) as e:
+            self._errors[NON_FIELD_ERRORS] = self.error_class([unicode(e)])
+            return None
@@ -29,7 +29,8 @@ from . import forms
 @lists.actions(
     model.Run,
     ["delete", "clone", "activate", "draft", "deactivate", "refresh"],
-    permission="execution.manage_runs")
+    permission="execution.manage_runs",
+    background={"activate": "activate_run", "refresh": "refresh_run"})
 @lists.finder(ManageFinder)
 @lists.filter("runs", filterset_class=RunFilterSet)
 @lists.sort("runs")
@@ -116,3 +117,40 @@ def run_edit(request, run_id):
             "run": run,
             }
         )
+
+
+
+@never_cache
+@permission_required("execution.execute")
+def run_import_results(request, run_id):
+    """Import results for a run from an uploaded JUnit XML/TAP/NDJSON file."""
+    run = get_object_or_404(
+        model.Run, pk=run_id)
+
+    if not run.status == model.Run.STATUS.active:
+        messages.error(
+            request,
+            "That test run is currently not open for testing; "
+            "results can only be imported into active runs.")
+        return redirect("manage_runs")
+
+    import_result = None
+    if request.method == "POST":
+        form = forms.ImportResultsForm(
+            request.POST, request.FILES, run=run, user=request.user)
+        if form.is_valid():
+            import_result = form.save()
+            if import_result is not None:
+                messages.success(request, import_result.get_as_list()[0])
+                form = forms.ImportResultsForm(run=run, user=request.user)
+    else:
+        form = forms.ImportResultsForm(run=run, user=request.user)
+    return TemplateResponse(
+        request,
+        "manage/run/import_results.html",
+        {
+            "form": form,
+            "run": run,
+            "import_result": import_result,
+            }
+        )
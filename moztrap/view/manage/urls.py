@@ -59,6 +59,11 @@ urlpatterns = patterns(
         "productversions.views.productversion_details",
         name="manage_productversion_details"),
 
+    # export
+    url(r"^productversion/(?P<productversion_id>\d+)/export/$",
+        "productversions.views.productversion_export",
+        name="manage_productversion_export"),
+
     # add
     url(r"^productversion/add/$",
         "productversions.views.productversion_add",
@@ -90,6 +95,11 @@ urlpatterns = patterns(
         "runs.views.run_edit",
         name="manage_run_edit"),
 
+    # import results
+    url(r"^run/(?P<run_id>\d+)/import/$",
+        "runs.views.run_import_results",
+        name="manage_run_import_results"),
+
     # suite ------------------------------------------------------------------
     # manage
     url(r"^suites/$",
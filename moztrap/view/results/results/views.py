@@ -30,7 +30,7 @@ def results_list(request, rcv_id):
         "results/result/results.html",
         {
             "results": model.Result.objects.filter(
-                runcaseversion=rcv).select_related(),
+                runcaseversion=rcv).select_related().with_labels(),
             "runcaseversion": rcv,
             }
         )
@@ -28,7 +28,8 @@ def runcaseversions_list(request):
         request,
         "results/case/cases.html",
         {
-            "runcaseversions": model.RunCaseVersion.objects.select_related(),
+            "runcaseversions": model.RunCaseVersion.objects.select_related(
+                ).with_result_summaries(),
             }
         )
 
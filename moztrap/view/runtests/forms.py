@@ -8,69 +8,42 @@ from django.core.exceptions import ValidationError, ObjectDoesNotExist
 import floppyforms as forms
 
 from ... import model
+from ...model.environments.index import EnvironmentIndex
 
 
 class EnvironmentSelectionForm(forms.Form):
     """Form for selecting an environment."""
     def __init__(self, *args, **kwargs):
-        """Accepts ``environments`` queryset and ``current`` env id."""
+        """
+        Accepts ``environments`` queryset or ``index``, and ``current`` env id.
+
+        ``index`` is an ``EnvironmentIndex``, e.g. the cached index of a run;
+        if not given, one is built from ``environments``.
+
+        """
         environments = kwargs.pop("environments", [])
+        self.index = kwargs.pop("index", None)
         current = kwargs.pop("current", None)
 
         super(EnvironmentSelectionForm, self).__init__(*args, **kwargs)
 
-        # list of categories, ordered by name
-        self.categories = []
-
-        # maps category to set of elements
-        self.elements_by_category = {}
-
-        # maps environment ID to list of element IDs, ordered by category
-        self.elementids_by_envid = {}
-
-        # elements in current environment
-        current_elements = []
-
-        env_element_through_model = model.Environment.elements.through
-        env_element_relationships = env_element_through_model.objects.filter(
-            environment__in=environments).select_related()
-
-        # first construct the ordered list of categories (and current elements)
-        cat_set = set()
-        for ee in env_element_relationships:
-            cat_set.add(ee.element.category)
-            if ee.environment.id == current:
-                current_elements.append(ee.element)
-        self.categories = sorted(cat_set, key=lambda c: c.name)
-
-        num_categories = len(self.categories)
-
-        # populate elements by category and environment
-        for ee in env_element_relationships:
-            byenv = self.elementids_by_envid.setdefault(
-                ee.environment.id, [None] * num_categories)
-            category_index = self.categories.index(ee.element.category)
-            byenv[category_index] = ee.element.id
-
-            bycat = self.elements_by_category.setdefault(
-                ee.element.category, set())
-            bycat.add(ee.element)
+        if self.index is None:
+            self.index = EnvironmentIndex.for_environments(environments)
 
         # construct choice-field for each env type
-        for category in self.categories:
-            self.fields["category_{0}".format(category.id)] = forms.ChoiceField(
-                choices=[("", "---------")] + [
-                    (e.id, e.name) for e in sorted(
-                        self.elements_by_category[category],
-                        key=lambda e: e.name)
-                    ],
-                label=category.name,
+        for cat_id, cat_name in self.index.categories:
+            self.fields["category_{0}".format(cat_id)] = forms.ChoiceField(
+                choices=[("", "---------")] + self.index.choices[cat_id],
+                label=cat_name,
                 required=False)
 
         # set initial data based on current user environment
-        for element in current_elements:
-            field_name = "category_{0}".format(element.category.id)
-            self.initial[field_name] = element.id
+        try:
+            current = int(current)
+        except (TypeError, ValueError):
+            current = None
+        for cat_id, element_id in self.index.elements_of(current):
+            self.initial["category_{0}".format(cat_id)] = element_id
 
 
     def clean(self):
@@ -80,16 +53,13 @@ class EnvironmentSelectionForm(forms.Form):
         selected_element_ids = set(
             [int(eid) for k, eid in self.cleaned_data.iteritems()
                 if k.find("category_") == 0 and eid])
-        matches = [
-            envid for envid, element_ids in self.elementids_by_envid.items()
-            if set([e for e in element_ids if e]).issubset(selected_element_ids)
-            ]
-        if not matches:
+        match = self.index.match(selected_element_ids)
+        if match is None:
             raise forms.ValidationError(
                 "The selected environment is not valid for this test run. "
                 "Please select a different combination.")
 
-        self.cleaned_data["environment"] = matches[0]
+        self.cleaned_data["environment"] = match
 
         return self.cleaned_data
 
@@ -101,7 +71,7 @@ class EnvironmentSelectionForm(forms.Form):
 
     def valid_environments_json(self):
         """Return lists of element IDs representing valid envs, as JSON."""
-        return json.dumps(self.elementids_by_envid.values())
+        return json.dumps(self.index.elementids_by_envid.values())
 
 
 class EnvironmentBuildSelectionForm(EnvironmentSelectionForm):
@@ -124,6 +94,7 @@ class EnvironmentBuildSelectionForm(EnvironmentSelectionForm):
         self.run = kwargs.pop("run", None)
         self.build = kwargs.pop("build", None)
         self.user = kwargs.pop("user", None)
+        self.job = None
         super(EnvironmentBuildSelectionForm, self).__init__(*args, **kwargs)
 
 
@@ -138,17 +109,30 @@ class EnvironmentBuildSelectionForm(EnvironmentSelectionForm):
 
 
     def save(self):
-        """Find the run with this build, or create a new one."""
+        """
+        Find the run with this build, or create a new one.
+
+        Returns the selected environment ID and the run ID. If the new run is
+        still being created by a background job, the run ID is None and the
+        job is available as ``self.job``.
+
+        """
+        envid = super(EnvironmentBuildSelectionForm, self).save()
         try:
             this_run = model.Run.objects.get(
                 series=self.run,
                 build=self.cleaned_data["build"],
                 )
         except ObjectDoesNotExist:
-            this_run = self.run.clone_for_series(
-                build=self.cleaned_data["build"],
+            self.job = model.Job.objects.enqueue(
+                "clone_run_for_series",
                 user=self.user,
+                unique=True,
+                run_id=self.run.id,
+                build=self.cleaned_data["build"],
                 )
-            this_run.activate()
-        # now we need to return this new run as the one to be executed.
-        return super(EnvironmentBuildSelectionForm, self).save(), this_run.id
+            if self.job.status != model.Job.STATUS.done:
+                return envid, None
+            # now we need to return this new run as the one to be executed.
+            return envid, self.job.get_result()["run_id"]
+        return envid, this_run.id
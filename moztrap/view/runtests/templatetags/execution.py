@@ -5,6 +5,8 @@ from classytags.core import Tag, Options
 from classytags.arguments import Argument
 
 from .... import model
+from ....model.execution.models import (
+    prefetch_results_for, prefetch_run_suites, prefetch_stepresults)
 
 
 
@@ -18,6 +20,9 @@ class ResultFor(Tag):
     If no relevant Result exists, returns *unsaved* default Result for use in
     template (result will be saved when case is started.)
 
+    Uses the result loaded by ``prefetch_execution_results`` if the
+    runcaseversion has one; otherwise loads it.
+
     """
     name = "result_for"
     options = Options(
@@ -31,25 +36,9 @@ class ResultFor(Tag):
 
     def render_tag(self, context, runcaseversion, user, environment, varname):
         """Get/construct Result and place it in context under ``varname``"""
-        result_kwargs = dict(
-            environment=environment,
-            tester=user,
-            runcaseversion=runcaseversion,
-            is_latest=True,
-            )
-        try:
-            result = model.Result.objects.get(**result_kwargs)
-        except model.Result.DoesNotExist:
-            result = model.Result(**result_kwargs)
-        except model.Result.MultipleObjectsReturned:
-            # find the latest one and set it to latest, which will set all
-            # others to is_latest=False
-            result = model.Result.objects.filter(**result_kwargs).order_by(
-                "-modified_on")[0]
-            result.set_latest()
-            result.save()
-
-        context[varname] = result
+        if not hasattr(runcaseversion, "_prefetched_result_for"):
+            prefetch_results_for([runcaseversion], user, environment)
+        context[varname] = runcaseversion._prefetched_result_for
         return u""
 
 
@@ -61,6 +50,9 @@ class OtherResultFor(Tag):
     """
     Places Result for this runcaseversion/env in context for other users.
 
+    Uses the result loaded by ``prefetch_execution_results`` if the
+    runcaseversion has one; otherwise loads it.
+
     """
     name = "other_result_for"
     options = Options(
@@ -74,28 +66,9 @@ class OtherResultFor(Tag):
 
     def render_tag(self, context, runcaseversion, user, environment, varname):
         """Get/construct Result and place it in context under ``varname``"""
-
-        # if the result.status is pending or assigned, then we try to find a result
-        # from another user to return instead.
-        include_kwargs = dict(
-            environment=environment,
-            runcaseversion=runcaseversion,
-            is_latest=True,
-            status__in=model.Result.COMPLETED_STATES,
-            )
-        exclude_kwargs = dict(
-            tester=user,
-            )
-
-        try:
-            result = model.Result.objects.filter(
-                **include_kwargs).exclude(**exclude_kwargs).order_by(
-                "-modified_on")[0]
-        except IndexError:
-            result = None
-
-
-        context[varname] = result
+        if not hasattr(runcaseversion, "_prefetched_other_result"):
+            prefetch_results_for([runcaseversion], user, environment)
+        context[varname] = runcaseversion._prefetched_other_result
         return u""
 
 
@@ -122,14 +95,11 @@ class StepResultFor(Tag):
 
     def render_tag(self, context, result, casestep, varname):
         """Get/construct StepResult and place it in context under ``varname``"""
-        stepresult_kwargs = dict(
-            result=result,
-            step=casestep,
-            )
-        try:
-            stepresult = model.StepResult.objects.get(**stepresult_kwargs)
-        except model.StepResult.DoesNotExist:
-            stepresult = model.StepResult(**stepresult_kwargs)
+        if not hasattr(result, "_prefetched_stepresults"):
+            prefetch_stepresults([result])
+        stepresult = result._prefetched_stepresults.get(casestep.id)
+        if stepresult is None:
+            stepresult = model.StepResult(result=result, step=casestep)
 
         context[varname] = stepresult
         return u""
@@ -153,11 +123,9 @@ class SuitesFor(Tag):
 
     def render_tag(self, context, run, runcaseversion, varname):
         """Get/construct Suite list and place it in context under ``varname``"""
-        casesuites = set(runcaseversion.caseversion.case.suites.values_list("id", flat=True))
-        runsuites = set(run.suites.values_list("id", flat=True))
-        result = model.Suite.objects.filter(pk__in=casesuites.intersection(runsuites))
-
-        context[varname] = result
+        if not hasattr(runcaseversion, "_prefetched_suites"):
+            prefetch_run_suites([runcaseversion])
+        context[varname] = runcaseversion._prefetched_suites
         return u""
 
 
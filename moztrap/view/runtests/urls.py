@@ -13,6 +13,9 @@ urlpatterns = patterns(
     url(r"^environment/(?P<run_id>\d+)/$",
         "set_environment",
         name="runtests_environment"),
+    url(r"^wait/(?P<job_id>\d+)/env/(?P<env_id>\d+)/$",
+        "wait",
+        name="runtests_wait"),
     url(r"^run/(?P<run_id>\d+)/env/(?P<env_id>\d+)/$",
         "run",
         name="runtests_run"),
@@ -12,6 +12,7 @@ from django.views.decorators.cache import never_cache
 from django.contrib import messages
 
 from ... import model
+from ...model.environments.index import EnvironmentIndex
 
 from ..filters import RunTestsRunCaseVersionFilterSet
 from ..lists import decorators as lists
@@ -55,7 +56,7 @@ def set_environment(request, run_id):
 
     form_kwargs = {
         "current": current,
-        "environments": run.environments.all().select_related()
+        "index": EnvironmentIndex.for_run(run),
         }
 
     # the run could be an individual, or a series.
@@ -92,6 +93,10 @@ def set_environment(request, run_id):
                 # we should just use the run id from this run.
                 envid = result
                 runid = run_id
+            if runid is None:
+                # the run for this build is still being created
+                return redirect(
+                    "runtests_wait", job_id=form.job.id, env_id=envid)
             return redirect("runtests_run", run_id=runid, env_id=envid)
     else:
         # run just specified, prompt user for env and possibly build
@@ -108,6 +113,30 @@ def set_environment(request, run_id):
 
 
 
+@never_cache
+@permission_required("execution.execute")
+def wait(request, job_id, env_id):
+    """Wait for the background job creating a run for a build to finish."""
+    job = get_object_or_404(model.Job, pk=job_id)
+
+    if job.status == model.Job.STATUS.done:
+        return redirect(
+            "runtests_run", run_id=job.get_result()["run_id"], env_id=env_id)
+    if job.status == model.Job.STATUS.failed:
+        messages.error(
+            request, "Sorry, the test run for this build could not be created.")
+        return redirect("runtests")
+
+    return TemplateResponse(
+        request,
+        "runtests/wait.html",
+        {
+            "job": job,
+            }
+        )
+
+
+
 # maps valid action names to default parameters
 ACTIONS = {
     "start": {},
@@ -213,7 +242,7 @@ def run(request, run_id, env_id):
             return redirect(request.get_full_path())
 
     envform = EnvironmentSelectionForm(
-        current=environment.id, environments=run.environments.all())
+        current=environment.id, index=EnvironmentIndex.for_run(run))
 
 
     return TemplateResponse(
@@ -226,10 +255,12 @@ def run(request, run_id, env_id):
             "run": run,
             "envform": envform,
             "runcaseversions": run.runcaseversions.select_related(
-                "caseversion").prefetch_related(
+                "caseversion__case").prefetch_related(
                     "caseversion__tags",
-                    "caseversion__case__suites",
-                    ).filter(environments=environment),
+                    "caseversion__steps",
+                    "caseversion__attachments",
+                    ).filter(environments=environment).with_execution_results(
+                    request.user, environment),
             "finder": {
                 # finder decorator populates top column (products), we
                 # prepopulate the other two columns
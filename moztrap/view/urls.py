@@ -36,6 +36,9 @@ urlpatterns = patterns(
     # results ----------------------------------------------------------------
     url(r"^results/", include("moztrap.view.results.urls")),
 
+    # jobs -------------------------------------------------------------------
+    url(r"^jobs/", include("moztrap.view.jobs.urls")),
+
     # admin ------------------------------------------------------------------
     url(r"^admin/", include(admin.site.urls)),
 
@@ -0,0 +1,18 @@
+"""
+Helpers for views that queue background jobs.
+
+"""
+from django.contrib import messages
+
+
+
+def job_message(request, job, message):
+    """
+    Add an info message about queued ``job``, with its polled progress.
+
+    The message is tagged with the job id; ``MT.pollJobs`` adds and updates
+    its progress, and reloads the page once the job is finished.
+
+    """
+    messages.info(
+        request, message, extra_tags="job job-id-{0}".format(job.id))
@@ -249,6 +249,9 @@ var MT = (function (MT, $) {
         // owa.js
         MT.owa();
 
+        // jobs.js
+        MT.pollJobs('#messages, #runtests-wait');
+
     });
 
     $(window).load(function () {
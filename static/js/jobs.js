@@ -0,0 +1,61 @@
+/*jslint    browser:    true,
+            indent:     4 */
+/*global    jQuery */
+
+var MT = (function (MT, $) {
+
+    'use strict';
+
+    // Poll the status of background jobs shown in ``container``, updating
+    // their progress; reload the page when a job is finished. Jobs are shown
+    // as ``.job-progress`` elements with a ``data-job-url``, or as messages
+    // tagged ``job job-id-<id>`` (whose job url is built from the
+    // ``data-job-url`` of ``#messages``, the url of job 0)
+    MT.pollJobs = function (container) {
+        var interval = 2000,
+            poll = function (el) {
+                $.get(el.data('job-url'), function (data) {
+                    if (data.finished) {
+                        window.location.reload();
+                        return;
+                    }
+                    if (data.total) {
+                        el.text(data.done + ' of ' + data.total + ' done');
+                    } else {
+                        el.text(data.status);
+                    }
+                    setTimeout(function () { poll(el); }, interval);
+                });
+            },
+            addProgress = function () {
+                var url = $('#messages').data('job-url');
+                $(container).find('.message.job').each(function () {
+                    var msg = $(this),
+                        id = /\bjob-id-(\d+)\b/.exec(msg.attr('class'));
+                    if (id && url && !msg.find('.job-progress').length) {
+                        msg.find('p').append(' ', $('<span class="job-progress"/>')
+                            .attr('data-job-url', url.replace(/\/0\/$/, '/' + id[1] + '/'))
+                            .text('queued'));
+                    }
+                });
+            },
+            pollNew = function () {
+                addProgress();
+                $(container).find('.job-progress[data-job-url]').each(function () {
+                    var el = $(this);
+                    if (!el.data('polling')) {
+                        el.data('polling', true);
+                        poll(el);
+                    }
+                });
+            };
+        pollNew();
+        // job messages may also arrive with ajax responses
+        $(document).ajaxComplete(function () {
+            setTimeout(pollNew, 0);
+        });
+    };
+
+    return MT;
+
+}(MT || {}, jQuery));
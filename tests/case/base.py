@@ -11,6 +11,13 @@ import mock
 
 class DBMixin(object):
     """Mixin for MozTrap test case classes that need the database."""
+    def _fixture_setup(self):
+        """Also discard cached environment indexes; run ids get reused."""
+        from moztrap.model.environments.index import invalidate_all
+        invalidate_all()
+        super(DBMixin, self)._fixture_setup()
+
+
     @property
     def model(self):
         """The data model."""
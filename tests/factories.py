@@ -374,3 +374,11 @@ class TagFactory(factory.Factory):
     FACTORY_FOR = model.Tag
 
     name = "Test Tag"
+
+
+
+class JobFactory(factory.Factory):
+    FACTORY_FOR = model.Job
+
+    task = "activate_run"
+    arguments = "{}"
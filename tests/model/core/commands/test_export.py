@@ -0,0 +1,136 @@
+"""
+Tests for management command to export cases.
+
+"""
+from cStringIO import StringIO
+import json
+import os
+from tempfile import mkdtemp
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+class ExportCasesTest(case.DBTestCase):
+    """Tests for export management command."""
+
+    def call_command(self, *args, **kwargs):
+        """
+        Runs the management command and returns (stdout, stderr) output.
+
+        Also patch ``sys.exit`` so a ``CommandError`` doesn't cause an exit.
+
+        """
+        with patch("sys.stdout", StringIO()) as stdout:
+            with patch("sys.stderr", StringIO()) as stderr:
+                with patch("sys.exit"):
+                    call_command("export", *args, **kwargs)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return (stdout.read(), stderr.read())
+
+
+    def test_no_args(self):
+        """Command shows usage."""
+        output = self.call_command()
+
+        self.assertEqual(
+            output,
+            (
+                "",
+                "Error: Usage: <product_name> <product_version> [<filename>] "
+                "[--batch-size <n>]\n",
+                )
+            )
+
+
+    def test_bad_product(self):
+        """Error if given non-existent product name."""
+        output = self.call_command("Foo", "1.0")
+
+        self.assertEqual(output, ("", 'Error: Product "Foo" does not exist\n'))
+
+
+    def test_bad_productversion(self):
+        """Error if given non-existent product version."""
+        self.F.ProductFactory.create(name="Foo")
+
+        output = self.call_command("Foo", "1.0")
+
+        self.assertEqual(
+            output,
+            (
+                "",
+                'Error: Version "1.0" of product "Foo" does not exist\n',
+                )
+            )
+
+
+    def test_bad_file(self):
+        """Error if the file can't be written."""
+        self.F.ProductVersionFactory.create(product__name="Foo", version="1.0")
+
+        output = self.call_command("Foo", "1.0", "does/not/exist.json")
+
+        self.assertEqual(
+            output,
+            (
+                "",
+                (
+                    'Error: Could not open "does/not/exist.json", '
+                    "I/O error 2: No such file or directory\n"
+                    ),
+                )
+            )
+
+
+    def test_stdout(self):
+        """Without a filename, the JSON is written to standard output."""
+        self.F.CaseVersionFactory.create(
+            productversion__product__name="Foo",
+            productversion__version="1.0",
+            name="Case",
+            )
+
+        output = self.call_command("Foo", "1.0", batch_size=1)
+
+        self.assertEqual(
+            json.loads(output[0]),
+            {
+                "suites": [],
+                "cases": [{"name": "Case", "description": "", "steps": []}],
+                }
+            )
+        self.assertEqual(output[1], "")
+
+
+    def test_round_trip(self):
+        """An exported file imports into another product version."""
+        cv = self.F.CaseVersionFactory.create(
+            productversion__product__name="Foo",
+            productversion__version="1.0",
+            name="Case",
+            )
+        self.F.CaseStepFactory.create(caseversion=cv, instruction="do this")
+        self.F.ProductVersionFactory.create(
+            product=cv.productversion.product, version="2.0")
+
+        path = os.path.join(mkdtemp(), "cases.json")
+        try:
+            output = self.call_command("Foo", "1.0", path)
+            self.assertEqual(output, ("", ""))
+
+            with patch("sys.stdout", StringIO()):
+                call_command("import", "Foo", "2.0", path)
+        finally:
+            os.remove(path)
+
+        cv2 = self.model.CaseVersion.objects.get(
+            productversion__version="2.0")
+        self.assertEqual(cv2.name, "Case")
+        self.assertEqual(cv2.steps.get().instruction, "do this")
@@ -65,7 +65,8 @@ class ImportCasesTest(case.DBTestCase):
             output,
             (
                 "",
-                "Error: Usage: <product_name> <product_version> <filename>\n",
+                "Error: Usage: <product_name> <product_version> <filename> "
+                "[--batch-size <n>] [--dry-run]\n",
                 )
             )
 
@@ -237,3 +238,92 @@ class ImportCasesTest(case.DBTestCase):
 
         self.assertEqual(output, ("No files found to import.\n", ""))
         self.assertEqual(self.model.CaseVersion.objects.count(), 0)
+
+
+    def test_bad_batch_size(self):
+        """Command shows usage if batch size isn't positive."""
+        output = self.call_command("Foo", "1.0", "file.json", batch_size=0)
+
+        self.assertIn("Error: Usage: ", output[1])
+
+
+    def test_bad_json_in_cases(self):
+        """Error if a case in the file is malformed."""
+        self.F.ProductVersionFactory.create(product__name="Foo", version="1.0")
+
+        with self.tempfile('{"cases": [{"name": "Foo"}, 1]}') as path:
+            output = self.call_command("Foo", "1.0", path)
+
+        self.assertIn(
+            "Error: Could not parse JSON: Expecting an object in cases",
+            output[1],
+            )
+
+
+    def test_batches(self):
+        """With verbosity, progress of each batch and throughput is shown."""
+        self.F.ProductVersionFactory.create(product__name="Foo", version="1.0")
+
+        data = {
+            "suites": [{"name": "S"}],
+            "cases": [
+                {"name": "Foo", "steps": [], "suites": ["S"]},
+                {"name": "Foo", "steps": []},
+                {"name": "Bar", "steps": []},
+                ]}
+
+        with self.tempfile(json.dumps(data)) as path:
+            output = self.call_command(
+                "Foo", "1.0", path, batch_size=2, verbosity=2)
+
+        lines = output[0].splitlines()
+        self.assertEqual(
+            lines[0],
+            "Batch 1: imported 1 cases and 1 suites (1 cases so far).",
+            )
+        self.assertEqual(
+            lines[1],
+            "Skipped: Case with this name already exists for this product: {",
+            )
+        self.assertIn(
+            "Batch 2: imported 1 cases and 0 suites (2 cases so far).", lines)
+        self.assertEqual(
+            lines[-4:-1],
+            [
+                "Imported 2 cases",
+                "Imported 1 suites",
+                "1 warnings (see above)",
+                ],
+            )
+        self.assertEqual(
+            len([l for l in lines if l.startswith("Skipped: ")]), 1)
+        self.assertRegexpMatches(
+            lines[-1], r"^Imported in \d+\.\d\ds \(\d+\.\d cases/s\)\.$")
+        self.assertEqual(
+            set(self.model.CaseVersion.objects.values_list("name", flat=True)),
+            set(["Foo", "Bar"]))
+
+
+    def test_dry_run(self):
+        """A dry run is reported as such."""
+        self.F.ProductVersionFactory.create(product__name="Foo", version="1.0")
+
+        data = {
+            "cases": [{"name": "Foo", "steps": [{"instruction": "do this"}]}]}
+
+        with self.tempfile(json.dumps(data)) as path:
+            with patch(
+                    "moztrap.model.library.importer.Importer.import_stream"
+                    ) as import_stream:
+                import_stream.return_value = iter([])
+                output = self.call_command("Foo", "1.0", path, dry_run=True)
+
+        self.assertEqual(
+            output,
+            (
+                "Imported 0 cases\nImported 0 suites\n"
+                "Dry run: nothing was saved.\n",
+                "",
+                )
+            )
+        self.assertTrue(import_stream.call_args[1]["dry_run"])
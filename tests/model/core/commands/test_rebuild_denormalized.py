@@ -0,0 +1,131 @@
+"""
+Tests for management command to verify and repair denormalized data.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+class RebuildDenormalizedTest(case.DBTestCase):
+    """Tests for rebuild_denormalized management command."""
+    def call_command(self, *args, **kwargs):
+        """
+        Runs the management command and returns (stdout, stderr) output.
+
+        Also patch ``sys.exit`` so a ``CommandError`` doesn't cause an exit.
+
+        """
+        with patch("sys.stdout", StringIO()) as stdout:
+            with patch("sys.stderr", StringIO()) as stderr:
+                with patch("sys.exit"):
+                    call_command("rebuild_denormalized", *args, **kwargs)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return (stdout.read(), stderr.read())
+
+
+    def break_data(self):
+        """Create a product, caseversions and a result with wrong data."""
+        product = self.F.ProductFactory.create()
+        pv1 = self.F.ProductVersionFactory.create(
+            product=product, version="1")
+        pv2 = self.F.ProductVersionFactory.create(
+            product=product, version="2")
+        cv1 = self.F.CaseVersionFactory.create(
+            productversion=pv1, case__product=product)
+        cv2 = self.F.CaseVersionFactory.create(
+            productversion=pv2, case=cv1.case)
+        result = self.F.ResultFactory.create()
+
+        self.model.ProductVersion.everything.filter(id=pv1.id).update(
+            latest=True, notrack=True)
+        self.model.CaseVersion.everything.filter(id=cv1.id).update(
+            latest=True, notrack=True)
+        self.model.LatestResult.objects.all().delete()
+
+        return pv1, cv1, cv2, result
+
+
+    def test_fixes(self):
+        """Fixes wrong flags and pointers, reporting how many."""
+        pv1, cv1, cv2, result = self.break_data()
+
+        output = self.call_command()
+
+        self.assertEqual(
+            output,
+            (
+                "Fixed 1 product version(s), 1 caseversion(s) and 1 latest "
+                "result(s).\n",
+                "",
+                )
+            )
+        self.assertFalse(self.refresh(pv1).latest)
+        self.assertFalse(self.refresh(cv1).latest)
+        self.assertTrue(self.refresh(cv2).latest)
+        self.assertTrue(self.refresh(result).is_latest)
+
+
+    def test_small_batches(self):
+        """Runcaseversions are rebuilt in batches of given size."""
+        results = [self.F.ResultFactory.create() for i in range(3)]
+        self.model.LatestResult.objects.all().delete()
+
+        output = self.call_command(batch_size=2)
+
+        self.assertEqual(
+            output,
+            (
+                "Fixed 0 product version(s), 0 caseversion(s) and 3 latest "
+                "result(s).\n",
+                "",
+                )
+            )
+        self.assertTrue(all(self.refresh(r).is_latest for r in results))
+
+
+    def test_correct(self):
+        """Nothing to fix is reported as such."""
+        self.F.CaseVersionFactory.create()
+
+        output = self.call_command(check=True)
+
+        self.assertEqual(
+            output,
+            (
+                "Would fix 0 product version(s), 0 caseversion(s) and 0 "
+                "latest result(s).\n",
+                "",
+                )
+            )
+
+
+    def test_check(self):
+        """With --check, reports what would be fixed."""
+        self.break_data()
+
+        output = self.call_command(check=True)
+
+        self.assertEqual(
+            output,
+            (
+                "Would fix 1 product version(s), 1 caseversion(s) and 1 "
+                "latest result(s).\n",
+                "",
+                )
+            )
+
+
+    def test_bad_batch_size(self):
+        """A batch size below one is an error."""
+        output = self.call_command(batch_size=0)
+
+        self.assertEqual(
+            output, ("", "Error: Usage: [--check] [--batch-size <n>]\n"))
@@ -52,3 +52,45 @@ class ProductTest(case.DBTestCase):
 
         self.assertEqual(self.refresh(v1).order, 1)
         self.assertEqual(self.refresh(v2).order, 2)
+
+
+    def test_reorder_versions_queries(self):
+        """Versions and latest caseversions are updated set-based."""
+        p = self.F.ProductFactory()
+        cases = [self.F.CaseFactory(product=p) for i in range(2)]
+        for version in ["1.3", "1.2", "1.1"]:
+            pv = self.F.ProductVersionFactory(product=p, version=version)
+            for c in cases:
+                self.F.CaseVersionFactory(productversion=pv, case=c)
+        self.model.ProductVersion.objects.update(order=0, latest=False)
+        self.model.CaseVersion.objects.update(latest=False)
+
+        # select versions, update versions, update latest caseversions
+        with self.assertNumQueries(3):
+            p.reorder_versions()
+
+        self.assertEqual(
+            [(v.version, v.order, v.latest) for v in p.versions.all()],
+            [("1.1", 1, False), ("1.2", 2, False), ("1.3", 3, True)],
+            )
+        self.assertEqual(
+            [
+                cv.productversion.version
+                for cv in self.model.CaseVersion.objects.filter(latest=True)
+                ],
+            ["1.3", "1.3"],
+            )
+
+
+    def test_reorder_versions_unchanged(self):
+        """Versions already in order are not updated."""
+        p = self.F.ProductFactory()
+        v1 = self.F.ProductVersionFactory(product=p, version="1.1")
+        v2 = self.F.ProductVersionFactory(product=p, version="1.2")
+        versions = [self.refresh(v).cc_version for v in [v1, v2]]
+
+        with self.assertNumQueries(2):
+            p.reorder_versions()
+
+        self.assertEqual(
+            [self.refresh(v).cc_version for v in [v1, v2]], versions)
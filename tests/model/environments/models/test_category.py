@@ -56,3 +56,50 @@ class CategoryTest(case.DBTestCase):
         env.delete()
 
         self.assertTrue(el.category.deletable)
+
+
+    def test_with_in_use(self):
+        """with_in_use annotates count of environments using each category."""
+        el = self.F.ElementFactory.create(name="Debian")
+        el2 = self.F.ElementFactory.create(name="Ubuntu", category=el.category)
+        other = self.F.CategoryFactory.create(name="Browser")
+        env = self.F.EnvironmentFactory.create()
+        env.elements.add(el, el2)
+        self.F.EnvironmentFactory.create().elements.add(el)
+        deleted = self.F.EnvironmentFactory.create()
+        deleted.elements.add(el2)
+        deleted.delete()
+
+        with self.assertNumQueries(1):
+            cats = dict(
+                (c.id, (c.in_use_count, c.deletable))
+                for c in self.model.Category.objects.with_in_use())
+
+        self.assertEqual(
+            cats, {el.category.id: (2, False), other.id: (0, True)})
+
+
+    def test_queryset_delete_prevention(self):
+        """Queryset delete of categories in use raises ProtectedError."""
+        el = self.F.ElementFactory.create(name="Debian")
+        other = self.F.CategoryFactory.create(name="Browser")
+        env = self.F.EnvironmentFactory.create()
+        env.elements.add(el)
+
+        with self.assertRaises(self.model.ProtectedError) as cm:
+            self.model.Category.objects.all().delete()
+
+        self.assertEqual(cm.exception.protected_objects, [env])
+        self.assertEqual(self.refresh(other).deleted_on, None)
+
+
+    def test_queryset_delete_ignores_deleted_envs(self):
+        """Queryset delete of categories only in deleted envs works."""
+        el = self.F.ElementFactory.create(name="Debian")
+        env = self.F.EnvironmentFactory.create()
+        env.elements.add(el)
+        env.delete()
+
+        self.model.Category.objects.all().delete()
+
+        self.assertFalse(self.refresh(el.category).deleted_on is None)
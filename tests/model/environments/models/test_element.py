@@ -56,3 +56,46 @@ class ElementTest(case.DBTestCase):
         env.delete()
 
         self.assertTrue(el.deletable)
+
+
+    def test_with_in_use(self):
+        """with_in_use annotates count of environments including elements."""
+        el = self.F.ElementFactory.create(name="Debian")
+        unused = self.F.ElementFactory.create(name="Ubuntu")
+        self.F.EnvironmentFactory.create().elements.add(el)
+        self.F.EnvironmentFactory.create().elements.add(el)
+        deleted = self.F.EnvironmentFactory.create()
+        deleted.elements.add(unused)
+        deleted.delete()
+
+        with self.assertNumQueries(1):
+            elements = dict(
+                (e.id, (e.in_use_count, e.deletable))
+                for e in self.model.Element.objects.with_in_use())
+
+        self.assertEqual(elements, {el.id: (2, False), unused.id: (0, True)})
+
+
+    def test_queryset_delete_prevention(self):
+        """Queryset delete of elements in use raises ProtectedError."""
+        el = self.F.ElementFactory.create(name="Debian")
+        unused = self.F.ElementFactory.create(name="Ubuntu")
+        env = self.F.EnvironmentFactory.create()
+        env.elements.add(el)
+
+        with self.assertRaises(self.model.ProtectedError) as cm:
+            self.model.Element.objects.all().delete()
+
+        self.assertEqual(cm.exception.protected_objects, [env])
+        self.assertEqual(self.refresh(unused).deleted_on, None)
+
+
+    def test_queryset_delete_not_in_use(self):
+        """Queryset delete of elements not in use deletes them."""
+        el = self.F.ElementFactory.create(name="Debian")
+        self.F.EnvironmentFactory.create().elements.add(el)
+        unused = self.F.ElementFactory.create(name="Ubuntu")
+
+        self.model.Element.objects.filter(pk=unused.pk).delete()
+
+        self.assertFalse(self.refresh(unused).deleted_on is None)
@@ -2,6 +2,8 @@
 Tests for Environment model.
 
 """
+from django.test.utils import override_settings
+
 from tests import case
 
 
@@ -24,6 +26,163 @@ class EnvironmentTest(case.DBTestCase):
             [el.name for el in e.ordered_elements()], [u"English", u"OS X"])
 
 
+    def test_element_names(self):
+        """element_names are names of elements in category name order."""
+        e = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X"], "Language": ["English"]})[0]
+
+        self.assertEqual(e.element_names(), [u"English", u"OS X"])
+        self.assertEqual(self.model.Environment().element_names(), [])
+
+
+    def test_with_labels(self):
+        """with_labels loads labels of all environments in one query."""
+        self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X", "Linux"], "Language": ["English", "German"]})
+
+        with self.assertNumQueries(2):
+            envs = list(self.model.Environment.objects.with_labels())
+
+        with self.assertNumQueries(0):
+            labels = sorted(unicode(e) for e in envs)
+
+        self.assertEqual(
+            labels,
+            [
+                u"English, Linux",
+                u"English, OS X",
+                u"German, Linux",
+                u"German, OS X",
+                ]
+            )
+
+
+    def test_labels_cached(self):
+        """Labels are cached across environment instances."""
+        e = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X"], "Language": ["English"]})[0]
+        unicode(e)
+
+        with self.assertNumQueries(1):
+            envs = list(self.model.Environment.objects.with_labels())
+
+        self.assertEqual(unicode(envs[0]), u"English, OS X")
+
+
+    @override_settings(CACHE_ENVIRONMENTS=None)
+    def test_labels_not_cached_in_local_memory(self):
+        """With a per-process cache backend, labels aren't cached."""
+        e = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X"], "Language": ["English"]})[0]
+        unicode(e)
+
+        with self.assertNumQueries(2):
+            envs = list(self.model.Environment.objects.with_labels())
+
+        self.assertEqual(unicode(envs[0]), u"English, OS X")
+
+
+    def test_label_element_renamed(self):
+        """Renaming an element refreshes cached labels."""
+        e = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X"], "Language": ["English"]})[0]
+        unicode(e)
+        el = self.model.Element.objects.get(name="English")
+
+        el.name = "Spanish"
+        el.save()
+
+        self.assertEqual(unicode(self.refresh(e)), u"Spanish, OS X")
+
+
+    def test_label_category_renamed(self):
+        """Renaming a category refreshes cached labels (its name orders)."""
+        e = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X"], "Language": ["English"]})[0]
+        unicode(e)
+        cat = self.model.Category.objects.get(name="Language")
+
+        cat.name = "Spoken language"
+        cat.save()
+
+        self.assertEqual(unicode(self.refresh(e)), u"OS X, English")
+
+
+    def test_label_elements_changed(self):
+        """Changing elements of an environment refreshes its label."""
+        e = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X"], "Language": ["English"]})[0]
+        unicode(e)
+
+        e.elements.remove(self.model.Element.objects.get(name="English"))
+
+        self.assertEqual(unicode(e), u"OS X")
+        self.assertEqual(unicode(self.refresh(e)), u"OS X")
+
+
+    def test_signature(self):
+        """Signature is kept in sync with elements."""
+        from moztrap.model.environments.models import element_signature
+        e1 = self.F.ElementFactory.create()
+        e2 = self.F.ElementFactory.create()
+        env = self.F.EnvironmentFactory.create()
+
+        env.elements.add(e2, e1)
+        self.assertEqual(env.signature, element_signature([e1.id, e2.id]))
+        self.assertEqual(
+            self.refresh(env).signature, element_signature([e2.id, e1.id]))
+
+        env.elements.remove(e1)
+        self.assertEqual(env.signature, element_signature([e2.id]))
+
+        e2.environments.clear()
+        self.assertEqual(self.refresh(env).signature, element_signature([]))
+
+        e1.environments.add(env)
+        self.assertEqual(
+            self.refresh(env).signature, element_signature([e1.id]))
+
+
+    def test_update_signatures(self):
+        """Signatures of many environments are updated in one statement."""
+        from moztrap.model.environments.models import element_signature
+        e1 = self.F.ElementFactory.create()
+        e2 = self.F.ElementFactory.create()
+        env1 = self.F.EnvironmentFactory.create()
+        env2 = self.F.EnvironmentFactory.create()
+        env3 = self.F.EnvironmentFactory.create()
+        self.model.Environment.elements.through.objects.create(
+            environment=env1, element=e1)
+        self.model.Environment.elements.through.objects.create(
+            environment=env2, element=e2)
+
+        # read links, then one UPDATE
+        with self.assertNumQueries(2):
+            signatures = self.model.Environment.update_signatures(
+                [env1.id, env2.id, env3.id])
+
+        self.assertEqual(
+            signatures,
+            {
+                env1.id: element_signature([e1.id]),
+                env2.id: element_signature([e2.id]),
+                env3.id: element_signature([]),
+                }
+            )
+        for env in [env1, env2, env3]:
+            self.assertEqual(self.refresh(env).signature, signatures[env.id])
+
+
+    def test_signature_change_not_a_modification(self):
+        """Updating the signature doesn't break saving the instance."""
+        env = self.F.EnvironmentFactory.create()
+        env.elements.add(self.F.ElementFactory.create())
+
+        env.save()
+
+        self.assertEqual(self.refresh(env).signature, env.signature)
+
+
     def test_clone(self):
         """Cloning an environment clones element relationships."""
         e = self.F.EnvironmentFactory.create_full_set(
@@ -73,6 +232,46 @@ class EnvironmentTest(case.DBTestCase):
         self.assertTrue(env.deletable)
 
 
+    def test_with_in_use(self):
+        """with_in_use annotates count of product versions using envs."""
+        env = self.F.EnvironmentFactory.create()
+        unused = self.F.EnvironmentFactory.create()
+        self.F.ProductVersionFactory.create(environments=[env])
+        self.F.ProductVersionFactory.create(version="2", environments=[env])
+        self.F.ProductVersionFactory.create(
+            version="3", environments=[unused]).delete()
+
+        with self.assertNumQueries(1):
+            envs = dict(
+                (e.id, (e.in_use_count, e.deletable))
+                for e in self.model.Environment.objects.with_in_use())
+
+        self.assertEqual(envs, {env.id: (2, False), unused.id: (0, True)})
+
+
+    def test_queryset_delete_prevention(self):
+        """Queryset delete of environments in use raises ProtectedError."""
+        env = self.F.EnvironmentFactory.create()
+        unused = self.F.EnvironmentFactory.create()
+        pv = self.F.ProductVersionFactory.create(environments=[env])
+
+        with self.assertRaises(self.model.ProtectedError) as cm:
+            self.model.Environment.objects.all().delete()
+
+        self.assertEqual(cm.exception.protected_objects, [pv])
+        self.assertEqual(self.refresh(unused).deleted_on, None)
+
+
+    def test_queryset_delete_ignores_deleted_product_versions(self):
+        """Queryset delete of envs used only by deleted versions works."""
+        env = self.F.EnvironmentFactory.create()
+        self.F.ProductVersionFactory.create(environments=[env]).delete()
+
+        self.model.Environment.objects.all().delete()
+
+        self.assertFalse(self.refresh(env).deleted_on is None)
+
+
     def test_remove_from_profile_not_in_use(self):
         """If an environment is not in use, remove_from_profile deletes it."""
         el = self.F.ElementFactory.create()
@@ -24,3 +24,106 @@ class HasEnvironmentsModelTest(case.TestCase):
     def test_cascade_envs_to(self):
         """cascade_envs_to returns empty dict in base class."""
         self.assertEqual(self.model_class.cascade_envs_to([], True), {})
+
+
+
+class EnvironmentCascadeTest(case.DBTestCase):
+    """Tests for set-based cascading of environment additions and removals."""
+    def setUp(self):
+        """Set up a productversion with caseversions and runs."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X", "Linux", "Windows"]})
+        self.pv = self.F.ProductVersionFactory.create(
+            environments=self.envs[1:])
+
+
+    def create(self, num_cases):
+        """Create ``num_cases`` caseversions, a draft and an active run."""
+        cvs = [
+            self.F.CaseVersionFactory.create(productversion=self.pv)
+            for i in range(num_cases)
+            ]
+        runs = [
+            self.F.RunFactory.create(productversion=self.pv, status=status)
+            for status in ["draft", "active"]
+            ]
+        return cvs, runs
+
+
+    def env_ids(self, obj):
+        """Return set of environment ids of ``obj``."""
+        return set(obj.environments.values_list("id", flat=True))
+
+
+    def test_add(self):
+        """Adds to productversion, draft runs and non-narrowed caseversions."""
+        (cv, narrowed), (draft, active) = self.create(2)
+        narrowed.remove_envs(self.envs[1])
+        cv.environments.add(self.envs[0])
+
+        self.pv.add_envs(self.envs[0].id)
+
+        all_ids = set(e.id for e in self.envs)
+        self.assertEqual(self.env_ids(self.pv), all_ids)
+        self.assertEqual(self.env_ids(cv), all_ids)
+        self.assertEqual(self.env_ids(draft), all_ids)
+        self.assertEqual(self.env_ids(narrowed), set([self.envs[2].id]))
+        self.assertEqual(
+            self.env_ids(active), set([self.envs[1].id, self.envs[2].id]))
+
+
+    def test_add_sends_reverse_signals(self):
+        """Receivers get a reverse add from each environment."""
+        from django.db.models.signals import m2m_changed
+        (cv,), runs = self.create(1)
+        calls = []
+        def receiver(sender, **kwargs):
+            calls.append(
+                (kwargs["action"], kwargs["instance"], kwargs["pk_set"]))
+        through = self.model.CaseVersion.environments.through
+        m2m_changed.connect(receiver, sender=through)
+        self.addCleanup(m2m_changed.disconnect, receiver, sender=through)
+
+        self.pv.add_envs(self.envs[0])
+
+        self.assertEqual(
+            calls,
+            [
+                ("pre_add", self.envs[0], set([cv.id])),
+                ("post_add", self.envs[0], set([cv.id])),
+                ]
+            )
+
+
+    def test_add_query_count(self):
+        """Number of queries doesn't depend on the number of objects."""
+        self.create(5)
+
+        # existing links and insert for each of productversion, caseversions
+        # and runs; ids of caseversions and draft runs to cascade to; pending
+        # run changes for caseversions and runs
+        with self.assertNumQueries(11):
+            self.pv.add_envs(self.envs[0])
+
+
+    def test_remove(self):
+        """Removes from productversion and all its runs and caseversions."""
+        (cv,), (draft, active) = self.create(1)
+        rcv = self.F.RunCaseVersionFactory.create(run=active, caseversion=cv)
+
+        self.pv.remove_envs(self.envs[1])
+
+        for obj in [self.pv, cv, draft, active, rcv]:
+            self.assertEqual(self.env_ids(obj), set([self.envs[2].id]))
+
+
+    def test_remove_query_count(self):
+        """Number of queries doesn't depend on the number of objects."""
+        cvs, (draft, active) = self.create(5)
+        for cv in cvs:
+            self.F.RunCaseVersionFactory.create(run=active, caseversion=cv)
+
+        # a delete for each model, runs to invalidate environment indexes of,
+        # and a rollup refresh for rcvs of caseversions and of runs
+        with self.assertNumQueries(21):
+            self.pv.remove_envs(self.envs[1])
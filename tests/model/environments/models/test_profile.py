@@ -43,6 +43,88 @@ class ProfileTest(case.DBTestCase):
             )
 
 
+    def test_generate_pairwise(self):
+        """With strength=2, generates environments covering every pair."""
+        elements = {}
+        for cat in ["OS", "Browser", "Language", "Device"]:
+            category = self.F.CategoryFactory(name=cat)
+            elements[cat] = [
+                self.F.ElementFactory(name="{0} {1}".format(cat, i),
+                                      category=category)
+                for i in range(3)
+                ]
+
+        p = self.model.Profile.generate(
+            "New Profile", *sum(elements.values(), []), strength=2)
+
+        envs = [set(e.elements.all()) for e in p.environments.all()]
+        self.assertLess(len(envs), 3 ** 4)
+        for cat1, cat2 in [("OS", "Browser"), ("Language", "Device")]:
+            for e1 in elements[cat1]:
+                for e2 in elements[cat2]:
+                    self.assertTrue(
+                        any(set([e1, e2]) <= env for env in envs),
+                        "{0} and {1} not covered".format(e1, e2),
+                        )
+
+
+    def test_generate_signatures(self):
+        """Generated environments get element signatures."""
+        from moztrap.model.environments.models import element_signature
+        os = self.F.CategoryFactory(name="Operating System")
+        windows = self.F.ElementFactory(name="Windows", category=os)
+        linux = self.F.ElementFactory(name="Linux", category=os)
+
+        p = self.model.Profile.generate("New Profile", windows, linux)
+
+        self.assertEqual(
+            sorted(e.signature for e in p.environments.all()),
+            sorted(
+                [element_signature([windows.id]), element_signature([linux.id])]
+                )
+            )
+
+
+    def test_generate_query_count(self):
+        """Number of queries doesn't depend on the number of environments."""
+        elements = []
+        for cat in ["OS", "Browser", "Language"]:
+            category = self.F.CategoryFactory(name=cat)
+            elements.extend(
+                [self.F.ElementFactory(category=category) for i in range(4)])
+
+        # profile, existing envs, envs, new env ids, element links
+        with self.assertNumQueries(5):
+            p = self.model.Profile.generate("New Profile", *elements)
+
+        self.assertEqual(p.environments.count(), 64)
+        self.assertEqual(
+            set(len(e.elements.all()) for e in p.environments.all()), set([3]))
+
+
+    def test_add_environments_skips_duplicates(self):
+        """Adding environments skips element sets the profile already has."""
+        p = self.F.ProfileFactory.create()
+        e1 = self.F.ElementFactory.create()
+        e2 = self.F.ElementFactory.create()
+        u = self.F.UserFactory.create()
+
+        self.assertEqual(p.add_environments([[e1.id]], user=u), 1)
+        self.assertEqual(
+            p.add_environments([[e1.id], [e2.id, e1.id], [e1.id, e2.id]]), 1)
+
+        self.assertEqual(
+            sorted(
+                sorted(e.elements.values_list("id", flat=True))
+                for e in p.environments.all()
+                ),
+            [[e1.id], sorted([e1.id, e2.id])],
+            )
+        self.assertEqual(p.environments.get(elements=e2).created_by, None)
+        self.assertEqual(
+            p.environments.exclude(elements=e2).get().created_by, u)
+
+
     def test_clone(self):
         """Cloning a profile prefixes name with 'Cloned'."""
         p = self.F.ProfileFactory.create(name="Foo")
@@ -0,0 +1,90 @@
+"""
+Tests for covering array generation.
+
+"""
+import itertools
+
+from django.utils.unittest import TestCase
+
+
+
+class CoveringArrayTest(TestCase):
+    """Tests for covering_array."""
+    def covering_array(self, groups, strength):
+        from moztrap.model.environments.combinations import covering_array
+        return covering_array(groups, strength)
+
+
+    def groups(self, num, size):
+        """Return ``num`` groups of ``size`` distinct values."""
+        return [
+            ["{0}-{1}".format(i, j) for j in range(size)] for i in range(num)]
+
+
+    def assertCovers(self, rows, groups, strength):
+        """Assert ``rows`` cover every ``strength``-wise interaction."""
+        for row in rows:
+            self.assertEqual(len(row), len(groups))
+            for value, group in zip(row, groups):
+                self.assertIn(value, group)
+        for cols in itertools.combinations(range(len(groups)), strength):
+            wanted = set(itertools.product(*[groups[c] for c in cols]))
+            found = set(tuple(row[c] for c in cols) for row in rows)
+            self.assertEqual(wanted - found, set())
+
+
+    def test_pairwise(self):
+        """Covers all pairs with far fewer rows than the full product."""
+        groups = self.groups(6, 5)
+
+        rows = self.covering_array(groups, 2)
+
+        self.assertCovers(rows, groups, 2)
+        self.assertLess(len(rows), 40)
+
+
+    def test_three_wise(self):
+        """Covers all triples."""
+        groups = self.groups(5, 3)
+
+        rows = self.covering_array(groups, 3)
+
+        self.assertCovers(rows, groups, 3)
+        self.assertLess(len(rows), 3 ** 5)
+
+
+    def test_uneven_groups(self):
+        """Groups of different sizes keep their order in the rows."""
+        groups = [["a"], ["b", "c", "d"], ["e", "f"], ["g", "h", "i", "j"]]
+
+        rows = self.covering_array(groups, 2)
+
+        self.assertCovers(rows, groups, 2)
+        self.assertEqual(len(rows), 12)
+
+
+    def test_few_groups(self):
+        """With no more groups than the strength, returns full product."""
+        groups = self.groups(2, 3)
+
+        self.assertEqual(
+            self.covering_array(groups, 2), list(itertools.product(*groups)))
+
+
+    def test_empty_group(self):
+        """An empty group means there are no combinations."""
+        self.assertEqual(self.covering_array([["a"], [], ["b"]], 2), [])
+
+
+    def test_deterministic(self):
+        """Same groups give the same rows."""
+        groups = self.groups(7, 3)
+
+        self.assertEqual(
+            self.covering_array(groups, 2), self.covering_array(groups, 2))
+
+
+    def test_bad_strength(self):
+        """Strength must be positive."""
+        with self.assertRaises(ValueError):
+            self.covering_array(self.groups(3, 2), 0)
@@ -0,0 +1,208 @@
+"""
+Tests for cached per-run environment indexes.
+
+"""
+from django.test.utils import override_settings
+
+from tests import case
+
+
+
+class EnvironmentIndexTest(case.DBTestCase):
+    """Tests for EnvironmentIndex."""
+    @property
+    def cls(self):
+        """The class under test."""
+        from moztrap.model.environments.index import EnvironmentIndex
+        return EnvironmentIndex
+
+
+    def setUp(self):
+        """Set up OS/Browser environments and a run with all of them."""
+        os = self.F.CategoryFactory.create(name="OS")
+        browser = self.F.CategoryFactory.create(name="Browser")
+        self.el = {}
+        for name, category in [
+                ("Windows", os), ("Linux", os),
+                ("Firefox", browser), ("Opera", browser)]:
+            self.el[name] = self.F.ElementFactory.create(
+                name=name, category=category).id
+        self.envs = []
+        for names in [
+                ["Windows", "Firefox"], ["Windows", "Opera"],
+                ["Linux", "Firefox"]]:
+            env = self.F.EnvironmentFactory.create()
+            env.elements.add(*[self.el[n] for n in names])
+            self.envs.append(env)
+        self.run = self.F.RunFactory.create()
+        self.run.environments.add(*self.envs)
+
+
+    def test_choices(self):
+        """Categories and their elements are ordered by name."""
+        index = self.cls.for_environments(self.model.Environment.objects.all())
+        browser = self.model.Category.objects.get(name="Browser")
+        os = self.model.Category.objects.get(name="OS")
+
+        self.assertEqual(
+            index.categories, [(browser.id, "Browser"), (os.id, "OS")])
+        self.assertEqual(
+            index.choices[os.id],
+            [(self.el["Linux"], "Linux"), (self.el["Windows"], "Windows")],
+            )
+        self.assertEqual(
+            index.elementids_by_envid[self.envs[1].id],
+            [self.el["Opera"], self.el["Windows"]],
+            )
+        self.assertEqual(
+            sorted(index.elements_of(self.envs[0].id)),
+            sorted(
+                [
+                    (browser.id, self.el["Firefox"]),
+                    (os.id, self.el["Windows"]),
+                    ]
+                )
+            )
+        self.assertEqual(index.elements_of(None), [])
+
+
+    def test_match(self):
+        """Matches environment with all its elements among the given ones."""
+        index = self.cls.for_environments(self.model.Environment.objects.all())
+        other = self.F.ElementFactory.create(name="English")
+
+        self.assertEqual(
+            index.match([self.el["Linux"], self.el["Firefox"]]),
+            self.envs[2].id,
+            )
+        self.assertEqual(
+            index.match([self.el["Linux"], self.el["Firefox"], other.id]),
+            self.envs[2].id,
+            )
+        self.assertEqual(
+            index.match([self.el["Linux"], self.el["Opera"]]), None)
+        self.assertEqual(index.match([self.el["Linux"]]), None)
+
+
+    def test_match_most_specific(self):
+        """Prefers the matching environment with the most elements."""
+        linux = self.model.Environment.objects.create()
+        linux.elements.add(self.el["Linux"])
+        index = self.cls.for_environments(self.model.Environment.objects.all())
+
+        self.assertEqual(
+            index.match([self.el["Linux"], self.el["Firefox"], 0]),
+            self.envs[2].id,
+            )
+        self.assertEqual(
+            index.match([self.el["Linux"], self.el["Opera"]]), linux.id)
+
+
+    def test_for_run_cached(self):
+        """Index of a run is cached."""
+        index = self.cls.for_run(self.run)
+
+        with self.assertNumQueries(0):
+            cached = self.cls.for_run(self.run)
+
+        self.assertEqual(cached.elementids_by_envid, index.elementids_by_envid)
+
+
+    def test_run_environment_added(self):
+        """Adding environments to the run invalidates its index."""
+        self.cls.for_run(self.run)
+        env = self.F.EnvironmentFactory.create_full_set({"OS": ["BeOS"]})[0]
+
+        self.run.environments.add(env)
+
+        self.assertIn(env.id, self.cls.for_run(self.run).elementids_by_envid)
+
+
+    def test_run_environment_removed(self):
+        """Removing environments from the run invalidates its index."""
+        self.cls.for_run(self.run)
+
+        self.run.remove_envs(self.envs[0])
+
+        self.assertNotIn(
+            self.envs[0].id, self.cls.for_run(self.run).elementids_by_envid)
+
+
+    def test_environment_run_added(self):
+        """Adding runs to an environment invalidates their indexes."""
+        run = self.F.RunFactory.create()
+        self.cls.for_run(run)
+
+        self.envs[0].run.add(run)
+
+        self.assertEqual(
+            self.cls.for_run(run).elementids_by_envid.keys(),
+            [self.envs[0].id],
+            )
+
+
+    def test_element_renamed(self):
+        """Renaming an element invalidates all indexes."""
+        self.cls.for_run(self.run)
+        linux = self.model.Element.objects.get(name="Linux")
+        linux.name = "Ubuntu"
+        linux.save()
+
+        index = self.cls.for_run(self.run)
+
+        self.assertIn(
+            (linux.id, "Ubuntu"), index.choices[linux.category_id])
+
+
+    def test_environment_elements_changed(self):
+        """Changing elements of an environment invalidates all indexes."""
+        self.cls.for_run(self.run)
+        self.envs[0].elements.remove(self.el["Firefox"])
+
+        index = self.cls.for_run(self.run)
+
+        self.assertEqual(
+            index.match([self.el["Windows"]]), self.envs[0].id)
+
+
+    def test_environment_deleted(self):
+        """Deleting an environment invalidates all indexes."""
+        self.cls.for_run(self.run)
+
+        self.envs[0].delete()
+
+        self.assertNotIn(
+            self.envs[0].id, self.cls.for_run(self.run).elementids_by_envid)
+
+
+    def test_environments_deleted_in_bulk(self):
+        """Soft-deleting a queryset of environments invalidates indexes."""
+        self.cls.for_run(self.run)
+
+        self.model.Environment.objects.filter(
+            pk__in=[e.id for e in self.envs[:2]]).delete()
+
+        self.assertEqual(
+            self.cls.for_run(self.run).elementids_by_envid.keys(),
+            [self.envs[2].id],
+            )
+
+
+    def test_environment_undeleted(self):
+        """Undeleting an environment invalidates all indexes."""
+        self.envs[0].delete()
+        self.cls.for_run(self.run)
+
+        self.envs[0].undelete()
+
+        self.assertIn(
+            self.envs[0].id, self.cls.for_run(self.run).elementids_by_envid)
+
+
+    @override_settings(CACHE_ENVIRONMENTS=None)
+    def test_not_cached_in_local_memory(self):
+        """With a per-process cache backend, indexes aren't cached."""
+        self.cls.for_run(self.run)
+
+        with self.assertNumQueries(1):
+            self.cls.for_run(self.run)
@@ -305,3 +305,119 @@ class ResultResourceTest(case.api.ApiTestCase):
             params=params,
             status=401,
             )
+
+
+
+class BulkResultResourceTest(case.api.ApiTestCase):
+    """Tests for the bulk result endpoint."""
+    def setUp(self):
+        """Set up a run with a caseversion and a user with an API key."""
+        super(BulkResultResourceTest, self).setUp()
+        self.user = self.F.UserFactory.create(
+            username="foo",
+            permissions=["execution.execute"],
+            )
+        apikey = self.F.ApiKeyFactory.create(owner=self.user)
+        self.params = {"username": self.user.username, "api_key": apikey.key}
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+                {"OS": ["OS X", "Linux"]})
+        self.rcv = self.F.RunCaseVersionFactory.create(
+            environments=self.envs)
+        self.F.CaseStepFactory.create(caseversion=self.rcv.caseversion)
+
+
+    @property
+    def url(self):
+        """The bulk endpoint URL."""
+        return self.get_resource_url("api_result_bulk", "result")
+
+
+    def result_data(self, env, **kwargs):
+        """Return data of a result for given environment."""
+        data = {
+            "case": self.rcv.caseversion.case.id,
+            "environment": env.id,
+            "run_id": self.rcv.run.id,
+            "status": "passed",
+            }
+        data.update(kwargs)
+        return data
+
+
+    def test_create(self):
+        """Creates all results."""
+        res = self.post(
+            self.url,
+            params=self.params,
+            payload={
+                "objects": [
+                    self.result_data(self.envs[0]),
+                    self.result_data(
+                        self.envs[1],
+                        status="failed",
+                        stepnumber=1,
+                        bug="http://www.example.com/bug",
+                        ),
+                    ]
+                },
+            )
+
+        self.assertEqual(res.json, {"created": 2, "errors": []})
+        failed = self.model.Result.objects.get(
+            runcaseversion=self.rcv, environment=self.envs[1])
+        self.assertEqual(failed.tester, self.user)
+        self.assertEqual(
+            failed.bug_urls(), set(["http://www.example.com/bug"]))
+        self.assertEqual(self.rcv.results.count(), 2)
+
+
+    def test_errors(self):
+        """Reports per-result errors and creates nothing."""
+        res = self.post(
+            self.url,
+            params=self.params,
+            payload={
+                "objects": [
+                    self.result_data(self.envs[0]),
+                    self.result_data(self.envs[1], status="bogus"),
+                    ]
+                },
+            status=400,
+            )
+
+        self.assertEqual(
+            res.json,
+            {
+                "created": 0,
+                "errors": [{"index": 1, "error": "Unknown status: bogus"}],
+                },
+            )
+        self.assertEqual(self.rcv.results.count(), 0)
+
+
+    def test_no_objects(self):
+        """A payload without a list of objects is a bad request."""
+        self.post(
+            self.url,
+            params=self.params,
+            payload={"objects": {}},
+            status=400,
+            )
+
+
+    def test_no_authorization(self):
+        """A user without execute permission can't submit results."""
+        user = self.F.UserFactory.create()
+        apikey = self.F.ApiKeyFactory.create(owner=user)
+
+        self.post(
+            self.url,
+            params={"username": user.username, "api_key": apikey.key},
+            payload={"objects": [self.result_data(self.envs[0])]},
+            status=401,
+            )
+
+
+    def test_get_not_allowed(self):
+        """The bulk endpoint only accepts POST."""
+        self.get(self.url, params=self.params, status=405)
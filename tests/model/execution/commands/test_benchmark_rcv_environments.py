@@ -0,0 +1,59 @@
+"""
+Tests for management command to benchmark runcaseversion environment updates.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+class BenchmarkRcvEnvironmentsTest(case.DBTestCase):
+    """Tests for benchmark_rcv_environments management command."""
+    def call_command(self, *args, **kwargs):
+        """
+        Runs the management command and returns (stdout, stderr) output.
+
+        Also patch ``sys.exit`` so a ``CommandError`` doesn't cause an exit.
+
+        """
+        with patch("sys.stdout", StringIO()) as stdout:
+            with patch("sys.stderr", StringIO()) as stderr:
+                with patch("sys.exit"):
+                    call_command(
+                        "benchmark_rcv_environments", *args, **kwargs)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return (stdout.read(), stderr.read())
+
+
+    def test_reports_timings(self):
+        """Reports a timing for each approach."""
+        stdout, stderr = self.call_command(cases=5, envs=3)
+
+        lines = stdout.splitlines()
+        self.assertEqual(lines[0], "5 runcaseversions x 3 environments:")
+        self.assertEqual(
+            [l.split(":")[0] for l in lines[1:]],
+            ["  python", "  set-based"],
+            )
+        self.assertEqual(stderr, "")
+
+
+    def test_bad_options(self):
+        """Too few environments is an error."""
+        output = self.call_command(cases=5, envs=1)
+
+        self.assertEqual(
+            output,
+            (
+                "",
+                "Error: Usage: [--cases <n>] [--envs <n>] "
+                "(at least 1 case, 2 envs)\n",
+                )
+            )
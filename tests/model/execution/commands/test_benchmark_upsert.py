@@ -0,0 +1,58 @@
+"""
+Tests for management command to benchmark bulk upserting runcaseversions.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+class BenchmarkUpsertTest(case.DBTestCase):
+    """Tests for benchmark_upsert management command."""
+    def call_command(self, *args, **kwargs):
+        """
+        Runs the management command and returns (stdout, stderr) output.
+
+        Also patch ``sys.exit`` so a ``CommandError`` doesn't cause an exit.
+
+        """
+        with patch("sys.stdout", StringIO()) as stdout:
+            with patch("sys.stderr", StringIO()) as stderr:
+                with patch("sys.exit"):
+                    call_command("benchmark_upsert", *args, **kwargs)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return (stdout.read(), stderr.read())
+
+
+    def test_reports_timings(self):
+        """Reports a timing for each approach."""
+        stdout, stderr = self.call_command(cases=6, existing=50)
+
+        lines = stdout.splitlines()
+        self.assertEqual(lines[0], "6 runcaseversions, 50% existing:")
+        labels = [l.split(":")[0] for l in lines[1:]]
+        self.assertEqual(labels[0], "  string-built")
+        self.assertTrue(labels[1].startswith("  upsert, "))
+        self.assertEqual(labels[-1], "  upsert, fallback")
+        self.assertEqual(stderr, "")
+
+
+    def test_bad_options(self):
+        """An existing percentage over 100 is an error."""
+        output = self.call_command(cases=5, existing=101)
+
+        self.assertEqual(
+            output,
+            (
+                "",
+                "Error: Usage: [--cases <n>] [--existing <percent>] "
+                "(at least 1 case)\n",
+                )
+            )
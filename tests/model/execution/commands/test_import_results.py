@@ -0,0 +1,145 @@
+"""
+Tests for management command to import results from a file.
+
+"""
+from cStringIO import StringIO
+import os
+import tempfile
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+class ImportResultsTest(case.DBTestCase):
+    """Tests for import_results management command."""
+    def call_command(self, *args, **kwargs):
+        """
+        Runs the management command and returns (stdout, stderr) output.
+
+        Also patch ``sys.exit`` so a ``CommandError`` doesn't cause an exit.
+
+        """
+        with patch("sys.stdout", StringIO()) as stdout:
+            with patch("sys.stderr", StringIO()) as stderr:
+                with patch("sys.exit"):
+                    call_command("import_results", *args, **kwargs)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return (stdout.read(), stderr.read())
+
+
+    def write_file(self, content, suffix):
+        """Write ``content`` to a temporary file and return its name."""
+        fd, filename = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, "w") as fh:
+            fh.write(content)
+        self.addCleanup(os.remove, filename)
+        return filename
+
+
+    def setUp(self):
+        """Set up a run with a case in an environment, and a tester."""
+        self.user = self.F.UserFactory.create(username="tester")
+        self.env = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X"]})[0]
+        self.rcv = self.F.RunCaseVersionFactory.create(
+            run__status="active", environments=[self.env])
+
+
+    def args(self, filename):
+        """Return command arguments for importing ``filename``."""
+        return [str(self.rcv.run.id), str(self.env.id), "tester", filename]
+
+
+    def test_junit(self):
+        """Imports a JUnit file, format guessed from extension."""
+        filename = self.write_file(
+            '<testsuite><testcase name="{0} opens"/>'
+            '<testcase name="opens other"/></testsuite>'.format(
+                self.rcv.caseversion.case_id),
+            ".xml",
+            )
+
+        stdout, stderr = self.call_command(*self.args(filename))
+
+        lines = stdout.splitlines()
+        self.assertTrue(lines[0].startswith("Imported 1 results in "))
+        self.assertEqual(lines[1:], ["1 unmatched tests:", "  opens other"])
+        self.assertEqual(stderr, "")
+        self.assertEqual(self.rcv.results.get().tester, self.user)
+
+
+    def test_format_option(self):
+        """Format can be given explicitly."""
+        filename = self.write_file(
+            "not ok 1 - {0}\n".format(self.rcv.caseversion.case_id), ".txt")
+
+        self.call_command(*self.args(filename), format="tap", batch_size=10)
+
+        self.assertEqual(self.rcv.results.get().status, "failed")
+
+
+    def test_unknown_format(self):
+        """Error if the format can't be guessed."""
+        filename = self.write_file("", ".txt")
+
+        stdout, stderr = self.call_command(*self.args(filename))
+
+        self.assertIn("Could not guess format", stderr)
+
+
+    def test_bad_file(self):
+        """Error if the file can't be parsed."""
+        filename = self.write_file("{", ".ndjson")
+
+        stdout, stderr = self.call_command(*self.args(filename))
+
+        self.assertIn("Could not parse JSON on line 1", stderr)
+
+
+    def test_missing_file(self):
+        """Error if the file doesn't exist."""
+        stdout, stderr = self.call_command(*self.args("/no/such/file.tap"))
+
+        self.assertIn('Could not open "/no/such/file.tap"', stderr)
+
+
+    def test_run_not_active(self):
+        """Error if the run isn't active; nothing is imported."""
+        self.rcv.run.status = self.model.Run.STATUS.draft
+        self.rcv.run.save()
+        filename = self.write_file(
+            "ok 1 - {0}\n".format(self.rcv.caseversion.case_id), ".tap")
+
+        stdout, stderr = self.call_command(*self.args(filename))
+
+        self.assertEqual(
+            stderr,
+            'Error: Run "{0}" is draft; results can only be imported into '
+            'active runs.\n'.format(self.rcv.run.name),
+            )
+        self.assertEqual(self.rcv.results.count(), 0)
+
+
+    def test_bad_user(self):
+        """Error if the tester doesn't exist."""
+        stdout, stderr = self.call_command(
+            str(self.rcv.run.id), str(self.env.id), "nobody", "f.tap")
+
+        self.assertEqual(stderr, 'Error: User "nobody" does not exist\n')
+
+
+    def test_usage(self):
+        """Error with wrong number of arguments."""
+        stdout, stderr = self.call_command("1")
+
+        self.assertEqual(
+            stderr,
+            "Error: Usage: <run_id> <environment_id> <username> <filename> "
+            "[--format <format>] [--batch-size <n>]\n",
+            )
@@ -0,0 +1,63 @@
+"""
+Tests for management command to rebuild result rollups.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+class RebuildResultRollupsTest(case.DBTestCase):
+    """Tests for rebuild_result_rollups management command."""
+    def call_command(self, *args, **kwargs):
+        """
+        Runs the management command and returns (stdout, stderr) output.
+
+        Also patch ``sys.exit`` so a ``CommandError`` doesn't cause an exit.
+
+        """
+        with patch("sys.stdout", StringIO()) as stdout:
+            with patch("sys.stderr", StringIO()) as stderr:
+                with patch("sys.exit"):
+                    call_command("rebuild_result_rollups", *args, **kwargs)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return (stdout.read(), stderr.read())
+
+
+    def test_rebuilds_all(self):
+        """Rebuilds rollups for all runs."""
+        rcv = self.F.RunCaseVersionFactory.create()
+        self.F.ResultFactory.create(runcaseversion=rcv, status="passed")
+        self.model.ResultRollup.objects.update(passed=0)
+
+        output = self.call_command()
+
+        self.assertEqual(output, ("Rebuilt rollups for 1 run(s).\n", ""))
+        self.assertEqual(rcv.run.result_summary()["passed"], 1)
+
+
+    def test_rebuilds_given_runs(self):
+        """Rebuilds rollups only for given run ids."""
+        rcv = self.F.RunCaseVersionFactory.create()
+        self.F.ResultFactory.create(runcaseversion=rcv, status="passed")
+        self.model.ResultRollup.objects.update(passed=0)
+
+        output = self.call_command(str(rcv.run.id))
+
+        self.assertEqual(output, ("Rebuilt rollups for 1 run(s).\n", ""))
+        self.assertEqual(rcv.run.result_summary()["passed"], 1)
+
+
+    def test_bad_run_id(self):
+        """Non-integer run ids are an error."""
+        output = self.call_command("foo")
+
+        self.assertEqual(
+            output, ("", "Error: Usage: [<run_id> <run_id> ...]\n"))
@@ -0,0 +1,153 @@
+"""
+Tests for LatestResult model and manager.
+
+"""
+from tests import case
+
+
+
+class LatestResultTest(case.DBTestCase):
+    """Tests for maintenance of latest-result pointers."""
+    def setUp(self):
+        """Set up a runcaseversion, an environment and two testers."""
+        self.rcv = self.F.RunCaseVersionFactory.create()
+        self.env = self.F.EnvironmentFactory.create()
+        self.tester = self.F.UserFactory.create()
+        self.other = self.F.UserFactory.create()
+
+
+    def result(self, status="passed", tester=None, **kwargs):
+        """Create and return a result."""
+        return self.F.ResultFactory.create(
+            runcaseversion=self.rcv,
+            environment=self.env,
+            tester=tester or self.tester,
+            status=status,
+            **kwargs)
+
+
+    def pointers(self):
+        """Return sorted list of (tester id, result id, status) pointers."""
+        return sorted(
+            self.model.LatestResult.objects.values_list(
+                "tester", "result", "status")
+            )
+
+
+    def test_unicode(self):
+        """Unicode representation names tester, rcv, env and result."""
+        r = self.result()
+
+        self.assertEqual(
+            unicode(self.model.LatestResult.objects.get()),
+            u"Latest result of {0} for rcv {1}, env {2}: {3}".format(
+                self.tester.id, self.rcv.id, self.env.id, r.id)
+            )
+
+
+    def test_new_result(self):
+        """Each new result replaces the tester's pointer."""
+        r1 = self.result("passed")
+        theirs = self.result("started", tester=self.other)
+        r2 = self.result("failed")
+
+        self.assertEqual(
+            self.pointers(),
+            [
+                (self.tester.id, r2.id, "failed"),
+                (self.other.id, theirs.id, "started"),
+                ]
+            )
+        self.assertFalse(self.refresh(r1).is_latest)
+        self.assertTrue(self.refresh(r2).is_latest)
+
+
+    def test_one_query_when_pointer_exists(self):
+        """Replacing an existing pointer is a single update."""
+        r1 = self.result("passed")
+        self.result("failed")
+
+        with self.assertNumQueries(1):
+            self.model.LatestResult.objects.set_latest(r1)
+
+        self.assertEqual(self.pointers(), [(self.tester.id, r1.id, "passed")])
+
+
+    def test_status_change(self):
+        """Changing the status of the latest result updates its pointer."""
+        r = self.result("started")
+        r.status = "passed"
+        r.save()
+
+        self.assertEqual(self.pointers(), [(self.tester.id, r.id, "passed")])
+
+
+    def test_set_latest_bulk(self):
+        """Replaces pointers of given results' keys, leaves others alone."""
+        old = self.result("passed")
+        theirs = self.result("passed", tester=self.other)
+        rcv2 = self.F.RunCaseVersionFactory.create()
+        new = [
+            self.model.Result.objects.create(
+                runcaseversion=rcv,
+                environment=self.env,
+                tester=self.tester,
+                status="failed",
+                )
+            for rcv in [self.rcv, rcv2]
+            ]
+        self.model.LatestResult.objects.all().delete()
+        self.model.LatestResult.objects.set_latest(old)
+        self.model.LatestResult.objects.set_latest(theirs)
+
+        self.model.LatestResult.objects.set_latest_bulk(new)
+
+        self.assertEqual(
+            self.pointers(),
+            sorted(
+                [
+                    (self.tester.id, new[0].id, "failed"),
+                    (self.tester.id, new[1].id, "failed"),
+                    (self.other.id, theirs.id, "passed"),
+                    ]
+                )
+            )
+
+
+    def test_rebuild(self):
+        """Rebuild fixes missing, wrong and stale pointers, counting them."""
+        self.result("passed")
+        r2 = self.result("failed")
+        theirs = self.result("started", tester=self.other)
+        self.model.LatestResult.objects.filter(tester=self.tester).delete()
+        self.model.LatestResult.objects.filter(tester=self.other).update(
+            status="passed")
+        orphan = self.F.ResultFactory.create()
+        self.model.Result.everything.filter(id=orphan.id).update(
+            runcaseversion=self.F.RunCaseVersionFactory.create())
+        self.model.LatestResult.objects.filter(result=orphan).update(
+            runcaseversion=self.rcv)
+
+        fixed = self.model.LatestResult.objects.rebuild([self.rcv.id])
+
+        self.assertEqual(fixed, 3)
+        self.assertEqual(
+            self.pointers(),
+            sorted(
+                [
+                    (self.tester.id, r2.id, "failed"),
+                    (self.other.id, theirs.id, "started"),
+                    ]
+                )
+            )
+
+
+    def test_rebuild_correct(self):
+        """Rebuild leaves correct pointers alone, in three queries."""
+        r = self.result("passed")
+
+        with self.assertNumQueries(3):
+            fixed = self.model.LatestResult.objects.rebuild([self.rcv.id])
+
+        self.assertEqual(fixed, 0)
+        self.assertEqual(self.pointers(), [(self.tester.id, r.id, "passed")])
@@ -0,0 +1,118 @@
+"""
+Tests for batch prefetching of what the run-tests page shows.
+
+"""
+from tests import case
+
+
+
+class PrefetchExecutionResultsTest(case.DBTestCase):
+    """Tests for ``prefetch_execution_results`` and its queryset flag."""
+    @property
+    def func(self):
+        """The function under test."""
+        from moztrap.model.execution.models import prefetch_execution_results
+        return prefetch_execution_results
+
+
+    def setUp(self):
+        """Set up a run with two rcvs, a tester and another tester."""
+        self.env = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Windows"]})[0]
+        self.run = self.F.RunFactory.create()
+        self.rcv1 = self.F.RunCaseVersionFactory.create(run=self.run)
+        self.rcv2 = self.F.RunCaseVersionFactory.create(run=self.run)
+        self.user = self.F.UserFactory.create()
+        self.other = self.F.UserFactory.create()
+
+
+    def result(self, rcv, tester, status, **kwargs):
+        """Create a result for ``rcv`` by ``tester`` in the environment."""
+        return self.F.ResultFactory.create(
+            runcaseversion=rcv,
+            tester=tester,
+            environment=self.env,
+            status=status,
+            **kwargs)
+
+
+    def test_results(self):
+        """Attaches the tester's result and another's completed result."""
+        mine = self.result(self.rcv1, self.user, "failed")
+        theirs = self.result(self.rcv1, self.other, "passed")
+        self.result(self.rcv2, self.other, "started")
+
+        rcvs = self.func([self.rcv1, self.rcv2], self.user, self.env)
+
+        self.assertEqual(rcvs[0]._prefetched_result_for, mine)
+        self.assertEqual(rcvs[0]._prefetched_other_result, theirs)
+        new = rcvs[1]._prefetched_result_for
+        self.assertIsNone(new.id)
+        self.assertEqual(
+            (new.tester, new.runcaseversion, new.environment, new.status),
+            (self.user, self.rcv2, self.env, "assigned"),
+            )
+        self.assertIsNone(rcvs[1]._prefetched_other_result)
+
+
+    def test_stepresults(self):
+        """Attaches step results of failed results by step id."""
+        mine = self.result(self.rcv1, self.user, "failed")
+        sr = self.F.StepResultFactory.create(
+            result=mine, bug_url="http://www.example.com/bug1")
+
+        rcvs = self.func([self.rcv1], self.user, self.env)
+
+        result = rcvs[0]._prefetched_result_for
+        self.assertEqual(result._prefetched_stepresults, {sr.step_id: sr})
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                result.bug_urls(), set(["http://www.example.com/bug1"]))
+
+
+    def test_suites(self):
+        """Attaches suites that are in the run and include the case."""
+        product = self.run.productversion.product
+        s1 = self.F.SuiteFactory.create(product=product)
+        s2 = self.F.SuiteFactory.create(product=product)
+        s3 = self.F.SuiteFactory.create(product=product)
+        for s in [s1, s2]:
+            self.F.RunSuiteFactory.create(run=self.run, suite=s)
+        for s in [s1, s2, s3]:
+            self.F.SuiteCaseFactory.create(
+                suite=s, case=self.rcv1.caseversion.case)
+
+        rcvs = self.func([self.rcv1, self.rcv2], self.user, self.env)
+
+        self.assertEqual(
+            sorted(s.id for s in rcvs[0]._prefetched_suites),
+            sorted([s1.id, s2.id]),
+            )
+        self.assertEqual(rcvs[1]._prefetched_suites, [])
+
+
+    def test_queryset(self):
+        """Evaluating a flagged queryset slice prefetches in a few queries."""
+        suite = self.F.SuiteFactory.create(
+            product=self.run.productversion.product)
+        self.F.RunSuiteFactory.create(run=self.run, suite=suite)
+        for i in range(3):
+            rcv = self.F.RunCaseVersionFactory.create(run=self.run)
+            self.F.SuiteCaseFactory.create(
+                suite=suite, case=rcv.caseversion.case)
+            self.result(rcv, self.user, "failed")
+            self.result(rcv, self.other, "passed")
+
+        qs = self.model.RunCaseVersion.objects.filter(
+            run=self.run).exclude(
+            pk__in=[self.rcv1.pk, self.rcv2.pk]).order_by(
+            "id").with_execution_results(self.user, self.env)
+
+        # runcaseversions, mine, others, step results, rcv cases, run suites,
+        # case suites, suites
+        with self.assertNumQueries(8):
+            rcvs = list(qs[:3])
+            for rcv in rcvs:
+                rcv._prefetched_result_for.bug_urls()
+                rcv._prefetched_other_result.tester
+                rcv._prefetched_suites
@@ -0,0 +1,107 @@
+"""
+Tests for batch prefetching of result summaries.
+
+"""
+from tests import case
+
+
+
+class PrefetchResultSummariesTest(case.DBTestCase):
+    """Tests for ``prefetch_result_summaries`` and ``with_result_summaries``."""
+    @property
+    def func(self):
+        """The function under test."""
+        from moztrap.model.execution.models import prefetch_result_summaries
+        return prefetch_result_summaries
+
+
+    def setUp(self):
+        """Set up two runs, one with two rcvs in two environments."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Windows", "Linux"]})
+        pv = self.F.ProductVersionFactory.create(environments=self.envs)
+        self.run = self.F.RunFactory.create(productversion=pv)
+        self.rcv1 = self.F.RunCaseVersionFactory.create(
+            run=self.run, caseversion__productversion=pv)
+        self.rcv2 = self.F.RunCaseVersionFactory.create(
+            run=self.run, caseversion__productversion=pv)
+        self.other = self.F.RunFactory.create(productversion=pv)
+
+        self.F.ResultFactory.create(
+            runcaseversion=self.rcv1, environment=self.envs[0], status="passed")
+        self.F.ResultFactory.create(
+            runcaseversion=self.rcv1, environment=self.envs[0], status="failed")
+        self.F.ResultFactory.create(
+            runcaseversion=self.rcv2,
+            environment=self.envs[1],
+            status="invalidated")
+        self.F.ResultFactory.create(
+            runcaseversion=self.rcv2, environment=self.envs[0], status="started")
+
+
+    def test_runs(self):
+        """Prefetched run summaries match the unprefetched ones."""
+        runs = self.func(self.model.Run.objects.order_by("id"))
+
+        self.assertEqual(
+            [(r.result_summary(), r.completion()) for r in runs],
+            [
+                ({"passed": 1, "failed": 1, "invalidated": 1}, 0.5),
+                ({"passed": 0, "failed": 0, "invalidated": 0}, 0),
+                ]
+            )
+
+
+    def test_runcaseversions(self):
+        """Prefetched rcv summaries match the unprefetched ones."""
+        rcvs = self.func(
+            self.model.RunCaseVersion.objects.filter(
+                run=self.run).order_by("id"))
+
+        self.assertEqual(
+            [(r.result_summary(), r.completion()) for r in rcvs],
+            [
+                ({"passed": 1, "failed": 1, "invalidated": 0}, 0.5),
+                ({"passed": 0, "failed": 0, "invalidated": 1}, 0.5),
+                ]
+            )
+
+
+    def test_deleted_results_ignored(self):
+        """Soft-deleted results are not counted."""
+        self.model.Result.objects.filter(status="invalidated").delete()
+
+        run = self.func([self.run])[0]
+
+        self.assertEqual(run.result_summary()["invalidated"], 0)
+        self.assertEqual(run.completion(), 0.25)
+
+
+    def test_one_query(self):
+        """All summaries for a page are fetched in a single query."""
+        runs = list(self.model.Run.objects.all())
+
+        with self.assertNumQueries(1):
+            self.func(runs)
+
+        with self.assertNumQueries(0):
+            for run in runs:
+                run.completion()
+                run.result_summary()
+
+
+    def test_empty(self):
+        """An empty page requires no queries."""
+        with self.assertNumQueries(0):
+            self.assertEqual(self.func([]), [])
+
+
+    def test_with_result_summaries(self):
+        """A queryset flagged ``with_result_summaries`` prefetches slices."""
+        qs = self.model.Run.objects.with_result_summaries().order_by("id")
+
+        with self.assertNumQueries(2):
+            runs = list(qs[:1])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(runs[0].completion(), 0.5)
@@ -52,10 +52,10 @@ class ResultTest(case.DBTestCase):
         u = self.F.UserFactory.create()
 
         rcv.result_pass(envs[0], user=u)
-        r1 = rcv.results.get(is_latest=True)
+        r1 = rcv.results.get(latest__isnull=False)
 
         rcv.result_fail(envs[0], user=u)
-        r2 = rcv.results.get(is_latest=True)
+        r2 = rcv.results.get(latest__isnull=False)
 
         r1 = self.refresh(r1)
         r1.comment="this is it"
@@ -67,3 +67,53 @@ class ResultTest(case.DBTestCase):
         self.assertEqual(r2.status, "failed")
         self.assertEqual(r2.is_latest, True)
         self.assertEqual(r1.is_latest, False)
+
+
+    def test_is_latest_select_related(self):
+        """is_latest of results selected with their pointers doesn't query."""
+        r1 = self.F.ResultFactory.create()
+        r2 = self.F.ResultFactory.create(
+            runcaseversion=r1.runcaseversion,
+            environment=r1.environment,
+            tester=r1.tester,
+            )
+
+        results = list(
+            self.model.Result.objects.select_related("latest").order_by("id"))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [r.is_latest for r in results], [False, True])
+
+
+    def test_is_latest_cached(self):
+        """is_latest queries once per instance, even if False."""
+        r1 = self.F.ResultFactory.create()
+        self.F.ResultFactory.create(
+            runcaseversion=r1.runcaseversion,
+            environment=r1.environment,
+            tester=r1.tester,
+            )
+        r1 = self.refresh(r1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(r1.is_latest, False)
+            self.assertEqual(r1.is_latest, False)
+
+
+    def test_with_labels(self):
+        """with_labels loads environment labels of all results at once."""
+        envs = self.F.EnvironmentFactory.create_full_set(
+                {"OS": ["OS X", "Linux"], "Language": ["English"]})
+        for env in envs:
+            self.F.ResultFactory.create(environment=env)
+
+        with self.assertNumQueries(2):
+            results = list(
+                self.model.Result.objects.select_related(
+                    "environment").with_labels())
+
+        with self.assertNumQueries(0):
+            labels = sorted(unicode(r.environment) for r in results)
+
+        self.assertEqual(labels, [u"English, Linux", u"English, OS X"])
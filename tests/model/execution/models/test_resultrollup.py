@@ -0,0 +1,322 @@
+"""
+Tests for ResultRollup model and manager.
+
+"""
+from mock import patch
+
+from tests import case
+
+
+
+class ResultRollupTest(case.DBTestCase):
+    """Tests for incremental maintenance of result rollups."""
+    def setUp(self):
+        """Set up a run with two rcvs in two environments."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Windows", "Linux"]})
+        pv = self.F.ProductVersionFactory.create(environments=self.envs)
+        self.run = self.F.RunFactory.create(productversion=pv)
+        self.rcv1 = self.F.RunCaseVersionFactory.create(
+            run=self.run, caseversion__productversion=pv)
+        self.rcv2 = self.F.RunCaseVersionFactory.create(
+            run=self.run, caseversion__productversion=pv)
+        self.tester = self.F.UserFactory.create()
+
+
+    def rollup(self, runcaseversion=None, environment=None):
+        """Return the stored rollup for this run and given rcv/env."""
+        return self.model.ResultRollup.objects._get(
+            run=self.run, runcaseversion=runcaseversion, environment=environment)
+
+
+    def counts(self, rollup):
+        """Return dict of counts of given rollup."""
+        return {
+            "passed": rollup.passed,
+            "failed": rollup.failed,
+            "invalidated": rollup.invalidated,
+            "completed": rollup.completed,
+            "total": rollup.total,
+            }
+
+
+    def test_totals(self):
+        """Each rcv/env combo counts toward total."""
+        self.assertEqual(self.rollup().total, 4)
+        self.assertEqual(self.rollup(runcaseversion=self.rcv1).total, 2)
+        self.assertEqual(self.rollup(environment=self.envs[0]).total, 2)
+
+
+    def test_result_save(self):
+        """Saving a result updates run, rcv, and run/env rollups."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+
+        expected = {
+            "passed": 1,
+            "failed": 0,
+            "invalidated": 0,
+            "completed": 1,
+            }
+        for rollup in [
+                self.rollup(),
+                self.rollup(runcaseversion=self.rcv1),
+                self.rollup(environment=self.envs[0]),
+                self.rollup(runcaseversion=self.rcv1, environment=self.envs[0]),
+                ]:
+            counts = self.counts(rollup)
+            del counts["total"]
+            self.assertEqual(counts, expected)
+
+
+    def test_new_latest_result(self):
+        """A new result by the same tester replaces the previous one."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+        self.rcv1.result_fail(self.envs[0], user=self.tester)
+
+        self.assertEqual(
+            self.counts(self.rollup()),
+            {
+                "passed": 0,
+                "failed": 1,
+                "invalidated": 0,
+                "completed": 1,
+                "total": 4,
+                }
+            )
+
+
+    def test_started_result(self):
+        """A result that isn't completed doesn't count."""
+        self.rcv1.start(self.envs[0], user=self.tester)
+
+        self.assertEqual(self.rollup().completed, 0)
+
+
+    def test_remove_envs(self):
+        """Removing environments from rcvs updates totals."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+
+        self.model.RunCaseVersion._remove_envs([self.rcv1], [self.envs[0]])
+
+        rollup = self.rollup()
+        self.assertEqual(rollup.total, 3)
+        self.assertEqual(rollup.passed, 1)
+
+
+    def test_rebuild_matches_incremental(self):
+        """Rebuilding from scratch gives the same counts."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+        self.rcv2.result_invalid(self.envs[1], user=self.tester)
+        self.rcv2.result_fail(self.envs[1], user=self.F.UserFactory.create())
+        before = self.counts(self.rollup())
+
+        self.model.ResultRollup.objects.rebuild([self.run.id])
+
+        self.assertEqual(self.counts(self.rollup()), before)
+
+
+    def test_read_without_rollups(self):
+        """A run without rollups reads as zeros, without building them."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+        self.model.ResultRollup.objects.all().delete()
+
+        self.assertEqual(self.run.completion(), 0)
+        self.assertEqual(self.rcv1.completion(), 0)
+        self.assertEqual(self.model.ResultRollup.objects.count(), 0)
+
+
+    def test_refresh_builds_run(self):
+        """A refresh of a run without rollups builds them all."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+        self.model.ResultRollup.objects.all().delete()
+
+        self.rcv2.result_fail(self.envs[0], user=self.tester)
+
+        self.assertEqual(self.run.completion(), 0.5)
+        self.assertEqual(self.rollup().total, 4)
+
+
+    def test_unique(self):
+        """There can only be one rollup per run, rcv and environment."""
+        from django.db import IntegrityError
+        with self.assertRaises(IntegrityError):
+            self.model.ResultRollup.objects.create(
+                run=self.run, runcaseversion=self.rcv1, environment=self.envs[0])
+
+
+    def test_concurrent_cell(self):
+        """A cell created since the refresh read the old cells is updated."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+        cell = self.rollup(runcaseversion=self.rcv1, environment=self.envs[0])
+        before = self.counts(self.rollup())
+        manager = self.model.ResultRollup.objects
+        real_create = manager._create
+
+        def _create(rollups):
+            # the cell appears, as if created by a concurrent refresh
+            self.model.ResultRollup.objects.bulk_create([cell])
+            return real_create(rollups)
+
+        cell.delete()
+        cell.id = None
+        with patch.object(manager, "_create", _create):
+            manager.refresh([self.rcv1], [self.envs[0].id])
+
+        self.assertEqual(self.counts(self.rollup()), before)
+        self.assertEqual(
+            self.model.ResultRollup.objects.filter(
+                runcaseversion=self.rcv1, environment=self.envs[0]).count(),
+            1,
+            )
+
+
+    def test_delete_result(self):
+        """Deleting and undeleting a result updates rollups."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+        result = self.model.Result.objects.get()
+
+        result.delete()
+
+        self.assertEqual(self.rollup().passed, 0)
+        self.assertEqual(self.rollup().completed, 0)
+
+        result.undelete()
+
+        self.assertEqual(self.rollup().passed, 1)
+        self.assertEqual(self.rollup().completed, 1)
+
+
+    def test_delete_result_permanently(self):
+        """Permanently deleting a result updates rollups."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+        result = self.model.Result.objects.get()
+
+        result.delete(permanent=True)
+
+        self.assertEqual(self.rollup().passed, 0)
+
+
+    def test_delete_results_queryset(self):
+        """Soft-deleting a queryset of results updates rollups."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+        self.rcv2.result_fail(self.envs[1], user=self.tester)
+
+        self.model.Result.objects.all().delete()
+
+        self.assertEqual(self.rollup().completed, 0)
+        self.assertEqual(self.rollup(environment=self.envs[1]).failed, 0)
+
+
+    def test_delete_runcaseversion(self):
+        """Soft-deleting a runcaseversion drops it from rollups."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+
+        self.rcv1.delete()
+
+        self.assertEqual(
+            self.counts(self.rollup()),
+            {
+                "passed": 0,
+                "failed": 0,
+                "invalidated": 0,
+                "completed": 0,
+                "total": 2,
+                }
+            )
+
+        self.rcv1.undelete()
+
+        self.assertEqual(self.rollup().total, 4)
+        self.assertEqual(self.rollup().passed, 1)
+
+
+    def test_soft_delete_run(self):
+        """Soft-deleting a run drops its runcaseversions from its rollups."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+
+        self.run.delete()
+
+        self.assertEqual(self.rollup().passed, 0)
+        self.assertEqual(self.rollup().total, 0)
+
+
+    def test_completed_fraction(self):
+        """Completed fraction is kept up to date as results come in."""
+        self.rcv1.result_pass(self.envs[0], user=self.tester)
+        self.rcv1.result_fail(self.envs[1], user=self.tester)
+
+        self.assertEqual(self.rollup().completed_fraction, 0.5)
+        self.assertEqual(
+            self.rollup(runcaseversion=self.rcv1).completed_fraction, 1)
+        self.assertEqual(
+            self.rollup(runcaseversion=self.rcv2).completed_fraction, 0)
+
+
+
+class CompletionQuerySetTest(case.DBTestCase):
+    """Tests for sorting and filtering runs and rcvs by completion."""
+    def setUp(self):
+        """Set up three runs, 0%, 50% and 100% complete."""
+        envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Windows", "Linux"]})
+        pv = self.F.ProductVersionFactory.create(environments=envs)
+        tester = self.F.UserFactory.create()
+        self.runs = []
+        self.rcvs = []
+        for done in [1, 0, 2]:
+            run = self.F.RunFactory.create(productversion=pv)
+            rcv = self.F.RunCaseVersionFactory.create(
+                run=run, caseversion__productversion=pv)
+            for env in envs[:done]:
+                rcv.result_pass(env, user=tester)
+            self.runs.append(run)
+            self.rcvs.append(rcv)
+
+
+    def test_order_by_completion(self):
+        """Runs can be ordered by completion."""
+        self.assertEqual(
+            list(self.model.Run.objects.order_by("-completion")),
+            [self.runs[2], self.runs[0], self.runs[1]],
+            )
+
+
+    def test_order_by_completion_rcvs(self):
+        """Runcaseversions can be ordered by completion."""
+        self.assertEqual(
+            list(self.model.RunCaseVersion.objects.order_by("completion")),
+            [self.rcvs[1], self.rcvs[0], self.rcvs[2]],
+            )
+
+
+    def test_with_completion(self):
+        """``with_completion`` annotates each object's completion fraction."""
+        run = self.model.Run.objects.with_completion().get(pk=self.runs[0].pk)
+
+        self.assertEqual(run.completion_fraction, 0.5)
+
+
+    def test_filter_completion(self):
+        """Runs can be filtered by ranges of completion."""
+        self.assertEqual(
+            set(self.model.Run.objects.filter_completion((0.5, 1), (1, None))),
+            set([self.runs[0], self.runs[2]]),
+            )
+
+
+    def test_filter_completion_rcvs(self):
+        """Runcaseversions can be filtered by completion."""
+        self.assertEqual(
+            list(self.model.RunCaseVersion.objects.filter_completion((1, None))),
+            [self.rcvs[2]],
+            )
+
+
+    def test_filter_completion_no_rollup(self):
+        """Runs without rollups count as zero complete."""
+        run = self.F.RunFactory.create()
+
+        self.assertEqual(
+            set(self.model.Run.objects.filter_completion((0, 0.25))),
+            set([self.runs[1], run]),
+            )
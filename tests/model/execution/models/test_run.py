@@ -642,7 +642,7 @@ class RunActivationTest(case.DBTestCase):
             ORDER BY rs.order, sc.order
             ",
 
-        Query 3-7: Get all the runcaseversions that are not in the result of
+        Query 3-8: Get all the runcaseversions that are not in the result of
          Query 2
             to be used for delete. and then delete them.
 
@@ -670,10 +670,18 @@ class RunActivationTest(case.DBTestCase):
             `execution_result`.`tester_id`, `execution_result`
             .`runcaseversion_id`, `execution_result`.`environment_id`,
             `execution_result`.`status`, `execution_result`.`comment`,
-            `execution_result`.`is_latest`, `execution_result`.`review`,
-            `execution_result`.`reviewed_by_id` FROM `execution_result`
+            `execution_result`.`review`, `execution_result`.`reviewed_by_id`
+            FROM `execution_result`
             WHERE `execution_result`.`runcaseversion_id` IN (1)",
 
+            "SELECT `execution_latestresult`.`id`,
+            `execution_latestresult`.`runcaseversion_id`,
+            `execution_latestresult`.`environment_id`,
+            `execution_latestresult`.`tester_id`,
+            `execution_latestresult`.`result_id`,
+            `execution_latestresult`.`status` FROM `execution_latestresult`
+            WHERE `execution_latestresult`.`runcaseversion_id` IN (1)",
+
             "DELETE FROM `execution_runcaseversion_suites` WHERE
             `runcaseversion_id` IN (1)",
 
@@ -682,7 +690,7 @@ class RunActivationTest(case.DBTestCase):
 
             "DELETE FROM `execution_runcaseversion` WHERE `id` IN (1)",
 
-        Query 8: Get existing runcaseversions with the caseversion ids so we
+        Query 9: Get existing runcaseversions with the caseversion ids so we
          can use
             Them to build the new RunCaseVersion objects we will only be
             updated
@@ -694,128 +702,46 @@ class RunActivationTest(case.DBTestCase):
             .`deleted_on` IS NULL AND `execution_runcaseversion`.`run_id` =
             1 ) ORDER BY `execution_runcaseversion`.`order` ASC",
 
-        Query 9: bulk insert for RunCaseVersions, updates if already existing
-
-            "INSERT INTO execution_runcaseversion (`id`, `created_on`,
-            `created_by_id`, `modified_on`, `modified_by_id`, `deleted_on`,
-            `deleted_by_id`, `cc_version`, `run_id`, `caseversion_id`,
-            `order`) VALUES (NULL, '2012-11-20 00:11:25.417158', NULL,
-            '2012-11-20 00:11:25.417176', NULL, NULL, NULL, 0, 1, 2, 1),
-            (NULL, '2012-11-20 00:11:25.417239', NULL,
-            '2012-11-20 00:11:25.417251', NULL, NULL, NULL, 0, 1, 3, 2),
-            (NULL, '2012-11-20 00:11:25.417298', NULL,
-            '2012-11-20 00:11:25.417310', NULL, NULL, NULL, 0, 1, 4, 3), (2,
-             '2012-11-20 00:11:25.417353', NULL, '2012-11-20 00:11:25
-             .417365', NULL, NULL, NULL, 0, 1, 5, 4), (NULL,
-             '2012-11-20 00:11:25.417411', NULL, '2012-11-20 00:11:25
-             .417423', NULL, NULL, NULL, 0, 1, 6, 5), (NULL,
-             '2012-11-20 00:11:25.417469', NULL, '2012-11-20 00:11:25
-             .417481', NULL, NULL, NULL, 0, 1, 7, 6) ON DUPLICATE KEY UPDATE
-              `caseversion_id`=VALUES(`caseversion_id`),
-              `run_id`=VALUES(`run_id`), `cc_version`=VALUES(`cc_version`),
-              `modified_by_id`=VALUES(`modified_by_id`),
-              `modified_on`=VALUES(`modified_on`), `order`=VALUES(`order`)",
-
-        Query 10: In order to add the runcaseversion_environment records,
-        we need to
-            have all the relevant runcaseversions and prefetch the
-            environments for the
-            caseversions
+        Query 10-11: bulk upsert of the existing RunCaseVersions (just
+            updating their order), then bulk insert of the new ones.
 
-            "SELECT `execution_runcaseversion`.`id`,
-            `execution_runcaseversion`.`created_on`,
-            `execution_runcaseversion`.`created_by_id`,
-            `execution_runcaseversion`.`modified_on`,
-            `execution_runcaseversion`.`modified_by_id`,
-            `execution_runcaseversion`.`deleted_on`,
-            `execution_runcaseversion`.`deleted_by_id`,
-            `execution_runcaseversion`.`cc_version`,
-            `execution_runcaseversion`.`run_id`, `execution_runcaseversion`
-            .`caseversion_id`, `execution_runcaseversion`.`order`,
-            `library_caseversion`.`id`, `library_caseversion`.`created_on`,
-            `library_caseversion`.`created_by_id`, `library_caseversion`
-            .`modified_on`, `library_caseversion`.`modified_by_id`,
-            `library_caseversion`.`deleted_on`, `library_caseversion`
-            .`deleted_by_id`, `library_caseversion`.`cc_version`,
-            `library_caseversion`.`status`, `library_caseversion`
-            .`productversion_id`, `library_caseversion`.`case_id`,
-            `library_caseversion`.`name`, `library_caseversion`
-            .`description`, `library_caseversion`.`latest`,
-            `library_caseversion`.`envs_narrowed` FROM
-            `execution_runcaseversion` INNER JOIN `library_caseversion` ON (
-            `execution_runcaseversion`.`caseversion_id` =
-            `library_caseversion`.`id`) WHERE (`execution_runcaseversion`
-            .`deleted_on` IS NULL AND `execution_runcaseversion`.`run_id` =
-            1 ) ORDER BY `execution_runcaseversion`.`order` ASC",
-
-        Query 11: This is the prefetch_related query used with Query 9.  Django
-            makes a separate query and links them in-memory.
-
-            "SELECT (`library_caseversion_environments`.`caseversion_id`) AS
-             `_prefetch_related_val`, `environments_environment`.`id`,
-             `environments_environment`.`created_on`,
-             `environments_environment`.`created_by_id`,
-             `environments_environment`.`modified_on`,
-             `environments_environment`.`modified_by_id`,
-             `environments_environment`.`deleted_on`,
-             `environments_environment`.`deleted_by_id`,
-             `environments_environment`.`cc_version`,
-             `environments_environment`.`profile_id` FROM
-             `environments_environment` INNER JOIN
-             `library_caseversion_environments` ON (
-             `environments_environment`.`id` =
-             `library_caseversion_environments`.`environment_id`) WHERE (
-             `environments_environment`.`deleted_on` IS NULL AND
-             `library_caseversion_environments`.`caseversion_id` IN (2, 3,
-             4, 5, 6, 7))",
-
-        Query 12: runcaseversion_environments that already existed that
-        pertain to
-            the runcaseversions that are still relevant.
-
-            "SELECT `execution_runcaseversion_environments`
-            .`runcaseversion_id`, `execution_runcaseversion_environments`
-            .`environment_id` FROM `execution_runcaseversion_environments`
-            WHERE `execution_runcaseversion_environments`
-            .`runcaseversion_id` IN (3, 4, 5, 2, 6, 7)",
+            "INSERT INTO "execution_runcaseversion" ("id", "created_on",
+            "created_by_id", "modified_on", "modified_by_id", "deleted_on",
+            "deleted_by_id", "cc_version", "run_id", "caseversion_id",
+            "order") VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE `modified_on` = VALUES(`modified_on`),
+            ..., `order` = VALUES(`order`)",
 
-        Query 13: Get the environments for this run so we can find the
-        intersection
-            with the caseversions.
-
-            "SELECT `environments_environment`.`id` FROM
-            `environments_environment` INNER JOIN
-            `execution_run_environments` ON (`environments_environment`.`id`
-             = `execution_run_environments`.`environment_id`) WHERE (
-             `environments_environment`.`deleted_on` IS NULL AND
-             `execution_run_environments`.`run_id` = 1 )",
+            "INSERT INTO "execution_runcaseversion" ("created_on",
+            "created_by_id", "modified_on", "modified_by_id", "deleted_on",
+            "deleted_by_id", "cc_version", "run_id", "caseversion_id",
+            "order") VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s),
+            (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s), ...",
 
-        Query 14: Find the runcaseversion_environments that are no longer
-        relevant.
+        Query 12: Get the ids of all runcaseversions in the run, one chunk
+            at a time, to update their environments.
 
-            "SELECT `execution_runcaseversion_environments`.`id`,
-            `execution_runcaseversion_environments`.`runcaseversion_id`,
-            `execution_runcaseversion_environments`.`environment_id` FROM
-            `execution_runcaseversion_environments`
-            WHERE ((`execution_runcaseversion_environments`.`runcaseversion_id`
-            = 2  AND `execution_runcaseversion_environments`.`environment_id`
-            = 5 ))",
+            "SELECT `execution_runcaseversion`.`id` FROM
+            `execution_runcaseversion` WHERE (`execution_runcaseversion`
+            .`deleted_on` IS NULL AND `execution_runcaseversion`.`run_id` = 1
+            AND `execution_runcaseversion`.`id` > 0 ) ORDER BY
+            `execution_runcaseversion`.`id` ASC LIMIT 500",
 
-        Query 15: Delete the runcaseversion_environments that pertained to the
-            caseversion that are no longer relevant.
+        Query 13: Delete the runcaseversion_environments in the chunk that
+            are not in both the caseversion's and the run's environments.
 
-            "DELETE FROM `execution_runcaseversion_environments` WHERE `id`
-            IN (9)",
+            "DELETE FROM `execution_runcaseversion_environments`
+            WHERE `execution_runcaseversion_environments`.runcaseversion_id
+            IN (2,3,4,5,6,7) AND NOT EXISTS (...)",
 
-        Query 16: Bulk insert of runcaseversion_environment mappings.
+        Query 14: Insert the missing runcaseversion_environments for the
+            chunk, joined from caseversion and run environments.
 
             "INSERT INTO `execution_runcaseversion_environments`
-            (`runcaseversion_id`, `environment_id`) VALUES (7, 3), (5, 4),
-            (3, 1), (3, 3), (6, 4), (7, 4), (5, 2), (6, 1), (4, 4), (3, 2),
-            (7, 1), (6, 3), (6, 2), (4, 3), (4, 2), (3, 4), (5, 1), (4, 1),
-            (7, 2), (5, 3)",
+            (runcaseversion_id, environment_id) SELECT r.id,
+            cve.environment_id FROM ... WHERE ... AND NOT EXISTS (...)",
 
-        Query 17: Update the test run to make it active.
+        Query 15: Update the test run to make it active.
 
             "UPDATE `execution_run` SET `created_on` = '2012-11-20 00:11:25',
             `created_by_id` = NULL, `modified_on` = '2012-11-20 00:11:25',
@@ -877,7 +803,7 @@ class RunActivationTest(case.DBTestCase):
         connection.queries = []
 
         try:
-            with self.assertNumQueries(16):
+            with self.assertNumQueries(24):
                 r.activate()
 
             # to debug, uncomment these lines:
@@ -891,10 +817,10 @@ class RunActivationTest(case.DBTestCase):
             updates = [x["sql"] for x in connection.queries if x["sql"].startswith("UPDATE")]
             deletes = [x["sql"] for x in connection.queries if x["sql"].startswith("DELETE")]
 
-            self.assertEqual(len(selects), 10)
-            self.assertEqual(len(inserts), 2)
-            self.assertEqual(len(updates), 1)
-            self.assertEqual(len(deletes), 3)
+            self.assertEqual(len(selects), 11)
+            self.assertEqual(len(inserts), 4)
+            self.assertEqual(len(updates), 3)
+            self.assertEqual(len(deletes), 6)
         except AssertionError as e:
             raise e
         finally:
@@ -1004,6 +930,173 @@ class RunActivationTest(case.DBTestCase):
 
 
 
+class RunIncrementalRefreshTest(case.DBTestCase):
+    """Tests for refreshing only what changed in an active run."""
+
+    def setUp(self):
+        """Set up an active run of a suite with two cases."""
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Linux", "Windows"]})
+        self.p = self.F.ProductFactory.create()
+        self.pv = self.F.ProductVersionFactory.create(
+            product=self.p, environments=self.envs)
+        self.suite = self.F.SuiteFactory.create(
+            product=self.p, status="active")
+        self.cvs = [self.add_case(order) for order in [1, 2]]
+        self.run = self.F.RunFactory.create(productversion=self.pv)
+        self.F.RunSuiteFactory.create(suite=self.suite, run=self.run)
+        self.run.activate()
+
+
+    def add_case(self, order):
+        """Add an active case to the suite and return its caseversion."""
+        cv = self.F.CaseVersionFactory.create(
+            productversion=self.pv, status="active")
+        self.F.SuiteCaseFactory.create(
+            suite=self.suite, case=cv.case, order=order)
+        return cv
+
+
+    def assertOrderedCaseVersions(self, caseversions):
+        """Assert that run has (only) ``caseversions`` in it (in order)."""
+        self.assertEqual(
+            [rcv.caseversion.id for rcv in self.run.runcaseversions.all()],
+            [cv.id for cv in caseversions]
+            )
+
+
+    def test_records_lock_time(self):
+        """Locking the run records when it was done."""
+        self.assertIsNotNone(self.refresh(self.run).locked_on)
+
+
+    def test_added_case(self):
+        """A case added to a suite is added to the run, in order."""
+        cv = self.add_case(0)
+
+        self.run.refresh()
+
+        self.assertOrderedCaseVersions([cv] + self.cvs)
+        rcv = self.run.runcaseversions.get(caseversion=cv)
+        self.assertEqual(set(rcv.environments.all()), set(self.envs))
+
+
+    def test_removed_case(self):
+        """A case removed from a suite is removed from the run."""
+        self.model.SuiteCase.objects.filter(
+            case=self.cvs[0].case).delete(permanent=True)
+
+        self.run.refresh()
+
+        self.assertOrderedCaseVersions(self.cvs[1:])
+
+
+    def test_deactivated_caseversion(self):
+        """A caseversion no longer active is removed from the run."""
+        self.cvs[1].deactivate()
+
+        self.run.refresh()
+
+        self.assertOrderedCaseVersions(self.cvs[:1])
+
+
+    def test_added_environment(self):
+        """Environments added to a caseversion are added to its rcv."""
+        rcv = self.run.runcaseversions.get(caseversion=self.cvs[0])
+        rcv.remove_envs(self.envs[0])
+        self.cvs[0].environments.remove(self.envs[0])
+        self.cvs[0].environments.add(self.envs[0])
+
+        self.run.refresh()
+
+        self.assertEqual(set(rcv.environments.all()), set(self.envs))
+
+
+    def test_rollups_updated(self):
+        """Result rollups reflect removed and added cases."""
+        rcv = self.run.runcaseversions.get(caseversion=self.cvs[0])
+        rcv.result_pass(self.envs[0], user=self.F.UserFactory.create())
+        self.model.SuiteCase.objects.filter(
+            case=self.cvs[0].case).delete(permanent=True)
+        self.add_case(3)
+
+        self.run.refresh()
+
+        self.assertEqual(
+            self.refresh(self.run).result_summary()["passed"], 0)
+        self.assertEqual(self.run.completion(), 0)
+        self.assertEqual(
+            self.model.ResultRollup.objects.for_run(self.run).total, 4)
+
+
+    def test_unchanged_rcvs_untouched(self):
+        """Runcaseversions of unchanged cases aren't rewritten."""
+        self.model.Run.objects.filter(pk=self.run.pk).update(
+            locked_on=datetime.datetime.utcnow() + datetime.timedelta(1))
+        self.run = self.refresh(self.run)
+        before = list(
+            self.run.runcaseversions.values_list("id", "modified_on"))
+
+        with patch.object(Run, "_refresh_cases") as refresh_cases:
+            self.run.refresh()
+
+        self.assertEqual(refresh_cases.call_count, 0)
+        self.assertEqual(
+            list(self.run.runcaseversions.values_list("id", "modified_on")),
+            before)
+
+
+    def test_runsuite_change_locks(self):
+        """Changes to the run's suites fall back to a full lock."""
+        suite = self.F.SuiteFactory.create(product=self.p, status="active")
+        self.F.RunSuiteFactory.create(suite=suite, run=self.run)
+
+        with patch.object(Run, "_lock_case_versions") as lock:
+            self.run.refresh()
+
+        lock.assert_called_once_with()
+
+
+    def test_run_environment_added_locks(self):
+        """Adding an environment to the run falls back to a full lock."""
+        self.model.Run.objects.filter(pk=self.run.pk).update(
+            locked_on=datetime.datetime.utcnow() + datetime.timedelta(1))
+        self.run = self.refresh(self.run)
+        env = self.F.EnvironmentFactory.create()
+        self.run.environments.add(env)
+
+        with patch.object(Run, "_lock_case_versions") as lock:
+            self.run.refresh()
+
+        lock.assert_called_once_with()
+
+
+    def test_pending_changes_cleared(self):
+        """Refreshing clears recorded pending changes."""
+        self.model.SuiteCase.objects.filter(
+            case=self.cvs[0].case).delete(permanent=True)
+        self.assertEqual(self.run.pending_changes.count(), 1)
+
+        self.run.refresh()
+
+        self.assertEqual(self.run.pending_changes.count(), 0)
+
+
+    def test_draft_run_not_recorded(self):
+        """Changes aren't recorded for runs that aren't active."""
+        self.run.draft()
+        self.model.SuiteCase.objects.filter(
+            case=self.cvs[0].case).delete(permanent=True)
+
+        self.assertEqual(self.run.pending_changes.count(), 0)
+
+
+    def test_clone_not_locked(self):
+        """A cloned run hasn't been locked."""
+        self.assertIsNone(self.run.clone().locked_on)
+
+
+
 class RefreshTransactionTest(case.TransactionTestCase):
     """Tests for ``Importer`` transactional behavior."""
 
@@ -220,7 +220,8 @@ class RunCaseVersionTest(case.DBTestCase):
 
         rcv.start(environment=envs[0], user=u)
 
-        r = rcv.results.get(environment=envs[0], tester=u, is_latest=True)
+        r = rcv.results.get(
+            environment=envs[0], tester=u, latest__isnull=False)
         self.assertEqual(r.status, "started")
 
 
@@ -234,7 +235,8 @@ class RunCaseVersionTest(case.DBTestCase):
 
         rcv.start(environment=envs[0], user=u)
 
-        r = rcv.results.get(environment=envs[0], tester=u, is_latest=True)
+        r = rcv.results.get(
+            environment=envs[0], tester=u, latest__isnull=False)
         self.assertEqual(r.modified_by, u)
 
 
@@ -248,7 +250,8 @@ class RunCaseVersionTest(case.DBTestCase):
 
         rcv.result_pass(envs[0], user=u)
 
-        r = rcv.results.get(environment=envs[0], tester=u, is_latest=True)
+        r = rcv.results.get(
+            environment=envs[0], tester=u, latest__isnull=False)
         self.assertEqual(r.status, "passed")
 
 
@@ -263,7 +266,8 @@ class RunCaseVersionTest(case.DBTestCase):
         rcv.start(envs[0], user=u)
         rcv.result_pass(envs[0], user=u)
 
-        r = rcv.results.get(environment=envs[0], tester=u, is_latest=True)
+        r = rcv.results.get(
+            environment=envs[0], tester=u, latest__isnull=False)
         self.assertEqual(r.status, "passed")
 
 
@@ -292,7 +296,7 @@ class RunCaseVersionTest(case.DBTestCase):
         rcv.start(environment=envs[0], user=u)
         rcv.result_invalid(environment=envs[0], user=u)
 
-        r = rcv.results.get(is_latest=True)
+        r = rcv.results.get(latest__isnull=False)
         self.assertEqual(r.status, "invalidated")
 
 
@@ -311,7 +315,8 @@ class RunCaseVersionTest(case.DBTestCase):
             comment="and this is why",
             )
 
-        r = rcv.results.get(environment=envs[0], tester=u, is_latest=True)
+        r = rcv.results.get(
+            environment=envs[0], tester=u, latest__isnull=False)
         self.assertEqual(self.refresh(r).comment, "and this is why")
 
 
@@ -340,7 +345,7 @@ class RunCaseVersionTest(case.DBTestCase):
         rcv.start(environment=envs[0], user=u)
         rcv.result_fail(environment=envs[0], user=u)
 
-        r = rcv.results.get(is_latest=True)
+        r = rcv.results.get(latest__isnull=False)
         self.assertEqual(r.status, "failed")
 
 
@@ -359,7 +364,8 @@ class RunCaseVersionTest(case.DBTestCase):
             comment="and this is why",
             )
 
-        r = rcv.results.get(environment=envs[0], tester=u, is_latest=True)
+        r = rcv.results.get(
+            environment=envs[0], tester=u, latest__isnull=False)
 
         self.assertEqual(self.refresh(r).comment, "and this is why")
 
@@ -383,7 +389,7 @@ class RunCaseVersionTest(case.DBTestCase):
             stepnumber=1,
             )
 
-        r = rcv.results.get(is_latest=True)
+        r = rcv.results.get(latest__isnull=False)
 
         sr = r.stepresults.get()
         self.assertEqual(sr.step, step)
@@ -404,7 +410,7 @@ class RunCaseVersionTest(case.DBTestCase):
 
         rcv.result_pass(environment=envs[0], user=u)
 
-        pass_r = rcv.results.get(is_latest=True)
+        pass_r = rcv.results.get(latest__isnull=False)
         sr = self.F.StepResultFactory.create(result=pass_r, step=step, status="passed")
 
         rcv.result_fail(
@@ -413,7 +419,7 @@ class RunCaseVersionTest(case.DBTestCase):
             stepnumber=1,
             )
 
-        fail_r = rcv.results.get(is_latest=True)
+        fail_r = rcv.results.get(latest__isnull=False)
         new_sr = fail_r.stepresults.get()
         self.assertNotEqual(new_sr, sr)
         self.assertEqual(new_sr.step, step)
@@ -439,7 +445,7 @@ class RunCaseVersionTest(case.DBTestCase):
             bug="http://www.example.com/",
             )
 
-        r = rcv.results.get(is_latest=True)
+        r = rcv.results.get(latest__isnull=False)
         sr = r.stepresults.get()
         self.assertEqual(sr.bug_url, "http://www.example.com/")
 
@@ -462,5 +468,5 @@ class RunCaseVersionTest(case.DBTestCase):
             stepnumber="2",
             )
 
-        r = rcv.results.get(is_latest=True)
+        r = rcv.results.get(latest__isnull=False)
         self.assertEqual(r.stepresults.count(), 0)
@@ -0,0 +1,302 @@
+"""
+Tests for bulk result importer.
+
+"""
+from cStringIO import StringIO
+
+from mock import patch
+
+from tests import case
+
+
+
+class ResultImporterTest(case.DBTestCase):
+    """Tests for ResultImporter."""
+    def setUp(self):
+        """Set up a run with two caseversions in one environment."""
+        self.user = self.F.UserFactory.create()
+        self.envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X", "Linux"]})
+        self.run = self.F.RunFactory.create()
+        self.rcv1 = self.F.RunCaseVersionFactory.create(
+            run=self.run, environments=[self.envs[0]])
+        self.rcv2 = self.F.RunCaseVersionFactory.create(
+            run=self.run, environments=[self.envs[0]])
+        self.step = self.F.CaseStepFactory.create(
+            caseversion=self.rcv2.caseversion, number=1)
+
+
+    def data(self, rcv, status="passed", **kwargs):
+        """Return result data for given runcaseversion."""
+        data = {
+            "case": unicode(rcv.caseversion.case_id),
+            "environment": unicode(self.envs[0].id),
+            "run_id": unicode(self.run.id),
+            "status": status,
+            }
+        data.update(kwargs)
+        return data
+
+
+    def import_results(self, results):
+        """Import given result data and return the import result."""
+        from moztrap.model.execution.importer import ResultImporter
+        return ResultImporter(self.user).import_results(results)
+
+
+    def test_create(self):
+        """Creates results, step results and rollups."""
+        r = self.import_results(
+            [
+                self.data(self.rcv1, comment="fine"),
+                self.data(
+                    self.rcv2, "failed", stepnumber=1, bug="http://bug/1"),
+                ]
+            )
+
+        self.assertEqual(r.as_dict(), {"created": 2, "errors": []})
+        result = self.model.Result.objects.get(runcaseversion=self.rcv1)
+        self.assertEqual(result.status, "passed")
+        self.assertEqual(result.comment, "fine")
+        self.assertEqual(result.tester, self.user)
+        self.assertEqual(result.created_by, self.user)
+        self.assertTrue(result.is_latest)
+        failed = self.model.Result.objects.get(runcaseversion=self.rcv2)
+        self.assertEqual(failed.bug_urls(), set(["http://bug/1"]))
+        self.assertEqual(failed.stepresults.get().step, self.step)
+        self.assertEqual(self.refresh(self.run).result_summary()["passed"], 1)
+
+
+    def test_unknown_step_ignored(self):
+        """A failed result for an unknown step number has no step result."""
+        self.import_results([self.data(self.rcv2, "failed", stepnumber=5)])
+
+        result = self.model.Result.objects.get(runcaseversion=self.rcv2)
+        self.assertEqual(result.stepresults.count(), 0)
+
+
+    def test_step_results_match_duplicates(self):
+        """Step results go to the right result of repeated submissions."""
+        self.import_results(
+            [
+                self.data(self.rcv2, "failed", stepnumber=1, bug="http://1"),
+                self.data(self.rcv2, "passed"),
+                self.data(self.rcv2, "failed", stepnumber=1, bug="http://3"),
+                ]
+            )
+
+        results = self.model.Result.objects.filter(runcaseversion=self.rcv2)
+        self.assertEqual(
+            sorted((r.status, r.bug_urls(), r.is_latest) for r in results),
+            [
+                ("failed", set(["http://1"]), False),
+                ("failed", set(["http://3"]), True),
+                ("passed", set(), False),
+                ]
+            )
+
+
+    def test_unsets_latest(self):
+        """Earlier latest results of the tester are no longer latest."""
+        old = self.F.ResultFactory.create(
+            runcaseversion=self.rcv1,
+            environment=self.envs[0],
+            tester=self.user,
+            status="failed",
+            )
+        other = self.F.ResultFactory.create(
+            runcaseversion=self.rcv1,
+            environment=self.envs[0],
+            status="failed",
+            )
+
+        self.import_results([self.data(self.rcv1)])
+
+        self.assertFalse(self.refresh(old).is_latest)
+        self.assertTrue(self.refresh(other).is_latest)
+
+
+    def test_errors(self):
+        """Reports an error for each invalid result, and saves nothing."""
+        r = self.import_results(
+            [
+                self.data(self.rcv1),
+                {"case": "1"},
+                self.data(self.rcv1, "started"),
+                self.data(self.rcv1, environment="foo"),
+                self.data(self.rcv1, environment="0"),
+                self.data(self.rcv1, environment=unicode(self.envs[1].id)),
+                ]
+            )
+
+        self.assertEqual(r.created, 0)
+        self.assertEqual([e["index"] for e in r.errors], [1, 2, 3, 4, 5])
+        self.assertEqual(r.errors[1]["error"], "Unknown status: started")
+        self.assertEqual(r.errors[2]["error"], "Invalid environment: foo")
+        self.assertEqual(r.errors[3]["error"], "Environment 0 does not exist")
+        self.assertTrue(
+            r.errors[4]["error"].startswith("RunCaseVersion not found"))
+        self.assertEqual(self.model.Result.objects.count(), 0)
+
+
+    def test_query_count(self):
+        """Number of queries doesn't depend on the number of results."""
+        rcvs = [
+            self.F.RunCaseVersionFactory.create(
+                run=self.run, environments=[self.envs[0]])
+            for i in range(5)
+            ]
+        for rcv in rcvs:
+            self.F.CaseStepFactory.create(caseversion=rcv.caseversion)
+
+        # rollups are refreshed (per runcaseversion) in one call
+        with patch(
+                "moztrap.model.execution.importer.ResultRollup.objects."
+                "refresh") as refresh:
+            with self.assertNumQueries(9):
+                self.import_results(
+                    [self.data(rcv, "failed", stepnumber=1) for rcv in rcvs]
+                    + [self.data(self.rcv2, "failed", stepnumber=1)]
+                    )
+
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(
+            self.model.StepResult.objects.filter(
+                result__tester=self.user).count(),
+            6,
+            )
+
+
+
+class ResultFileImporterTest(case.DBTestCase):
+    """Tests for ResultFileImporter."""
+    def setUp(self):
+        """Set up a run with two cases, one with an idprefix."""
+        self.user = self.F.UserFactory.create()
+        self.env = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X"]})[0]
+        self.run = self.F.RunFactory.create(status="active")
+        self.rcv1 = self.F.RunCaseVersionFactory.create(
+            run=self.run, environments=[self.env])
+        self.rcv2 = self.F.RunCaseVersionFactory.create(
+            run=self.run,
+            caseversion__case__idprefix="ab",
+            environments=[self.env],
+            )
+
+
+    def import_file(self, tap, **kwargs):
+        """Import given TAP string and return the import result."""
+        from moztrap.model.execution.importer import ResultFileImporter
+        importer = ResultFileImporter(self.run, self.env, self.user, **kwargs)
+        return importer.import_file(StringIO(tap), "tap")
+
+
+    def test_import(self):
+        """Matches results by case id and prefix; reports unmatched."""
+        r = self.import_file(
+            "ok 1 - {0} passes\n"
+            "not ok 2 - ab-{1} fails\n"
+            "ok 3 - xy-{0} wrong prefix\n"
+            "ok 4 - 0 not in run\n"
+            "ok 5 - no case\n".format(
+                self.rcv1.caseversion.case_id, self.rcv2.caseversion.case_id),
+            batch_size=2,
+            )
+
+        self.assertEqual(r.created, 2)
+        self.assertEqual(
+            r.sorted_unmatched(),
+            [
+                "0 not in run",
+                "no case",
+                "xy-{0} wrong prefix".format(self.rcv1.caseversion.case_id),
+                ]
+            )
+        self.assertEqual(r.errors, [])
+        self.assertEqual(
+            self.rcv1.results.get(environment=self.env).status, "passed")
+        self.assertEqual(
+            self.rcv2.results.get(environment=self.env).status, "failed")
+
+
+    def test_run_not_active(self):
+        """Results can't be imported into a run that isn't active."""
+        from moztrap.model.execution.importer import (
+            ResultFileImporter, RunNotActive)
+        self.run.status = self.model.Run.STATUS.disabled
+        self.run.save()
+
+        with self.assertRaises(RunNotActive):
+            ResultFileImporter(self.run, self.env, self.user)
+
+
+    def test_invalid_results_reported(self):
+        """Results the run doesn't take are reported, others are saved."""
+        other_env = self.F.EnvironmentFactory.create()
+        from moztrap.model.execution.importer import ResultFileImporter
+        importer = ResultFileImporter(self.run, other_env, self.user)
+
+        r = importer.import_file(
+            StringIO(
+                '{{"case": {0}, "status": "bogus", "environment": {1}}}\n'
+                '{{"case": {0}, "status": "passed"}}\n'
+                '{{"case": {0}, "status": "passed", "environment": {1}}}\n'
+                .format(self.rcv1.caseversion.case_id, self.env.id)
+                ),
+            "ndjson",
+            )
+
+        self.assertEqual(r.created, 1)
+        self.assertEqual(len(r.errors), 2)
+        self.assertTrue(r.errors[0].endswith("Unknown status: bogus"))
+        self.assertIn("RunCaseVersion not found", r.errors[1])
+
+
+    def test_report(self):
+        """Report lists throughput, unmatched tests and errors."""
+        from moztrap.model.execution.importer import ResultFileImportResult
+        r = ResultFileImportResult()
+        r.created, r.seconds = 10, 2
+        r.add_unmatched("b")
+        r.add_unmatched("a")
+        r.add_error("c: Unknown status: bogus")
+
+        self.assertEqual(
+            r.get_as_list(),
+            [
+                "Imported 10 results in 2.00s (5.0 results/s).",
+                "2 unmatched tests:",
+                "  a",
+                "  b",
+                "1 invalid results:",
+                "  c: Unknown status: bogus",
+                ]
+            )
+
+
+
+    def test_report_capped(self):
+        """Only the first MAX_REPORTED unmatched tests and errors are kept."""
+        from moztrap.model.execution.importer import ResultFileImportResult
+        r = ResultFileImportResult()
+        with patch("moztrap.model.execution.importer.MAX_REPORTED", 2):
+            for ref in ["c", "b", "a"]:
+                r.add_unmatched(ref)
+                r.add_error("{0}: Unknown status: bogus".format(ref))
+
+        self.assertEqual(r.num_unmatched, 3)
+        self.assertEqual(r.num_errors, 3)
+        self.assertEqual(
+            r.get_as_list()[1:],
+            [
+                "3 unmatched tests:",
+                "  b",
+                "  c",
+                "  ... and 1 more",
+                "3 invalid results:",
+                "  c: Unknown status: bogus",
+                "  b: Unknown status: bogus",
+                "  ... and 1 more",
+                ]
+            )
@@ -0,0 +1,167 @@
+"""
+Tests for result file parsers.
+
+"""
+from cStringIO import StringIO
+
+from django.utils.unittest import TestCase
+
+
+
+class ParseCaseRefTest(TestCase):
+    """Tests for parse_case_ref."""
+    def parse(self, name):
+        from moztrap.model.execution.resultfiles import parse_case_ref
+        return parse_case_ref(name)
+
+
+    def test_id(self):
+        """A leading case id."""
+        self.assertEqual(self.parse("12 opens the url"), (None, 12))
+
+
+    def test_prefix(self):
+        """A leading prefixed case id."""
+        self.assertEqual(self.parse("ab-12: opens the url"), ("ab", 12))
+
+
+    def test_tagged(self):
+        """A case reference after a hash anywhere in the name."""
+        self.assertEqual(self.parse("test_open_url #ab-12"), ("ab", 12))
+
+
+    def test_none(self):
+        """A name without a case reference."""
+        self.assertEqual(self.parse("test_open_url2"), (None, None))
+
+
+
+class ParseJUnitTest(TestCase):
+    """Tests for parse_junit."""
+    def parse(self, xml):
+        from moztrap.model.execution.resultfiles import parse_junit
+        return list(parse_junit(StringIO(xml)))
+
+
+    def test_statuses(self):
+        """Passed, failed, errored and skipped test cases."""
+        results = self.parse(
+            """<?xml version="1.0"?>
+            <testsuites>
+              <testsuite name="suite">
+                <testcase classname="t" name="1 passes"/>
+                <testcase classname="t" name="ab-2 fails">
+                  <failure message="Expected foo.">trace</failure>
+                </testcase>
+                <testcase classname="t" name="3 errors">
+                  <error>Boom.</error>
+                </testcase>
+                <testcase classname="t" name="4 skipped"><skipped/></testcase>
+              </testsuite>
+            </testsuites>
+            """)
+
+        self.assertEqual(
+            [(r["prefix"], r["case"], r["status"], r["comment"])
+             for r in results],
+            [
+                (None, 1, "passed", ""),
+                ("ab", 2, "failed", "Expected foo."),
+                (None, 3, "failed", "Boom."),
+                ]
+            )
+        self.assertEqual(results[0]["ref"], "1 passes")
+
+
+    def test_bad_xml(self):
+        """Unparseable XML raises ResultFileError."""
+        from moztrap.model.execution.resultfiles import ResultFileError
+        with self.assertRaises(ResultFileError):
+            self.parse("<testsuite><testcase name='1'></testsuite>")
+
+
+
+class ParseTAPTest(TestCase):
+    """Tests for parse_tap."""
+    def parse(self, tap):
+        from moztrap.model.execution.resultfiles import parse_tap
+        return list(parse_tap(StringIO(tap)))
+
+
+    def test_statuses(self):
+        """Passed, failed, skipped and todo tests; stops at bail out."""
+        results = self.parse(
+            "1..6\n"
+            "ok 1 - 1 passes\n"
+            "not ok 2 - fails #ab-2\n"
+            "  ---\n"
+            "  message: nope\n"
+            "  ...\n"
+            "ok 3 - 3 skipped # SKIP no network\n"
+            "not ok 4 - 4 not yet # TODO later\n"
+            "ok 5\n"
+            "Bail out! Out of memory.\n"
+            "ok 6 - 6 never run\n"
+            )
+
+        self.assertEqual(
+            [(r["prefix"], r["case"], r["status"]) for r in results],
+            [
+                (None, 1, "passed"),
+                ("ab", 2, "failed"),
+                (None, None, "passed"),
+                ]
+            )
+
+
+
+class ParseNDJSONTest(TestCase):
+    """Tests for parse_ndjson."""
+    def parse(self, ndjson):
+        from moztrap.model.execution.resultfiles import parse_ndjson
+        return list(parse_ndjson(StringIO(ndjson)))
+
+
+    def test_records(self):
+        """Each line is a result; optional keys are passed on."""
+        results = self.parse(
+            '{"case": 1, "status": "passed"}\n'
+            '\n'
+            '{"case": "ab-2", "status": "failed", "comment": "No.", '
+            '"bug": "http://bug/1", "stepnumber": 1, "environment": 3}\n'
+            )
+
+        self.assertEqual(results[0]["case"], 1)
+        self.assertEqual(
+            results[1],
+            {
+                "ref": "ab-2",
+                "prefix": "ab",
+                "case": 2,
+                "status": "failed",
+                "comment": "No.",
+                "bug": "http://bug/1",
+                "stepnumber": 1,
+                "environment": 3,
+                }
+            )
+
+
+    def test_bad_json(self):
+        """Unparseable line raises ResultFileError naming the line."""
+        from moztrap.model.execution.resultfiles import ResultFileError
+        with self.assertRaises(ResultFileError) as cm:
+            self.parse('{"case": 1, "status": "passed"}\n{"case": \n')
+
+        self.assertIn("line 2", str(cm.exception))
+
+
+
+class GuessFormatTest(TestCase):
+    """Tests for guess_format."""
+    def test_guess(self):
+        from moztrap.model.execution.resultfiles import guess_format
+        self.assertEqual(guess_format("results.XML"), "junit")
+        self.assertEqual(guess_format("results.tap"), "tap")
+        self.assertEqual(guess_format("results.jsonl"), "ndjson")
+        self.assertEqual(guess_format("results.txt"), None)
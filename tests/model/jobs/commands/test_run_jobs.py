@@ -0,0 +1,70 @@
+"""
+Tests for management command to run background jobs.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+from django.test.utils import override_settings
+
+from mock import patch
+
+from tests import case
+
+
+
+@override_settings(ASYNC_JOBS=True)
+class RunJobsTest(case.DBTestCase):
+    """Tests for run_jobs management command."""
+    def call_command(self, *args, **kwargs):
+        """
+        Runs the management command and returns (stdout, stderr) output.
+
+        Also patch ``sys.exit`` so a ``CommandError`` doesn't cause an exit.
+
+        """
+        with patch("sys.stdout", StringIO()) as stdout:
+            with patch("sys.stderr", StringIO()) as stderr:
+                with patch("sys.exit"):
+                    call_command("run_jobs", *args, **kwargs)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return (stdout.read(), stderr.read())
+
+
+    def test_runs_queued(self):
+        """Runs queued jobs, then exits with --once."""
+        e = self.F.ElementFactory.create()
+        job = self.model.Job.objects.enqueue(
+            "generate_profile", name="Foo", element_ids=[e.id])
+
+        output = self.call_command(once=True)
+
+        self.assertEqual(output, ("Ran 1 job(s).\n", ""))
+        self.assertEqual(self.refresh(job).status, "done")
+        self.assertEqual(self.model.Profile.objects.get().name, "Foo")
+
+
+    def test_reports_failed(self):
+        """Failed jobs are reported."""
+        job = self.model.Job.objects.enqueue("activate_run", run_id=0)
+
+        output = self.call_command(once=True)
+
+        self.assertEqual(
+            output,
+            (
+                "activate_run job {0} (failed)\nRan 1 job(s).\n".format(
+                    job.id),
+                "",
+                )
+            )
+
+
+    def test_bad_interval(self):
+        """Interval must be positive."""
+        output = self.call_command(interval=0)
+
+        self.assertEqual(
+            output, ("", "Error: Usage: [--once] [--interval <seconds>]\n"))
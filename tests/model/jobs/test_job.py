@@ -0,0 +1,274 @@
+"""
+Tests for Job model and manager.
+
+"""
+import datetime
+
+from django.test.utils import override_settings
+
+from mock import patch
+
+from tests import case
+
+
+
+class JobTest(case.DBTestCase):
+    """Tests for queueing and running jobs."""
+    def setUp(self):
+        """Register a task for the tests that records its calls."""
+        self.calls = []
+        self.registry = {"record": self.record, "fail": self.fail_task}
+        patcher = patch(
+            "moztrap.model.jobs.tasks.registry", self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+    def record(self, job, **kwargs):
+        """A task recording its arguments and reporting progress."""
+        self.calls.append(kwargs)
+        job.set_progress(1, 2)
+        return {"ok": True}
+
+
+    def fail_task(self, job):
+        """A task that fails."""
+        raise ValueError("Oops.")
+
+
+    def test_enqueue_runs_inline(self):
+        """Without ASYNC_JOBS, a queued job is run right away."""
+        job = self.model.Job.objects.enqueue("record", foo=1)
+
+        self.assertEqual(self.calls, [{"foo": 1}])
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.get_result(), {"ok": True})
+        self.assertIsNotNone(job.finished_on)
+
+
+    @override_settings(ASYNC_JOBS=True)
+    def test_enqueue_async(self):
+        """With ASYNC_JOBS, a queued job is left for the worker."""
+        job = self.model.Job.objects.enqueue("record", foo=1)
+
+        self.assertEqual(self.calls, [])
+        self.assertEqual(job.status, "queued")
+        self.assertFalse(job.finished)
+
+
+    def test_enqueue_unknown(self):
+        """Queueing an unknown task is an error."""
+        with self.assertRaises(ValueError):
+            self.model.Job.objects.enqueue("foo")
+
+
+    @override_settings(ASYNC_JOBS=True)
+    def test_enqueue_unique(self):
+        """A unique job isn't queued again while unfinished."""
+        job = self.model.Job.objects.enqueue("record", unique=True, foo=1)
+
+        self.assertEqual(
+            self.model.Job.objects.enqueue("record", unique=True, foo=1), job)
+        self.assertNotEqual(
+            self.model.Job.objects.enqueue("record", unique=True, foo=2), job)
+
+
+    def test_enqueue_inline_failure(self):
+        """A job failing inline raises the error."""
+        with self.assertRaises(ValueError):
+            self.model.Job.objects.enqueue("fail")
+
+
+    @override_settings(ASYNC_JOBS=True)
+    def test_claim(self):
+        """Claiming marks the oldest queued job running."""
+        job1 = self.model.Job.objects.enqueue("record")
+        job2 = self.model.Job.objects.enqueue("record")
+
+        claimed = self.model.Job.objects.claim()
+
+        self.assertEqual(claimed, job1)
+        self.assertEqual(claimed.status, "running")
+        self.assertIsNotNone(claimed.started_on)
+        self.assertEqual(self.model.Job.objects.claim(), job2)
+        self.assertIsNone(self.model.Job.objects.claim())
+
+
+    @override_settings(ASYNC_JOBS=True, JOB_TIMEOUT=60)
+    def test_claim_fails_stale(self):
+        """Claiming fails running jobs that have stopped reporting."""
+        stale = self.F.JobFactory.create(
+            status="running", heartbeat_on=self.minutes_ago(2))
+        alive = self.F.JobFactory.create(
+            status="running", heartbeat_on=self.minutes_ago(0))
+
+        self.assertIsNone(self.model.Job.objects.claim())
+
+        stale = self.refresh(stale)
+        self.assertEqual(stale.status, "failed")
+        self.assertTrue(stale.finished)
+        self.assertEqual(stale.error, "Worker stopped responding.")
+        self.assertEqual(self.refresh(alive).status, "running")
+
+
+    @override_settings(ASYNC_JOBS=True, JOB_TIMEOUT=60)
+    def test_enqueue_unique_ignores_stale(self):
+        """A stale running job doesn't stop a unique job being queued."""
+        stale = self.F.JobFactory.create(
+            task="record",
+            arguments='{"foo": 1}',
+            status="running",
+            heartbeat_on=self.minutes_ago(2),
+            )
+        alive = self.F.JobFactory.create(
+            task="record",
+            arguments='{"foo": 2}',
+            status="running",
+            heartbeat_on=self.minutes_ago(0),
+            )
+
+        job = self.model.Job.objects.enqueue("record", unique=True, foo=1)
+
+        self.assertNotEqual(job, stale)
+        self.assertEqual(job.status, "queued")
+        self.assertEqual(
+            self.model.Job.objects.enqueue("record", unique=True, foo=2),
+            alive,
+            )
+
+
+    def minutes_ago(self, minutes):
+        """Return the time ``minutes`` ago."""
+        from moztrap.model.mtmodel import utcnow
+        return utcnow() - datetime.timedelta(minutes=minutes)
+
+
+    @override_settings(ASYNC_JOBS=True)
+    def test_run(self):
+        """Running a job records its progress and result."""
+        job = self.model.Job.objects.enqueue("record", foo=1)
+
+        job.run(commit=True)
+
+        job = self.refresh(job)
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.done, job.total), (1, 2))
+        self.assertEqual(job.progress(), 1)
+        self.assertEqual(job.get_result(), {"ok": True})
+        self.assertIsNotNone(job.heartbeat_on)
+
+
+    @override_settings(ASYNC_JOBS=True)
+    def test_run_failure(self):
+        """A failed job records the error rather than raising it."""
+        job = self.model.Job.objects.enqueue("fail")
+
+        job.run(commit=True)
+
+        job = self.refresh(job)
+        self.assertEqual(job.status, "failed")
+        self.assertTrue(job.finished)
+        self.assertIn("ValueError: Oops.", job.error)
+        self.assertIsNone(job.get_result())
+
+
+    def test_progress(self):
+        """Progress is the fraction of steps done."""
+        job = self.F.JobFactory.create(status="running", done=1, total=4)
+
+        self.assertEqual(job.progress(), 0.25)
+
+
+    def test_progress_no_total(self):
+        """Progress of a job that hasn't reported is zero."""
+        self.assertEqual(self.F.JobFactory.create().progress(), 0)
+
+
+    def test_unicode(self):
+        """Unicode representation is task, id and status."""
+        job = self.F.JobFactory.create()
+
+        self.assertEqual(
+            unicode(job), u"activate_run job {0} (queued)".format(job.id))
+
+
+
+class TasksTest(case.DBTestCase):
+    """Tests for the built-in job tasks."""
+    def test_activate_run(self):
+        """Activates the run."""
+        r = self.F.RunFactory.create()
+
+        job = self.model.Job.objects.enqueue("activate_run", run_id=r.id)
+
+        self.assertEqual(self.refresh(r).status, "active")
+        self.assertEqual(job.get_result(), {"run_id": r.id})
+
+
+    def test_clone_run_for_series(self):
+        """Clones series for the build and activates the clone."""
+        series = self.F.RunFactory.create(is_series=True)
+
+        job = self.model.Job.objects.enqueue(
+            "clone_run_for_series", run_id=series.id, build="b1")
+
+        run = self.model.Run.objects.get(pk=job.get_result()["run_id"])
+        self.assertEqual(run.series, series)
+        self.assertEqual(run.build, "b1")
+        self.assertEqual(run.status, "active")
+
+
+    def test_generate_profile(self):
+        """Generates a profile from the given elements."""
+        e1 = self.F.ElementFactory.create(name="Linux")
+        e2 = self.F.ElementFactory.create(name="Windows", category=e1.category)
+
+        job = self.model.Job.objects.enqueue(
+            "generate_profile", name="Foo", element_ids=[e1.id, e2.id])
+
+        profile = self.model.Profile.objects.get(
+            pk=job.get_result()["profile_id"])
+        self.assertEqual(profile.name, "Foo")
+        self.assertEqual(profile.environments.count(), 2)
+
+
+    def test_fill_productversion(self):
+        """Copies caseversions whose case isn't in the target yet."""
+        cv = self.F.CaseVersionFactory.create(name="One")
+        existing = self.F.CaseVersionFactory.create(
+            productversion=cv.productversion)
+        target = self.F.ProductVersionFactory.create(
+            product=cv.productversion.product, version="2")
+        self.F.CaseVersionFactory.create(
+            productversion=target, case=existing.case)
+
+        job = self.model.Job.objects.enqueue(
+            "fill_productversion",
+            productversion_id=target.id,
+            source_id=cv.productversion.id,
+            )
+
+        self.assertEqual(job.get_result()["cloned"], 1)
+        self.assertEqual((job.done, job.total), (1, 1))
+        self.assertEqual(
+            target.caseversions.get(case=cv.case).name, "One")
+
+
+
+class TasksTransactionTest(case.TransactionTestCase):
+    """Tests for transactional behavior of the built-in job tasks."""
+    @override_settings(ASYNC_JOBS=True)
+    def test_clone_run_for_series_failure(self):
+        """If activating the clone fails, no draft clone is left behind."""
+        series = self.F.RunFactory.create(is_series=True)
+        job = self.model.Job.objects.enqueue(
+            "clone_run_for_series", run_id=series.id, build="b1")
+
+        with patch(
+                "moztrap.model.mtmodel.DraftStatusModel.activate") as activate:
+            activate.side_effect = ValueError("Oops.")
+            job.run(commit=True)
+
+        self.assertEqual(self.refresh(job).status, "failed")
+        self.assertEqual(
+            self.model.Run.everything.filter(series=series).count(), 0)
@@ -0,0 +1,60 @@
+"""
+Tests for management command to benchmark cloning caseversions.
+
+"""
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from mock import patch
+
+from tests import case
+
+
+
+class BenchmarkCloneTest(case.DBTestCase):
+    """Tests for benchmark_clone management command."""
+    def call_command(self, *args, **kwargs):
+        """
+        Runs the management command and returns (stdout, stderr) output.
+
+        Also patch ``sys.exit`` so a ``CommandError`` doesn't cause an exit.
+
+        """
+        with patch("sys.stdout", StringIO()) as stdout:
+            with patch("sys.stderr", StringIO()) as stderr:
+                with patch("sys.exit"):
+                    call_command("benchmark_clone", *args, **kwargs)
+
+        stdout.seek(0)
+        stderr.seek(0)
+        return (stdout.read(), stderr.read())
+
+
+    def test_reports_timings(self):
+        """Reports a timing and query count for each approach."""
+        stdout, stderr = self.call_command(cases=4, steps=2, envs=2)
+
+        lines = stdout.splitlines()
+        self.assertEqual(
+            lines[0], "4 caseversions, 2 steps each, 2 environments:")
+        self.assertEqual(
+            [l.split(":")[0] for l in lines[1:]],
+            ["  per object", "  bulk"],
+            )
+        self.assertTrue(all(l.endswith(" queries") for l in lines[1:]))
+        self.assertEqual(stderr, "")
+
+
+    def test_bad_options(self):
+        """Too few cases is an error."""
+        output = self.call_command(cases=0)
+
+        self.assertEqual(
+            output,
+            (
+                "",
+                "Error: Usage: [--cases <n>] [--steps <n>] [--envs <n>] "
+                "(at least 1 case)\n",
+                )
+            )
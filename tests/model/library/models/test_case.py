@@ -28,6 +28,100 @@ class CaseTest(case.DBTestCase):
         self.assertEqual(new.versions.get().name, "Cloned: CV 1")
 
 
+    def test_clone_versions_in_bulk(self):
+        """Versions cloned with a case get steps and latest flags."""
+        cv1 = self.F.CaseVersionFactory.create(name="CV 1")
+        pv2 = self.F.ProductVersionFactory.create(
+            product=cv1.productversion.product, version="2")
+        cv2 = self.F.CaseVersionFactory.create(
+            name="CV 2", case=cv1.case, productversion=pv2)
+        self.F.CaseStepFactory.create(caseversion=cv2, instruction="Do it")
+
+        new = cv1.case.clone()
+
+        versions = list(new.versions.order_by("productversion__order"))
+        self.assertEqual(
+            [(v.name, v.latest) for v in versions],
+            [("Cloned: CV 1", False), ("Cloned: CV 2", True)],
+            )
+        self.assertEqual(
+            [s.instruction for s in versions[1].steps.all()], ["Do it"])
+
+
+    def test_set_latest_versions(self):
+        """Marks latest version of each case in one go."""
+        cv1 = self.F.CaseVersionFactory.create()
+        pv2 = self.F.ProductVersionFactory.create(
+            product=cv1.productversion.product, version="2")
+        cv2 = self.F.CaseVersionFactory.create(
+            case=cv1.case, productversion=pv2)
+        other = self.F.CaseVersionFactory.create(productversion=pv2)
+        self.model.CaseVersion.objects.update(latest=False)
+
+        with self.assertNumQueries(3):
+            latest = self.model.Case.set_latest_versions(
+                [cv1.case.id, other.case.id])
+
+        self.assertEqual(latest, set([cv2.id, other.id]))
+        self.assertEqual(
+            [self.refresh(cv).latest for cv in [cv1, cv2, other]],
+            [False, True, True],
+            )
+
+
+    def _product_cases(self):
+        """Return caseversions of two cases in versions 1 and 2 of a product."""
+        cv1 = self.F.CaseVersionFactory.create()
+        product = cv1.productversion.product
+        pv2 = self.F.ProductVersionFactory.create(product=product, version="2")
+        cv2 = self.F.CaseVersionFactory.create(
+            case=cv1.case, productversion=pv2)
+        other = self.F.CaseVersionFactory.create(productversion=pv2)
+        elsewhere = self.F.CaseVersionFactory.create()
+        self.model.CaseVersion.objects.update(latest=False)
+        self.model.CaseVersion.objects.filter(pk=cv1.pk).update(latest=True)
+        return product, [cv1, cv2, other, elsewhere]
+
+
+    def test_set_product_latest_versions(self):
+        """Marks latest version of each case of a product in one statement."""
+        product, cvs = self._product_cases()
+
+        with self.assertNumQueries(1):
+            self.model.Case.set_product_latest_versions(product.id)
+
+        self.assertEqual(
+            [self.refresh(cv).latest for cv in cvs],
+            [False, True, True, False],
+            )
+
+
+    def test_set_product_latest_versions_only_changes(self):
+        """Only caseversions whose latest flag changes are updated."""
+        product, cvs = self._product_cases()
+        self.model.CaseVersion.objects.filter(pk=cvs[2].pk).update(latest=True)
+        version = self.refresh(cvs[2]).cc_version
+
+        self.model.Case.set_product_latest_versions(product.id)
+
+        self.assertEqual(self.refresh(cvs[2]).cc_version, version)
+
+
+    def test_set_product_latest_versions_fallback(self):
+        """Without joined updates, changes are selected and updated."""
+        from django.db import connections, DEFAULT_DB_ALIAS
+        product, cvs = self._product_cases()
+        backend = connections[DEFAULT_DB_ALIAS].__class__
+
+        with patch.object(backend, "vendor", "other"):
+            self.model.Case.set_product_latest_versions(product.id)
+
+        self.assertEqual(
+            [self.refresh(cv).latest for cv in cvs],
+            [False, True, True, False],
+            )
+
+
     def test_all_versions(self):
         """Returns ordered product versions paired with caseversion or None."""
         c = self.F.CaseFactory()
@@ -129,6 +223,72 @@ class CaseVersionTest(case.DBTestCase):
         self.assertEqual(len(new.environments.all()), 2)
 
 
+    def test_clone_many_in_bulk(self):
+        """Queued caseversion clones are inserted with steps, tags, envs."""
+        tag = self.F.TagFactory.create()
+        cvs = []
+        for i in range(3):
+            cv = self.F.CaseVersionFactory.create(
+                name="CV {0}".format(i),
+                environments={"OS": ["OS X", "Linux"]},
+                )
+            cv.tags.add(tag)
+            self.F.CaseStepFactory.create(caseversion=cv)
+            cvs.append(cv)
+        pv = self.F.ProductVersionFactory.create(version="2")
+        u = self.F.UserFactory.create()
+
+        cloner = self.model.BulkCloner(user=u)
+        clones = [
+            cv.clone(
+                overrides={"productversion": pv, "case": cv.case},
+                user=u,
+                cloner=cloner,
+                )
+            for cv in cvs
+            ]
+        cloner.run()
+
+        for cv, clone in zip(cvs, clones):
+            clone = self.refresh(clone)
+            self.assertEqual(clone.productversion, pv)
+            self.assertEqual(clone.name, "Cloned: " + cv.name)
+            self.assertEqual(clone.created_by, u)
+            self.assertTrue(clone.latest)
+            self.assertEqual(list(clone.tags.all()), [tag])
+            self.assertEqual(
+                set(clone.environments.all()), set(cv.environments.all()))
+            step = clone.steps.get()
+            self.assertEqual(step.created_by, u)
+            self.assertFalse(self.refresh(cv).latest)
+
+
+    def test_clone_query_count_constant(self):
+        """Cloning cost doesn't grow with the number of steps, tags, envs."""
+        def create(num):
+            cv = self.F.CaseVersionFactory.create(
+                environments={"OS": ["OS {0}".format(i) for i in range(num)]})
+            for i in range(num):
+                self.F.CaseStepFactory.create(caseversion=cv)
+                self.F.CaseAttachmentFactory.create(caseversion=cv)
+                cv.tags.add(self.F.TagFactory.create(name=str(i)))
+            pv = self.F.ProductVersionFactory.create(
+                product=cv.productversion.product,
+                version="{0}.1".format(num),
+                )
+            return cv, pv
+
+        for num in [2, 5]:
+            cv, pv = create(num)
+            with self.assertNumQueries(17):
+                new = cv.clone(overrides={"productversion": pv})
+
+            self.assertEqual(new.steps.count(), num)
+            self.assertEqual(new.attachments.count(), num)
+            self.assertEqual(new.tags.count(), num)
+            self.assertEqual(new.environments.count(), num)
+
+
     def test_default_active(self):
         """New CaseVersion defaults to active state."""
         cv = self.F.CaseVersionFactory()
@@ -0,0 +1,134 @@
+"""
+Tests for the case file parser.
+
+"""
+from cStringIO import StringIO
+
+from django.utils.unittest import TestCase
+
+from mock import patch
+
+
+
+class ParseJSONTest(TestCase):
+    """Tests for parse_json."""
+    def parse(self, data):
+        from moztrap.model.library.casefiles import parse_json
+        return list(parse_json(StringIO(data)))
+
+
+    def assertError(self, data, message):
+        """Assert that parsing data raises CaseFileError with message."""
+        from moztrap.model.library.casefiles import CaseFileError
+        with self.assertRaises(CaseFileError) as cm:
+            self.parse(data)
+        self.assertEqual(str(cm.exception), message)
+
+
+    def test_sections(self):
+        """Suites and cases are yielded in order, other keys ignored."""
+        items = self.parse(
+            """{
+              "suites": [{"name": "S", "description": "d"}],
+              "other": {"ignored": [1, 2]},
+              "cases": [
+                {"name": "C1", "steps": [{"instruction": "do this"}]},
+                {"name": "C2", "tags": ["t"]}
+              ]
+            }""")
+
+        self.assertEqual(
+            items,
+            [
+                ("suites", {"name": "S", "description": "d"}),
+                ("cases", {
+                        "name": "C1", "steps": [{"instruction": "do this"}]}),
+                ("cases", {"name": "C2", "tags": ["t"]}),
+                ]
+            )
+
+
+    def test_empty(self):
+        """An empty object or lists yield nothing."""
+        self.assertEqual(self.parse(" {} "), [])
+        self.assertEqual(self.parse('{"suites": [], "cases": [ ]}'), [])
+
+
+    def test_unicode(self):
+        """Strings are decoded as UTF-8."""
+        self.assertEqual(
+            self.parse('{"cases": [{"name": "caf\xc3\xa9"}]}'),
+            [("cases", {"name": u"caf\xe9"})],
+            )
+
+
+    @patch("moztrap.model.library.casefiles.READ_SIZE", 3)
+    def test_small_reads(self):
+        """Items and tokens cut across reads are parsed."""
+        self.assertEqual(
+            self.parse(
+                '{"other": 12345, "cases": [{"name": "caf\xc3\xa9"}, '
+                '{"name": "C2", "n": 1.5, "x": true}]}'),
+            [
+                ("cases", {"name": u"caf\xe9"}),
+                ("cases", {"name": "C2", "n": 1.5, "x": True}),
+                ]
+            )
+
+
+    @patch("moztrap.model.library.casefiles.MAX_ITEM_SIZE", 10)
+    def test_too_large(self):
+        """An item that doesn't decode within the maximum size is an error."""
+        self.assertError(
+            '{"cases": [{"name": "' + "x" * 100000,
+            "Value too large or malformed (char 11)",
+            )
+
+
+    def test_not_object(self):
+        """A file that isn't an object is an error."""
+        self.assertError("[]", "Expecting '{', found '[' (char 0)")
+
+
+    def test_truncated(self):
+        """A truncated file is an error."""
+        self.assertError("{", "Expecting value, found end of file (char 1)")
+        self.assertError(
+            '{"cases": [{"name": "C1"}',
+            "Expecting ',', found end of file (char 25)",
+            )
+
+
+    def test_item_not_object(self):
+        """A case that isn't an object is an error."""
+        self.assertError(
+            '{"cases": ["C1"]}', "Expecting an object in cases (char 11)")
+
+
+    def test_bad_item(self):
+        """A malformed case is an error."""
+        self.assertError(
+            '{"cases": [{"name": }]}',
+            "No JSON object could be decoded (char 11)",
+            )
+
+
+    def test_bad_key(self):
+        """A key that isn't a string is an error."""
+        self.assertError('{1: []}', "Expecting property name (char 2)")
+
+
+    def test_extra_data(self):
+        """Data after the object is an error."""
+        self.assertError("{} []", "Extra data (char 3)")
+
+
+    def test_items_before_error(self):
+        """Items before an error are yielded."""
+        from moztrap.model.library.casefiles import (
+            CaseFileError, parse_json)
+        items = parse_json(StringIO('{"cases": [{"name": "C1"}, ]}'))
+
+        self.assertEqual(items.next(), ("cases", {"name": "C1"}))
+        with self.assertRaises(CaseFileError):
+            items.next()
@@ -0,0 +1,152 @@
+"""Tests for suite/case exporter."""
+import json
+
+from tests import case
+
+
+
+class ExporterTest(case.DBTestCase):
+    """Tests for ``Exporter``."""
+    def setUp(self):
+        """Setup for exporter tests; create a product version."""
+        self.pv = self.F.ProductVersionFactory.create()
+
+
+    def exporter(self, productversion=None, **kwargs):
+        """Return an ``Exporter`` of given (or default) product version."""
+        from moztrap.model.library.exporter import Exporter
+        return Exporter(productversion or self.pv, **kwargs)
+
+
+    def test_empty(self):
+        """A product version without cases exports empty lists."""
+        self.assertEqual(
+            self.exporter().export_data(), {"suites": [], "cases": []})
+        self.assertEqual(
+            json.loads("".join(self.exporter().export_json())),
+            {"suites": [], "cases": []},
+            )
+
+
+    def test_case(self):
+        """A case is exported with its steps, tags, suites and creator."""
+        u = self.F.UserFactory.create(email="someone@example.com")
+        cv = self.F.CaseVersionFactory.create(
+            productversion=self.pv,
+            name="Foo",
+            description="described",
+            user=u,
+            )
+        self.F.CaseStepFactory.create(
+            caseversion=cv, number=2, instruction="do that", expected="ok")
+        self.F.CaseStepFactory.create(
+            caseversion=cv, number=1, instruction="do this")
+        cv.tags.add(self.F.TagFactory.create(name="b"))
+        cv.tags.add(self.F.TagFactory.create(name="a"))
+        self.F.SuiteCaseFactory.create(
+            case=cv.case,
+            suite=self.F.SuiteFactory.create(
+                product=self.pv.product, name="S", description="suite"),
+            )
+
+        self.assertEqual(
+            self.exporter().export_data(),
+            {
+                "suites": [{"name": "S", "description": "suite"}],
+                "cases": [
+                    {
+                        "name": "Foo",
+                        "description": "described",
+                        "created_by": "someone@example.com",
+                        "tags": ["a", "b"],
+                        "suites": ["S"],
+                        "steps": [
+                            {"instruction": "do this", "expected": ""},
+                            {"instruction": "do that", "expected": "ok"},
+                            ],
+                        },
+                    ],
+                }
+            )
+
+
+    def test_other_productversion(self):
+        """Cases and suites of other product versions aren't exported."""
+        cv = self.F.CaseVersionFactory.create(
+            productversion__product=self.pv.product)
+        self.F.SuiteCaseFactory.create(
+            case=cv.case, suite__product=self.pv.product)
+
+        self.assertEqual(
+            self.exporter().export_data(), {"suites": [], "cases": []})
+
+
+    def test_deleted(self):
+        """Deleted cases, steps, tags and suites aren't exported."""
+        cv = self.F.CaseVersionFactory.create(
+            productversion=self.pv, name="Foo")
+        self.F.CaseStepFactory.create(caseversion=cv).delete()
+        tag = self.F.TagFactory.create()
+        cv.tags.add(tag)
+        tag.delete()
+        self.F.SuiteCaseFactory.create(
+            case=cv.case, suite__product=self.pv.product).suite.delete()
+        self.F.CaseVersionFactory.create(productversion=self.pv).delete()
+
+        self.assertEqual(
+            self.exporter().export_data(),
+            {
+                "suites": [],
+                "cases": [{"name": "Foo", "description": "", "steps": []}],
+                }
+            )
+
+
+    def test_batches(self):
+        """Cases are read a batch at a time, four queries per batch."""
+        for i in range(5):
+            cv = self.F.CaseVersionFactory.create(
+                productversion=self.pv, name="case {0}".format(i))
+            self.F.CaseStepFactory.create(caseversion=cv)
+
+        chunks = self.exporter(batch_size=2).export_json()
+
+        # two queries for the (empty) suites, then per batch of cases
+        with self.assertNumQueries(1 + 4 + 4 + 4 + 1):
+            data = json.loads("".join(chunks))
+
+        self.assertEqual(
+            [c["name"] for c in data["cases"]],
+            ["case {0}".format(i) for i in range(5)],
+            )
+
+
+    def test_round_trip(self):
+        """Exported data imports as the same cases and suites."""
+        from moztrap.model.library.importer import Importer
+        case_data = {
+            "suites": [{"name": "S", "description": "suite"}],
+            "cases": [
+                {
+                    "name": "Foo",
+                    "description": "described",
+                    "tags": ["t"],
+                    "suites": ["S"],
+                    "steps": [{"instruction": "do this", "expected": "ok"}],
+                    },
+                {
+                    "name": "Bar",
+                    "description": "",
+                    "steps": [],
+                    },
+                ],
+            }
+        Importer().import_data(self.pv, case_data)
+        exported = json.loads("".join(self.exporter().export_json()))
+
+        self.assertEqual(exported, case_data)
+
+        pv2 = self.F.ProductVersionFactory.create()
+        Importer().import_data(pv2, exported)
+
+        self.assertEqual(self.exporter(pv2).export_data(), case_data)
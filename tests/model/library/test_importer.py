@@ -20,6 +20,12 @@ class ImporterTestBase(object):
         return Importer().import_data(self.pv, case_data)
 
 
+    def import_stream(self, items, **kwargs):
+        """Call ``Importer.import_stream``; return list of batch results."""
+        from moztrap.model.library.importer import Importer
+        return list(Importer().import_stream(self.pv, items, **kwargs))
+
+
 class ImporterTest(ImporterTestBase, case.DBTestCase):
     """Tests for ``Importer``."""
     def test_create_caseversion(self):
@@ -132,192 +138,57 @@ class ImporterTest(ImporterTestBase, case.DBTestCase):
 
     def test_create_two_caseversions_same_user(self):
         """
-        Two caseversions that both use the same user.  Test that import caches
-        the user and doesn't have to query for it a second time.
-
-        Expect 17 queries for this import:
-
-        Query 1: Ensure this caseversion does not already exist for this
-        productversion::
-
-            SELECT (1) AS `a` FROM `library_caseversion` WHERE
-            (`library_caseversion`.`deleted_on` IS NULL AND
-            `library_caseversion`.`name` = Foo AND
-            `library_caseversion`.`productversion_id` = 12 ) LIMIT 1
-
-        Query 2: Find the user for this email::
-
-            SELECT `auth_user`.`id`, `auth_user`.`username`,
-            `auth_user`.`first_name`, `auth_user`.`last_name`,
-            `auth_user`.`email`, `auth_user`.`password`,
-            `auth_user`.`is_staff`, `auth_user`.`is_active`,
-            `auth_user`.`is_superuser`, `auth_user`.`last_login`,
-            `auth_user`.`date_joined` FROM `auth_user` WHERE
-            `auth_user`.`email` = sumbudee@mozilla.com
-
-        Transaction: SAVEPOINT s140735243669888_x1
-
-        Query 3: Create the first new case object::
-
-            INSERT INTO `library_case` (`created_on`, `created_by_id`,
-            `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-            `product_id`) VALUES (2012-03-07 19:35:34, None, 2012-03-07
-            19:35:34, None, None, None, 12)
-
-        Queries 4-8: Create the first new caseversion object::
-
-            INSERT INTO `library_caseversion` (`created_on`, `created_by_id`,
-            `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-            `status`, `productversion_id`, `case_id`, `name`, `description`,
-            `latest`, `envs_narrowed`) VALUES (2012-03-07 19:35:34, 2,
-            2012-03-07 19:35:34, 2, None, None, draft, 12, 10, Foo, , False,
-            False)
-
-             SELECT `environments_environment`.`id`,
-            `environments_environment`.`created_on`,
-            `environments_environment`.`created_by_id`,
-            `environments_environment`.`modified_on`,
-            `environments_environment`.`modified_by_id`,
-            `environments_environment`.`deleted_on`,
-            `environments_environment`.`deleted_by_id`,
-            `environments_environment`.`profile_id` FROM
-            `environments_environment` INNER JOIN
-            `core_productversion_environments` ON
-            (`environments_environment`.`id` =
-            `core_productversion_environments`.`environment_id`) WHERE
-            (`environments_environment`.`deleted_on` IS NULL AND
-            `core_productversion_environments`.`productversion_id` = 12 )
-
-             SELECT `library_caseversion`.`id`,
-            `library_caseversion`.`created_on`,
-            `library_caseversion`.`created_by_id`,
-            `library_caseversion`.`modified_on`,
-            `library_caseversion`.`modified_by_id`,
-            `library_caseversion`.`deleted_on`,
-            `library_caseversion`.`deleted_by_id`,
-            `library_caseversion`.`status`,
-            `library_caseversion`.`productversion_id`,
-            `library_caseversion`.`case_id`, `library_caseversion`.`name`,
-            `library_caseversion`.`description`,
-            `library_caseversion`.`latest`,
-            `library_caseversion`.`envs_narrowed` FROM `library_caseversion`
-            INNER JOIN `core_productversion` ON
-            (`library_caseversion`.`productversion_id` =
-            `core_productversion`.`id`) WHERE
-            (`library_caseversion`.`deleted_on` IS NULL AND
-            `library_caseversion`.`case_id` = 10 ) ORDER BY
-            `core_productversion`.`order` DESC LIMIT 1
-
-             UPDATE `library_caseversion` SET `latest` = False WHERE
-            (`library_caseversion`.`deleted_on` IS NULL AND
-            `library_caseversion`.`case_id` = 10 )
-
-             UPDATE `library_caseversion` SET `created_on` = 2012-03-07
-            19:35:34, `created_by_id` = 2, `modified_on` = 2012-03-07 19:35:34,
-            `modified_by_id` = 2, `deleted_on` = NULL, `deleted_by_id` = NULL,
-            `status` = draft, `productversion_id` = 12, `case_id` = 10, `name`
-            = Foo, `description` = , `latest` = True, `envs_narrowed` = False
-            WHERE `library_caseversion`.`id` = 10
-
-        Query 9: Add the new step to the caseversion::
-
-            INSERT INTO `library_casestep` (`created_on`, `created_by_id`,
-            `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-            `caseversion_id`, `number`, `instruction`, `expected`) VALUES
-            (2012-03-07 19:35:34, None, 2012-03-07 19:35:34, None, None, None,
-            10, 1, do this, )
-
-        Transaction: RELEASE SAVEPOINT s140735243669888_x1
-
-        Query 10: Ensure the second caseversion with this name and pv doesn't
-        exist::
-
-            SELECT (1) AS `a` FROM `library_caseversion` WHERE
-            (`library_caseversion`.`deleted_on` IS NULL AND
-            `library_caseversion`.`name` = Bar AND
-            `library_caseversion`.`productversion_id` = 12 ) LIMIT 1
-
-        Transaction: SAVEPOINT s140735243669888_x2
-
-        **NOTE: We didn't have to search for the user again, since it was
-        cached**
-
-        Query 11: Create the second new case::
-
-            INSERT INTO `library_case` (`created_on`, `created_by_id`,
-            `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-            `product_id`) VALUES (2012-03-07 19:35:34, None, 2012-03-07
-            19:35:34, None, None, None, 12)
-
-        Queries 12-16: Create the second new caseversion::
-
-             INSERT INTO `library_caseversion` (`created_on`, `created_by_id`,
-             `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-             `status`, `productversion_id`, `case_id`, `name`, `description`,
-             `latest`, `envs_narrowed`) VALUES (2012-03-07 19:35:34, 2,
-             2012-03-07 19:35:34, 2, None, None, draft, 12, 11, Bar, , False,
-             False)
-
-              SELECT `environments_environment`.`id`,
-             `environments_environment`.`created_on`,
-             `environments_environment`.`created_by_id`,
-             `environments_environment`.`modified_on`,
-             `environments_environment`.`modified_by_id`,
-             `environments_environment`.`deleted_on`,
-             `environments_environment`.`deleted_by_id`,
-             `environments_environment`.`profile_id` FROM
-             `environments_environment` INNER JOIN
-             `core_productversion_environments` ON
-             (`environments_environment`.`id` =
-             `core_productversion_environments`.`environment_id`) WHERE
-             (`environments_environment`.`deleted_on` IS NULL AND
-             `core_productversion_environments`.`productversion_id` = 12 )
-
-              SELECT `library_caseversion`.`id`,
-             `library_caseversion`.`created_on`,
-             `library_caseversion`.`created_by_id`,
-             `library_caseversion`.`modified_on`,
-             `library_caseversion`.`modified_by_id`,
-             `library_caseversion`.`deleted_on`,
-             `library_caseversion`.`deleted_by_id`,
-             `library_caseversion`.`status`,
-             `library_caseversion`.`productversion_id`,
-             `library_caseversion`.`case_id`, `library_caseversion`.`name`,
-             `library_caseversion`.`description`,
-             `library_caseversion`.`latest`,
-             `library_caseversion`.`envs_narrowed` FROM `library_caseversion`
-             INNER JOIN `core_productversion` ON
-             (`library_caseversion`.`productversion_id` =
-             `core_productversion`.`id`) WHERE
-             (`library_caseversion`.`deleted_on` IS NULL AND
-             `library_caseversion`.`case_id` = 11 ) ORDER BY
-             `core_productversion`.`order` DESC LIMIT 1
-
-              UPDATE `library_caseversion` SET `latest` = False WHERE
-             (`library_caseversion`.`deleted_on` IS NULL AND
-             `library_caseversion`.`case_id` = 11 )
-
-              UPDATE `library_caseversion` SET `created_on` = 2012-03-07
-             19:35:34, `created_by_id` = 2, `modified_on` = 2012-03-07
-             19:35:34, `modified_by_id` = 2, `deleted_on` = NULL,
-             `deleted_by_id` = NULL, `status` = draft, `productversion_id` =
-             12, `case_id` = 11, `name` = Bar, `description` = , `latest` =
-             True, `envs_narrowed` = False WHERE `library_caseversion`.`id` =
-             11
-
-        Query 17: Add the step to the second caseversion::
-
-            INSERT INTO `library_casestep` (`created_on`, `created_by_id`,
-            `modified_on`, `modified_by_id`, `deleted_on`, `deleted_by_id`,
-            `caseversion_id`, `number`, `instruction`, `expected`) VALUES
-            (2012-03-07 19:35:34, None, 2012-03-07 19:35:34, None, None, None,
-            11, 1, do this, )
-
-        Transaction: RELEASE SAVEPOINT s140735243669888_x2
-
-        Note: Django 1.4 now logs transaction points in the connection.queries
-
-        EXPECT: 17 Queries + 4 Transaction actions = 21 queries.
+        Two caseversions that both use the same user.  Test that import looks
+        up the user once, and inserts the cases in bulk.
+
+        Expect 9 queries for this import:
+
+        Query 1: Load names of existing caseversions of this productversion::
+
+            SELECT `library_caseversion`.`name` FROM `library_caseversion`
+            WHERE (`library_caseversion`.`deleted_on` IS NULL AND
+            `library_caseversion`.`productversion_id` = 12 )
+
+        Query 2: Find the users for all emails::
+
+            SELECT `auth_user`.`id`, ... FROM `auth_user` WHERE
+            `auth_user`.`email` IN (sumbudee@mozilla.com) ORDER BY
+            `auth_user`.`id` ASC
+
+        Query 3: Create both new case objects::
+
+            INSERT INTO `library_case` (`created_on`, ..., `product_id`,
+            `idprefix`) VALUES (...), (...)
+
+        Query 4: Create both new caseversion objects::
+
+            INSERT INTO `library_caseversion` (`created_on`, ..., `name`,
+            `description`, `latest`, `envs_narrowed`) VALUES (...), (...)
+
+        Query 5: Find the environments of the productversion, to give to
+        the new caseversions (it has none)::
+
+            SELECT `core_productversion_environments`.`id`, ... WHERE
+            (`core_productversion_environments`.`productversion_id` IN (12)
+            AND `environments_environment`.`deleted_on` IS NULL)
+
+        Query 6: Add the steps of both caseversions::
+
+            INSERT INTO `library_casestep` (`created_on`, ...,
+            `instruction`, `expected`) VALUES (...), (...)
+
+        Queries 7-9: Mark the latest versions of both cases::
+
+            SELECT `library_caseversion`.`case_id`,
+            `library_caseversion`.`id`, `core_productversion`.`order` ...
+            WHERE `library_caseversion`.`case_id` IN (10, 11) ...
+
+            UPDATE `library_caseversion` SET ..., `latest` = False WHERE
+            ... `library_caseversion`.`case_id` IN (10, 11) AND NOT
+            (`library_caseversion`.`id` IN (10, 11))
+
+            UPDATE `library_caseversion` SET ..., `latest` = True WHERE
+            ... `library_caseversion`.`id` IN (10, 11)
 
         To re-capture this query list, use a block like this in place
             of the "with self.assertNumQueries..." block::
@@ -354,7 +225,7 @@ class ImporterTest(ImporterTestBase, case.DBTestCase):
             }
 
         # Test code as normal
-        with self.assertNumQueries(21):
+        with self.assertNumQueries(9):
             result = self.import_data(case_data)
 
         cv1 = self.model.CaseVersion.objects.get(name="Foo")
@@ -650,6 +521,214 @@ class ImporterTest(ImporterTestBase, case.DBTestCase):
 
 
 
+    def test_case_name_conflict_in_import(self):
+        """A case with the name of an earlier one in the import is skipped."""
+        result = self.import_data(
+            {
+                "cases": [
+                    {
+                        "name": "Foo",
+                        "steps": [{"instruction": "do this"}],
+                        },
+                    {
+                        "name": "foo",
+                        "steps": [{"instruction": "do that"}],
+                        },
+                    ]
+                }
+            )
+
+        cv = self.model.CaseVersion.objects.get()
+        self.assertEqual(cv.name, "Foo")
+        self.assertEqual(result.num_cases, 1)
+        self.assertEqual(
+            [w["reason"] for w in result.warnings],
+            [ImportResult.SKIP_CASE_NAME_CONFLICT],
+            )
+
+
+    def test_step_no_instruction_skips_case(self):
+        """A case with a step without instruction is not imported at all."""
+        result = self.import_data(
+            {
+                "cases": [
+                    {
+                        "name": "Foo",
+                        "steps": [
+                            {"instruction": "do this"},
+                            {"expected": "did this"},
+                            ],
+                        },
+                    {
+                        "name": "Bar",
+                        "steps": [{"instruction": "do that"}],
+                        },
+                    ]
+                }
+            )
+
+        cv = self.model.CaseVersion.objects.get()
+        self.assertEqual(cv.name, "Bar")
+        self.assertEqual(self.model.CaseStep.objects.count(), 1)
+        self.assertEqual(self.model.Case.objects.count(), 1)
+        self.assertEqual(result.num_cases, 1)
+
+
+    def test_no_existing_user_warns_once(self):
+        """A missing user is only warned about once."""
+        result = self.import_data(
+            {
+                "cases": [
+                    {
+                        "created_by": "sumbudee@mozilla.com",
+                        "name": name,
+                        "steps": [{"instruction": "do this"}],
+                        }
+                    for name in ["Foo", "Bar"]
+                    ]
+                }
+            )
+
+        self.assertEqual(result.num_cases, 2)
+        self.assertEqual(
+            result.warnings,
+            [
+                {
+                    "reason": ImportResult.WARN_USER_NOT_FOUND,
+                    "item": "sumbudee@mozilla.com",
+                    }
+                ]
+            )
+
+
+    def test_global_tag(self):
+        """An existing global tag is used, unless there's a product tag."""
+        global_tag = self.model.Tag.objects.create(name="global")
+        self.model.Tag.objects.create(name="both")
+        product_tag = self.model.Tag.objects.create(
+            name="both", product=self.pv.product)
+
+        self.import_data(
+            {
+                "cases": [
+                    {
+                        "name": "Foo",
+                        "steps": [{"instruction": "do this"}],
+                        "tags": ["global", "both"],
+                        }
+                    ]
+                }
+            )
+
+        cv = self.model.CaseVersion.objects.get()
+        self.assertEqual(
+            set(cv.tags.all()), set([global_tag, product_tag]))
+        self.assertEqual(self.model.Tag.objects.count(), 3)
+
+
+    def test_bulk(self):
+        """Cases, steps, tags and suites are inserted in bulk."""
+        self.pv.environments.add(
+            *self.F.EnvironmentFactory.create_full_set(
+                {"OS": ["OS X", "Linux"]}))
+        case_data = {
+            "cases": [
+                {
+                    "name": "case {0}".format(i),
+                    "steps": [
+                        {"instruction": "do this"},
+                        {"instruction": "do that", "expected": "it works"},
+                        ],
+                    "tags": ["tag", "tag {0}".format(i % 2)],
+                    "suites": ["suite"],
+                    }
+                for i in range(10)
+                ]
+            }
+
+        # however many cases there are (up to a batch); the environment
+        # links record changes for runs once per environment
+        with self.assertNumQueries(21):
+            result = self.import_data(case_data)
+
+        self.assertEqual(result.num_cases, 10)
+        self.assertEqual(result.num_suites, 1)
+        self.assertEqual(self.model.CaseStep.objects.count(), 20)
+        self.assertEqual(
+            self.model.CaseVersion.objects.filter(latest=True).count(), 10)
+        self.assertEqual(
+            self.model.CaseVersion.environments.through.objects.count(), 20)
+        self.assertEqual(
+            self.model.CaseVersion.tags.through.objects.count(), 20)
+        self.assertEqual(self.model.Tag.objects.count(), 3)
+        self.assertEqual(
+            self.model.Suite.objects.get().cases.count(), 10)
+
+
+    def test_stream(self):
+        """A stream is imported in batches, with a result for each."""
+        results = self.import_stream(
+            [
+                ("suites", {"name": "Suite", "description": "described"}),
+                ("cases", {"name": "Foo", "suites": ["Suite"]}),
+                ("cases", {"name": "Bar", "suites": ["Suite"]}),
+                ("cases", {"name": "Baz", "suites": ["Other"]}),
+                ],
+            batch_size=2,
+            )
+
+        self.assertEqual(
+            [(r.num_cases, r.num_suites) for r in results], [(1, 1), (2, 1)])
+        self.assertEqual(
+            self.model.Suite.objects.get(name="Suite").description,
+            "described")
+        self.assertEqual(
+            set(self.model.Suite.objects.get(name="Suite").cases.values_list(
+                "versions__name", flat=True)),
+            set(["Foo", "Bar"]),
+            )
+        self.assertEqual(
+            self.model.CaseVersion.objects.filter(latest=True).count(), 3)
+
+
+    def test_stream_name_conflict_across_batches(self):
+        """A case with the name of one in an earlier batch is skipped."""
+        results = self.import_stream(
+            [
+                ("cases", {"name": "Foo", "steps": []}),
+                ("cases", {"name": "foo", "steps": []}),
+                ],
+            batch_size=1,
+            )
+
+        self.assertEqual([r.num_cases for r in results], [1, 0])
+        self.assertEqual(
+            results[1].warnings[0]["reason"],
+            ImportResult.SKIP_CASE_NAME_CONFLICT,
+            )
+        self.assertEqual(self.model.CaseVersion.objects.count(), 1)
+
+
+    def test_stream_name_query_per_batch(self):
+        """Names of a batch are checked with one query, not kept around."""
+        items = [("cases", {"name": "Foo", "steps": []})]
+
+        from moztrap.model.library.importer import Importer
+        results = Importer().import_stream(self.pv, items * 2, batch_size=1)
+
+        with self.assertNumQueries(8):
+            results.next()
+        # the duplicate is found by one name query
+        with self.assertNumQueries(1):
+            result = results.next()
+
+        self.assertEqual(
+            result.warnings[0]["reason"],
+            ImportResult.SKIP_CASE_NAME_CONFLICT,
+            )
+
+
+
 class ImporterTransactionTest(ImporterTestBase, case.TransactionTestCase):
     """Tests for ``Importer`` transactional behavior."""
 
@@ -716,3 +795,34 @@ class ImporterTransactionTest(ImporterTestBase, case.TransactionTestCase):
             ImportResult.SKIP_STEP_NO_INSTRUCTION,
             )
 
+
+    def test_stream_commits_batches(self):
+        """Batches imported before an error in the stream are kept."""
+        def items():
+            yield ("cases", {"name": "Foo", "steps": []})
+            yield ("cases", {"name": "Bar", "steps": []})
+            raise ValueError("Bad file")
+
+        with self.assertRaises(ValueError):
+            self.import_stream(items(), batch_size=1)
+
+        self.assertEqual(
+            set(self.model.CaseVersion.objects.values_list("name", flat=True)),
+            set(["Foo", "Bar"]),
+            )
+
+
+    def test_stream_dry_run(self):
+        """Nothing is saved in a dry run, but results are reported."""
+        results = self.import_stream(
+            [
+                ("cases", {"name": "Foo", "steps": []}),
+                ("cases", {"name": "Foo", "steps": []}),
+                ],
+            batch_size=1,
+            dry_run=True,
+            )
+
+        self.assertEqual([r.num_cases for r in results], [1, 0])
+        self.assertEqual(self.model.Case.objects.count(), 0)
+        self.assertEqual(self.model.CaseVersion.objects.count(), 0)
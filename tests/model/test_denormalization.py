@@ -0,0 +1,184 @@
+"""
+Tests for deferred maintenance of denormalized data.
+
+"""
+from tests import case
+
+
+
+class DeferredDenormalizationTest(case.DBTestCase):
+    """Tests for ``deferred_denormalization``."""
+    def setUp(self):
+        """Set up a product with two versions and a case in the first."""
+        self.product = self.F.ProductFactory.create()
+        self.pv1 = self.F.ProductVersionFactory.create(
+            product=self.product, version="1")
+        self.pv2 = self.F.ProductVersionFactory.create(
+            product=self.product, version="2")
+        self.cv1 = self.F.CaseVersionFactory.create(
+            productversion=self.pv1, case__product=self.product)
+
+
+    def deferred(self):
+        """Return the context manager under test."""
+        from moztrap.model import deferred_denormalization
+        return deferred_denormalization()
+
+
+    def deferring(self):
+        """Return the current pending changes, or None."""
+        from moztrap.model.denormalization import deferring
+        return deferring()
+
+
+    def test_caseversion_latest(self):
+        """Latest caseversion is only marked on exit."""
+        with self.deferred():
+            cv2 = self.F.CaseVersionFactory.create(
+                productversion=self.pv2, case=self.cv1.case)
+
+            self.assertTrue(self.refresh(self.cv1).latest)
+            self.assertFalse(self.refresh(cv2).latest)
+
+        self.assertFalse(self.refresh(self.cv1).latest)
+        self.assertTrue(self.refresh(cv2).latest)
+
+
+    def test_caseversion_instance(self):
+        """Saved caseversions are updated on exit, and can be saved again."""
+        with self.deferred():
+            cv2 = self.F.CaseVersionFactory.create(
+                productversion=self.pv2, case=self.cv1.case)
+
+        self.assertTrue(cv2.latest)
+        self.assertEqual(cv2.cc_version, self.refresh(cv2).cc_version)
+        cv2.name = "Renamed"
+        cv2.save()
+
+        self.assertEqual(self.refresh(cv2).name, "Renamed")
+
+
+    def test_productversion_instance(self):
+        """Saved product versions are updated on exit."""
+        with self.deferred():
+            pv0 = self.F.ProductVersionFactory.create(
+                product=self.product, version="0")
+
+        self.assertEqual(pv0.order, 1)
+        self.assertFalse(pv0.latest)
+        pv0.codename = "Zero"
+        pv0.save()
+
+        self.assertEqual(self.refresh(pv0).codename, "Zero")
+
+
+    def test_caseversion_delete(self):
+        """Deleting a caseversion marks the latest one on exit."""
+        cv2 = self.F.CaseVersionFactory.create(
+            productversion=self.pv2, case=self.cv1.case)
+
+        with self.deferred():
+            cv2.delete()
+
+            self.assertFalse(self.refresh(self.cv1).latest)
+
+        self.assertTrue(self.refresh(self.cv1).latest)
+
+
+    def test_productversion_order(self):
+        """Product versions are reordered on exit, with case versions."""
+        with self.deferred():
+            pv0 = self.F.ProductVersionFactory.create(
+                product=self.product, version="0")
+            pv3 = self.F.ProductVersionFactory.create(
+                product=self.product, version="3")
+            cv3 = self.F.CaseVersionFactory.create(
+                productversion=pv3, case=self.cv1.case)
+
+            self.assertFalse(self.refresh(pv3).latest)
+
+        self.assertEqual(
+            [(pv.id, pv.latest) for pv in self.product.versions.all()],
+            [
+                (pv0.id, False),
+                (self.pv1.id, False),
+                (self.pv2.id, False),
+                (pv3.id, True),
+                ]
+            )
+        self.assertFalse(self.refresh(self.cv1).latest)
+        self.assertTrue(self.refresh(cv3).latest)
+
+
+    def test_bulk_clone(self):
+        """Bulk clones record their cases for marking on exit."""
+        with self.deferred():
+            clone = self.cv1.clone(overrides={"productversion": self.pv2})
+
+            self.assertTrue(self.refresh(self.cv1).latest)
+
+        self.assertTrue(self.refresh(clone).latest)
+        self.assertFalse(self.refresh(self.cv1).latest)
+
+
+    def test_results(self):
+        """Latest-result pointers and rollups are updated on exit."""
+        rcv = self.F.RunCaseVersionFactory.create()
+        env = self.F.EnvironmentFactory.create()
+        rcv.environments.add(env)
+        rcv.run.environments.add(env)
+
+        tester = self.F.UserFactory.create()
+
+        with self.deferred():
+            self.F.ResultFactory.create(
+                runcaseversion=rcv, environment=env, tester=tester,
+                status="failed")
+            r2 = self.F.ResultFactory.create(
+                runcaseversion=rcv, environment=env, tester=tester,
+                status="passed")
+
+            self.assertFalse(self.refresh(r2).is_latest)
+
+        self.assertTrue(self.refresh(r2).is_latest)
+        self.assertEqual(rcv.run.result_summary()["passed"], 1)
+        self.assertEqual(rcv.run.result_summary()["failed"], 0)
+
+
+    def test_nested(self):
+        """Nested blocks are part of the outer one."""
+        with self.deferred() as outer:
+            with self.deferred() as inner:
+                cv2 = self.F.CaseVersionFactory.create(
+                    productversion=self.pv2, case=self.cv1.case)
+
+            self.assertIs(inner, outer)
+            self.assertFalse(self.refresh(cv2).latest)
+
+        self.assertTrue(self.refresh(cv2).latest)
+
+
+    def test_exception(self):
+        """On an exception, nothing is recomputed and deferring stops."""
+        with self.assertRaises(ValueError):
+            with self.deferred():
+                cv2 = self.F.CaseVersionFactory.create(
+                    productversion=self.pv2, case=self.cv1.case)
+                raise ValueError()
+
+        self.assertIsNone(self.deferring())
+        self.assertFalse(self.refresh(cv2).latest)
+
+
+    def test_fewer_queries(self):
+        """Saving many caseversions marks latest versions once."""
+        cases = [self.cv1.case] + [
+            self.F.CaseFactory.create(product=self.product) for i in range(4)]
+
+        # two queries saving each caseversion (with its environments), three
+        # marking all latest versions, and one reloading the saved instances
+        with self.assertNumQueries(2 * len(cases) + 4):
+            with self.deferred():
+                for c in cases:
+                    self.model.CaseVersion.objects.create(
+                        productversion=self.pv2, case=c, name="new")
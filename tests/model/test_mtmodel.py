@@ -8,6 +8,8 @@ a test-only model.
 """
 import datetime
 
+from django.db.models.query import QuerySet
+
 from mock import patch
 
 from tests import case
@@ -511,6 +513,119 @@ class CascadeUndeleteTest(UndeleteMixin, MTModelTestCase):
 
 
 
+class SoftDeleteCascadeTest(UndeleteMixin, MTModelTestCase):
+    """Tests for the chunked, SQL-level soft-delete cascade."""
+    def create_tree(self):
+        """Create a product with a result (and step result) under it."""
+        rcv = self.F.RunCaseVersionFactory.create()
+        sr = self.F.StepResultFactory.create(
+            result__runcaseversion=rcv,
+            step__caseversion=rcv.caseversion,
+            )
+        return rcv.run.productversion.product, sr
+
+
+    def test_deep_cascade(self):
+        """Deleting a product cascades all the way down to step results."""
+        p, sr = self.create_tree()
+        rcv = sr.result.runcaseversion
+
+        p.delete(user=self.user)
+
+        deleted_on = self.refresh(p).deleted_on
+        for obj in [
+                rcv.run.productversion,
+                rcv.caseversion,
+                rcv.caseversion.case,
+                sr.step,
+                rcv.run,
+                rcv,
+                sr.result,
+                sr,
+                ]:
+            obj = self.refresh(obj)
+            self.assertEqual(obj.deleted_on, deleted_on)
+            self.assertEqual(obj.deleted_by, self.user)
+
+
+    def test_deep_undelete(self):
+        """Undeleting a product cascades all the way down to step results."""
+        p, sr = self.create_tree()
+        p.delete()
+
+        p.undelete(user=self.user)
+
+        for obj in [sr.result.runcaseversion, sr.result, sr.step, sr]:
+            self.assertNotDeleted(self.refresh(obj))
+        self.assertEqual(self.refresh(sr).modified_by, self.user)
+
+
+    def test_chunked(self):
+        """Dependents are found and updated a page of ids at a time."""
+        rcv = self.F.RunCaseVersionFactory.create()
+        results = [
+            self.F.ResultFactory.create(runcaseversion=rcv) for i in range(5)]
+        sr = self.F.StepResultFactory.create(result=results[4])
+
+        with patch("moztrap.model.mtmodel.SoftDeleteCascade.chunk_size", 2):
+            rcv.run.delete()
+
+        for obj in results + [sr]:
+            self.assertFalse(self.refresh(obj).deleted_on is None)
+
+
+    def test_doesnt_load_instances(self):
+        """Dependents aren't loaded as instances, only their ids."""
+        rcv = self.F.RunCaseVersionFactory.create()
+        for i in range(3):
+            self.F.ResultFactory.create(runcaseversion=rcv)
+
+        with patch("moztrap.model.execution.models.Result.__init__") as init:
+            rcv.run.delete()
+
+        self.assertEqual(init.call_count, 0)
+        self.assertEqual(
+            self.model.Result.objects.filter(runcaseversion=rcv).count(), 0)
+
+
+    def test_query_count_constant(self):
+        """Number of queries doesn't grow with the number of dependents."""
+        for num in [1, 5]:
+            run = self.F.RunFactory.create()
+            for i in range(num):
+                self.F.ResultFactory.create(
+                    runcaseversion=self.F.RunCaseVersionFactory.create(run=run))
+
+            # 11 of them refresh result rollups of the deleted rcvs
+            with self.assertNumQueries(23):
+                run.delete()
+
+
+    def test_self_referencing_cycle(self):
+        """A cycle of self-referencing FKs doesn't cascade forever."""
+        r1 = self.F.RunFactory.create()
+        r2 = self.F.RunFactory.create(series=r1)
+        r1.series = r2
+        r1.save()
+
+        r1.delete()
+
+        self.assertFalse(self.refresh(r1).deleted_on is None)
+        self.assertFalse(self.refresh(r2).deleted_on is None)
+
+
+    def test_sliced_queryset(self):
+        """A sliced queryset can be deleted."""
+        p1 = self.F.ProductFactory.create(name="one")
+        p2 = self.F.ProductFactory.create(name="two")
+
+        self.model.Product.objects.order_by("name")[:1].delete()
+
+        self.assertFalse(self.refresh(p1).deleted_on is None)
+        self.assertEqual(self.refresh(p2).deleted_on, None)
+
+
+
 class CloneTest(UndeleteMixin, MTModelTestCase):
     """Tests for cloning."""
     def test_cascade_non_m2m_or_reverse_fk(self):
@@ -571,6 +686,82 @@ class CloneTest(UndeleteMixin, MTModelTestCase):
 
 
 
+class BulkClonerTest(MTModelTestCase):
+    """Tests for cloning many objects and their cascades in bulk."""
+    def test_clones_get_ids(self):
+        """Bulk-inserted clones get their new ids and a fresh cc_version."""
+        products = [
+            self.F.ProductFactory.create(name=name) for name in "abc"]
+        cloner = self.model.BulkCloner(user=self.user)
+
+        clones = [p.clone(cloner=cloner, user=self.user) for p in products]
+
+        self.assertEqual([c.id for c in clones], [None] * 3)
+        # one INSERT gets all their ids
+        with self.assertNumQueries(3):
+            cloner.run()
+        for clone in clones:
+            self.assertEqual(self.refresh(clone).name, clone.name)
+            self.assertEqual(self.refresh(clone).cc_version, 0)
+            self.assertEqual(clone.created_by, self.user)
+            clone.save()
+        self.assertEqual(
+            sorted(c.name for c in clones),
+            ["Cloned: a", "Cloned: b", "Cloned: c"],
+            )
+
+
+    def test_cascade_children_in_bulk(self):
+        """Reverse-FK children of all clones are loaded in one query."""
+        suites = []
+        for i in range(2):
+            suite = self.F.SuiteFactory.create(name=str(i))
+            for j in range(3):
+                self.F.SuiteCaseFactory.create(suite=suite)
+            suites.append(suite)
+        cloner = self.model.BulkCloner(user=self.user)
+        clones = [s.clone(cloner=cloner, user=self.user) for s in suites]
+
+        with self.assertNumQueries(3):
+            cloner.run()
+
+        for suite, clone in zip(suites, clones):
+            self.assertEqual(
+                set(sc.case for sc in clone.suitecases.all()),
+                set(sc.case for sc in suite.suitecases.all()),
+                )
+            self.assertEqual(
+                [sc.created_by for sc in clone.suitecases.all()],
+                [self.user] * 3,
+                )
+
+
+    def test_cascade_filter(self):
+        """A cascade filter function is applied to each object's relation."""
+        s = self.F.SuiteFactory.create()
+        keep = self.F.SuiteCaseFactory.create(suite=s, order=1)
+        self.F.SuiteCaseFactory.create(suite=s, order=2)
+
+        new = s.clone(cascade={"suitecases": lambda qs: qs.filter(order=1)})
+
+        self.assertEqual([sc.case for sc in new.suitecases.all()], [keep.case])
+
+
+    def test_deleted_not_cloned(self):
+        """Deleted children and many-to-many targets aren't cloned."""
+        cv = self.F.CaseVersionFactory.create()
+        self.F.CaseStepFactory.create(caseversion=cv).delete()
+        tag = self.F.TagFactory.create()
+        cv.tags.add(tag)
+        tag.delete()
+
+        new = cv.clone()
+
+        self.assertEqual(new.steps.count(), 0)
+        self.assertEqual(new.tags.count(), 0)
+
+
+
 class MTManagerTest(MTModelTestCase):
     """Tests for MTManager."""
     def test_objects_doesnt_include_deleted(self):
@@ -608,6 +799,117 @@ class MTManagerTest(MTModelTestCase):
 
 
 
+class BulkUpsertTest(case.DBTestCase):
+    """Tests for BulkUpsert (and ``MTManager.bulk_insert_or_update``)."""
+    dialect = None
+
+
+    def upsert(self, objs, **kwargs):
+        """Upsert ``objs`` (products) and return ids."""
+        from moztrap.model.mtmodel import BulkUpsert
+        upsert = BulkUpsert(
+            self.model.Product, kwargs.pop("update_fields", None),
+            dialect=self.dialect)
+        for k, v in kwargs.items():
+            setattr(upsert, k, v)
+        return upsert.run(objs)
+
+
+    def test_new_get_ids(self):
+        """New objects are inserted and get their ids."""
+        objs = [self.model.Product(name=n) for n in ["One", "Two", "Three"]]
+
+        ids = self.upsert(objs)
+
+        self.assertEqual(ids, [o.id for o in objs])
+        self.assertEqual(
+            list(
+                self.model.Product.objects.filter(id__in=ids).order_by(
+                    "id").values_list("name", flat=True)),
+            ["One", "Two", "Three"],
+            )
+
+
+    def test_existing_updated(self):
+        """Objects with ids update their rows, or are inserted with them."""
+        p = self.F.ProductFactory.create(name="Old", description="Old")
+
+        ids = self.upsert(
+            [
+                self.model.Product(id=p.id, name="New", description="New"),
+                self.model.Product(id=p.id + 1, name="Other"),
+                ],
+            update_fields=["name"],
+            )
+
+        self.assertEqual(ids, [p.id, p.id + 1])
+        p = self.refresh(p)
+        self.assertEqual((p.name, p.description), ("New", "Old"))
+        self.assertEqual(
+            self.model.Product.objects.get(id=p.id + 1).name, "Other")
+
+
+    def test_values_are_parameters(self):
+        """Values (with quotes) are passed as parameters."""
+        name = u"It's \"quoted\"; DROP TABLE"
+
+        ids = self.upsert([self.model.Product(name=name)])
+
+        self.assertEqual(self.model.Product.objects.get(id=ids[0]).name, name)
+
+
+    def test_chunks(self):
+        """Rows are sent in chunks of at most ``batch_size``."""
+        p = self.F.ProductFactory.create(name="Old")
+        objs = [self.model.Product(name=str(i)) for i in range(5)]
+
+        with self.assertNumQueries(3):
+            self.upsert(objs, batch_size=2)
+        with self.assertNumQueries(2 if self.dialect == "fallback" else 1):
+            self.upsert([self.model.Product(id=p.id, name="New")])
+
+        self.assertEqual(
+            self.model.Product.objects.filter(
+                name__in=[str(i) for i in range(5)]).count(),
+            5,
+            )
+
+
+    def test_chunk_bytes(self):
+        """Chunks are also limited to about ``max_bytes`` of values."""
+        objs = [
+            self.model.Product(name=str(i), description="x" * 1000)
+            for i in range(4)
+            ]
+
+        with self.assertNumQueries(2):
+            self.upsert(objs, max_bytes=2500)
+
+
+    def test_manager(self):
+        """``bulk_insert_or_update`` upserts with the manager's database."""
+        p = self.F.ProductFactory.create(name="Old")
+
+        ids = self.model.Product.everything.bulk_insert_or_update(
+            [
+                self.model.Product(id=p.id, name="New"),
+                self.model.Product(name="Other"),
+                ]
+            )
+
+        self.assertEqual(ids[0], p.id)
+        self.assertEqual(self.refresh(p).name, "New")
+        self.assertEqual(
+            self.model.Product.objects.get(id=ids[1]).name, "Other")
+
+
+
+class FallbackBulkUpsertTest(BulkUpsertTest):
+    """Tests for the fallback (update, then insert) upsert dialect."""
+    dialect = "fallback"
+
+
+
 class TeamModelTest(case.DBTestCase):
     """Tests for TeamModel base class."""
     @property
@@ -762,3 +1064,119 @@ class OptimisticLockingTest(case.DBTestCase):
 
         with self.assertRaises(self.model.ConcurrencyError):
             p.save()
+
+
+
+class ChangedFieldsTest(case.DBTestCase):
+    """Tests for saving only changed fields of loaded instances."""
+    def change_in_db(self, obj, **kwargs):
+        """Change ``obj`` in db, bypassing concurrency control."""
+        QuerySet.update(obj.__class__.everything.filter(pk=obj.pk), **kwargs)
+
+
+    def test_new_instance(self):
+        """A new instance has no record of loaded values until saved."""
+        p = self.model.Product(name="Foo")
+
+        self.assertEqual(p.changed_fields, None)
+
+        p.save()
+
+        self.assertEqual(p.changed_fields, [])
+
+
+    def test_changed_fields(self):
+        """Fields changed since loaded are reported as changed."""
+        self.F.ProductFactory.create(name="Foo")
+        p = self.model.Product.objects.get()
+
+        self.assertEqual(p.changed_fields, [])
+
+        p.name = "Bar"
+        p.modified_on = datetime.datetime(2012, 1, 1)
+
+        self.assertEqual(p.changed_fields, ["name"])
+
+
+    def test_saves_changed_fields(self):
+        """An update only saves changed fields."""
+        self.F.ProductFactory.create(name="Foo", description="Old")
+        p = self.model.Product.objects.get()
+        self.change_in_db(p, description="Other")
+
+        p.name = "Bar"
+        p.save()
+
+        p = self.refresh(p)
+        self.assertEqual(p.name, "Bar")
+        self.assertEqual(p.description, "Other")
+        self.assertEqual(p.cc_version, 1)
+
+
+    def test_saved_fields_not_changed(self):
+        """Once saved, fields are no longer changed."""
+        p = self.F.ProductFactory.create(name="Foo")
+        p.name = "Bar"
+        p.save()
+
+        self.assertEqual(p.changed_fields, [])
+
+
+    def test_not_loaded_saves_all(self):
+        """An instance that wasn't loaded or saved saves all fields."""
+        p = self.F.ProductFactory.create(name="Foo", description="Old")
+        self.change_in_db(p, description="Other")
+        p2 = self.model.Product(
+            id=p.id, name="Bar", description="New", cc_version=p.cc_version)
+
+        p2.save()
+
+        self.assertEqual(self.refresh(p).description, "New")
+
+
+    def test_update_fields(self):
+        """With ``update_fields``, only those fields are saved."""
+        p = self.F.ProductFactory.create(name="Foo", description="Old")
+        p.name = "Bar"
+        p.description = "New"
+
+        p.save(update_fields=["name"])
+
+        self.assertEqual(p.changed_fields, ["description"])
+        p = self.refresh(p)
+        self.assertEqual(p.name, "Bar")
+        self.assertEqual(p.description, "Old")
+
+
+    def test_update_fields_modified(self):
+        """With ``update_fields``, modification is still tracked."""
+        p = self.F.ProductFactory.create(name="Foo")
+        user = self.F.UserFactory.create()
+
+        p.save(update_fields=[], user=user)
+
+        p = self.refresh(p)
+        self.assertEqual(p.modified_by, user)
+        self.assertEqual(p.cc_version, 1)
+
+
+    def test_update_fields_bad_name(self):
+        """A name in ``update_fields`` that isn't a field is an error."""
+        p = self.F.ProductFactory.create(name="Foo")
+
+        with self.assertRaises(ValueError):
+            p.save(update_fields=["foo"])
+
+
+    def test_deferred_fields(self):
+        """Deferred fields aren't loaded (or saved) by saving."""
+        self.F.ProductFactory.create(name="Foo", description="Old")
+        p = self.model.Product.objects.defer("description").get()
+        p.name = "Bar"
+
+        with self.assertNumQueries(1):
+            p.save()
+
+        p = self.refresh(p)
+        self.assertEqual(p.name, "Bar")
+        self.assertEqual(p.description, "Old")
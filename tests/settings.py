@@ -10,3 +10,6 @@ SITE_URL = "http://localhost:80"
 USE_BROWSERID = True
 
 PASSWORD_HASHERS = ['django.contrib.auth.hashers.UnsaltedMD5PasswordHasher']
+
+# tests run in a single process, so the local-memory cache will do
+CACHE_ENVIRONMENTS = True
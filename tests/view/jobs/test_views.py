@@ -0,0 +1,65 @@
+"""
+Tests for background job views.
+
+"""
+from django.core.urlresolvers import reverse
+
+from tests import case
+
+
+
+class JobStatusTest(case.view.AuthenticatedViewTestCase,
+                    case.view.NoCacheTest,
+                    ):
+    """Tests for job status view."""
+    def setUp(self):
+        """These tests all require a job."""
+        super(JobStatusTest, self).setUp()
+        self.job = self.F.JobFactory.create(
+            status="running", done=1, total=4)
+
+
+    @property
+    def url(self):
+        """Shortcut for job status url."""
+        return reverse("job_status", kwargs={"job_id": self.job.id})
+
+
+    def test_status(self):
+        """Returns status and progress as JSON."""
+        res = self.get()
+
+        self.assertEqual(
+            res.json,
+            {
+                "id": self.job.id,
+                "task": "activate_run",
+                "status": "running",
+                "done": 1,
+                "total": 4,
+                "progress": 0.25,
+                "finished": False,
+                "result": None,
+                }
+            )
+
+
+    def test_finished(self):
+        """A finished job includes its result."""
+        self.job.status = "done"
+        self.job.result = '{"run_id": 3}'
+        self.job.save()
+
+        res = self.get()
+
+        self.assertEqual(res.json["finished"], True)
+        self.assertEqual(res.json["result"], {"run_id": 3})
+
+
+    def test_not_found(self):
+        """404 for a nonexistent job."""
+        self.app.get(
+            reverse("job_status", kwargs={"job_id": self.job.id + 1}),
+            user=self.user,
+            status=404,
+            )
@@ -2,7 +2,7 @@
 Tests for list actions.
 
 """
-from mock import Mock
+from mock import Mock, patch
 
 from django.http import HttpResponse
 from django.test import RequestFactory
@@ -133,6 +133,27 @@ class ActionsTest(case.TestCase):
         instance.doit.assert_called_with(user=req.user)
 
 
+    def test_background_action(self):
+        """A background action is queued as a job instead of called."""
+        req = self.req("post", "/the/url", data={"action-doit": "3"})
+        instance = self.mock_model._base_manager.get.return_value
+        instance._meta.module_name = "thing"
+        instance.id = 3
+
+        with patch(
+                "moztrap.view.lists.actions.Job.objects.enqueue") as enqueue:
+            enqueue.return_value.finished = True
+            self.view(
+                req,
+                decorator=self.actions(
+                    self.mock_model, ["doit"], background={"doit": "do_it"})
+                )
+
+        enqueue.assert_called_with(
+            "do_it", user=req.user, unique=True, thing_id=3)
+        self.assertFalse(instance.doit.called)
+
+
     def test_POST_no_action(self):
         """Without fallthrough, redirects even if no action taken."""
         req = self.req("post", "/the/url", data={})
@@ -540,6 +540,38 @@ class ChoicesFilterTest(FiltersTestCase):
 
 
 
+class CompletionFilterTest(FiltersTestCase):
+    """Tests for CompletionFilter."""
+    def test_filter(self):
+        """Filters queryset by completion ranges of all values."""
+        f = self.filters.CompletionFilter("completion")
+
+        qs = Mock()
+        qs2 = f.filter(qs, ["0-25", "100"])
+
+        qs.filter_completion.assert_called_with((0, 0.25), (1, None))
+        self.assertIs(qs2, qs.filter_completion.return_value)
+
+
+    def test_filter_doesnt_touch_queryset_if_no_values(self):
+        """Doesn't call .filter_completion() unless actually filtered."""
+        f = self.filters.CompletionFilter("completion")
+
+        qs = Mock()
+        f.filter(qs, [])
+
+        self.assertEqual(qs.filter_completion.call_count, 0)
+
+
+    def test_values(self):
+        """Only known ranges are valid values."""
+        f = self.filters.CompletionFilter("completion")
+
+        self.assertEqual(
+            f.values({"completion": ["25-50", "10-20"]}), ["25-50"])
+
+
+
 class ModelFilterTest(FiltersTestCase):
     """Tests for ModelFilter."""
     @property
@@ -2,6 +2,8 @@
 Tests for environment forms.
 
 """
+import json
+
 from tests import case
 
 
@@ -38,6 +40,31 @@ class AddProfileFormTest(case.DBTestCase):
             set(p.environments.get().elements.all()), set([e1, e2]))
 
 
+    def test_save_pairwise(self):
+        """Can choose to only generate environments covering every pair."""
+        elements = []
+        for cat in ["OS", "Browser", "Language"]:
+            category = self.F.CategoryFactory.create(name=cat)
+            elements.extend(
+                [self.F.ElementFactory.create(category=category)
+                 for i in range(3)]
+                )
+
+        f = self.form(
+            {
+                "elements": [str(e.id) for e in elements],
+                "strength": "2",
+                "name": "Foo",
+                "cc_version": "0"},
+            user=self.F.UserFactory.create(),
+            )
+        self.assertTrue(f.is_valid(), f.errors)
+        p = f.save()
+
+        self.assertEqual(json.loads(f.job.arguments)["strength"], 2)
+        self.assertLess(p.environments.count(), 27)
+
+
     def test_empty_category_rendered(self):
         """A category with no elements is still rendered in elements widget."""
         self.F.CategoryFactory.create(name="EmptyCat")
@@ -52,6 +79,20 @@ class AddProfileFormTest(case.DBTestCase):
         self.assertIn("SomeElement", unicode(self.form()["elements"]))
 
 
+    def test_deletable_annotated(self):
+        """Rendering the widget doesn't query in-use status per row."""
+        for i in range(3):
+            el = self.F.ElementFactory.create(name="Element {0}".format(i))
+            self.F.EnvironmentFactory.create().elements.add(el)
+        self.F.ElementFactory.create(name="Unused")
+        f = self.form()
+
+        with self.assertNumQueries(2):
+            rendered = unicode(f["elements"])
+
+        self.assertEqual(rendered.count('class="action-delete"'), 2)
+
+
     def test_selected_element_ids(self):
         """Selected elements are rendered checked."""
         unsel = self.F.ElementFactory.create()
@@ -590,6 +590,27 @@ class EditProfileViewTest(case.view.FormViewTestCase,
         self.assertEqual(env.profile, self.profile)
 
 
+    def test_add_duplicate_environment(self):
+        """Adding an environment the profile already has is an error."""
+        e1 = self.F.ElementFactory.create(name="Linux")
+        env = self.F.EnvironmentFactory.create(profile=self.profile)
+        env.elements.add(e1)
+
+        res = self.ajax_post(
+            "add-environment-form",
+            {
+                "add-environment": "1",
+                "element-element": [str(e1.id)],
+                },
+            )
+
+        self.assertEqual(
+            res.json["messages"][0]["message"],
+            "That environment is already in this profile.",
+            )
+        self.assertEqual(self.profile.environments.count(), 1)
+
+
     def test_no_elements(self):
         """Add env with no elements results in error message."""
         res = self.ajax_post(
@@ -284,3 +284,54 @@ class EditProductVersionTest(case.view.FormViewTestCase,
         res = form.submit(status=200)
 
         res.mustcontain("Another user saved changes to this object")
+
+
+
+class ProductVersionExportTest(case.view.AuthenticatedViewTestCase,
+                               case.view.NoCacheTest,
+                               ):
+    """Test for productversion export view."""
+    def setUp(self):
+        """Setup for export tests; create a productversion."""
+        super(ProductVersionExportTest, self).setUp()
+        self.productversion = self.F.ProductVersionFactory.create(
+            product__name="Foo", version="1.0")
+
+
+    @property
+    def url(self):
+        """Shortcut for product version export url."""
+        return reverse(
+            "manage_productversion_export",
+            kwargs=dict(productversion_id=self.productversion.id)
+            )
+
+
+    def test_export(self):
+        """Downloads the cases as a JSON attachment."""
+        self.F.CaseVersionFactory.create(
+            productversion=self.productversion, name="Foo Case")
+
+        res = self.get()
+
+        self.assertEqual(res.content_type, "application/json")
+        self.assertEqual(
+            res.headers["Content-Disposition"],
+            'attachment; filename="foo-10.json"',
+            )
+        self.assertEqual(
+            [c["name"] for c in res.json["cases"]], ["Foo Case"])
+
+
+    def test_details_link(self):
+        """Details link to the export."""
+        res = self.app.get(
+            reverse(
+                "manage_productversion_details",
+                kwargs=dict(productversion_id=self.productversion.id),
+                ),
+            user=self.user,
+            headers={"X-Requested-With": "XMLHttpRequest"},
+            )
+
+        res.mustcontain(self.url)
@@ -6,6 +6,7 @@ Tests for run management views.
 from datetime import date
 
 from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
 
 from tests import case
 
@@ -37,6 +38,47 @@ class RunsTest(case.view.manage.ListViewTestCase,
         return reverse("manage_runs")
 
 
+    @override_settings(ASYNC_JOBS=True)
+    def test_activate_in_background(self):
+        """Activation is queued as a job, with a message polling it."""
+        self.add_perm(self.perm)
+
+        r = self.factory.create(status="draft")
+
+        res = self.get_form().submit(
+            name="action-activate",
+            index=0,
+            headers={"X-Requested-With": "XMLHttpRequest"},
+            )
+
+        job = self.model.Job.objects.get()
+        self.assertEqual(job.task, "activate_run")
+        self.assertEqual(job.get_result(), None)
+        self.assertEqual(self.refresh(r).status, "draft")
+        self.assertEqual(
+            res.json["messages"][0]["tags"],
+            "job job-id-{0} info".format(job.id),
+            )
+
+
+    @override_settings(ASYNC_JOBS=True)
+    def test_activate_in_background_escapes_name(self):
+        """The job message is escaped; jobs.js adds its progress."""
+        self.add_perm(self.perm)
+
+        self.factory.create(status="draft", name="<b>Foo</b>")
+
+        res = self.get_form().submit(
+            name="action-activate", index=0, status=302).follow()
+
+        res.mustcontain(
+            "Run &#39;&lt;b&gt;Foo&lt;/b&gt;&#39; will activate shortly.")
+        self.assertEqual(
+            res.html.find("div", id="messages")["data-job-url"],
+            reverse("job_status", kwargs={"job_id": 0}),
+            )
+
+
 
 class RunDetailTest(case.view.AuthenticatedViewTestCase,
                     case.view.NoCacheTest,
@@ -251,3 +293,108 @@ class EditRunTest(case.view.FormViewTestCase,
         res = form.submit(status=200)
 
         res.mustcontain("Another user saved changes to this object")
+
+
+
+class ImportResultsTest(case.view.FormViewTestCase,
+                        case.view.NoCacheTest,
+                        ):
+    """Tests for import-results view."""
+    form_id = "run-import-results-form"
+
+
+    def setUp(self):
+        """Setup for import tests; create run with a case, add perm."""
+        super(ImportResultsTest, self).setUp()
+        self.env = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["OS X"]})[0]
+        self.rcv = self.F.RunCaseVersionFactory.create(
+            run__status="active", environments=[self.env])
+        self.rcv.run.environments.add(self.env)
+        self.add_perm("execute")
+
+
+    @property
+    def url(self):
+        """Shortcut for import-results url."""
+        return reverse(
+            "manage_run_import_results", kwargs=dict(run_id=self.rcv.run.id))
+
+
+    def test_requires_execute_permission(self):
+        """Requires execute permission."""
+        res = self.app.get(
+            self.url, user=self.F.UserFactory.create(), status=302)
+
+        self.assertRedirects(res, "/")
+
+
+    def test_import(self):
+        """Imports results; reports throughput and unmatched tests."""
+        form = self.get_form()
+        form["environment"] = str(self.env.id)
+        form["file"] = (
+            "results.tap",
+            "ok 1 - {0} passes\nok 2 - something else\n".format(
+                self.rcv.caseversion.case_id),
+            )
+
+        res = form.submit(status=200)
+
+        res.mustcontain("Imported 1 results in")
+        res.mustcontain("1 unmatched test")
+        res.mustcontain("something else")
+        result = self.rcv.results.get()
+        self.assertEqual(result.tester, self.user)
+        self.assertEqual(result.environment, self.env)
+
+
+    def test_run_not_active(self):
+        """Results can't be imported into a run that isn't active."""
+        self.rcv.run.status = self.model.Run.STATUS.draft
+        self.rcv.run.save()
+
+        res = self.get(status=302)
+
+        self.assertRedirects(res, reverse("manage_runs"))
+        res.follow().mustcontain("not open for testing")
+
+
+    def test_run_not_active_post(self):
+        """Results posted to a run that isn't active aren't saved."""
+        form = self.get_form()
+        form["environment"] = str(self.env.id)
+        form["file"] = (
+            "results.tap",
+            "ok 1 - {0} passes\n".format(self.rcv.caseversion.case_id),
+            )
+        self.rcv.run.status = self.model.Run.STATUS.disabled
+        self.rcv.run.save()
+
+        res = form.submit(status=302)
+
+        self.assertRedirects(res, reverse("manage_runs"))
+        self.assertEqual(self.rcv.results.count(), 0)
+
+
+    def test_unknown_format(self):
+        """Error if the format isn't given and can't be guessed."""
+        form = self.get_form()
+        form["environment"] = str(self.env.id)
+        form["file"] = ("results.txt", "ok 1\n")
+
+        res = form.submit(status=200)
+
+        res.mustcontain("Could not guess the format of this file")
+
+
+    def test_bad_file(self):
+        """Error if the file can't be parsed."""
+        form = self.get_form()
+        form["environment"] = str(self.env.id)
+        form["format"] = "ndjson"
+        form["file"] = ("results.txt", "{\n")
+
+        res = form.submit(status=200)
+
+        res.mustcontain("Could not parse JSON on line 1")
@@ -27,6 +27,41 @@ class RunResultsViewTest(case.view.ListViewTestCase,
         return reverse("results_runs")
 
 
+    def _runs_by_completion(self):
+        """Create runs "Foo 0", "Foo 50", and "Foo 100" by completion."""
+        envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Windows", "Linux"]})
+        pv = self.F.ProductVersionFactory.create(environments=envs)
+        for done in [1, 0, 2]:
+            run = self.factory.create(
+                name="Foo {0}".format(done * 50), productversion=pv)
+            rcv = self.F.RunCaseVersionFactory.create(
+                run=run, caseversion__productversion=pv)
+            for env in envs[:done]:
+                rcv.result_pass(env, user=self.user)
+
+
+    def test_sort_by_completion(self):
+        """Can sort by completion."""
+        self._runs_by_completion()
+
+        res = self.get(
+            params={"sortfield": "completion", "sortdirection": "desc"})
+
+        self.assertOrderInList(res, "Foo 100", "Foo 50", "Foo 0")
+
+
+    def test_filter_by_completion(self):
+        """Can filter by completion range."""
+        self._runs_by_completion()
+
+        res = self.get(params={"filter-completion": "50-75"})
+
+        self.assertInList(res, "Foo 50")
+        self.assertNotInList(res, "Foo 100")
+        self.assertNotInList(res, "Foo 0")
+
+
 
 class RunDetailTest(case.view.AuthenticatedViewTestCase):
     """Test for run-detail ajax view."""
@@ -76,29 +76,18 @@ class ResultForTest(case.DBTestCase):
         self.assertEqual(self.model.Result.objects.count(), 2)
 
 
-    def test_dupe_latest_results_sets_non_latest_to_false(self):
-        """If dupe latest results exists, keep the last-modified."""
-
-        with mock.patch("moztrap.model.mtmodel.utcnow") as mock_utcnow:
-            mock_utcnow.return_value = datetime.datetime(2012, 3, 24)
-            res1 = self.F.ResultFactory(
-                status="passed",
+    def test_latest_result_is_pointed_result(self):
+        """Finds the result the latest-result pointer refers to."""
+        res1 = self.F.ResultFactory(status="passed")
+        res2 = self.F.ResultFactory(
+            tester=res1.tester,
+            runcaseversion=res1.runcaseversion,
+            environment=res1.environment,
+            status="failed",
             )
-            mock_utcnow.return_value = datetime.datetime(2012, 3, 25)
-            res2 = self.F.ResultFactory(
-                tester=res1.tester,
-                runcaseversion=res1.runcaseversion,
-                environment=res1.environment,
-                status="passed",
-                )
-
-            # manually set a non-latest result to is_latest=True
-            # since res1 has already been saved, and has a pk assigned,
-            # it will not try to set all the other results to NOT latest.
-            mock_utcnow.return_value = datetime.datetime(2012, 3, 24)
-            self.model.Result.objects.filter(pk=res1.pk).update(
-                is_latest=True,
-                )
+        # saving an older result doesn't make it latest
+        res1.comment = "changed"
+        res1.save()
 
         self.assertEqual(self.result_for(
                 res1.runcaseversion,
@@ -106,9 +95,7 @@ class ResultForTest(case.DBTestCase):
                 res1.environment,
                 "{{ result.id }}",
                 ), str(res2.id))
-        self.assertEqual(self.model.Result.objects.count(), 2)
-        self.assertEqual(
-            self.model.Result.objects.get(is_latest=True).pk, res2.pk)
+        self.assertEqual(self.model.LatestResult.objects.count(), 1)
 
 
     def test_result_does_not_exist(self):
@@ -175,6 +175,32 @@ class EnvironmentSelectionFormTest(case.DBTestCase):
         self.assertEqual(f.save(), winff.id)
 
 
+    def test_index(self):
+        """Can pass in an environment index instead of environments."""
+        from moztrap.model.environments.index import EnvironmentIndex
+        envs = self.F.EnvironmentFactory.create_full_set(
+            {"OS": ["Linux", "Windows"]})
+        cat = self.model.Category.objects.get()
+        index = EnvironmentIndex.for_environments(
+            self.model.Environment.objects.all())
+
+        data = {"category_{0}".format(cat.id): str(envs[1].elements.get().id)}
+
+        with self.assertNumQueries(0):
+            f = self.form(
+                data,
+                index=index,
+                current=envs[0].id,
+                )
+            self.assertTrue(f.is_valid(), f.errors)
+
+        self.assertEqual(f.save(), envs[1].id)
+        self.assertEqual(
+            f.initial,
+            {"category_{0}".format(cat.id): envs[0].elements.get().id}
+            )
+
+
 
 class EnvironmentBuildSelectionFormTest(case.DBTestCase):
     """
@@ -5,6 +5,7 @@ Tests for runtests views.
 from datetime import datetime
 
 from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
 
 from BeautifulSoup import BeautifulSoup
 from mock import patch
@@ -228,6 +229,91 @@ class SetEnvironmentTest(case.view.AuthenticatedViewTestCase,
 
 
 
+    @override_settings(ASYNC_JOBS=True)
+    def test_set_environment_and_build_in_background(self):
+        """If the run for a build is being created, redirects to wait view."""
+        self.add_perm("execute")
+        self.testrun.environments.add(*self.envs)
+        self.testrun.is_series = True
+        self.testrun.save()
+
+        cat = self.model.Category.objects.get()
+
+        form = self.get().forms["runtests-environment-form"]
+        form["category_{0}".format(cat.id)] = self.envs[0].elements.get().id
+        form["build"] = "rahbuild"
+
+        res = form.submit(status=302)
+
+        job = self.model.Job.objects.get()
+        self.assertEqual(job.task, "clone_run_for_series")
+        self.assertRedirects(
+            res,
+            reverse(
+                "runtests_wait",
+                kwargs={"job_id": job.id, "env_id": self.envs[0].id})
+        )
+
+
+
+class WaitTest(case.view.AuthenticatedViewTestCase,
+               case.view.NoCacheTest,
+               ):
+    """Tests for view waiting for the run of a build to be created."""
+    def setUp(self):
+        """These tests all require a job and execute permission."""
+        super(WaitTest, self).setUp()
+        self.job = self.F.JobFactory.create(task="clone_run_for_series")
+        self.add_perm("execute")
+
+
+    @property
+    def url(self):
+        """Shortcut for runtests_wait url."""
+        return reverse(
+            "runtests_wait", kwargs={"job_id": self.job.id, "env_id": 2})
+
+
+    def test_requires_execute_permission(self):
+        """Requires execute permission."""
+        res = self.app.get(
+            self.url, user=self.F.UserFactory.create(), status=302)
+
+        self.assertRedirects(res, "/")
+
+
+    def test_pending(self):
+        """Polls the job while it isn't finished."""
+        res = self.get()
+
+        res.mustcontain(
+            'data-job-url="{0}"'.format(
+                reverse("job_status", kwargs={"job_id": self.job.id})))
+
+
+    def test_done(self):
+        """Redirects to the new run once the job is done."""
+        self.job.status = "done"
+        self.job.result = '{"run_id": 5}'
+        self.job.save()
+
+        res = self.get(status=302)
+
+        self.assertRedirects(
+            res, reverse("runtests_run", kwargs={"run_id": 5, "env_id": 2}))
+
+
+    def test_failed(self):
+        """Redirects to run selection with a message if the job failed."""
+        self.job.status = "failed"
+        self.job.save()
+
+        res = self.get(status=302).follow()
+
+        res.mustcontain("could not be created")
+
+
+
 class RunTestsTest(case.view.AuthenticatedViewTestCase,
                    case.view.NoCacheTest,
                    ):
@@ -326,6 +412,48 @@ class RunTestsTest(case.view.AuthenticatedViewTestCase,
         self.app.get(url, user=self.user, status=404)
 
 
+    def count_queries(self):
+        """Return the number of queries getting the page takes."""
+        from django.db import connection
+        connection.use_debug_cursor = True
+        try:
+            # queries are reset when the request starts
+            self.get()
+            return len(connection.queries)
+        finally:
+            connection.use_debug_cursor = False
+
+
+    def create_row(self):
+        """Create a failed case with a step, another tester's result, suite."""
+        result = self.create_result(status="failed")
+        rcv = result.runcaseversion
+        step = self.F.CaseStepFactory.create(caseversion=rcv.caseversion)
+        self.F.StepResultFactory.create(
+            result=result, step=step, status="failed", bug_url="http://a/1")
+        self.create_result(
+            runcaseversion=rcv,
+            tester=self.F.UserFactory.create(),
+            status="passed",
+            )
+        suite = self.F.SuiteFactory.create(
+            product=self.testrun.productversion.product)
+        self.F.SuiteCaseFactory.create(suite=suite, case=rcv.caseversion.case)
+        self.F.RunSuiteFactory.create(run=self.testrun, suite=suite)
+
+
+    def test_query_count_independent_of_cases(self):
+        """Results, step results and suites of the page are batch-loaded."""
+        self.create_row()
+        self.get()  # warm up caches filled on first request
+        few = self.count_queries()
+
+        for i in range(4):
+            self.create_row()
+
+        self.assertEqual(self.count_queries(), few)
+
+
     def test_inactive_run_redirects_to_selector(self):
         """An inactive run redirects to run selector with message."""
         self.testrun.status = "draft"
@@ -592,7 +720,7 @@ class RunTestsTest(case.view.AuthenticatedViewTestCase,
         result = rcv.results.get(
             tester=self.user,
             environment=self.envs[0],
-            is_latest=True)
+            latest__isnull=False)
 
         self.assertEqual(result.status, result.STATUS.passed)
 
@@ -633,7 +761,7 @@ class RunTestsTest(case.view.AuthenticatedViewTestCase,
         result = rcv.results.get(
             tester=self.user,
             environment=self.envs[0],
-            is_latest=True)
+            latest__isnull=False)
 
         self.assertEqual(result.status, result.STATUS.invalidated)
         self.assertEqual(result.comment, "it ain't valid")
@@ -679,7 +807,7 @@ class RunTestsTest(case.view.AuthenticatedViewTestCase,
         result = rcv.results.get(
             tester=self.user,
             environment=self.envs[0],
-            is_latest=True)
+            latest__isnull=False)
 
         self.assertEqual(result.status, result.STATUS.failed)
         self.assertEqual(result.comment, "it didn't pass")
@@ -721,7 +849,7 @@ class RunTestsTest(case.view.AuthenticatedViewTestCase,
         result = rcv.results.get(
             tester=self.user,
             environment=self.envs[0],
-            is_latest=True,
+            latest__isnull=False,
             )
 
         self.assertEqual(result.status, result.STATUS.started)
@@ -760,7 +888,7 @@ class RunTestsTest(case.view.AuthenticatedViewTestCase,
 
         self.assertRedirects(res, self.url)
 
-        result = rcv.results.get(is_latest=True)
+        result = rcv.results.get(latest__isnull=False)
 
         self.assertEqual(result.status, result.STATUS.invalidated)
         self.assertEqual(result.comment, "")